@@ -0,0 +1,379 @@
+"""
+Fakes and fixtures shared by the unit tests. These live outside the
+phenix_apps package so they aren't installed with it.
+"""
+
+import io
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+import minimega
+import pytest
+
+from phenix_apps.apps.scorch import ComponentBase
+from phenix_apps.apps.scorch import app as scorch_app
+from phenix_apps.common import settings
+
+
+def fake_host_data(name: str, poll: int, vms: int = 500) -> dict:
+    """
+    minimega `host` data for a host, with the load and memory use changing
+    over polls.
+    """
+
+    return {
+        "Name": name,
+        "CPUs": 64,
+        "CPUCommit": 500,
+        "Load": f"{poll % 3}.00 1.50 1.25",
+        "MemUsed": 100000 + (poll // 4) * 10,
+        "MemTotal": 512000,
+        "RX": 0.0,
+        "TX": 0.0,
+        "VMs": vms,
+    }
+
+
+class FakeMinimega:
+    """
+    In-memory stand-in for a minimega connection.
+
+    - VMs are spread evenly over hosts, for `vm info` and `host`.
+    - cc commands run on the VMs matching the cc filter and complete after
+      polls_to_complete `cc commands` polls, or the number given for their VM
+      in slow_vms. They exit with the VM's code in exitcodes (0 by default).
+    - Each VM's filesystem can be a local directory in roots. Mounting copies
+      it to the mount point (after mount_delay, in the background) and clearing
+      the mount copies any changes, including removed files, back.
+    - Other commands (like qos) are recorded in commands, including the ones
+      in files it reads, whose responses are streamed back like minimega does.
+      Commands in read_errors fail, and stop the read.
+    """
+
+    def __init__(
+        self,
+        vms: list = (),
+        hosts: list = ("compute1",),
+        polls_to_complete: int = 2,
+        roots: dict | None = None,
+        mount_delay: float = 0.0,
+        slow_polls: dict | None = None,
+        slow_vms: dict | None = None,
+    ):
+        self._namespace = "test"
+        self.vms = {vm: f"{i:08x}-0000-4000-8000-000000000000" for i, vm in enumerate(vms)}
+        self.hosts = list(hosts)
+        self.polls_to_complete = polls_to_complete
+        self.roots = roots or {}
+        self.mount_delay = mount_delay
+        self.slow_polls = slow_polls or {}  # host poll number --> seconds it takes
+        self.slow_vms = slow_vms or {}  # VM --> polls its cc commands take
+        self.exitcodes = {}  # VM --> exit code of its cc commands
+        self.peak_in_flight = 0  # most VMs with foreground cc commands outstanding at one poll
+
+        self.prefix = ""
+        self.filter = ""
+        self.issued = []  # cc commands
+        self.commands = []  # other commands run, in order
+        self.reads = []  # lines of each file read
+        self.calls = []
+        self.vm_info_args = []
+        self.host_polls = []  # time.monotonic() of each host poll
+        # cc_exitcode calls to fail for each command ID before succeeding
+        self.exitcode_failures = {}
+
+        self.mounts = {}
+        self.populating = {}
+        self.active_mounts = 0
+        self.max_active_mounts = 0
+
+        self.moreResponses = False
+        self._pending = []
+        self.read_errors = {}  # command in a file it reads --> error it fails with
+        self.missing_responses = 0  # responses left off the end of each file read
+        self.lock = threading.Lock()
+
+    def _call(self, name):
+        self.calls.append(name)
+
+    def _run(self, *args):
+        if self.moreResponses:
+            raise minimega.Error("more responses to be read from last command")
+
+        self.commands.append(" ".join(str(arg) for arg in args))
+        return [{"Response": "", "Error": ""}]
+
+    # --- VMs and hosts ---
+
+    def vm_info(self, summary=None):
+        self._call("vm_info")
+        self.vm_info_args.append(summary)
+
+        rows = {host: [] for host in self.hosts}
+
+        for i, (vm, uuid) in enumerate(self.vms.items()):
+            rows[self.hosts[i % len(self.hosts)]].append([str(i), vm, "RUNNING", "test", uuid])
+
+        return [
+            {"Host": host, "Header": ["id", "name", "state", "namespace", "uuid"], "Tabular": tabular}
+            for host, tabular in rows.items()
+        ]
+
+    def host(self):
+        self._call("host")
+
+        poll = len(self.host_polls)
+        self.host_polls.append(time.monotonic())
+        time.sleep(self.slow_polls.get(poll, 0.0))
+
+        vms = len(self.vms) // len(self.hosts)
+        return [{"Host": host, "Data": fake_host_data(host, poll, vms)} for host in self.hosts]
+
+    # --- cc ---
+
+    def cc_prefix(self, prefix=None):
+        self._call("cc_prefix")
+        if prefix is None:
+            return [{"Response": self.prefix}]
+        self.prefix = prefix
+
+    def clear_cc_prefix(self):
+        self._call("clear_cc_prefix")
+        self.prefix = ""
+
+    def cc_filter(self, filter=None):
+        self._call("cc_filter")
+        if filter is None:
+            # minimega shows filters joined with '&&'
+            return [{"Response": " && ".join(self.filter.split())}]
+        self.filter = filter
+
+    def clear_cc_filter(self):
+        self._call("clear_cc_filter")
+        self.filter = ""
+
+    def cc_exec(self, cmd):
+        return self._issue("cc_exec", cmd)
+
+    def cc_exec_once(self, cmd):
+        return self._issue("cc_exec_once", cmd)
+
+    def cc_background_once(self, cmd):
+        return self._issue("cc_background_once", cmd)
+
+    def cc_send(self, src):
+        return self._issue("cc_send", f"send {src}")
+
+    def _issue(self, name, cmd):
+        self._call(name)
+        targets = [vm for vm in self.vms if self.filter in (f"name={vm}", "all")]
+        self.issued.append({
+            "id": str(len(self.issued) + 1),
+            "call": name,
+            "prefix": self.prefix,
+            "cmd": cmd,
+            "targets": targets,
+            "polls": 0,
+        })
+        return [{"Response": ""}]
+
+    def cc_commands(self):
+        self._call("cc_commands")
+        rows = []
+
+        in_flight = set()
+
+        for cmd in self.issued:
+            cmd["polls"] += 1
+            polls = max([self.polls_to_complete] + [self.slow_vms.get(vm, 0) for vm in cmd["targets"]])
+            done = cmd["polls"] >= polls
+            responses = len(cmd["targets"]) if done else 0
+            rows.append([cmd["id"], cmd["prefix"], f"[{cmd['cmd']}]", str(responses)])
+
+            if (cmd["polls"] == 1 or not done) and cmd["call"] != "cc_background_once":
+                in_flight.update(cmd["targets"])
+
+        self.peak_in_flight = max(self.peak_in_flight, len(in_flight))
+
+        return [{"Tabular": rows}]
+
+    def cc_responses(self, cmd_id):
+        self._call("cc_responses")
+        cmd = self.issued[int(cmd_id) - 1]
+        resp = "".join(
+            f"{cmd_id}/{self.vms[vm]}/stdout:\n{cmd['cmd']} on {vm}\n\n" for vm in cmd["targets"]
+        )
+        return [{"Response": resp}]
+
+    def cc_exitcode(self, cmd_id, vm):
+        self._call("cc_exitcode")
+        if vm not in self.vms:
+            raise minimega.Error(f"unknown vm {vm}")
+        if self.exitcode_failures.get(cmd_id, 0):
+            self.exitcode_failures[cmd_id] -= 1
+            raise minimega.Error("exit code not yet processed")
+        return [{"Response": str(self.exitcodes.get(vm, 0))}]
+
+    # --- cc mounts ---
+
+    def cc_mount(self, vm, path):
+        if vm not in self.roots:
+            raise RuntimeError(f"vm not found: {vm}")
+
+        with self.lock:
+            self.active_mounts += 1
+            self.max_active_mounts = max(self.max_active_mounts, self.active_mounts)
+
+        def populate():
+            time.sleep(self.mount_delay)
+            shutil.copytree(self.roots[vm], path, dirs_exist_ok=True)
+
+        self.mounts[vm] = path
+
+        if self.mount_delay:
+            self.populating[vm] = threading.Thread(target=populate)
+            self.populating[vm].start()
+        else:
+            populate()
+
+    def clear_cc_mount(self, vm):
+        # the mount has to be done populating before it can be torn down
+        if vm in self.populating:
+            self.populating.pop(vm).join()
+
+        path = self.mounts.pop(vm)
+        shutil.rmtree(self.roots[vm])
+        shutil.copytree(path, self.roots[vm])
+
+        for entry in os.listdir(path):
+            full = os.path.join(path, entry)
+            if os.path.isdir(full):
+                shutil.rmtree(full)
+            else:
+                os.remove(full)
+
+        with self.lock:
+            self.active_mounts -= 1
+
+    # --- qos ---
+
+    def qos_add_loss(self, vm, interface, percent):
+        return self._run("qos", "add", vm, interface, "loss", percent)
+
+    def qos_add_delay(self, vm, interface, duration):
+        return self._run("qos", "add", vm, interface, "delay", duration)
+
+    def qos_add_rate(self, vm, interface, bw, unit):
+        return self._run("qos", "add", vm, interface, "rate", bw, unit)
+
+    def clear_qos(self, vm, interface):
+        return self._run("clear", "qos", vm, interface)
+
+    # --- reading command files ---
+
+    def _read_line(self, line):
+        # like minimega, stop reading at the first command that fails
+        if line in self.read_errors:
+            self._pending = []
+            self.moreResponses = False
+            raise minimega.Error(self.read_errors[line])
+
+        self.commands.append(line)
+
+    def read(self, path):
+        if self.moreResponses:
+            raise minimega.Error("more responses to be read from last command")
+
+        lines = Path(path).read_text().splitlines()
+        self.reads.append(lines)
+
+        # respond to the first command and stream the rest
+        self._read_line(lines[0])
+        self._pending = lines[1:]
+        self.moreResponses = bool(self._pending)
+
+        return [{"Response": "", "Error": ""}]
+
+    def streamResponses(self):
+        self.moreResponses = False
+        pending, self._pending = self._pending, []
+
+        for i, line in enumerate(pending):
+            self._read_line(line)
+
+            if i < len(pending) - self.missing_responses:
+                yield [{"Response": "", "Error": ""}]
+
+
+@pytest.fixture
+def host_data():
+    """
+    Function returning fake minimega `host` data for a host and poll number.
+    """
+
+    return fake_host_data
+
+
+@pytest.fixture
+def fake_minimega():
+    """
+    The FakeMinimega class, to create fake minimega connections with.
+    """
+
+    return FakeMinimega
+
+
+@pytest.fixture
+def scorch_component(tmp_path, monkeypatch):
+    """
+    Returns a function that builds a scorch component through its constructor
+    (which runs the stage), passing the experiment on stdin and the stage
+    arguments on the command line like scorch does.
+
+    The experiment has the given topology nodes and a scorch app with one
+    component of the given type and metadata. If mm is given, it's used as the
+    component's minimega connection.
+    """
+
+    phenix_dir = tmp_path / "phenix"
+
+    monkeypatch.setattr(settings, "PHENIX_LOG_FILE", None)
+    monkeypatch.setattr(scorch_app, "PHENIX_DIR", str(phenix_dir))
+    monkeypatch.setenv("PHENIX_FILES_DIR", str(tmp_path / "files"))
+
+    # phenix creates the experiment's images directory
+    (phenix_dir / "images" / "exp").mkdir(parents=True)
+
+    def build(cls, typ: str, stage: str, metadata: dict, nodes: list = (), mm=None, name: str | None = None, count: int = 0):
+        name = name or typ
+
+        experiment = {
+            "spec": {
+                "experimentName": "exp",
+                "baseDir": str(tmp_path / "exp"),
+                "topology": {"nodes": list(nodes)},
+                "scenario": {
+                    "apps": [
+                        {
+                            "name": "scorch",
+                            "metadata": {"components": [{"name": name, "type": typ, "metadata": metadata}]},
+                        }
+                    ]
+                },
+            },
+        }
+
+        monkeypatch.setattr(sys, "argv", [f"phenix-scorch-component-{typ}", stage, name, "0", "0", str(count)])
+        monkeypatch.setattr(sys, "stdin", io.StringIO(json.dumps(experiment)))
+
+        if mm is not None:
+            monkeypatch.setattr(ComponentBase, "mm_init", lambda self, namespaced=True: mm)
+
+        return cls()
+
+    return build
@@ -1,5 +1,6 @@
 import argparse
 import copy
+import gc
 import os
 import re
 import sys
@@ -7,7 +8,7 @@ from typing import Any, Optional
 
 from box import Box
 
-from phenix_apps.common import settings, utils
+from phenix_apps.common import lazy_box, settings, utils
 from phenix_apps.common.logger import logger, configure_logging
 
 
@@ -22,8 +23,11 @@ class AppBase(object):
         # Keep this around just in case apps want direct access to it.
         self.raw_input = sys.stdin.read()
 
+        # Subtrees of the experiment are only wrapped in Box objects when
+        # they're first accessed, which keeps startup fast for large
+        # experiments.
         try:
-            self.experiment = Box.from_json(self.raw_input)
+            self.experiment = lazy_box.loads(self.raw_input)
         except Exception:
             try:
                 self.experiment = Box.from_yaml(self.raw_input)
@@ -52,7 +56,7 @@ class AppBase(object):
         self.templates_dir = utils.abs_path(py_path, "templates")
 
     @classmethod
-    def main(cls, name: str):
+    def main(cls, name: str, freeze_gc: bool = False):
         parser = argparse.ArgumentParser(description=f"phenix user app: {name}")
         parser.add_argument(
             "stage", choices=cls.valid_stages, help="Lifecycle stage to execute"
@@ -67,14 +71,17 @@ class AppBase(object):
         configure_logging(force_console=dryrun)
 
         app = cls(name, args.stage, dryrun)
+
+        # When the app is the whole process, the experiment lives until exit,
+        # so the garbage collector doesn't need to keep rescanning it.
+        if freeze_gc:
+            gc.freeze()
+
         app.execute_stage()
         app.finalize()
 
         # Output the experiment JSON (standard Phenix app behavior)
-        if app.dryrun:
-            print(app.experiment.to_json(indent=2))
-        else:
-            print(app.experiment.to_json())
+        lazy_box.dump(app.experiment, sys.stdout, indent=2 if app.dryrun else None)
 
         return app
 
@@ -116,46 +123,163 @@ class AppBase(object):
             if app.name == name:
                 return app
 
+    def _topology_index(self, rebuild: bool = False) -> dict:
+        """
+        Lookup indexes over the topology nodes and this app's hosts, built on
+        first use and kept up to date by add_node, add_label and add_annotation.
+
+        Node indexes hold positions in the topology node list so lookups that
+        return multiple nodes can preserve topology order. Hostname and IP
+        lookups check their result against the node and rebuild the indexes
+        when it doesn't match or is missing, so hostnames and interfaces can
+        also be changed directly. Labels and annotations should be added with
+        add_label and add_annotation.
+        """
+
+        nodes = self.experiment.spec.topology.nodes
+        index = getattr(self, "_index", None)
+
+        # Rebuild if the topology was replaced or modified outside of add_node.
+        if not rebuild and index and index["nodes"] is nodes and index["count"] == len(nodes):
+            return index
+
+        index = {
+            "nodes": nodes,
+            "count": 0,
+            "hostname": {},  # hostname -> position
+            "ip": {},  # IP address -> hostname
+            "labels": {},  # label key -> set of positions
+            "annotations": {},  # annotation key -> set of positions
+        }
+
+        self._index = index
+
+        for pos in range(len(nodes)):
+            self._index_node(pos)
+
+        return index
+
+    def _app_hosts_index(self, rebuild: bool = False) -> dict:
+        """
+        Hostname index over the hosts in this app's Scenario metadata, built on
+        first use. Like the topology index, it's rebuilt when the hosts list is
+        replaced or its length changes, and lookups check their result against
+        the host to catch hostnames changed directly.
+        """
+
+        hosts = self.app.get("hosts", [])
+        index = getattr(self, "_hosts_index", None)
+
+        if not rebuild and index and index["hosts"] is hosts and index["count"] == len(hosts):
+            return index
+
+        index = {
+            "hosts": hosts,
+            "count": len(hosts),
+            "hostname": {},  # hostname -> app host
+        }
+
+        for host in hosts:
+            index["hostname"].setdefault(host.hostname, host)
+
+        self._hosts_index = index
+
+        return index
+
+    def _index_node(self, pos: int) -> None:
+        index = self._index
+        node = index["nodes"][pos]
+
+        index["hostname"].setdefault(node.general.hostname, pos)
+        index["count"] = max(index["count"], pos + 1)
+
+        network = node.get("network") or {}
+
+        for i in network.get("interfaces") or []:
+            if "address" in i:
+                index["ip"].setdefault(i["address"], node.general.hostname)
+
+        for attribute in ("labels", "annotations"):
+            for key in node.get(attribute) or {}:
+                index[attribute].setdefault(key, set()).add(pos)
+
+    def _app_node(self, host: Box, copy_: bool = False) -> Box:
+        """
+        Merge an app host with its topology node. Unless copy_ is set, the
+        result is a read-only view that shares its values with the experiment
+        instead of copying them. Nothing in it can be changed, at any depth,
+        including the topology node.
+        """
+
+        topo_node = self.extract_node(host.hostname)
+
+        if copy_:
+            node = copy.deepcopy(host)
+            node.update({"topology": topo_node})
+
+            return node
+
+        node = lazy_box.frozen_view(host)
+        dict.__setitem__(node, "topology", topo_node)
+
+        return node
+
     def extract_node(
         self, hostname: str, wildcard: bool = False
     ) -> Box | list[Box] | None:
-        regex = re.compile(hostname)
-        extracted = []
+        if wildcard:
+            regex = re.compile(hostname)
 
-        for node in self.experiment.spec.topology.nodes:
-            if wildcard:
-                if regex.match(node.general.hostname):
-                    extracted.append(node)
-            else:
-                if node.general.hostname == hostname:
-                    return node
+            return [
+                node for node in self.experiment.spec.topology.nodes
+                if regex.match(node.general.hostname)
+            ]
 
-        if wildcard:
-            return extracted
-        else:
+        nodes = self.experiment.spec.topology.nodes
+        pos = self._topology_index()["hostname"].get(hostname)
+
+        if pos is None or nodes[pos].general.hostname != hostname:
+            # The node may have been renamed (or another node renamed to this
+            # hostname) since the index was built.
+            pos = self._topology_index(rebuild=True)["hostname"].get(hostname)
+
+        if pos is None:
             return None
 
+        return nodes[pos]
+
     def extract_topology_nodes_by_attribute(
         self, attribute: str, vals: str | list[str]
     ) -> list[Box]:
-        hosts = []
-
         if isinstance(vals, str):
             vals = [vals]
 
-        for node in self.experiment.spec.topology.nodes:
-            node_attribute = node.get(attribute, {})
+        index = self._topology_index()
+        nodes = self.experiment.spec.topology.nodes
 
-            # Could be a null entry in the JSON schema.
-            if not node_attribute:
-                continue
+        if attribute not in ("labels", "annotations"):
+            hosts = []
 
-            for val in node_attribute.keys():
-                if val in vals:
-                    hosts.append(node)
-                    break
+            for node in nodes:
+                node_attribute = node.get(attribute, {})
 
-        return hosts
+                # Could be a null entry in the JSON schema.
+                if not node_attribute:
+                    continue
+
+                for val in node_attribute.keys():
+                    if val in vals:
+                        hosts.append(node)
+                        break
+
+            return hosts
+
+        positions = set()
+
+        for val in vals:
+            positions.update(index[attribute].get(val, ()))
+
+        return [nodes[pos] for pos in sorted(positions)]
 
     def extract_annotated_topology_nodes(
         self, annotations: str | list[str]
@@ -176,77 +300,87 @@ class AppBase(object):
         return self.extract_topology_nodes_by_attribute("labels", labels)
 
     def extract_app_node(
-        self, hostname: str, include_missing: bool = True
+        self, hostname: str, include_missing: bool = True, copy: bool = False
     ) -> Box | None:
-        for host in self.app.get("hosts", []):
-            if host.hostname == hostname:
-                topo_node = self.extract_node(hostname)
+        """
+        Return the host in this app's "hosts" matching "hostname", merged with
+        its Topology node under the "topology" key.
 
-                if not topo_node and not include_missing:
-                    continue
+        The returned node is read-only unless "copy" is True.
+        """
 
-                node = copy.deepcopy(host)
-                node.update({"topology": topo_node})
+        host = self._app_hosts_index()["hostname"].get(hostname)
 
-                return node
+        if host is None or host.hostname != hostname:
+            # The host may have been renamed (or another host renamed to this
+            # hostname) since the index was built.
+            host = self._app_hosts_index(rebuild=True)["hostname"].get(hostname)
 
-        return None
+        if host is None:
+            return None
+
+        if not include_missing and not self.extract_node(hostname):
+            return None
+
+        return self._app_node(host, copy)
 
-    def extract_all_nodes(self, include_missing: bool = True) -> list[Box]:
+    def extract_all_nodes(
+        self, include_missing: bool = True, copy: bool = False
+    ) -> list[Box]:
         """
         Extract Topology nodes with hostnames that match the hostname
         defined in the "hosts" attribute in the Scenario metadata
         for this app.
+
+        The returned nodes are read-only unless "copy" is True.
         """
 
         hosts = []
 
         for host in self.app.get("hosts", []):
-            topo_node = self.extract_node(host.hostname)
-
-            if not topo_node and not include_missing:
+            if not include_missing and not self.extract_node(host.hostname):
                 continue
 
-            node = copy.deepcopy(host)
-            node.update({"topology": topo_node})
-
-            hosts.append(node)
+            hosts.append(self._app_node(host, copy))
 
         return hosts
 
     def extract_nodes_type(
-        self, types: str | list[str], include_missing: bool = True
+        self, types: str | list[str], include_missing: bool = True, copy: bool = False
     ) -> list[Box]:
         """
         Extract Topology nodes with hostnames that match the hostname
         defined in the "hosts" attribute in the Scenario metadata
         for this app and have the type/types matching the "type"
         field in the Scenario metadata.
-        """
 
-        hosts = []
+        The returned nodes are read-only unless "copy" is True.
+        """
 
         if isinstance(types, str):
             types = [types]
 
-        for host in self.app.get("hosts", []):
-            node_type = host.metadata.get("type", None)
+        types = set(types)
+        hosts = []
 
-            if node_type in types:
-                topo_node = self.extract_node(host.hostname)
+        # Types are matched while iterating over the app hosts (which keeps
+        # their order across types) rather than indexed, so types changed in
+        # place are always picked up.
+        for host in self.app.get("hosts", []):
+            md = host.get("metadata") or {}
 
-                if not topo_node and not include_missing:
-                    continue
+            if md.get("type", None) not in types:
+                continue
 
-                node = copy.deepcopy(host)
-                node.update({"topology": topo_node})
+            if not include_missing and not self.extract_node(host.hostname):
+                continue
 
-                hosts.append(node)
+            hosts.append(self._app_node(host, copy))
 
         return hosts
 
     def extract_nodes_label(
-        self, labels: str | list[str], include_missing: bool = True
+        self, labels: str | list[str], include_missing: bool = True, copy: bool = False
     ) -> list[Box]:
         """
         Extract Topology nodes that match values in the "labels" attribute for each
@@ -254,6 +388,8 @@ class AppBase(object):
 
         Note that this is *different* from "labels" in the Topology metadata,
         use "extract_labelled_topology_nodes" for those.
+
+        The returned nodes are read-only unless "copy" is True.
         """
 
         hosts = []
@@ -265,37 +401,19 @@ class AppBase(object):
             node_labels = host.metadata.get("labels", [])
 
             if isinstance(node_labels, str):
-                if node_labels in labels:
-                    topo_node = self.extract_node(host.hostname)
-
-                    if not topo_node and not include_missing:
-                        continue
-
-                    node = copy.deepcopy(host)
-                    node.update({"topology": topo_node})
-
-                    hosts.append(node)
+                matched = node_labels in labels
             elif isinstance(node_labels, list):
-                if any(item in node_labels for item in labels):
-                    topo_node = self.extract_node(host.hostname)
-
-                    if not topo_node and not include_missing:
-                        continue
-
-                    node = copy.deepcopy(host)
-                    node.update({"topology": topo_node})
-
-                    hosts.append(node)
-            elif str(node_labels) in labels:
-                topo_node = self.extract_node(host.hostname)
+                matched = any(item in node_labels for item in labels)
+            else:
+                matched = str(node_labels) in labels
 
-                if not topo_node and not include_missing:
-                    continue
+            if not matched:
+                continue
 
-                node = copy.deepcopy(host)
-                node.update({"topology": topo_node})
+            if not include_missing and not self.extract_node(host.hostname):
+                continue
 
-                hosts.append(node)
+            hosts.append(self._app_node(host, copy))
 
         return hosts
 
@@ -332,31 +450,45 @@ class AppBase(object):
         if ":" in address:
             address, _ = address.split(":", 1)
 
-        nodes = self.experiment.spec.topology.nodes
+        hostname = self._topology_index()["ip"].get(address)
 
-        for node in nodes:
-            for i in node.network.interfaces:
-                if "address" in i and i["address"] == address:
-                    return node.general.hostname
+        if hostname is None or not self._has_address(hostname, address):
+            # Interfaces may have been changed since the index was built.
+            hostname = self._topology_index(rebuild=True)["ip"].get(address)
 
-        return None
+        return hostname
 
-    def add_node(self, new_node: Box | dict, overwrite: bool = False) -> None:
-        found = None
+    def _has_address(self, hostname: str, address: str) -> bool:
+        pos = self._index["hostname"].get(hostname)
+
+        if pos is None:
+            return False
+
+        node = self._index["nodes"][pos]
+
+        if node.general.hostname != hostname:
+            return False
 
-        for idx, node in enumerate(self.experiment.spec.topology.nodes):
-            if node.general.hostname == new_node["general"]["hostname"]:
-                found = idx
-                break
+        network = node.get("network") or {}
+
+        return any(i.get("address") == address for i in network.get("interfaces") or [])
+
+    def add_node(self, new_node: Box | dict, overwrite: bool = False) -> None:
+        index = self._topology_index()
+        nodes = self.experiment.spec.topology.nodes
+        found = index["hostname"].get(new_node["general"]["hostname"])
 
         # If we didn't find an existing node, just append the new node.
         # If there is an existing node and the overwrite arg is set,
         # overwrite it with the new node, otherwise do nothing. Check
         # if found is None since found (idx) could be 0.
         if found is None:
-            self.experiment.spec.topology.nodes.append(new_node)
+            nodes.append(new_node)
+            self._index_node(len(nodes) - 1)
         elif overwrite:
-            self.experiment.spec.topology.nodes[found] = Box(new_node)
+            nodes[found] = Box(new_node)
+            # The replaced node may have had other addresses, labels, etc.
+            self._index = None
 
     def add_annotation(self, hostname: str, key: str, value: Any) -> None:
         node = self.extract_node(hostname)
@@ -371,6 +503,9 @@ class AppBase(object):
         annotations[key] = value
         node["annotations"] = annotations
 
+        pos = self._index["hostname"][hostname]
+        self._index["annotations"].setdefault(key, set()).add(pos)
+
     def add_label(self, hostname: str, key: str, value: str) -> None:
         node = self.extract_node(hostname)
 
@@ -384,6 +519,9 @@ class AppBase(object):
         labels[key] = value
         node["labels"] = labels
 
+        pos = self._index["hostname"][hostname]
+        self._index["labels"].setdefault(key, set()).add(pos)
+
     def add_inject(self, hostname: str, inject: Box | dict) -> None:
         node = self.extract_node(hostname)
 
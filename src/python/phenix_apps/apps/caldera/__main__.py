@@ -1,7 +1,7 @@
 from .app import Caldera
 
 def main():
-    Caldera.main("caldera")
+    Caldera.main("caldera", freeze_gc=True)
 
 if __name__ == "__main__":
     main()
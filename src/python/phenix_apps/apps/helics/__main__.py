@@ -1,7 +1,7 @@
 from .app import Helics
 
 def main():
-    Helics.main("helics")
+    Helics.main("helics", freeze_gc=True)
 
 if __name__ == "__main__":
     main()
@@ -1,7 +1,7 @@
 from .app import OTSim
 
 def main():
-    OTSim.main('ot-sim')
+    OTSim.main('ot-sim', freeze_gc=True)
 
 if __name__ == "__main__":
     main()
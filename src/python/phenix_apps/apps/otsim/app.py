@@ -130,7 +130,8 @@ class OTSim(AppBase):
     # Field device, assumed to use the I/O module that acts as a HELICS
     # federate. Will use default I/O federate provided in app metadata if
     # not provided as part of the device name(s).
-    servers = self.extract_nodes_type('fd-server', False)
+    # copy, since device names in the metadata get namespaced below
+    servers = self.extract_nodes_type('fd-server', False, copy=True)
     broker_addr_wait = {} # {broker_addr:wait_file}
 
     for server in servers:
@@ -65,10 +65,36 @@ DEFAULT_INFRASTRUCTURES = {
 }
 
 
+# (infrastructure, frozen mappings) --> merged infrastructure mappings
+_MERGED = {}
+
+
+def _freeze(value):
+  # Hashable version of (possibly nested) metadata, keeping key order since
+  # merged mappings keep it too.
+  if isinstance(value, dict):
+    return tuple((k, _freeze(v)) for k, v in value.items())
+
+  if isinstance(value, list):
+    return ('__list__',) + tuple(_freeze(v) for v in value)
+
+  return value
+
+
 def merge_infrastructure_with_default(infra, mappings):
   # Merge provided infrastructure mappings (if any) with default infrastructure
   # mappings (if any). Note that this only goes two levels deep (which is all
   # that's needed right now).
+  #
+  # Merged mappings are cached per infrastructure and provided mappings, so the
+  # returned mappings are shared and must not be modified.
+  key = (infra, _freeze(mappings))
+
+  try:
+    return _MERGED[key]
+  except KeyError:
+    pass
+
   merged = copy.deepcopy(DEFAULT_INFRASTRUCTURES.get(infra, {}))
 
   for k, v in mappings.items():
@@ -77,9 +103,47 @@ def merge_infrastructure_with_default(infra, mappings):
     else:
       merged[k] = v
 
+  _MERGED[key] = merged
+
   return merged
 
 
+# (id(merged mappings), device type) --> I/O module variables. Merged mappings
+# are cached for the life of the process, so their IDs are never reused.
+_IO_VARIABLES = {}
+
+
+def _io_variables(mapping, type):
+  """
+  Returns (variable, subscription type, publication type) for each variable of
+  the given infrastructure device type. The publication type is None for
+  variables that can't be written.
+  """
+  key = (id(mapping), type)
+
+  if key not in _IO_VARIABLES:
+    variables = []
+
+    for var, var_type in mapping[type].items():
+      # We don't care about scaling in the I/O module, so if the variable
+      # type is a dictionary convert it to a string (using its `type` entry)
+      # so the rest of the code can assume it's just a string.
+      if isinstance(var_type, dict):
+        var_type = var_type['type']
+
+      sub_type = 'double' if var_type in ['analog-read', 'analog-read-write'] else 'boolean'
+      pub_type = None
+
+      if var_type in ['analog-read-write', 'binary-read-write']:
+        pub_type = 'double' if var_type == 'analog-read-write' else 'boolean'
+
+      variables.append((var, sub_type, pub_type))
+
+    _IO_VARIABLES[key] = variables
+
+  return _IO_VARIABLES[key]
+
+
 class Infrastructure:
   def __init__(self, mappings):
     self.mappings = mappings
@@ -101,60 +165,30 @@ class Infrastructure:
 
       assert type in mapping
 
-      device   = mapping[type]
       tag_name = topic.split('/')[1]
 
-      for var, var_type in device.items():
-          # We don't care about scaling in the I/O module, so if the variable
-          # type is a dictionary convert it to a string (using its `type` entry)
-          # so the rest of the code can assume it's just a string.
-        if isinstance(var_type, dict):
-          var_type = var_type['type']
-
-        sub = ET.Element('subscription')
-
-        key = ET.SubElement(sub, 'key')
-        key.text = f'{topic}.{var}'
-
-        tag = ET.SubElement(sub, 'tag')
-        tag.text = f'{tag_name}.{var}'
+      for var, sub_type, pub_type in _io_variables(mapping, type):
+        sub = ET.SubElement(doc, 'subscription')
 
-        typ = ET.SubElement(sub, 'type')
+        ET.SubElement(sub, 'key').text  = f'{topic}.{var}'
+        ET.SubElement(sub, 'tag').text  = f'{tag_name}.{var}'
+        ET.SubElement(sub, 'type').text = sub_type
 
-        if var_type in ['analog-read', 'analog-read-write']:
-          typ.text = 'double'
-        else:
-          typ.text = 'boolean'
-
-        doc.append(sub)
-
-        if var_type in ['analog-read-write', 'binary-read-write']:
+        if pub_type:
           # `endpoint` will be False if disabled, otherwise it will be the name
           # of the endpoint to send updates to (prepended with the destination
           # federate name).
           if endpoint:
-            tag = ET.Element('tag')
-            tag.attrib['key'] = f'{tag_name}.{var}'
+            tag = ET.Element('tag', {'key': f'{tag_name}.{var}'})
             tag.text = f'{tag_name}.{var}'
 
             endpoints[endpoint].append(tag)
           else:
-            pub = ET.Element('publication')
-
-            key = ET.SubElement(pub, 'key')
-            key.text = f'{tag_name}.{var}'
-
-            tag = ET.SubElement(pub, 'tag')
-            tag.text = f'{tag_name}.{var}'
-
-            typ = ET.SubElement(pub, 'type')
-
-            if var_type == 'analog-read-write':
-              typ.text = 'double'
-            else:
-              typ.text = 'boolean'
+            pub = ET.SubElement(doc, 'publication')
 
-            doc.append(pub)
+            ET.SubElement(pub, 'key').text  = f'{tag_name}.{var}'
+            ET.SubElement(pub, 'tag').text  = f'{tag_name}.{var}'
+            ET.SubElement(pub, 'type').text = pub_type
 
     for name, tags in endpoints.items():
       endpoint = ET.Element('endpoint')
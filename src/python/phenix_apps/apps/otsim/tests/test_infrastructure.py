@@ -0,0 +1,60 @@
+"""
+Unit tests for ot-sim infrastructure mappings.
+"""
+
+import copy
+
+import lxml.etree as ET
+
+from phenix_apps.apps.otsim import infrastructure
+from phenix_apps.apps.otsim.infrastructure import DEFAULT_INFRASTRUCTURES, Infrastructure, merge_infrastructure_with_default
+
+
+def test_merge_is_memoized(mocker):
+    mocker.patch.dict(infrastructure._MERGED, clear=True)
+    deepcopy = mocker.spy(copy, "deepcopy")
+    defaults = copy.deepcopy(DEFAULT_INFRASTRUCTURES)
+    deepcopy.reset_mock()
+
+    overrides = {"bus": {"angle": "analog-read"}, "pump": {"flow": "analog-read"}}
+
+    merged = merge_infrastructure_with_default("power-distribution", overrides)
+
+    assert list(merged["bus"]) == ["voltage", "angle"]
+    assert merged["pump"] == {"flow": "analog-read"}
+
+    for _ in range(100):
+        assert merge_infrastructure_with_default("power-distribution", dict(overrides)) is merged
+
+    assert deepcopy.call_count == 1
+
+    # different overrides (or override order) get their own merged mappings
+    assert merge_infrastructure_with_default("power-distribution", {}) is not merged
+    assert list(merge_infrastructure_with_default("power-distribution", {"bus": {"angle": "analog-read", "voltage": "analog-read"}})["bus"]) == ["voltage", "angle"]
+    assert merge_infrastructure_with_default("power-distribution", {}) == DEFAULT_INFRASTRUCTURES["power-distribution"]
+
+    assert DEFAULT_INFRASTRUCTURES == defaults
+
+
+def test_io_module_xml():
+    infra = Infrastructure({"power-distribution": {"bus": {"setpt": {"type": "analog-read-write"}}}})
+    devices = {
+        "fed/bus-1": {"type": "bus", "endpoint": False},
+        "fed/breaker-1": {"type": "breaker", "endpoint": "fed/updates"},
+    }
+
+    for _ in range(2):
+        doc = ET.Element("io")
+        infra.io_module_xml(doc, "power-distribution", devices)
+
+        xml = ET.tostring(doc).decode()
+
+        assert xml.startswith(
+            "<io><subscription><key>fed/bus-1.voltage</key><tag>bus-1.voltage</tag><type>double</type></subscription>"
+            "<subscription><key>fed/bus-1.setpt</key><tag>bus-1.setpt</tag><type>double</type></subscription>"
+            "<publication><key>bus-1.setpt</key><tag>bus-1.setpt</tag><type>double</type></publication>"
+        )
+        assert "<key>fed/breaker-1.status</key><tag>breaker-1.status</tag><type>boolean</type>" in xml
+        assert xml.endswith(
+            '<endpoint name="fed/updates"><tag key="breaker-1.controls">breaker-1.controls</tag></endpoint></io>'
+        )
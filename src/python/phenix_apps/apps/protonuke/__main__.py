@@ -1,7 +1,7 @@
 from .app import Protonuke
 
 def main():
-    Protonuke.main("protonuke")
+    Protonuke.main("protonuke", freeze_gc=True)
 
 if __name__ == "__main__":
     main()
@@ -2,7 +2,7 @@ from phenix_apps.apps.scale.app import Scale
 
 
 def main():
-    Scale.main("scale")
+    Scale.main("scale", freeze_gc=True)
 
 
 if __name__ == "__main__":
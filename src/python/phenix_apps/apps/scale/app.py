@@ -297,6 +297,11 @@ echo 'DONE!'
         ]
         summary_rows = []
 
+        # Batched provisioning renders node scripts in parallel and pushes
+        # them to this many nodes per minimega call. Disabled when 0.
+        batch_size = int(self.metadata.get("batch_size", 0))
+        workers = int(self.metadata.get("workers", os.cpu_count() or 1))
+
         # Use stderr for progress to avoid interfering with stdout JSON output if any
         with Progress(console=Console(stderr=True)) as progress:
             for profile in profiles:
@@ -313,6 +318,7 @@ echo 'DONE!'
                 task = progress.add_task(
                     f"[cyan]Profile {profile.get('name', 'unknown')}", total=node_count
                 )
+                batch = []
 
                 for i in range(1, node_count + 1):
                     hostname = plugin.get_hostname(i)
@@ -368,27 +374,90 @@ echo 'DONE!'
                         plugin, "templates_dir", self.templates_dir
                     )
 
-                    with open(mm_config, "w") as file_:
-                        utils.mako_serve_template(
-                            template_name, plugin_templates_dir, file_, config=cfg
-                        )
+                    if batch_size > 0:
+                        # Rendered later, so copy the nets before their
+                        # starting IPs are increased below.
+                        cfg["NETS"] = [dict(net) for net in cfg["NETS"]]
+                        cfg["BULK_NETWORK"] = True
+
+                        job = (template_name, {"config": cfg}, mm_config)
+                        batch.append((hostname, plugin_templates_dir, job))
+                    else:
+                        with open(mm_config, "w") as file_:
+                            utils.mako_serve_template(
+                                template_name, plugin_templates_dir, file_, config=cfg
+                            )
 
-                    if not self.dryrun:
-                        mm.cc_filter(filter=f"name={hostname}")
-                        mm.cc_send(mm_config)
+                        if not self.dryrun:
+                            mm.cc_filter(filter=f"name={hostname}")
+                            mm.cc_send(mm_config)
+
+                        progress.update(task, advance=1)
 
                     # Increase all nets' starting IP for next loop
                     if net_info:
                         for net in net_info[1]:
                             net["addr"] += containers
 
-                    progress.update(task, advance=1)
+                if batch:
+                    self._provision_batch(
+                        None if self.dryrun else mm,
+                        batch,
+                        batch_size,
+                        workers,
+                        progress,
+                        task,
+                    )
 
         self._print_summary_table(summary_headers, summary_rows)
         logger.info(
             f"Ran post-start for user app: {self.name} with {len(profiles)} profiles",
         )
 
+    def _provision_batch(
+        self,
+        mm: minimega.minimega | None,
+        nodes: list[tuple[str, str, tuple[str, dict[str, Any], str]]],
+        batch_size: int,
+        workers: int,
+        progress: Progress,
+        task: Any,
+    ) -> None:
+        """Renders and sends minimega scripts for many nodes.
+
+        Scripts are rendered in parallel, then sent to up to `batch_size` nodes
+        per minimega call by reading a command file with the `cc filter` and
+        `cc send` commands for each node.
+
+        Args:
+            mm: minimega connection, or None for a dry run.
+            nodes: (hostname, templates dir, render job) for each node.
+            batch_size: nodes to send scripts to per minimega call.
+            workers: processes to render scripts with.
+            progress: progress display to advance as nodes are sent to.
+            task: progress task for the nodes' profile.
+        """
+        jobs = {}
+        for _, templates_dir, job in nodes:
+            jobs.setdefault(templates_dir, []).append(job)
+
+        for templates_dir, dir_jobs in jobs.items():
+            utils.mako_serve_many(templates_dir, dir_jobs, workers=workers)
+
+        commands = f"{self.app_dir}/post-start.mm"
+
+        for start in range(0, len(nodes), batch_size):
+            batch = nodes[start : start + batch_size]
+
+            if mm is not None:
+                lines = []
+                for hostname, _, job in batch:
+                    lines += [f"cc filter name={hostname}", f"cc send {job[2]}"]
+
+                utils.mm_read_commands(mm, commands, lines)
+
+            progress.update(task, advance=len(batch))
+
     def _print_summary_table(self, headers: list[str], rows: list[list[Any]]) -> None:
         if not rows:
             return
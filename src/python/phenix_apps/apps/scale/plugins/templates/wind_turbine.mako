@@ -39,6 +39,27 @@ vm launch
 
 vm start all
 
+% if config.get('BULK_NETWORK'):
+<%
+  # Configure every container's network with a single command rather than
+  # changing the cc filter for each container. Containers are matched by
+  # their hostname.
+  cases = []
+  for c_idx in range(config['COUNT']):
+    c_name = config['CONTAINER_HOSTNAMES'][c_idx]
+    c_ips = config['CONTAINER_IPS'][c_idx]
+    c_gw = config['CONTAINER_GATEWAYS'][c_idx]
+    cmds = [f"ip addr add {ip_addr} dev veth{idx}" for idx, ip_addr in enumerate(c_ips)]
+    if c_gw:
+      cmds.append(f"ip route add default via {c_gw}")
+    if cmds:
+      cases.append(f"{c_name}) {'; '.join(cmds)};;")
+%>
+% if cases:
+clear cc filter
+cc exec sh -c "case $(hostname) in ${' '.join(cases)} esac"
+% endif
+% else:
 % for i in range(config['START_INDEX'], config['COUNT'] + config['START_INDEX']):
 <%
   c_idx = i - config['START_INDEX']
@@ -53,4 +74,5 @@ cc exec ip addr add ${ip_addr} dev veth${idx}
 % if c_gw:
 cc exec ip route add default via ${c_gw}
 % endif
-% endfor
\ No newline at end of file
+% endfor
+% endif
@@ -348,10 +348,10 @@ class WindTurbine(ScalePlugin):
             # Write config
             config.to_file(f"{cfg_dir}/config.xml")
 
-        # Create tarball of configs
-        tgz_path = f"{self.app.exp_dir}/wind-configs.tgz"
-        with tarfile.open(tgz_path, "w:gz") as tar:
-            tar.add(self.app.app_dir, arcname=os.path.basename(self.app.app_dir))
+        # Create a tarball of this node's configs only. Each node's bundle is
+        # written exactly once, so configure time stays linear in the number
+        # of turbines instead of re-archiving every previous node's configs.
+        tgz_path = self._bundle_node_configs(hostname)
 
         # Inject tarball
         self.app.add_inject(
@@ -372,6 +372,21 @@ class WindTurbine(ScalePlugin):
             ]
             self.app.add_annotation(broker_host, "helics/federate", annotation)
 
+    def _bundle_node_configs(self, hostname: str) -> str:
+        """
+        Package the configs generated for a single node into its own tarball.
+        Paths inside the archive are rooted at the app directory name so the
+        VM still extracts them to /<app>/<hostname>/<i>/.
+        """
+        node_dir = f"{self.app.app_dir}/{hostname}"
+        arcname = f"{os.path.basename(self.app.app_dir)}/{hostname}"
+
+        tgz_path = f"{self.app.exp_dir}/wind-configs-{hostname}.tgz"
+        with tarfile.open(tgz_path, "w:gz") as tar:
+            tar.add(node_dir, arcname=arcname)
+
+        return tgz_path
+
     def _generate_main_controller(
         self,
         config: Config,
@@ -19,6 +19,9 @@ vm config volume ${dst} ${vol_src}
         name_tmpl = config.get('CONTAINER_NAME_TEMPLATE', '{}')
         name = name_tmpl.format(i)
     %>
+    % if config.get('BULK_NETWORK'):
+vm config hostname ${name}
+    % endif
 vm launch container ${name}
 % endfor
 
@@ -28,6 +31,25 @@ vm launch
 
 vm start all
 
+% if config.get('BULK_NETWORK'):
+<%
+    # Configure every container's network with a single command rather than
+    # changing the cc filter for each container. Containers are matched by
+    # their hostname, which is set to their name above.
+    cases = []
+    for i in range(config.get('START_INDEX', 0), config['COUNT'] + config.get('START_INDEX', 0)):
+        name = config.get('CONTAINER_NAME_TEMPLATE', '{}').format(i)
+        cmds = [f"ip addr add {net['addr'] + i}/{net['prefix']} dev veth{idx}" for idx, net in enumerate(config['NETS'])]
+        if config['NETS'] and config['GATEWAY']:
+            cmds.append(f"ip route add default via {config['GATEWAY']}")
+        if cmds:
+            cases.append(f"{name}) {'; '.join(cmds)};;")
+%>
+    % if cases:
+clear cc filter
+cc exec sh -c "case $(hostname) in ${' '.join(cases)} esac"
+    % endif
+% else:
 % for i in range(config.get('START_INDEX', 0), config['COUNT'] + config.get('START_INDEX', 0)):
     <%
         name_tmpl = config.get('CONTAINER_NAME_TEMPLATE', '{}')
@@ -41,3 +63,4 @@ cc exec ip addr add ${str(net['addr']+i)}/${net['prefix']} dev veth${idx}
 cc exec ip route add default via ${config['GATEWAY']}
     % endif
 % endfor
+% endif
@@ -3,7 +3,9 @@ Unit tests for the Scale logic and plugin compliance.
 """
 
 import importlib
+import ipaddress as ip
 import pkgutil
+from pathlib import Path
 from unittest.mock import MagicMock
 
 import pytest
@@ -164,6 +166,108 @@ def test_post_start_logic(mocker):
     mock_mm_conn.cc_send.assert_any_call("/tmp/files/node-1.mm")
 
 
+class StreamingMinimega:
+    """
+    Stand-in for a minimega connection that, like minimega, streams back a
+    response for each command in a file it reads, and refuses new commands
+    until they've all been read.
+    """
+
+    def __init__(self):
+        self.reads = []
+        self.moreResponses = False
+        self._pending = 0
+
+    def _run(self, *args):
+        if self.moreResponses:
+            raise RuntimeError("more responses to be read from last command")
+
+        return [{"Response": "", "Error": ""}]
+
+    def read(self, path):
+        resp = self._run("read", path)
+
+        lines = Path(path).read_text().splitlines()
+        self.reads.append(lines)
+
+        self._pending = len(lines) - 1
+        self.moreResponses = self._pending > 0
+
+        return resp
+
+    def streamResponses(self):
+        self.moreResponses = False
+
+        for _ in range(self._pending):
+            yield [{"Response": "", "Error": ""}]
+
+    def cc_filter(self, filter):
+        raise AssertionError("cc filter should only be set from command files")
+
+    def cc_send(self, path):
+        raise AssertionError("cc send should only be issued from command files")
+
+
+def test_post_start_batched(mocker, tmp_path):
+    """Test post_start renders node scripts and sends them in batches."""
+    mocker.patch("phenix_apps.apps.scale.app.logger")
+    mocker.patch("phenix_apps.apps.scale.app.Progress")
+    mock_minimega = mocker.patch("phenix_apps.apps.scale.app.minimega")
+    mocker.patch("phenix_apps.apps.scale.app.Scale.__init__", return_value=None)
+
+    mock_mm_conn = StreamingMinimega()
+    mock_minimega.connect.return_value = mock_mm_conn
+
+    app = Scale()
+    app.name = "scale"
+    app.exp_name = "test_exp"
+    app.app_dir = str(tmp_path)
+    app.files_dir = str(tmp_path)
+    app.templates_dir = str(Path(__file__).parents[1] / "templates")
+    app.metadata = {
+        "name": "default",
+        "plugin": "builtin",
+        "count": 5,
+        "batch_size": 2,
+        "workers": 2,
+    }
+    app.dryrun = False
+    app._print_summary_table = MagicMock()
+
+    mock_plugin = MagicMock()
+    mock_plugin.get_node_count.return_value = 5
+    mock_plugin.get_hostname.side_effect = lambda i: f"node-{i}"
+    mock_plugin.get_container_count.return_value = 2
+    mock_plugin.get_template_name.return_value = "minimega.mako"
+    mock_plugin.templates_dir = app.templates_dir
+    app._get_plugin_instance = MagicMock(return_value=mock_plugin)
+
+    nets = [{"addr": ip.IPv4Address("10.0.0.0"), "prefix": 24}]
+    app._process_networks = MagicMock(return_value=("test_exp,100", nets))
+    app._get_gateway = MagicMock(return_value="10.0.0.254")
+
+    app.post_start()
+
+    commands = mock_mm_conn.reads
+    assert len(commands) == 3
+    assert commands[0] == [
+        "cc filter name=node-1", f"cc send {tmp_path}/node-1.mm",
+        "cc filter name=node-2", f"cc send {tmp_path}/node-2.mm",
+    ]
+    assert commands[2] == ["cc filter name=node-5", f"cc send {tmp_path}/node-5.mm"]
+
+    # Each node's containers get the next addresses, as they do unbatched.
+    script = (tmp_path / "node-3.mm").read_text()
+    assert "vm config hostname 2\nvm launch container 2" in script
+    assert "cc filter name=" not in script
+    assert (
+        'cc exec sh -c "case $(hostname) in '
+        "1) ip addr add 10.0.0.5/24 dev veth0; ip route add default via 10.0.0.254;; "
+        "2) ip addr add 10.0.0.6/24 dev veth0; ip route add default via 10.0.0.254;; "
+        'esac"'
+    ) in script
+
+
 def test_discover_plugins(mocker):
     """Test that _discover_plugins method correctly imports modules based on metadata."""
     mocker.patch("phenix_apps.apps.scale.app.logger")
@@ -1,3 +1,4 @@
+import tarfile
 from unittest.mock import MagicMock
 
 import pytest
@@ -206,10 +207,64 @@ def test_on_node_configured(wind_turbine, mocker):
     assert mock_config_instance.to_file.call_count == 6
 
     # 3. Check tarball creation
-    mock_tarfile.assert_called_with("/tmp/exp_dir/wind-configs.tgz", "w:gz")
+    mock_tarfile.assert_called_with("/tmp/exp_dir/wind-configs-test-wtg-1.tgz", "w:gz")
+    mock_tarfile.return_value.__enter__.return_value.add.assert_called_with(
+        "/tmp/app_dir/test-wtg-1", arcname="app_dir/test-wtg-1"
+    )
 
     # 4. Check injection
     mock_app.add_inject.assert_any_call(
         hostname="test-wtg-1",
-        inject={"src": "/tmp/exp_dir/wind-configs.tgz", "dst": "/wind-configs.tgz"},
+        inject={
+            "src": "/tmp/exp_dir/wind-configs-test-wtg-1.tgz",
+            "dst": "/wind-configs.tgz",
+        },
     )
+
+
+def test_configure_bundles_scale_linearly(wind_turbine, mocker, tmp_path):
+    """Test that a 1,000 turbine configure archives each node's configs once."""
+    plugin, mock_app = wind_turbine
+    mock_app.app_dir = str(tmp_path / "scale")
+    mock_app.exp_dir = str(tmp_path)
+    mock_app._process_networks.return_value = ("net_str", [])
+    mock_app._get_gateway.return_value = None
+
+    count = 1000
+    profile = {
+        "name": "big-wtg",
+        "count": count,
+        "container_template": {"external_network": {"name": "EXT"}},
+    }
+    plugin.pre_configure(mock_app, profile)
+
+    # Write a tiny placeholder instead of rendering the full ot-sim XML.
+    mock_config_cls = mocker.patch("phenix_apps.apps.scale.plugins.wind_turbine.Config")
+    mock_config_cls.return_value.to_file.side_effect = lambda path: open(
+        path, "w"
+    ).close()
+
+    archived = []
+
+    def add(self, name, *args, **kwargs):
+        archived.append(kwargs.get("arcname") or name)
+        return original_add(self, name, *args, **kwargs)
+
+    original_add = tarfile.TarFile.add
+    mocker.patch.object(tarfile.TarFile, "add", add)
+
+    node_count = plugin.get_node_count()
+    for i in range(1, node_count + 1):
+        plugin.on_node_configured(mock_app, i, plugin.get_hostname(i))
+
+    # Each node archives its own directory, one directory per container and
+    # one config per container. Re-archiving the whole app directory for
+    # every node would make this grow quadratically with the turbine count.
+    per_node = 1 + 2 * plugin.config.containers_per_node
+    assert node_count == count
+    assert len(archived) == node_count * per_node
+
+    with tarfile.open(tmp_path / "wind-configs-big-wtg-1000.tgz") as tar:
+        names = tar.getnames()
+    assert "scale/big-wtg-1000/6/config.xml" in names
+    assert all(n.startswith("scale/big-wtg-1000") for n in names)
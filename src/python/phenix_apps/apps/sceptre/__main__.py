@@ -1,7 +1,7 @@
 from .app import Sceptre
 
 def main():
-    Sceptre.main("sceptre")
+    Sceptre.main("sceptre", freeze_gc=True)
 
 if __name__ == "__main__":
     main()
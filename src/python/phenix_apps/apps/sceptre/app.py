@@ -15,7 +15,7 @@ class Sceptre(AppBase):
     def __init__(self, name: str, stage: str, dryrun: bool = False) -> None:
         super().__init__(name, stage, dryrun)
 
-        self.eprint(self.stage)
+        logger.debug(f"sceptre stage: {self.stage}")
 
         self.startup_dir: str = f"{self.exp_dir}/startup"
         self.sceptre_dir: str = f"{self.exp_dir}/sceptre"
@@ -25,6 +25,35 @@ class Sceptre(AppBase):
         os.makedirs(self.sceptre_dir, exist_ok=True)
         os.makedirs(self.elk_dir, exist_ok=True)
 
+        # Renders (path --> job) and chmods put off until the end of pre-start
+        # when configs are being rendered by worker processes.
+        self._render_jobs: Optional[Dict[str, tuple]] = None
+        self._chmods: list = []
+
+    def render(self, template_name: str, file_path: str, **kwargs) -> str:
+        if self._render_jobs is None:
+            return super().render(template_name, file_path, **kwargs)
+
+        # Only the last render of a path is kept, same as when rendering each
+        # one straight away.
+        self._render_jobs.pop(file_path, None)
+        self._render_jobs[file_path] = (template_name, kwargs, file_path)
+
+        return file_path
+
+    def chmod(self, file_path: str, mode: Optional[int] = None) -> None:
+        """
+        Sets the mode of the given file, or just makes it executable by its
+        owner if no mode is given, once any pending render of it is written.
+        """
+
+        if self._render_jobs is not None:
+            self._chmods.append((file_path, mode))
+        elif mode is None:
+            utils.mark_executable(file_path)
+        else:
+            os.chmod(file_path, mode)
+
     def find_override(self, filename: str) -> Optional[Dict[str, str]]:
         # Note, asset_dir must be declared in the scenario.yaml to work correctly
         overrideFile = f"{self.asset_dir}/injects/override/{filename}"
@@ -52,7 +81,7 @@ class Sceptre(AppBase):
 
         startup_file = f"{self.startup_dir}/{device.hostname}-start{ext}"
         self.render("sceptre_start.mako", startup_file, **kwargs)
-        utils.mark_executable(startup_file)
+        self.chmod(startup_file)
 
     def add_sceptre_startup_injects_windows(self, hostname: str) -> None:
         """
@@ -565,14 +594,41 @@ class Sceptre(AppBase):
                 self.add_inject(hostname=elk[0].hostname, inject=kwargs)
 
     def pre_start(self):
+        # With workers > 1, config files are rendered by that many worker
+        # processes once every inject and annotation has been added, so the
+        # experiment and files come out the same whatever the number of
+        # workers. Only template rendering is done in parallel.
+        workers = int(self.metadata.get("workers", 1))
+
+        if workers <= 1:
+            self._pre_start()
+            return
+
+        self._render_jobs = {}
+        self._chmods = []
+
+        try:
+            self._pre_start()
+
+            jobs = list(self._render_jobs.values())
+            logger.info(f"rendering {len(jobs)} sceptre config files with {workers} workers")
+        finally:
+            self._render_jobs = None
+
+        utils.mako_serve_many(self.templates_dir, jobs, workers=workers)
+
+        for file_path, mode in self._chmods:
+            self.chmod(file_path, mode)
+
+    def _pre_start(self):
         # Write sceptre startup script injections
         scheduler_file = f"{self.startup_dir}/sceptre-startup-scheduler.cmd"
         self.render("sceptre-startup-scheduler.mako", scheduler_file)
-        os.chmod(scheduler_file, 0o0777)
+        self.chmod(scheduler_file, 0o0777)
 
         startup_file = f"{self.startup_dir}/sceptre-startup.ps1"
         self.render("sceptre-startup.mako", startup_file)
-        os.chmod(startup_file, 0o777)
+        self.chmod(startup_file, 0o777)
 
         fd_configs = []
         # Add hil tags that are listed in the provider metadata
@@ -581,10 +637,16 @@ class Sceptre(AppBase):
 
 
         ######################## Provider pre-start ###################################
-        providers    = self.extract_nodes_type("provider")
+        # copy, since provider metadata gets updated below for the YAML config
+        providers    = self.extract_nodes_type("provider", copy=True)
         provider_map = {}
         objects_file_path = None
 
+        # if ignition hmi is being used, providers need to sleep and field
+        # devices need to restart
+        ignition_labeled = bool(self.extract_nodes_label("ignition"))
+        ignition_typed   = bool(self.extract_nodes_type("ignition"))
+
         for provider in providers:
             if "metadata" not in provider:
                 logger.warning(f"No metadata for provider '{provider.hostname}', skipping...")
@@ -603,7 +665,7 @@ class Sceptre(AppBase):
                     "publish_endpoint": pub_endpoint,
                     # if ignition hmi is being used, provider needs to sleep
                     # labels: - ignition
-                    "needsleep": True if self.extract_nodes_label("ignition") else False,
+                    "needsleep": ignition_labeled,
                 }
             )
 
@@ -817,7 +879,7 @@ class Sceptre(AppBase):
                 kwargs={
                     "name": sceptre_type,
                     # type: ignition
-                    "needrestart": True if self.extract_nodes_type("ignition") else False,
+                    "needrestart": ignition_typed,
                 }
             )
 
@@ -863,6 +925,9 @@ class Sceptre(AppBase):
         # Write helics federate config file injections
         feds = self.extract_nodes_label("helics-federate")
 
+        # group fd config registers by provider once for all federates
+        helics_config = configs.HelicsConfig(fd_server_configs) if feds else None
+
         for fed in feds:
             vm_dir = f"{self.sceptre_dir}/{fed.hostname}"
             os.makedirs(vm_dir, exist_ok=True)
@@ -887,56 +952,19 @@ class Sceptre(AppBase):
                 config['real_time'] = 'true' if helics_md['real_time'] else 'false'
             if 'end_time' in helics_md:
                 config['end_time'] = helics_md['end_time']
-            input_regs = ['analog-input', 'binary-input', 'input-register',
-                          'discrete-input']
             config['subs'] = []
             config['pubs'] = []
             config['ends'] = []
             if md.get('simulator', None) == 'Helics':
-                # get all possible [<provider>/]<tag>,<type> from fd configs
-                subs = [(
-                    f'{f"{c.provider}/" if r.regtype in input_regs else ""}'
-                    f'{r.devname}.{r.field},'
-                    f'{"bool" if r.fieldtype.split("-")[0] == "binary" else "double"}')
-                    for _,c in fd_server_configs.items() \
-                        for p in c.protocols \
-                            for d in p.devices \
-                                for r in d.registers if r.regtype in input_regs]
-                # remove duplicates and sort list
-                subs = sorted(list(dict.fromkeys(subs)))
-                config['subs'] = subs
-                # get all possible <tag>,<provider>/<tag> from fd configs
-                ends = [(
-                    f'{r.devname}.{r.field},'
-                    f'{c.provider}/{r.devname}.{r.field}')
-                    for _,c in fd_server_configs.items() \
-                        for p in c.protocols \
-                            for d in p.devices \
-                                for r in d.registers]
-                # remove duplicates and sort list
-                ends = sorted(list(dict.fromkeys(ends)))
-                config['ends'] = ends
+                # all possible <provider>/<tag>,<type> and <tag>,<provider>/<tag>
+                # from fd configs
+                config['subs'] = list(helics_config.subs)
+                config['ends'] = list(helics_config.ends)
             else:
-                # get all possible <tag>,<type> from fd configs
-                pubs = [(
-                    f'{r.devname}.{r.field},'
-                    f'{"bool" if r.fieldtype.split("-")[0] == "binary" else "double"}')
-                    for _,c in fd_server_configs.items() \
-                        for p in c.protocols \
-                            for d in p.devices \
-                                for r in d.registers if c.provider == config['name']]
-                # remove duplicates and sort list
-                pubs = sorted(list(dict.fromkeys(pubs)))
-                config['pubs'] = pubs
-                # get all possible <tag> from fd configs
-                ends = [f'{r.devname}.{r.field}'
-                    for _,c in fd_server_configs.items() \
-                        for p in c.protocols \
-                            for d in p.devices \
-                                for r in d.registers if c.provider == config['name']]
-                # remove duplicates and sort list
-                ends = sorted(list(dict.fromkeys(ends)))
-                config['ends'] = ends
+                # all possible <tag>,<type> and <tag> from fd configs for this
+                # provider
+                config['pubs'] = helics_config.pubs_for(config['name'])
+                config['ends'] = helics_config.ends_for(config['name'])
             # add any additional pubs/subs/ends (e.g. new sub for interdependency logic)
             if 'publications' in helics_md:
                 config['pubs'].extend(
@@ -1112,6 +1140,7 @@ class Sceptre(AppBase):
                 devices_by_protocol=parsed.devices_by_protocol,
                 publish_endpoint=pub_endpoint,
                 server_endpoint=srv_endpoint,
+                device_subtype=fd_.metadata.get("subtype", "single"),
                 reg_config=reg_config,
                 counter=fep_counter,
             )
@@ -1135,7 +1164,7 @@ class Sceptre(AppBase):
         fdlist_file = f"{self.elk_dir}/fdlist.json"
         with open(fdlist_file, "w") as file_:
             json.dump(fdlist, file_)
-        utils.mark_executable(fdlist_file)
+        self.chmod(fdlist_file)
 
         # we already read in all the providers at the start so no need to re-read them
         for provider in providers:
@@ -1145,7 +1174,7 @@ class Sceptre(AppBase):
                 provider_restart_file,
                 ip=provider.topology.network.interfaces[0].address,
             )
-            utils.mark_executable(provider_restart_file)
+            self.chmod(provider_restart_file)
 
         gtmap = []
         for fd_config in fd_server_configs.values():
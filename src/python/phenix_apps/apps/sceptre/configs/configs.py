@@ -59,7 +59,11 @@ def get_fdconfig_class(infrastructure: str) -> type:
                     protocols_list.append(Protocol(
                         protocol, devices_by_protocol[protocol], base_class, self.reg_config
                     ))
-            infra.Register.reset_addresses()
+            # assign addresses in the order registers were generated
+            allocator = infra.AddressAllocator()
+            for protocol in protocols_list:
+                for device in protocol.devices:
+                    device.assign_addresses(allocator)
             return protocols_list
 
     return FieldDeviceConfig
@@ -246,3 +250,55 @@ class HistorianConfig:
                     if tag_list:
                         topic_name = channel.name + "_" + device_name
                         self.tags[topic_name] = tag_list
+
+
+class HelicsConfig:
+    INPUT_REGS = ['analog-input', 'binary-input', 'input-register', 'discrete-input']
+
+    def __init__(self, fd_configs: dict):
+        """Collect the HELICS subscriptions, publications and endpoints for
+        federates from every field device register in a single pass, so
+        building each federate's config doesn't walk every register again.
+
+        Each list is de-duplicated and sorted.
+
+        Args:
+            fd_configs (dict): Field device configs, keyed by hostname
+        """
+        subs = {}
+        ends = {}
+        provider_pubs = {}
+        provider_ends = {}
+
+        for fd_config in fd_configs.values():
+            provider = fd_config.provider
+            pubs_ = provider_pubs.setdefault(provider, {})
+            ends_ = provider_ends.setdefault(provider, {})
+
+            for protocol in fd_config.protocols:
+                for device in protocol.devices:
+                    for register in device.registers:
+                        tag = f'{register.devname}.{register.field}'
+                        type_ = 'bool' if register.fieldtype.split('-')[0] == 'binary' else 'double'
+
+                        if register.regtype in HelicsConfig.INPUT_REGS:
+                            subs[f'{provider}/{tag},{type_}'] = None
+
+                        ends[f'{tag},{provider}/{tag}'] = None
+                        pubs_[f'{tag},{type_}'] = None
+                        ends_[tag] = None
+
+        # <provider>/<tag>,<type> for each input register
+        self.subs = sorted(subs)
+        # <tag>,<provider>/<tag> for each register
+        self.ends = sorted(ends)
+        # provider --> <tag>,<type> for each of the provider's registers
+        self.provider_pubs = {k: sorted(v) for k, v in provider_pubs.items()}
+        # provider --> <tag> for each of the provider's registers
+        self.provider_ends = {k: sorted(v) for k, v in provider_ends.items()}
+
+    def pubs_for(self, provider: str) -> list:
+        return list(self.provider_pubs.get(provider, []))
+
+    def ends_for(self, provider: str) -> list:
+        return list(self.provider_ends.get(provider, []))
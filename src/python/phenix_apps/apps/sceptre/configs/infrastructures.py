@@ -601,6 +601,12 @@ class Device(Infrastructure):
                                 self.device_type, self.protocol, self.range,self.reg_config)
                 self.registers.append(fd_register)
 
+    def assign_addresses(self, allocator) -> None:
+        for register in self.registers:
+            # SunSpec registers are addressed by their SunSpec device
+            if isinstance(register, Register):
+                allocator.assign(register, self.reg_config)
+
 
 class Register:
     TYPE = {}
@@ -626,9 +632,6 @@ class Register:
     TYPE['iec60870-5-104'] = {
         'analog-read': 'analog-input', 'analog-read-write': 'analog-output',
         'binary-read': 'binary-input', 'binary-read-write': 'binary-output'}
-    addresses = {'dnp3': 0, 'dnp3-serial': 0, 'bacnet': 0, 'iec60870-5-104': 1,
-        'input-register': 30000, 'holding-register': 40000, 'discrete-input': 10000,
-        'coil': 0, 'float-point': 1000, 'single-point': 3000}
 
     def __init__(self, devname, field, fieldtype, devtype, protocol, range_, reg_config):
         self.devname = devname
@@ -639,37 +642,66 @@ class Register:
         self.devtype = devtype
         self.range = range_
 
-        # Protocol-wide register numbers used for DNP3 registers
-        if not bool(reg_config):
-            if 'dnp3' in self.protocol or 'bacnet' in self.protocol or 'iec60870-5-104' in self.protocol:
-                self.addr = type(self).addresses[self.protocol]
-                type(self).addresses[self.protocol] += 1
-            else:
-                self.addr = type(self).addresses[self.regtype]
-                type(self).addresses[self.regtype] += 1
-        else:
+        # Assigned by the field device's AddressAllocator, using reg_config
+        self.addr = None
+
+
+class AddressAllocator:
+    """Assigns register addresses for a single field device, in the order its
+    registers are assigned.
+
+    Addresses count up from a starting address per protocol (DNP3, BACnet and
+    IEC 60870-5-104) or per register type (Modbus). A register listed in its
+    device's manual register config moves the count to its configured
+    register number.
+    """
+
+    ADDRESSES = {'dnp3': 0, 'dnp3-serial': 0, 'bacnet': 0, 'iec60870-5-104': 1,
+        'input-register': 30000, 'holding-register': 40000, 'discrete-input': 10000,
+        'coil': 0, 'float-point': 1000, 'single-point': 3000}
+
+    FIELD_TYPES = ['analog-read', 'analog-read-write', 'binary-read', 'binary-read-write']
+
+    def __init__(self):
+        self.addresses = dict(type(self).ADDRESSES)
+        # id(reg_config) --> (reg_config, index of its register numbers)
+        self.__indexes = {}
+
+    def __index(self, reg_config) -> dict:
+        entry = self.__indexes.get(id(reg_config))
+
+        if entry is None:
+            index = {}
+
             for config in reg_config:
-                if self.fieldtype in config.keys() and self.devname == config["name"] and self.devtype == config["type"]:
-                    for item in config[self.fieldtype]:
-                        if self.field == item['field'] and self.regtype == item['register_type']:
-                            register_number = item["register_number"]
-                            if 'dnp3' in self.protocol or 'bacnet' in self.protocol or 'iec60870-5-104' in self.protocol:
-                                self.addr = type(self).addresses[self.protocol]
-                                type(self).addresses[self.protocol] = register_number
-                            else:
-                                self.addr = type(self).addresses[self.regtype]
-                                type(self).addresses[self.regtype] = register_number
-
-            # DEFAULT: if something isn't right
-            if 'dnp3' in self.protocol or 'bacnet' in self.protocol or 'iec60870-5-104' in self.protocol:
-                self.addr = type(self).addresses[self.protocol]
-                type(self).addresses[self.protocol] += 1
-            else:
-                self.addr = type(self).addresses[self.regtype]
-                type(self).addresses[self.regtype] += 1
+                for fieldtype in type(self).FIELD_TYPES:
+                    if fieldtype not in config.keys():
+                        continue
 
-    @staticmethod
-    def reset_addresses():
-        Register.addresses = {'dnp3': 0, 'dnp3-serial': 0, 'bacnet': 0, 'iec60870-5-104': 1, 'input-register': 30000,
-        'holding-register': 40000, 'discrete-input': 10000, 'coil': 0,
-        'float-point': 1000, 'single-point': 3000}
+                    for item in config[fieldtype]:
+                        key = (config["name"], config["type"], fieldtype, item['field'], item['register_type'])
+                        # the last matching item wins
+                        index[key] = item["register_number"]
+
+            # keep a reference so the ID isn't reused while it's cached
+            entry = self.__indexes[id(reg_config)] = (reg_config, index)
+
+        return entry[1]
+
+    def assign(self, register: Register, reg_config) -> int:
+        if 'dnp3' in register.protocol or 'bacnet' in register.protocol or 'iec60870-5-104' in register.protocol:
+            key = register.protocol
+        else:
+            key = register.regtype
+
+        if reg_config:
+            index = self.__index(reg_config)
+            key_  = (register.devname, register.devtype, register.fieldtype, register.field, register.regtype)
+
+            if key_ in index:
+                self.addresses[key] = index[key_]
+
+        register.addr = self.addresses[key]
+        self.addresses[key] += 1
+
+        return register.addr
@@ -2,11 +2,16 @@
 This is a "dependacy free" implementaion of a register-map genrator, only using
 native python modules. This module simple takes in a field device config and
 genrates an XML file that can be read my Microsoft Excel."
+
+Rows are written to the file as they're added, so memory use doesn't grow with
+the number of registers. RegMapGen is a context manager: the workbook goes to
+a temporary file that only replaces the register map once it's complete.
 '''
 
 import xml.etree.ElementTree as ET
 import datetime
 import json
+import os
 class RegMapGen():
     def __init__(cls, exp_dir, exp,filename="excel.xml", num_cols="11", num_rows="591"):
         wb_attrib = {"xmlns":"urn:schemas-microsoft-com:office:spreadsheet",
@@ -138,6 +143,41 @@ class RegMapGen():
         item = ET.SubElement(cls.wo, "ProtectScenarios")
         item.text= "False"
 
+        # Stream the workbook: everything up to the end of the table is
+        # written on entry, each row is written as it's added and the rest is
+        # written by write() on a clean exit.
+        cls.head, cls.tail = ET.tostring(cls.workbook).decode('utf-8').split('</Table>', 1)
+        cls.tail = '</Table>' + cls.tail
+
+        cls.path = f'{cls.exp_dir}analytics/register_map_{cls.exp}.xml'
+        cls.tmp_path = f'{cls.path}.tmp'
+        cls.file = None
+
+    def __enter__(cls):
+        cls.file = open(cls.tmp_path, 'w')
+        try:
+            cls.file.write('<?xml version="1.0"?>')
+            cls.file.write('<?mso-application progid="Excel.Sheet"?>')
+            cls.file.write(cls.head)
+        except BaseException:
+            cls.file.close()
+            os.remove(cls.tmp_path)
+            raise
+        return cls
+
+    def __exit__(cls, exc_type, exc, tb):
+        done = False
+        try:
+            if exc_type is None:
+                cls.write()
+                cls.file.close()
+                os.replace(cls.tmp_path, cls.path)
+                done = True
+        finally:
+            if not done:
+                cls.file.close()
+                os.remove(cls.tmp_path)
+
     def add_cell(cls,row,ss_sid,ss_type,data,md="",index=""):
         cell_attri ={}
         cell_attri["ss:StyleID"]=ss_sid
@@ -165,16 +205,19 @@ class RegMapGen():
         ET.SubElement(style, "Protection")
 
     def write(cls):
-        # create a new XML file with the results
-        mydata = ET.tostring(cls.workbook).decode('utf-8')
-        with open(f'{cls.exp_dir}analytics/register_map_{cls.exp}.xml', 'w') as f:
-            f.write('<?xml version="1.0"?>')
-            f.write('<?mso-application progid="Excel.Sheet"?>')
-            f.write(mydata)
+        # finish the XML file with the results
+        cls.file.write(cls.tail)
+
+    def add_row(cls):
+        # rows are written to the file by new_row rather than kept in the table
+        return ET.Element("Row",attrib={"ss:Height":"14"})
+
+    def write_row(cls,row):
+        cls.file.write(ET.tostring(row).decode('utf-8'))
 
     def new_row(cls,regs,i,proto=[],dev=[],ip=""):
         if i ==0 and dev != []:
-            row = ET.SubElement(cls.table,"Row",attrib={"ss:Height":"14"})
+            row = cls.add_row()
             if cls.fd_bit:
                 cls.add_cell(row,"field_device_dark","String",dev[0],md=str(dev[1]),index="2")
                 cls.fd_bit = not cls.fd_bit
@@ -210,7 +253,7 @@ class RegMapGen():
                 cls.attr_bit = not cls.attr_bit
 
         elif proto !=[]:
-            row = ET.SubElement(cls.table,"Row",attrib={"ss:Height":"14"})
+            row = cls.add_row()
 
             if cls.ip_bit:
                 cls.add_cell(row,"ip_proto_dark","String",proto[0],md=str(proto[1]),index="4")
@@ -239,7 +282,7 @@ class RegMapGen():
                 cls.attr_bit = not cls.attr_bit
 
         else:
-            row = ET.SubElement(cls.table,"Row",attrib={"ss:Height":"14"})
+            row = cls.add_row()
 
             if cls.attr_bit:
                 cls.add_cell(row,"small_dark","String",regs["device"],index="5")
@@ -260,73 +303,83 @@ class RegMapGen():
                 cls.add_cell(row,"small_light","String",regs["data"])
                 cls.attr_bit = not cls.attr_bit
 
+        cls.write_row(row)
+
 def generate_file(fd_configs, exp_dir, exp):
-    number_of_regs=0
     ## Get the number of registers so we can configure the worksheet
     ## to support the correct number of rows
-    for _, field_dev  in fd_configs.items():
-        for _, regs in  field_dev.registers.items():
-            for _ in regs:
-                number_of_regs+=1
+    number_of_regs = sum(len(regs) for field_dev in fd_configs.values() for regs in field_dev.registers.values())
 
     ## Initialize workbook
-    wb = RegMapGen(exp_dir, exp, num_rows=str((number_of_regs + 10)))
-
-    ## Loop through every device in the experiemnt
-    for name, field_dev  in fd_configs.items():
-        fd_addr= field_dev.ipaddr
-        protos={}
-
-        ## Generate a map containg protocols and their associated registers
-        for devname, regs in  field_dev.registers.items():
-            for reg in regs:
-                if reg.protocol.lower() == "modbus":
-                    scale = reg.range
-                else:
-                    scale = 'N/A'
-                if reg.protocol in protos:
-                    protos[reg.protocol].append({"device":devname,"device_type":reg.devtype,"register_number":reg.addr, "rw":reg.fieldtype,"scale":scale,"data":reg.field,"register_type":reg.regtype})
-                else:
-                    protos[reg.protocol] = []
-                    protos[reg.protocol].append({"device":devname,"device_type":reg.devtype,"register_number":reg.addr, "rw":reg.fieldtype,"scale":scale,"data":reg.field,"register_type":reg.regtype})
-
-        total_reg_cnt = 0
-        protos_names = list(protos)
-
-        ## Get the register count for the current device for formatting
-        for key, regs in protos.items():
-            total_reg_cnt += len(regs)
-
-        ## For each protocol in current device we want to properly create rows in our table
-        for key, regs in protos.items():
-            i=0
-            for reg in sorted(regs,key=lambda k:k['register_number']):
-
-                if i ==0:
-                    if len(protos_names) == len(protos.items()):
-                        wb.new_row(reg,i,[key.upper(),(len(protos[key])-1)],[name.upper(),(total_reg_cnt-1)],ip=fd_addr)
-                    else :
-                        wb.new_row(reg,i,[key.upper(),(len(protos[key])-1)])
-                else:
-                    wb.new_row(reg,i)
-                i+=1
-            protos_names.pop()
-    wb.write()
-
-def update_config(config,fd,devname,protocol,fieldtype,field,register_number,regtype):
-    for i in range(len(config["nodes"])):
-        if (config["nodes"][i]["general"]["hostname"] == fd):
-            if "manual_register_config" not in config["nodes"][i]["metadata"].keys():
-                config["nodes"][i]["metadata"]["manual_register_config"] = "False"
-            if "connected_rtus" in config["nodes"][i]["metadata"].keys():
-                continue
-            for j in range(len(config["nodes"][i]["metadata"][protocol])):
-                if config["nodes"][i]["metadata"][protocol][j]["name"] == devname:
-                    if fieldtype in config["nodes"][i]["metadata"][protocol][j]:
-                        config["nodes"][i]["metadata"][protocol][j][fieldtype].append({"field":field,"register_number":register_number,"register_type":regtype})
+    with RegMapGen(exp_dir, exp, num_rows=str((number_of_regs + 10))) as wb:
+        ## Loop through every device in the experiemnt
+        for name, field_dev  in fd_configs.items():
+            fd_addr= field_dev.ipaddr
+            protos={}
+
+            ## Generate a map containg protocols and their associated registers
+            for devname, regs in  field_dev.registers.items():
+                for reg in regs:
+                    if reg.protocol.lower() == "modbus":
+                        scale = reg.range
+                    else:
+                        scale = 'N/A'
+                    protos.setdefault(reg.protocol, []).append({"device":devname,"device_type":reg.devtype,"register_number":reg.addr, "rw":reg.fieldtype,"scale":scale,"data":reg.field,"register_type":reg.regtype})
+
+            ## Get the register count for the current device for formatting
+            total_reg_cnt = sum(len(regs) for regs in protos.values())
+
+            ## For each protocol in current device we want to properly create rows in our table
+            for p, (key, regs) in enumerate(protos.items()):
+                for i, reg in enumerate(sorted(regs,key=lambda k:k['register_number'])):
+                    if i ==0:
+                        if p == 0:
+                            wb.new_row(reg,i,[key.upper(),(len(regs)-1)],[name.upper(),(total_reg_cnt-1)],ip=fd_addr)
+                        else :
+                            wb.new_row(reg,i,[key.upper(),(len(regs)-1)])
                     else:
-                        config["nodes"][i]["metadata"][protocol][j][fieldtype] = []
-                        config["nodes"][i]["metadata"][protocol][j][fieldtype].append({"field":field,"register_number":register_number,"register_type":regtype})
+                        wb.new_row(reg,i)
+
+class _ConfigIndex():
+    '''
+    Looks up topology nodes by hostname, and their protocol devices by name,
+    without scanning every node for each register.
+    '''
+
+    def __init__(cls, config):
+        cls.nodes = {}
+        for node in config["nodes"]:
+            cls.nodes.setdefault(node["general"]["hostname"], []).append(node)
+        # (id(node), protocol) --> device name --> devices
+        cls.devices = {}
+
+    def get_nodes(cls, hostname):
+        return cls.nodes.get(hostname, [])
+
+    def get_devices(cls, node, protocol, devname):
+        key = (id(node), protocol)
+        if key not in cls.devices:
+            devices = {}
+            for device in node["metadata"][protocol]:
+                devices.setdefault(device["name"], []).append(device)
+            cls.devices[key] = devices
+        return cls.devices[key].get(devname, [])
+
+
+def update_config(config,fd,devname,protocol,fieldtype,field,register_number,regtype,index=None):
+    if index is None:
+        index = _ConfigIndex(config)
+    for node in index.get_nodes(fd):
+        if "manual_register_config" not in node["metadata"].keys():
+            node["metadata"]["manual_register_config"] = "False"
+        if "connected_rtus" in node["metadata"].keys():
+            continue
+        for device in index.get_devices(node, protocol, devname):
+            if fieldtype in device:
+                device[fieldtype].append({"field":field,"register_number":register_number,"register_type":regtype})
+            else:
+                device[fieldtype] = []
+                device[fieldtype].append({"field":field,"register_number":register_number,"register_type":regtype})
     return config
 
 
@@ -337,11 +390,11 @@ def generate_json(topology,topo_dir,fd_configs,experiment_directory):
     '''
     with open(f'{topo_dir}{topology}.json') as topo:
         config = json.load(topo)
+    index = _ConfigIndex(config)
     for devconfig  in fd_configs:
         for proto in devconfig.protocols:
             for dev in proto.devices:
                 for reg in dev.registers:
-                    config = update_config(config,devconfig.name,reg.devname,proto.protocol,reg.fieldtype,reg.field,reg.addr,reg.regtype)
+                    config = update_config(config,devconfig.name,reg.devname,proto.protocol,reg.fieldtype,reg.field,reg.addr,reg.regtype,index)
     with open('{}/ConfigWithCustomRegs.json'.format(experiment_directory), 'w') as f:
-        f.write(json.dumps(config, indent=4))
-    
+        json.dump(config, f, indent=4)
@@ -1,7 +1,88 @@
-import random, string
+import hashlib, json, os, random, string, tempfile, threading
 import xml.etree.ElementTree as ET
 
+import phenix_apps.common.settings as settings
 import phenix_apps.common.utils as utils
+from phenix_apps.common.logger import logger
+
+
+MODELS_DIR = utils.abs_path(__file__, 'models/smdx')
+
+# Process-wide cache of parsed SunSpec models, keyed by model ID. Each model is
+# a (name, id, len, points) tuple, where points is a list of (id, type, len,
+# sf) tuples from all of the model's blocks, in order.
+_MODELS      = {}
+_MODELS_LOCK = threading.Lock()
+
+
+def _parse_model(path):
+    model  = ET.ElementTree(file=path).getroot().find('model')
+    points = [
+        (point.get('id'), point.get('type'), point.get('len'), point.get('sf'))
+        for block in model.findall('block') # model 126 has multiple block elements defined
+        for point in block
+    ]
+
+    return (model.get('name'), model.get('id'), model.get('len'), points)
+
+
+def _load_model(path, cache_dir):
+    """ Parses the given SMDX file, using the precompiled form in the given
+    cache directory if there's one for the file's current contents, and
+    precompiling it there otherwise.
+    """
+    if not cache_dir:
+        return _parse_model(path)
+
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    name   = os.path.splitext(os.path.basename(path))[0]
+    cached = os.path.join(cache_dir, f'{name}-{digest}.json')
+
+    try:
+        with open(cached) as f:
+            name_, id_, len_, points = json.load(f)
+            return (name_, id_, len_, [tuple(point) for point in points])
+    except (OSError, ValueError):
+        pass
+
+    model = _parse_model(path)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # write to a temporary file first so concurrent runs never see a
+        # partial file
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(model, f)
+        os.replace(tmp, cached)
+    except OSError as ex:
+        logger.warning(f'unable to cache SunSpec model {name} in {cache_dir}: {ex}')
+
+    return model
+
+
+def get_model(model_id, cache_dir=None):
+    """ Returns the parsed SunSpec model with the given ID.
+
+    Each model file is only parsed once per process. Set
+    PHENIX_SUNSPEC_CACHE_DIR (or pass `cache_dir`) to also keep precompiled
+    models on disk, keyed by the hash of the model file.
+    """
+    model_id = int(model_id)
+
+    with _MODELS_LOCK:
+        model = _MODELS.get(model_id)
+
+        if model is None:
+            if cache_dir is None:
+                cache_dir = settings.PHENIX_SUNSPEC_CACHE_DIR
+
+            model = _MODELS[model_id] = _load_model(f'{MODELS_DIR}/smdx_{model_id:05d}.xml', cache_dir)
+
+    return model
 
 
 class SunSpecDevice:
@@ -37,11 +118,16 @@ class SunSpecDevice:
 
         # Start the SunSpec register address at 40002 because
         # the sunspec_template automatically injects the well-known
-        # SunSpec device map identifier 'SunS' at register 40000. We
-        # initialize the address here because multiple SunSpec device
-        # configurations can be generated in a single phēnix run, and
-        # each configuration should start out at 40002.
-        SunSpecDevice.Register.address = 40002
+        # SunSpec device map identifier 'SunS' at register 40000. Each
+        # device keeps its own address so multiple SunSpec device
+        # configurations can be generated in a single phēnix run, each
+        # starting out at 40002.
+        self.address = SunSpecDevice.Register.START_ADDRESS
+
+    def add_register(self, *args) -> None:
+        register = SunSpecDevice.Register(self.infra, self.devname, *args, addr=self.address)
+        self.address += SunSpecDevice.Register.sizes[register.fieldtype]
+        self.registers.append(register)
 
 
     def generate_registers(self, models):
@@ -52,42 +138,29 @@ class SunSpecDevice:
         models : array
             Integer array of SunSpec models to create registers for.
         """
-        base_path = utils.abs_path(__file__, '../../')
-
         for model_id in models:
-            xml_file  = f'smdx_{int(model_id):05d}.xml'
-            model = ET.ElementTree(file=f'{base_path}/protocols/sunspec/models/smdx/{xml_file}').getroot()
-            model = model.find('model')
-
-            register = SunSpecDevice.Register(self.infra, self.devname, model.get('name'), 'uint16', model.get('id'))
-            self.registers.append(register)
+            name, id_, len_, points = get_model(model_id)
 
-            register = SunSpecDevice.Register(self.infra, self.devname, 'length', 'uint16', model.get('len'))
-            self.registers.append(register)
+            self.add_register(name, 'uint16', id_)
+            self.add_register('length', 'uint16', len_)
 
-            blocks = model.findall('block')
-            for block in blocks: # model 126 has multiple block elements defined
-                for point in block:
-                    name      = point.get('id')
-                    fieldtype = point.get('type')
-                    field     = None
-                    scaling   = point.get('sf') # Will return `None` if point doesn't have a scaling factor
+            for name, fieldtype, length, scaling in points: # `scaling` is `None` if point doesn't have a scaling factor
+                field = None
 
-                    # The SCEPTRE Bennu RTU expects string elements to indicate
-                    # the base-8 length of the string (ie. `string8`, `string16`).
-                    if fieldtype == 'string':
-                        fieldtype = f"string{point.get('len')}"
+                # The SCEPTRE Bennu RTU expects string elements to indicate
+                # the base-8 length of the string (ie. `string8`, `string16`).
+                if fieldtype == 'string':
+                    fieldtype = f"string{length}"
 
-                    if model_id == 1: # common block -- set some static values
-                        if name == 'Mn':
-                            field = 'Sandia SCEPTRE'
-                        elif name == 'Md':
-                            field = 'SunSpec RTU'
-                        elif name == 'SN': # generate random string for serial number
-                            field = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(32))
+                if model_id == 1: # common block -- set some static values
+                    if name == 'Mn':
+                        field = 'Sandia SCEPTRE'
+                    elif name == 'Md':
+                        field = 'SunSpec RTU'
+                    elif name == 'SN': # generate random string for serial number
+                        field = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(32))
 
-                    register = SunSpecDevice.Register(self.infra, self.devname, name, fieldtype, field, scaling)
-                    self.registers.append(register)
+                self.add_register(name, fieldtype, field, scaling)
 
 
     class Register:
@@ -145,9 +218,9 @@ class SunSpecDevice:
         # Start the SunSpec register address at 40002 because the
         # sunspec_template automatically injects the well-known SunSpec device
         # map identifier 'SunS' at register 40000.
-        address = 40002
+        START_ADDRESS = 40002
 
-        def __init__(self, infra, devname, name, fieldtype, field = None, scaling = None):
+        def __init__(self, infra, devname, name, fieldtype, field = None, scaling = None, addr = START_ADDRESS):
             self.devname   = devname
             self.name      = name
             self.fieldtype = fieldtype
@@ -163,7 +236,7 @@ class SunSpecDevice:
                 self.scaling = type(self).scalings[scaling]
 
             self.regtype = "register"
-            self.addr    = type(self).address
+            self.addr    = addr
             self.static  = False
 
             if field is not None:
@@ -187,5 +260,3 @@ class SunSpecDevice:
                     # value set to it's default disabled value of '0', so it's
                     # OK to just have it in this section of the if-statement.
                     if fieldtype == 'pad': self.fieldtype = 'int16'
-
-            type(self).address += type(self).sizes[self.fieldtype]
@@ -0,0 +1,176 @@
+"""
+Unit tests for the sceptre config builders.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from phenix_apps.apps.sceptre.configs import configs
+from phenix_apps.apps.sceptre.configs.configs import HelicsConfig
+
+
+FIELDTYPES = [
+    ("analog-input", "analog-read"),
+    ("binary-input", "binary-read"),
+    ("analog-output", "analog-read-write"),
+    ("binary-output", "binary-read-write"),
+]
+
+
+def _model(providers, fds, registers):
+    """
+    Returns fd configs spread over the given number of providers with the
+    given number of registers each. Tags repeat across field devices, like
+    shared buses do in real models.
+    """
+
+    configs = {}
+
+    for i in range(fds):
+        regs = []
+
+        for j in range(registers):
+            regtype, fieldtype = FIELDTYPES[j % len(FIELDTYPES)]
+            regs.append(
+                SimpleNamespace(
+                    devname=f"dev-{(i * registers + j) // 8 % (fds * registers // 10)}",
+                    field=f"field-{j % 8}",
+                    fieldtype=fieldtype,
+                    regtype=regtype,
+                )
+            )
+
+        device = SimpleNamespace(registers=regs)
+        protocol = SimpleNamespace(devices=[device])
+
+        configs[f"fd-{i}"] = SimpleNamespace(provider=f"provider-{i % providers}", protocols=[protocol])
+
+    return configs
+
+
+def _reference(fd_configs, name, helics):
+    # the nested comprehensions sceptre used to build each federate's config with
+    input_regs = HelicsConfig.INPUT_REGS
+    regs = [(c, r) for c in fd_configs.values() for p in c.protocols for d in p.devices for r in d.registers]
+    type_ = lambda r: "bool" if r.fieldtype.split("-")[0] == "binary" else "double"
+
+    if helics:
+        subs = [f"{c.provider}/{r.devname}.{r.field},{type_(r)}" for c, r in regs if r.regtype in input_regs]
+        ends = [f"{r.devname}.{r.field},{c.provider}/{r.devname}.{r.field}" for c, r in regs]
+        return sorted(dict.fromkeys(subs)), [], sorted(dict.fromkeys(ends))
+
+    pubs = [f"{r.devname}.{r.field},{type_(r)}" for c, r in regs if c.provider == name]
+    ends = [f"{r.devname}.{r.field}" for c, r in regs if c.provider == name]
+    return [], sorted(dict.fromkeys(pubs)), sorted(dict.fromkeys(ends))
+
+
+def test_helics_config_matches_reference():
+    fd_configs = _model(providers=5, fds=40, registers=20)
+    helics = HelicsConfig(fd_configs)
+
+    assert (helics.subs, [], helics.ends) == _reference(fd_configs, None, True)
+
+    for name in ["provider-0", "provider-3", "nope"]:
+        assert ([], helics.pubs_for(name), helics.ends_for(name)) == _reference(fd_configs, name, False)
+
+    # federates extend their lists, which mustn't change the shared ones
+    helics.pubs_for("provider-0").append("extra,double")
+    assert "extra,double" not in helics.pubs_for("provider-0")
+
+
+class CountingDevice:
+    """
+    Device that counts how many times its registers are walked.
+    """
+
+    def __init__(self, registers):
+        self._registers = registers
+        self.walks = 0
+
+    @property
+    def registers(self):
+        self.walks += 1
+        return self._registers
+
+
+def test_helics_config_walks_registers_once():
+    # 100 federates (one per provider) over 20k registers
+    fd_configs = _model(providers=100, fds=400, registers=50)
+
+    devices = []
+    for fd_config in fd_configs.values():
+        protocol = fd_config.protocols[0]
+        protocol.devices = [CountingDevice(protocol.devices[0].registers)]
+        devices.append(protocol.devices[0])
+
+    helics = HelicsConfig(fd_configs)
+    configs = [(helics.pubs_for(f"provider-{i}"), helics.ends_for(f"provider-{i}")) for i in range(100)]
+
+    # Building each federate's config used to walk every register again.
+    assert [d.walks for d in devices] == [1] * len(devices)
+
+    assert all(pubs and ends for pubs, ends in configs)
+    assert len(helics.ends) == len({(c.provider, r.devname, r.field) for c in fd_configs.values() for r in c.protocols[0].devices[0].registers})
+
+
+DEVICES = {
+    "dnp3": [{"type": "bus", "name": "bus-1"}, {"type": "generator", "name": "gen-1"}],
+    "modbus": [{"type": "load", "name": "load-1"}, {"type": "bus", "name": "bus-2"}],
+}
+
+
+def _addresses(fd_config):
+    return [
+        (p.protocol, d.device_name, r.field, r.regtype, r.addr)
+        for p in fd_config.protocols for d in p.devices for r in d.registers
+    ]
+
+
+def test_register_addresses():
+    cls = configs.get_fdconfig_class("power-transmission")
+    fd_config = cls("provider", "rtu-1", {}, DEVICES, "pub", "srv", "single", {}, 1)
+
+    addresses = _addresses(fd_config)
+
+    # DNP3 counts per protocol and Modbus per register type
+    assert [a[4] for a in addresses if a[0] == "dnp3"] == list(range(15))
+    assert [a[4] for a in addresses if a[3] == "input-register"][:3] == [30000, 30001, 30002]
+    assert [a[4] for a in addresses if a[3] == "coil"] == [0, 1]
+
+    # every field device starts from the same addresses
+    assert _addresses(cls("provider", "rtu-2", {}, DEVICES, "pub", "srv", "single", {}, 2)) == addresses
+
+    reg_config = {
+        "rtu-1": {
+            "modbus": [
+                {
+                    "name": "load-1",
+                    "type": "load",
+                    "analog-read": [
+                        {"field": "mw", "register_type": "input-register", "register_number": 30100},
+                        {"field": "mw", "register_type": "input-register", "register_number": 30200},
+                        {"field": "mvar", "register_type": "holding-register", "register_number": 7},
+                    ],
+                },
+            ],
+        },
+    }
+
+    fd_config = cls("provider", "rtu-1", {}, DEVICES, "pub", "srv", "single", reg_config, 1)
+    modbus = [(a[1], a[2], a[4]) for a in _addresses(fd_config) if a[3] == "input-register"]
+
+    # the last matching register number wins and later registers count on
+    # from it, while mismatched register types are ignored
+    assert modbus[:3] == [("load-1", "mw", 30200), ("load-1", "mvar", 30201), ("bus-2", "voltage", 30202)]
+
+
+def test_register_addresses_concurrent():
+    cls = configs.get_fdconfig_class("power-transmission")
+
+    def build(i):
+        return _addresses(cls("provider", f"rtu-{i}", {}, DEVICES, "pub", "srv", "single", {}, i))
+
+    serial = [build(i) for i in range(50)]
+
+    with ThreadPoolExecutor(8) as pool:
+        assert list(pool.map(build, range(50))) == serial
@@ -0,0 +1,101 @@
+"""
+Unit tests for the sceptre register map generator.
+"""
+
+import json
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+import pytest
+
+from phenix_apps.apps.sceptre.configs import configs, reg_map_gen
+
+SS = "{urn:schemas-microsoft-com:office:spreadsheet}"
+
+
+def _register(protocol, addr, field):
+    return SimpleNamespace(
+        protocol=protocol, range=(0, 10), devtype="bus", addr=addr,
+        fieldtype="analog-read", field=field, regtype="input-register",
+    )
+
+
+def test_generate_file(tmp_path):
+    (tmp_path / "analytics").mkdir()
+
+    fd_configs = {
+        "rtu-1": SimpleNamespace(
+            ipaddr="10.0.0.1",
+            registers={
+                "bus-1": [_register("modbus", 2, "mw"), _register("dnp3", 0, "kv"), _register("modbus", 1, "<a&b>")],
+                "bus-2": [_register("dnp3", 1, "angle")],
+            },
+        ),
+        "rtu-2": SimpleNamespace(ipaddr="10.0.0.2", registers={"bus-3": [_register("dnp3", 5, "mw")]}),
+    }
+
+    reg_map_gen.generate_file(fd_configs, f"{tmp_path}/", "exp")
+
+    text = (tmp_path / "analytics" / "register_map_exp.xml").read_text()
+    assert text.startswith('<?xml version="1.0"?><?mso-application progid="Excel.Sheet"?><Workbook ')
+
+    table = ET.fromstring(text.split("?>", 2)[2]).find(f"{SS}Worksheet/{SS}Table")
+    rows = [[data.text for data in row.iter(f"{SS}Data")] for row in table]
+
+    assert table.get(f"{SS}ExpandedRowCount") == "15"
+    assert rows[1][0] == "Field Device"
+
+    # registers are grouped by field device and protocol and sorted by number
+    assert [row[-5] for row in rows[2:]] == ["1", "2", "0", "1", "5"]
+    assert rows[2][:3] == ["RTU-1", "10.0.0.1", "MODBUS"] and rows[2][-1] == "<a&b>"
+    assert rows[4][0] == "DNP3"
+    assert rows[6][:3] == ["RTU-2", "10.0.0.2", "DNP3"]
+
+
+
+def test_generate_file_failure_keeps_old_map(tmp_path):
+    (tmp_path / "analytics").mkdir()
+    old = tmp_path / "analytics" / "register_map_exp.xml"
+    old.write_text("old")
+
+    broken = _register("dnp3", 0, "kv")
+    del broken.devtype
+
+    fd_configs = {
+        "rtu-1": SimpleNamespace(ipaddr="10.0.0.1", registers={"bus-1": [_register("modbus", 2, "mw")]}),
+        "rtu-2": SimpleNamespace(ipaddr="10.0.0.2", registers={"bus-2": [broken]}),
+    }
+
+    with pytest.raises(AttributeError):
+        reg_map_gen.generate_file(fd_configs, f"{tmp_path}/", "exp")
+
+    # the half-written workbook is discarded rather than left in place
+    assert old.read_text() == "old"
+    assert [p.name for p in (tmp_path / "analytics").iterdir()] == ["register_map_exp.xml"]
+
+def test_generate_json(tmp_path):
+    cls = configs.get_fdconfig_class("power-transmission")
+
+    devices = {"modbus": [{"type": "load", "name": "load-1"}]}
+    fd_configs = [cls("provider", "rtu-1", {}, devices, "pub", "srv", "single", {}, 1)]
+
+    nodes = [
+        {"general": {"hostname": "rtu-1"}, "metadata": {"modbus": [{"type": "load", "name": "load-1"}]}},
+        {"general": {"hostname": "rtu-1"}, "metadata": {"connected_rtus": ["rtu-2"]}},
+        {"general": {"hostname": "rtu-2"}, "metadata": {}},
+    ]
+
+    (tmp_path / "topo.json").write_text(json.dumps({"nodes": nodes}))
+
+    reg_map_gen.generate_json("topo", f"{tmp_path}/", fd_configs, str(tmp_path))
+
+    raw = (tmp_path / "ConfigWithCustomRegs.json").read_text()
+    out = json.loads(raw)["nodes"]
+
+    assert raw.startswith('{\n    "nodes": [')
+    assert out[0]["metadata"]["manual_register_config"] == "False"
+    assert out[0]["metadata"]["modbus"][0]["analog-read"][0] == {
+        "field": "mw", "register_number": 30000, "register_type": "input-register",
+    }
+    assert out[1]["metadata"] == {"connected_rtus": ["rtu-2"], "manual_register_config": "False"}
+    assert out[2]["metadata"] == {}
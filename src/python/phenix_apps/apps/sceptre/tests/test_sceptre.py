@@ -0,0 +1,47 @@
+"""
+Unit tests for the sceptre app.
+"""
+
+import json
+import os
+
+from phenix_apps.benchmarks import runner
+from phenix_apps.benchmarks.experiment import generate_experiment
+
+
+def _pre_start(base_dir, workers):
+    experiment = generate_experiment(200)
+    experiment["spec"]["baseDir"] = str(base_dir)
+
+    for app in experiment["spec"]["scenario"]["apps"]:
+        if app["name"] == "sceptre":
+            app["metadata"] = {"workers": workers}
+
+    raw, _ = runner.run_stage("sceptre", "configure", json.dumps(experiment), memory=False)
+    raw, _ = runner.run_stage("sceptre", "pre-start", raw, memory=False)
+
+    files = {}
+
+    for root, _, names in os.walk(base_dir):
+        for name in names:
+            path = os.path.join(root, name)
+
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, base_dir)] = (f.read(), os.stat(path).st_mode)
+
+    return json.loads(raw.replace(str(base_dir), "BASEDIR")), files
+
+
+def test_pre_start_workers_match_serial(tmp_path):
+    serial, serial_files = _pre_start(tmp_path / "serial", 1)
+    parallel, parallel_files = _pre_start(tmp_path / "parallel", 4)
+
+    serial["spec"]["scenario"]["apps"][0].pop("metadata")
+    parallel["spec"]["scenario"]["apps"][0].pop("metadata")
+
+    assert serial == parallel
+    assert len(serial_files) > 100
+    assert serial_files == parallel_files
+
+    # FEPs, which take over the RTUs behind them, are rendered the same way
+    assert os.path.join("sceptre", "fep-0", "config.xml") in serial_files
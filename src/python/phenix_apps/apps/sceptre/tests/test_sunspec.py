@@ -0,0 +1,52 @@
+"""
+Unit tests for SunSpec register generation.
+"""
+
+import os
+
+import phenix_apps.apps.sceptre.protocols.sunspec as sunspec
+
+
+MODELS = [1, 103, 123]
+
+
+def test_one_parse_per_model(mocker):
+    mocker.patch.dict(sunspec._MODELS, clear=True)
+    parse = mocker.spy(sunspec, "_parse_model")
+
+    registers = []
+
+    for i in range(10000):
+        sunspec.SunSpecDevice("PowerDistribution", f"inverter-{i}", registers).generate_registers(MODELS)
+
+    assert parse.call_count == len(MODELS)
+    assert len(registers) == 10000 * sum(len(sunspec.get_model(m)[3]) + 2 for m in MODELS)
+
+    first = [r for r in registers if r.devname == "inverter-0"]
+    last = [r for r in registers if r.devname == "inverter-9999"]
+
+    # addresses restart for each device, and serial numbers are still random
+    assert [(r.name, r.addr) for r in first] == [(r.name, r.addr) for r in last]
+    assert next(r.field for r in first if r.name == "SN") != next(r.field for r in last if r.name == "SN")
+
+
+def test_precompiled_models(tmp_path, mocker):
+    mocker.patch.dict(sunspec._MODELS, clear=True)
+    parse = mocker.spy(sunspec, "_parse_model")
+
+    model = sunspec.get_model(1, cache_dir=str(tmp_path))
+    assert parse.call_count == 1
+
+    cached = os.listdir(tmp_path)
+    assert len(cached) == 1 and cached[0].startswith("smdx_00001-")
+
+    # a new process only needs the precompiled model
+    sunspec._MODELS.clear()
+    assert sunspec.get_model(1, cache_dir=str(tmp_path)) == model
+    assert parse.call_count == 1
+
+    # a corrupt precompiled model is reparsed
+    (tmp_path / cached[0]).write_text("{")
+    sunspec._MODELS.clear()
+    assert sunspec.get_model(1, cache_dir=str(tmp_path)) == model
+    assert parse.call_count == 2
@@ -10,8 +10,9 @@ from typing import List, Optional, Tuple, Union
 import io
 import json
 
-from phenix_apps.common.settings import PHENIX_DIR
-from phenix_apps.common import utils
+from phenix_apps.apps.scorch.profiling import StageProfiler
+from phenix_apps.common.settings import PHENIX_DIR, PHENIX_SCORCH_PROFILE, PHENIX_SCORCH_PROFILE_INTERVAL
+from phenix_apps.common import lazy_box, utils
 from phenix_apps.common.logger import logger
 
 from box import Box
@@ -86,7 +87,7 @@ class ComponentBase(object):
         self.raw_input: str = sys.stdin.read()
 
         try:
-            self.experiment: Box = Box.from_json(self.raw_input)
+            self.experiment: Box = lazy_box.loads(self.raw_input)
         except Exception as ex:
             self.eprint(f"Failed to parse experiment JSON for scorch component '{self.name}': {ex}")
             sys.exit(1)
@@ -104,6 +105,10 @@ class ComponentBase(object):
         self._mm: minimega.minimega | None = None  # minimega instance
         self._es: Elasticsearch | None = None  # Elasticsearch instance
 
+        # Extra details about the stage (e.g. timing of processing steps)
+        # that get saved in the stage's info file.
+        self.stage_info: dict = {}
+
         def signal_handler(signum, stack):
             pass
 
@@ -135,8 +140,13 @@ class ComponentBase(object):
         # we use a lambda function because level and msg do not exist until the logger calls this function
         logger.log = lambda level, msg: self.buffer_logger_log(level, msg, log_buffer, orig_logger_log)
 
+        profiler = self.stage_profiler()
+
         start = time.time()
 
+        if profiler:
+            profiler.start()
+
         # redirect stdout and stderr to mirror to our buffers
         try:
             with redirect_stdout(stdout_mirror), redirect_stderr(stderr_mirror):
@@ -144,6 +154,9 @@ class ComponentBase(object):
         except Exception as ex:
             out = f"Error occurred: {ex}"
         finally:
+            if profiler:
+                profiler.stop()
+
             sys.stdout = orig_stdout_stream
             sys.stderr = orig_stderr_stream
             logger.log = orig_logger_log
@@ -178,9 +191,43 @@ class ComponentBase(object):
           "stderr": self._format_stream(stderr_mirror.getvalue()),
           "logs": self._format_stream(log_buffer.getvalue())
         }
+
+        if self.stage_info:
+            content["info"] = self.stage_info
+
+        if profiler:
+            content["profile"] = profiler.write(os.path.splitext(info_file)[0])
+
         with open(info_file, 'w') as f:
             json.dump(content, f, indent=2)
 
+    def stage_profiler(self) -> Optional[StageProfiler]:
+        """
+        Returns a StageProfiler for the stage if profiling was enabled via the
+        component's `profile` metadata ("timing", "sample" or true) or the
+        PHENIX_SCORCH_PROFILE setting, otherwise None. Any other value is
+        ignored with a warning.
+        """
+
+        metadata = self.metadata or {}
+        mode = metadata.get('profile', PHENIX_SCORCH_PROFILE)
+
+        if mode is True:
+            mode = 'timing'
+
+        if mode is None or mode is False or mode == '':
+            return None
+
+        if mode not in ('timing', 'sample'):
+            self.eprint(f"WARNING: ignoring unknown profile mode {mode!r} (expected 'timing', 'sample' or true)")
+            return None
+
+        if mode == 'sample':
+            interval = float(metadata.get('profile_interval', PHENIX_SCORCH_PROFILE_INTERVAL))
+            return StageProfiler(sample_interval=interval)
+
+        return StageProfiler()
+
     # override phenix's logger buffer_logger_log to also save to our buffer
     def buffer_logger_log(self, level, msg, log_buffer, orig_logger_log):
         try:
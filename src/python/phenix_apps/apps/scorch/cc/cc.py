@@ -1,16 +1,49 @@
 import os
 import subprocess
 import sys
+import time
 import uuid
+from collections import deque
 
 from phenix_apps.apps.scorch import ComponentBase
 from phenix_apps.common import utils
 
 
+class _CommandFailed(Exception):
+    """
+    A VM's command failed. The reason has already been written out.
+    """
+
+
+class _BufferedOutput:
+    """
+    Holds a VM's messages so they can be printed together, instead of being
+    interleaved with other VMs' messages when VMs are run concurrently.
+    """
+
+    def __init__(self) -> None:
+        self.messages = []
+
+    def print(self, msg: str) -> None:
+        self.messages.append((False, msg))
+
+    def eprint(self, msg: str) -> None:
+        self.messages.append((True, msg))
+
+    def replay(self, out) -> None:
+        for error, msg in self.messages:
+            if error:
+                out.eprint(msg)
+            else:
+                out.print(msg)
+
+
 class CC(ComponentBase):
     def __init__(self):
         ComponentBase.__init__(self, 'cc')
 
+        self.__deadline = None
+
         self.execute_stage()
 
     def configure(self):
@@ -49,6 +82,8 @@ class CC(ComponentBase):
                 self.eprint(f"Unknown command type '{cmd.type}' for stage '{stage}'")
                 sys.exit(1)
 
+        targets = []
+
         for vm in vms:
             if vm.hostname not in nodes:
                 self.eprint(f'{vm.hostname} is not in the topology')
@@ -60,152 +95,290 @@ class CC(ComponentBase):
                 self.print(f'{vm.hostname} has no commands for stage {stage}')
                 continue
 
-            for cmd in commands:
-                if cmd.type == 'exec':
-                    validator = cmd.get('validator', None)
-                    wait      = cmd.get('wait', False)
-                    once      = cmd.get('once', True)
+            targets.append((vm, commands))
 
-                    if validator:
-                        wait = True # force waiting so validation can occur
+        if not targets:
+            return
+
+        timeout = float(self.metadata.get('timeout', 0))
+        workers = int(self.metadata.get('concurrency', 1))
+
+        self.__deadline = time.monotonic() + timeout if timeout else None
+
+        # reset commands clear every VM's cc commands and responses, so they
+        # can't be run while other VMs' commands are still in flight
+        if workers > 1 and any(cmd.type == 'reset' for _, commands in targets for cmd in commands):
+            self.print('VM commands include a reset, so running them one VM at a time')
+            workers = 1
+
+        if workers > 1:
+            self.__run_concurrently(stage, targets, workers)
+        else:
+            tracker = utils.MMCommandTracker(self.mm)
+
+            for vm, commands in targets:
+                steps = self.__run_vm(stage, vm, commands, self, tracker)
+
+                try:
+                    handle = self.__step(steps)
+
+                    while handle:
+                        results = self.__wait(tracker, [handle])
+                        handle  = self.__step(steps, results[handle])
+                except _CommandFailed:
+                    sys.exit(1)
+                except (RuntimeError, subprocess.TimeoutExpired) as ex:
+                    self.eprint(f"error running commands in VM {vm.hostname}: {ex}")
+                    sys.exit(1)
+                finally:
+                    steps.close()
+                    tracker.clear_cc_state()
+
+        self.mm.clear_cc_filter()
+
+    def __run_concurrently(self, stage: str, targets: list, workers: int) -> None:
+        """
+        Run each VM's commands in order, for up to `workers` VMs at a time.
+        Every VM's commands go through one tracker and are waited on together,
+        and each VM moves on to its next command as soon as its current one
+        completes. Each VM's output is printed together once it's done.
+        """
+
+        self.print(f"running commands for {len(targets)} VMs, {workers} at a time")
+
+        tracker = utils.MMCommandTracker(self.mm)
+        queue   = deque(targets)
+        active  = {}  # command handle --> (vm, steps, output)
+        failed  = []
+
+        def advance(vm, steps, out, results=None):
+            try:
+                handle = self.__step(steps, results)
+            except Exception as ex:
+                if not isinstance(ex, _CommandFailed):
+                    out.eprint(f"error running commands in VM {vm.hostname}: {ex}")
+
+                failed.append(vm.hostname)
+                handle = None
+
+            if handle:
+                active[handle] = (vm, steps, out)
+            else:
+                out.replay(self)
+
+        try:
+            while queue or active:
+                while queue and len(active) < workers:
+                    vm, commands = queue.popleft()
+                    out = _BufferedOutput()
+
+                    advance(vm, self.__run_vm(stage, vm, commands, out, tracker), out)
+
+                if not active:
+                    continue
+
+                try:
+                    done = self.__wait(tracker, list(active), first=True)
+                except RuntimeError as ex:
+                    # out of time, so every VM still waiting on a command fails
+                    for vm, steps, out in active.values():
+                        steps.close()
+                        out.eprint(f"error running commands in VM {vm.hostname}: {ex}")
+                        out.replay(self)
+                        failed.append(vm.hostname)
+
+                    active.clear()
+                    continue
+
+                for handle, results in done.items():
+                    advance(*active.pop(handle), results)
+        finally:
+            tracker.clear_cc_state()
+
+        if failed:
+            self.eprint(f"commands failed for {len(failed)} of {len(targets)} VMs: {sorted(failed)}")
+            sys.exit(1)
+
+    @staticmethod
+    def __step(steps, results=None):
+        """
+        Resume a VM's commands with the results of the command they're waiting
+        on. Returns the handle of the next command they wait on, or None once
+        they're done.
+        """
+
+        try:
+            return steps.send(results)
+        except StopIteration:
+            return None
+
+    def __wait(self, tracker: utils.MMCommandTracker, handles: list, first: bool = False) -> dict:
+        try:
+            return tracker.wait(handles, timeout=self.__remaining(), first=first)
+        except RuntimeError:
+            raise RuntimeError(f"timeout of {self.metadata.timeout} seconds exceeded") from None
+
+    def __remaining(self) -> float:
+        """
+        Seconds left before the stage times out, or 0.0 if it has no timeout.
+        Raises RuntimeError once the timeout has passed.
+        """
+
+        if self.__deadline is None:
+            return 0.0
+
+        remaining = self.__deadline - time.monotonic()
+
+        if remaining <= 0:
+            raise RuntimeError(f"timeout of {self.metadata.timeout} seconds exceeded")
+
+        return remaining
+
+    def __run_vm(self, stage: str, vm, commands: list, out, tracker: utils.MMCommandTracker):
+        """
+        Run a VM's commands in order, writing messages to out (which has
+        print and eprint methods). Raises _CommandFailed if one fails.
+
+        This is a generator: it yields the tracker handle of each command it
+        needs to wait on, and expects to be sent that command's results.
+        """
+
+        for cmd in commands:
+            if cmd.type == 'exec':
+                validator = cmd.get('validator', None)
+                wait      = cmd.get('wait', False)
+                once      = cmd.get('once', True)
+
+                if validator:
+                    wait = True # force waiting so validation can occur
 
-                    self.print(f"executing command '{cmd.args}' in VM {vm.hostname}")
+                out.print(f"executing command '{cmd.args}' in VM {vm.hostname}")
 
-                    script = self.__send_cmd_as_file(vm.hostname, cmd.args)
+                script = yield from self.__send_cmd_as_file(vm.hostname, cmd.args, tracker)
 
-                    if wait:
-                        results = utils.mm_exec_wait(self.mm, vm.hostname, script, once=once)
+                if wait:
+                    results = (yield tracker.submit(script, vm=vm.hostname, once=once))[vm.hostname]
 
-                        self.print(f"command '{cmd.args}' executed in VM {vm.hostname} using cc")
+                    out.print(f"command '{cmd.args}' executed in VM {vm.hostname} using cc")
 
-                        node = self.extract_node(vm.hostname)
+                    node = self.extract_node(vm.hostname)
 
-                        # HACK: If Windows, use presence of stderr to determine
-                        # success/failure instead of exit code. Ugh...
-                        if node.hardware.os_type.lower() == "windows":
-                            if results['stderr']:
-                                self.eprint(f"command '{cmd.args}' resulted in output to STDERR (assuming failure)")
-                                self.print(f"STDERR Output: {results['stderr']}")
+                    # HACK: If Windows, use presence of stderr to determine
+                    # success/failure instead of exit code. Ugh...
+                    if node.hardware.os_type.lower() == "windows":
+                        if results['stderr']:
+                            out.eprint(f"command '{cmd.args}' resulted in output to STDERR (assuming failure)")
+                            out.print(f"STDERR Output: {results['stderr']}")
 
-                                sys.exit(1)
-                        elif results['exitcode']:
-                            self.eprint(f"command '{cmd.args}' returned a non-zero exit code of '{results['exitcode']}'")
+                            raise _CommandFailed()
+                    elif results['exitcode']:
+                        out.eprint(f"command '{cmd.args}' returned a non-zero exit code of '{results['exitcode']}'")
 
-                            if results['stderr']:
-                                self.print(f"STDERR Output: {results['stderr']}")
+                        if results['stderr']:
+                            out.print(f"STDERR Output: {results['stderr']}")
 
-                            sys.exit(1)
+                        raise _CommandFailed()
 
-                        if results['stdout']:
-                            self.print(f"STDOUT Output: {results['stdout']}")
+                    if results['stdout']:
+                        out.print(f"STDOUT Output: {results['stdout']}")
 
-                        if validator:
-                            self.print(f"validating results from '{cmd.args}'")
+                    if validator:
+                        out.print(f"validating results from '{cmd.args}'")
 
-                            tempfile = f'/tmp/{str(uuid.uuid4())}.sh'
+                        tempfile = f'/tmp/{str(uuid.uuid4())}.sh'
 
-                            with open(tempfile, 'w') as tf:
-                                tf.write(validator)
+                        with open(tempfile, 'w') as tf:
+                            tf.write(validator)
 
+                        try:
                             proc = subprocess.run(
                                 ['bash', tempfile, vm.hostname], input=results['stdout'].encode(), capture_output=True,
+                                timeout=self.__remaining() or None,
                             )
-
+                        finally:
                             os.remove(tempfile)
 
-                            if proc.returncode != 0:
-                                stderr = proc.stderr.decode()
-                                if stderr:
-                                    self.eprint(f'results validation failed: {stderr}')
-                                else:
-                                    self.eprint('results validation failed')
-
-                                sys.exit(1)
+                        if proc.returncode != 0:
+                            stderr = proc.stderr.decode()
+                            if stderr:
+                                out.eprint(f'results validation failed: {stderr}')
                             else:
-                                self.print('results are valid')
-                    else:
-                        self.mm.cc_filter(f'name={vm.hostname}')
+                                out.eprint('results validation failed')
 
-                        if once:
-                            self.mm.cc_exec_once(script)
+                            raise _CommandFailed()
                         else:
-                            self.mm.cc_exec(script)
-
-                        self.print(f"command '{cmd.args}' executed in VM {vm.hostname} using cc")
-                elif cmd.type == 'background':
-                    once = cmd.get('once', True)
-
-                    self.print(f"backgrounding command '{cmd.args}' in VM {vm.hostname} using cc")
-
-                    script = self.__send_cmd_as_file(vm.hostname, cmd.args)
-
-                    self.mm.cc_filter(f'name={vm.hostname}')
-
-                    if once:
-                        self.mm.cc_background_once(script)
-                    else:
-                        self.mm.cc_background(script)
-
-                    self.mm.clear_cc_filter()
-                    self.print(f"command '{cmd.args}' backgrounded in VM {vm.hostname}")
-                elif cmd.type == 'send':
-                    args = cmd.args.split(':')
-                    src  = None
-                    dst  = None
-
-                    if len(args) == 1:
-                        src = dst = args[0]
-                    elif len(args) == 2:
-                        src = args[0]
-                        dst = args[1]
-                    else:
-                        self.eprint(f'too many files provided for send command for VM {vm.hostname}: {cmd.args}')
-                        sys.exit(1)
-
-                    if not os.path.isabs(src):
-                        src = '/phenix/' + src
-
-                    if not os.path.isabs(dst):
-                        dst = '/phenix/' + dst
-
-                    self.print(f"sending file '{src}' to VM {vm.hostname} at '{dst}' using cc")
-
-                    try:
-                        utils.mm_send(self.mm, vm.hostname, src, dst)
-                        self.print(f"file '{src}' sent to VM {vm.hostname} at '{dst}'")
-                    except Exception as ex:
-                        self.eprint(f"error sending '{src}' to VM {vm.hostname}: {ex}")
-                        sys.exit(1)
-                elif cmd.type == 'recv':
-                    args = cmd.args.split(':')
-                    src  = None
-                    dst  = None
-
-                    if len(args) == 1:
-                        src = args[0]
-                        dst = self.base_dir + '/' + os.path.basename(src)
-                    elif len(args) == 2:
-                        src = args[0]
-                        dst = args[1]
-                    else:
-                        self.eprint(f'too many files provided for recv command for VM {vm.hostname}: {cmd.args}')
-                        sys.exit(1)
-
-                    self.print(f"receiving file '{src}' from VM {vm.hostname} to `{dst}` using cc")
-
-                    try:
-                        utils.mm_recv(self.mm, vm.hostname, src, dst)
-                        self.print(f"file '{src}' received from VM {vm.hostname} to `{dst}`")
-                    except Exception as ex:
-                        self.eprint(f"error receiving '{src}' from VM {vm.hostname}: {ex}")
-                        sys.exit(1)
-                elif cmd.type == 'reset':
-                    self.__reset_cc()
+                            out.print('results are valid')
                 else:
-                    self.eprint(f"Unknown command type '{cmd.type}' for VM '{vm.hostname}' and stage '{stage}'")
-                    sys.exit(1)
+                    tracker.submit(script, vm=vm.hostname, once=once)
+
+                    out.print(f"command '{cmd.args}' executed in VM {vm.hostname} using cc")
+            elif cmd.type == 'background':
+                once = cmd.get('once', True)
 
-    def __send_cmd_as_file(self, hostname, cmd):
+                out.print(f"backgrounding command '{cmd.args}' in VM {vm.hostname} using cc")
+
+                script = yield from self.__send_cmd_as_file(vm.hostname, cmd.args, tracker)
+
+                tracker.submit(script, vm=vm.hostname, once=once, background=True)
+                out.print(f"command '{cmd.args}' backgrounded in VM {vm.hostname}")
+            elif cmd.type == 'send':
+                args = cmd.args.split(':')
+                src  = None
+                dst  = None
+
+                if len(args) == 1:
+                    src = dst = args[0]
+                elif len(args) == 2:
+                    src = args[0]
+                    dst = args[1]
+                else:
+                    out.eprint(f'too many files provided for send command for VM {vm.hostname}: {cmd.args}')
+                    raise _CommandFailed()
+
+                if not os.path.isabs(src):
+                    src = '/phenix/' + src
+
+                if not os.path.isabs(dst):
+                    dst = '/phenix/' + dst
+
+                out.print(f"sending file '{src}' to VM {vm.hostname} at '{dst}' using cc")
+
+                try:
+                    utils.mm_send(self.mm, vm.hostname, src, dst)
+                    out.print(f"file '{src}' sent to VM {vm.hostname} at '{dst}'")
+                except Exception as ex:
+                    out.eprint(f"error sending '{src}' to VM {vm.hostname}: {ex}")
+                    raise _CommandFailed()
+            elif cmd.type == 'recv':
+                args = cmd.args.split(':')
+                src  = None
+                dst  = None
+
+                if len(args) == 1:
+                    src = args[0]
+                    dst = self.base_dir + '/' + os.path.basename(src)
+                elif len(args) == 2:
+                    src = args[0]
+                    dst = args[1]
+                else:
+                    out.eprint(f'too many files provided for recv command for VM {vm.hostname}: {cmd.args}')
+                    raise _CommandFailed()
+
+                out.print(f"receiving file '{src}' from VM {vm.hostname} to `{dst}` using cc")
+
+                try:
+                    utils.mm_recv(self.mm, vm.hostname, src, dst)
+                    out.print(f"file '{src}' received from VM {vm.hostname} to `{dst}`")
+                except Exception as ex:
+                    out.eprint(f"error receiving '{src}' from VM {vm.hostname}: {ex}")
+                    raise _CommandFailed()
+            elif cmd.type == 'reset':
+                self.__reset_cc()
+            else:
+                out.eprint(f"Unknown command type '{cmd.type}' for VM '{vm.hostname}' and stage '{stage}'")
+                raise _CommandFailed()
+
+    def __send_cmd_as_file(self, hostname, cmd, tracker):
         cmd_file = f'run-{self.extract_run_name()}_{str(uuid.uuid4())}'
         node     = self.extract_node(hostname)
 
@@ -220,15 +393,11 @@ class CC(ComponentBase):
         with open(cmd_src, 'w') as f:
             f.write(cmd)
 
-        self.mm.cc_filter(f'name={hostname}')
-        self.mm.cc_send(cmd_src)
-
         # wait for file to be sent via cc
-        last_cmd = utils.mm_last_command(self.mm)
-        utils.mm_wait_for_cmd(self.mm, last_cmd['id'])
-        self.mm.clear_cc_filter()
-
-        os.remove(cmd_src)
+        try:
+            yield tracker.send(cmd_src, vm=hostname)
+        finally:
+            os.remove(cmd_src)
 
         if node.hardware.os_type.lower() == "windows":
             return f'powershell.exe -ExecutionPolicy Bypass -File {cmd_dst}'
@@ -0,0 +1,146 @@
+"""
+Unit tests for running the cc component's VM commands concurrently, run
+against a fake minimega connection.
+"""
+
+import re
+
+import pytest
+
+from phenix_apps.apps.scorch.cc.cc import CC
+from phenix_apps.common import utils
+
+
+@pytest.fixture(autouse=True)
+def clear_uuid_cache():
+    utils._VM_UUIDS.clear()
+
+
+def vm_commands(count: int, validator: str) -> tuple:
+    vms = [
+        {
+            "hostname": f"vm{i}",
+            "start": [
+                {"type": "exec", "args": f"hostname {i}", "wait": True, "validator": validator},
+                {"type": "background", "args": "sleep 60"},
+            ],
+        }
+        for i in range(count)
+    ]
+
+    nodes = [{"general": {"hostname": f"vm{i}"}, "hardware": {"os_type": "linux"}} for i in range(count)]
+
+    return vms, nodes
+
+
+@pytest.fixture
+def run_start(mocker, scorch_component, fake_minimega):
+    """
+    Returns a function that runs the start stage of a cc component with a VM
+    for each of the given fake minimega's VMs, each running an exec and a
+    background command. Script names are replaced with 'script.sh' in the
+    messages it returns.
+    """
+
+    def run(mm, messages=None, validator='grep -q " on $1$"', **metadata):
+        messages = [] if messages is None else messages
+        vms, nodes = vm_commands(len(mm.vms), validator)
+
+        def record(stream):
+            return lambda msg: messages.append((stream, re.sub(r"\S+/run-\S+\.sh", "script.sh", msg)))
+
+        mocker.patch.object(CC, "print", side_effect=record("out"))
+        mocker.patch.object(CC, "eprint", side_effect=record("err"))
+
+        scorch_component(CC, "cc", "start", {"vms": vms, **metadata}, nodes, mm=mm)
+
+        return messages
+
+    return run
+
+
+def vms(count: int) -> list:
+    return [f"vm{i}" for i in range(count)]
+
+
+def vm_of(msg):
+    for word in msg.split():
+        if word.startswith("vm") and word[2:].isdigit():
+            return word
+
+    return None
+
+
+def by_vm(messages):
+    blocks = {}
+
+    for stream, msg in messages:
+        vm = vm_of(msg)
+
+        if vm:
+            blocks.setdefault(vm, []).append((stream, msg))
+
+    return blocks
+
+
+def test_concurrent_output_matches_serial(run_start, fake_minimega, tmp_path):
+    serial_mm = fake_minimega(vms(6), polls_to_complete=1)
+    serial = run_start(serial_mm)
+
+    mm = fake_minimega(vms(6), polls_to_complete=1)
+    concurrent = run_start(mm, concurrency=6)
+
+    assert by_vm(concurrent) == by_vm(serial)
+    assert ("out", "STDOUT Output: bash script.sh on vm4") in concurrent
+
+    # each VM's messages are printed together rather than interleaved
+    names = [vm_of(msg) for _, msg in concurrent if vm_of(msg)]
+    runs = [vm for i, vm in enumerate(names) if i == 0 or names[i - 1] != vm]
+    assert len(runs) == len(set(runs)) == 6
+
+    # each of the three things every VM waits on (sending each script and
+    # running the first) is checked for all VMs with one 'cc commands' poll,
+    # instead of a poll per VM
+    assert serial_mm.calls.count("cc_commands") == 18
+    assert mm.calls.count("cc_commands") == 3
+
+    assert [(c["call"], c["targets"]) for c in mm.issued[-6:]] == [("cc_background_once", [vm]) for vm in vms(6)]
+    assert mm.prefix == ""
+    assert not list((tmp_path / "phenix" / "images" / "exp").iterdir())
+
+
+def test_concurrency_limit(run_start, fake_minimega):
+    mm = fake_minimega(vms(12), polls_to_complete=1, slow_vms={"vm0": 3, "vm5": 4})
+
+    run_start(mm, concurrency=4)
+
+    assert mm.peak_in_flight == 4
+    assert sorted(vm for c in mm.issued if c["call"] == "cc_exec_once" for vm in c["targets"]) == sorted(vms(12))
+
+
+def test_failed_commands_exit_after_all_vms(run_start, fake_minimega):
+    mm = fake_minimega(vms(5), polls_to_complete=1)
+    mm.exitcodes["vm3"] = 2
+    messages = []
+
+    with pytest.raises(SystemExit):
+        run_start(mm, messages, validator='[ "$1" != vm2 ]', concurrency=5)
+
+    assert ("err", "results validation failed") in messages
+    assert ("err", "command 'hostname 3' returned a non-zero exit code of '2'") in messages
+    assert messages[-1] == ("err", "commands failed for 2 of 5 VMs: ['vm2', 'vm3']")
+
+    # the other VMs still ran their background commands
+    assert sorted(vm for c in mm.issued if c["call"] == "cc_background_once" for vm in c["targets"]) == ["vm0", "vm1", "vm4"]
+
+
+def test_timeout(run_start, fake_minimega, tmp_path):
+    mm = fake_minimega(vms(3), polls_to_complete=1, slow_vms={"vm1": 1000})
+    messages = []
+
+    with pytest.raises(SystemExit):
+        run_start(mm, messages, concurrency=3, timeout=0.3)
+
+    assert ("err", "error running commands in VM vm1: timeout of 0.3 seconds exceeded") in messages
+    assert messages[-1] == ("err", "commands failed for 1 of 3 VMs: ['vm1']")
+    assert not list((tmp_path / "phenix" / "images" / "exp").iterdir())
@@ -1,12 +1,15 @@
 import argparse
 import csv
+import heapq
+import queue
 import sys
+import threading
 import timeit
 import math
-from collections import defaultdict
+from datetime import datetime, timedelta, timezone
 from operator import itemgetter
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional, Tuple
 
 from dateutil.parser import parse as parse_time
 import elasticsearch.helpers
@@ -14,15 +17,23 @@ import elasticsearch.helpers
 from phenix_apps.common import utils
 
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MILLISECOND = timedelta(milliseconds=1)
+_DONE = object()
+
 def gen_csv(
     record: dict,
     csv_path: Path,
     es_server: str,
     es_index: str = "rtds-clean",
     iperf_dir: Optional[Path] = None,
+    slices: int = 4,
 ):
     """
     Generate CSV file from RTDS data in Elasticsearch and iperf data (or packet TCP RTT values).
+
+    Docs are pulled with a sliced scroll (one thread per slice) and streamed
+    through in time order, so memory use doesn't grow with the run length.
     """
     utils.print_msg("Generating CSV file...")
 
@@ -30,6 +41,7 @@ def gen_csv(
     # Physical values are 30hz. so, lots of physical measurements will be missing.
     # length of intervals for iperf client should be close to 1800, like 1798
     # example: cat iperf_client_load5.json | jq '.intervals | length'
+    iperf_data = None  # type: Optional[dict[str, dict[int, dict]]]
     if iperf_dir:
         iperf_raw = {}  # type: dict[str, dict]
         for iperf_file in iperf_dir.glob("iperf_client-data_*.json"):
@@ -105,6 +117,9 @@ def gen_csv(
                 ]
             }
         },
+        # Docs are streamed in time order so rows can be written as soon as
+        # each time step is complete, instead of holding every doc in memory.
+        "sort": [{"sceptre_time": "asc"}],
         # This limits what fields get returned, instead of returning the whole doc
         "fields": [
             "rtds_time",
@@ -122,213 +137,368 @@ def gen_csv(
     }
 
     # 30 * 60 * 30 * 8 * 6 = 2592000 docs for 30 minutes
-    # Takes ~4 minutes to pull and process that many docs from Elasticsearch
-    scroll_timer = timeit.default_timer()
+    proc_start = timeit.default_timer()
 
     # Tune index pattern to just the day(s) experiment was run
     # NOTE: this assumes the experiment duration <= 2 days
     index = utils.get_indices_from_range(es_index, start_time, actual_stop_time)
 
-    utils.print_msg(f"Submitting scroll query to Elasticsearch (index: '{index}')")
-    iterator = elasticsearch.helpers.scan(client=es_rtds, query=query, index=index)  # generator
+    utils.print_msg(f"Submitting scroll query to Elasticsearch (index: '{index}', slices: {slices})")
 
-    utils.print_msg("Starting Elasticsearch doc pull")
-    all_docs = []
-    for doc in iterator:
-        all_docs.append({k: v[0] for k, v in doc["fields"].items()})
+    # This assumes PMU polling rate of 30hz
+    expected_count = int(30 * configured_duration)
+    pmu_names = list(pmus.keys())
+    stats = {"docs": 0, "skipped": 0, "out_of_order": 0}
+    stop = threading.Event()
 
-    scroll_duration = timeit.default_timer() - scroll_timer
-    utils.print_msg(f"Got {len(all_docs)} docs from Elasticsearch in {scroll_duration:.2f} seconds")
+    # Rows go to a temporary file that only replaces csv_path once every
+    # check has passed, same as when the whole CSV was written at the end.
+    tmp_path = csv_path.with_name(f"{csv_path.name}.part")
 
-    es_rtds.close()  # disconnect from Elasticsearch
-    if not all_docs:
-        utils.eprint("No docs were retrieved from Elasticsearch!")
-        sys.exit(1)
+    try:
+        docs = _scan_sorted(es_rtds, query, index, slices, stop)
+        steps = _time_steps(docs, start_time, stop_time_modified, pmus, channels, stats)
 
-    proc_start = timeit.default_timer()
-    utils.print_msg(f"Processing {len(all_docs)} docs...")
-    ground_truth = defaultdict(list)  # type: dict[float, list[dict]]
-    skipped_docs = []
-    trimmed_all_docs = []
+        with tmp_path.open("w", newline="") as csvfile:
+            writer = csv.writer(csvfile)
+
+            # write the CSV header
+            writer.writerow(csv_header)
+
+            # Sometimes we end up with an extra time step at the end, which
+            # is dropped. Hold back the latest step until the next one shows
+            # up so it can be dropped without knowing the total up front.
+            held = next(steps, None)
+            count = 0
+
+            if held:
+                time_zero = held[0]
+
+                for step in steps:
+                    writer.writerow(_build_row(count, held, time_zero, pmu_names, channels, iperf_data))
+                    held = step
+                    count += 1
+
+                count += 1  # include the held time step
+
+            utils.print_msg(
+                f"Processed {stats['docs']} docs from Elasticsearch in {timeit.default_timer() - proc_start:.2f} seconds"
+            )
+
+            if not stats["docs"]:
+                utils.eprint("No docs were retrieved from Elasticsearch!")
+                sys.exit(1)
+
+            if stats["skipped"]:
+                utils.print_msg(f"WARN: {stats['skipped']} docs were skipped due to being outside of time range")
+
+            if not count:
+                utils.eprint(f"No docs within time range {start_time} - {stop_time_modified}!")
+                sys.exit(1)
+
+            utils.print_msg(f"length of ground_truth: {count}")
+
+            # ensure docs ordered by sceptre_time are also ordered by rtds_time
+            if stats["out_of_order"]:
+                utils.eprint("all_docs sorted by sceptre_time != sorted by rtds_time!")
+                utils.eprint(f"** {stats['out_of_order']} differing docs **")
+
+            # sometimes we end up with an extra row, if that's the case, remove the last row
+            if count - 1 == expected_count:
+                utils.print_msg(f"WARNING: there are {count} time steps but expected {expected_count}, removing the last time step")
+                count -= 1
+            else:
+                # TODO: sometimes it's one time step less, and I don't know why. Allowing it for now
+                if count == expected_count - 1:
+                    utils.print_msg(f"WARNING: there are {count} time steps, one fewer than expected {expected_count}, allowing it to pass so we can get these darn runs done")
+                # elif count != expected_count:
+                # TODO: loosening this quite a bit for now.
+                elif count < expected_count - 10:
+                    utils.eprint(f"number of time_steps {count} != expected count of {expected_count} (30 * {configured_duration} seconds)")
+                    sys.exit(1)
+
+                writer.writerow(_build_row(count - 1, held, time_zero, pmu_names, channels, iperf_data))
+
+        tmp_path.replace(csv_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        stop.set()  # stop any scroll threads still running
+        es_rtds.close()  # disconnect from Elasticsearch
+
+    utils.print_msg(f"Wrote {count} rows to CSV file: {csv_path}")
+
+
+def fast_parse_time(value: str) -> datetime:
+    """
+    Parse an ISO 8601 timestamp, using datetime.fromisoformat for the
+    formats Elasticsearch returns and falling back to dateutil for the rest.
+    """
+
+    try:
+        if value[-1] == "Z":
+            return datetime.fromisoformat(value[:-1] + "+00:00")
+        return datetime.fromisoformat(value)
+    except (ValueError, IndexError):
+        return parse_time(value)
+
+
+def _scan_slice(
+    client, query: dict, index: str, slice_id: int, slices: int
+) -> Iterator[Tuple[int, datetime, dict]]:
+    """
+    Scroll through one slice of the query results, yielding a
+    (millisecond, sceptre_time, doc) tuple for each doc in time order.
+    """
+
+    if slices > 1:
+        query = dict(query, slice={"id": slice_id, "max": slices})
+
+    hits = elasticsearch.helpers.scan(client=client, query=query, index=index, preserve_order=True)
+
+    for hit in hits:
+        doc = {k: v[0] for k, v in hit["fields"].items()}
+
+        sceptre_time = fast_parse_time(doc["sceptre_time"])
+        assert sceptre_time.tzinfo.tzname(sceptre_time) == "UTC"
+
+        yield (sceptre_time - _EPOCH) // _MILLISECOND, sceptre_time, doc
+
+
+def _prefetch(items: Iterator, stop: threading.Event, depth: int = 4, chunk: int = 1000) -> Iterator:
+    """
+    Drain an iterator on a background thread, handing items back in chunks
+    through a bounded queue so memory stays flat while the thread runs ahead.
+    """
+
+    buf = queue.Queue(maxsize=depth)
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buf.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def worker():
+        try:
+            batch = []
+
+            for item in items:
+                batch.append(item)
+
+                if len(batch) == chunk:
+                    if not put(batch):
+                        return
+
+                    batch = []
+
+            if put(batch):
+                put(_DONE)
+        except BaseException as ex:
+            put(ex)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+    while True:
+        batch = buf.get()
+
+        if batch is _DONE:
+            return
+
+        if isinstance(batch, BaseException):
+            raise batch
+
+        yield from batch
+
+
+def _scan_sorted(client, query: dict, index: str, slices: int, stop: threading.Event) -> Iterator:
+    """
+    Run a sliced scroll with one thread per slice, merging the time ordered
+    slices back into a single time ordered stream of docs.
+    """
+
+    streams = [
+        _prefetch(_scan_slice(client, query, index, i, slices), stop)
+        for i in range(max(slices, 1))
+    ]
+
+    if len(streams) == 1:
+        return streams[0]
+
+    return heapq.merge(*streams, key=itemgetter(0))
+
+
+def _time_steps(
+    docs: Iterator,
+    start_time: datetime,
+    stop_time: datetime,
+    pmus: dict,
+    channels: list,
+    stats: dict,
+) -> Iterator[Tuple[float, datetime, dict]]:
+    """
+    Group a time ordered stream of docs into time steps, yielding a
+    (time_step, sceptre_time, nested) tuple for each step in order as soon as
+    it's complete. nested maps PMU name => channel => doc.
+    """
+
+    pending = {}  # type: dict[float, tuple[datetime, dict]]
+    last_rtds = {}  # type: dict[tuple[str, str], str]
+    last_ms = None
+
+    for ms, sceptre_time, doc in docs:
+        stats["docs"] += 1
 
-    for doc in all_docs:
         m_time = doc["measurement.time"]
-        r_ts = parse_time(doc["rtds_time"]).timestamp()
+        r_ts = fast_parse_time(doc["rtds_time"]).timestamp()
         if not math.isclose(m_time, r_ts, rel_tol=1e-12):
             utils.eprint(f"measurement.time {m_time} is not close to rtds_time {r_ts}, something is wrong with the rtds provider code")
             sys.exit(1)
 
-        sceptre_time = parse_time(doc["sceptre_time"])
-        assert sceptre_time.tzinfo.tzname(sceptre_time) == "UTC"
+        # Elasticsearch sorts dates to the millisecond, so every time step
+        # before the current millisecond is complete.
+        if ms != last_ms:
+            if last_ms is not None and ms < last_ms:
+                utils.eprint(f"docs from Elasticsearch are not in sceptre_time order ({sceptre_time})")
+                sys.exit(1)
+
+            yield from _complete_steps(pending, last_rtds, stats)
+            last_ms = ms
 
         # exclude docs outside of the time range
         # this works around quirkyness with Elasticsearch date range filter
         # and the fact timestamps of reads don't fall on nice clean time boundaries
-        if sceptre_time < start_time or sceptre_time > stop_time_modified:
-            skipped_docs.append(doc)
+        if sceptre_time < start_time or sceptre_time > stop_time:
+            stats["skipped"] += 1
             continue
 
-        trimmed_all_docs.append(doc)
-        ground_truth[sceptre_time.timestamp()].append(doc)
-
-    # replace with out of range timestamps removed
-    all_docs = trimmed_all_docs
-    utils.print_msg(f"length of ground_truth: {len(ground_truth)}")
-
-    if skipped_docs:
-        utils.print_msg(f"WARN: {len(skipped_docs)} docs were skipped due to being outside of time range")
-
-    # ensure docs sorted by rtds_time have the same order when sorted by sceptre_time
-    by_sceptre = sorted(all_docs, key=itemgetter("pmu.name", "measurement.channel", "sceptre_time"))
-    by_rtds = sorted(all_docs, key=itemgetter("pmu.name", "measurement.channel", "rtds_time"))
-    assert len(by_sceptre) == len(by_rtds)
-    if by_sceptre != by_rtds:
-        utils.eprint("all_docs sorted by sceptre_time != sorted by rtds_time!")
-
-        differing = []
-        for i in range(len(by_sceptre)):
-            if by_sceptre[i] != by_rtds[i]:
-                differing.append((i, by_sceptre[i], by_rtds[i]))
-
-        utils.eprint(f"** {len(differing)} differing docs **")
-        # diff_str = "\n| index | by_sceptre | by_rtds |\n| --- | --- | --- |\n"
-        # for d in differing:
-        #     diff_str += f"{d[0]} | {d[1]} | {d[2]}\n"
-        # utils.eprint(diff_str)
-        # sys.exit(1)
-
-    # measurement.time transcends PMUs, so all PMUs will have the same time step
-    # from the RTDS.
-    # We record the time value of the first data point in our filtered set
-    # of data, and use that as the zer0 for the entire set.
-    # Sorting the time steps is important
-    # this applies to sceptre_time as well, after applying my hack to
-    # the provider to force the same timestamp.
-    time_steps = sorted(ground_truth.keys())  # type: list[float]
-    nested = {
-        time_step: {pmu_name: {channel: {} for channel in channels} for pmu_name in pmus.keys()}
-        for time_step in time_steps
-    }
-    for doc in all_docs:
-        sceptre_time = parse_time(doc["sceptre_time"])
-        nested[sceptre_time.timestamp()][doc["pmu.name"]][doc["measurement.channel"]] = doc
+        time_step = sceptre_time.timestamp()
 
-    utils.print_msg(
-        f"Processed {len(all_docs)} docs in {timeit.default_timer() - proc_start:.2f} seconds"
-    )
+        if time_step not in pending:
+            # pick first entry for timestamps.
+            pending[time_step] = (
+                sceptre_time,
+                {pmu_name: {channel: {} for channel in channels} for pmu_name in pmus.keys()},
+            )
 
-    # checks that first doc and last doc are within the time range
-    first_ts = parse_time(ground_truth[time_steps[0]][0]["sceptre_time"])
-    if first_ts < start_time:
-        utils.eprint(f"first timestamp in time steps of {first_ts} < start_time of {start_time}!\nfirst_ts: {first_ts}\nstart_time: {start_time}")
-        sys.exit(1)
-    last_ts = parse_time(ground_truth[time_steps[-1]][0]["sceptre_time"])
-    if last_ts > stop_time_modified:
-        utils.eprint(f"last timestamp in time steps of {last_ts} > stop_time_modified of {stop_time_modified}!\nlast_ts: {last_ts}\nstop_time_modified: {stop_time_modified}")
-        sys.exit(1)
+        pending[time_step][1][doc["pmu.name"]][doc["measurement.channel"]] = doc
 
-    # This assumes PMU polling rate of 30hz
-    expected_count = int(30 * configured_duration)
-    # sometimes we end up with an extra row, if that's the case, remove the last row
-    if len(time_steps) - 1 == expected_count:
-        utils.print_msg(f"WARNING: there are {len(time_steps)} time steps but expected {expected_count}, removing the last time step")
-        del time_steps[-1]
-    # TODO: sometimes it's one time step less, and I don't know why. Allowing it for now
-    elif len(time_steps) == expected_count - 1:
-        utils.print_msg(f"WARNING: there are {len(time_steps)} time steps, one fewer than expected {expected_count}, allowing it to pass so we can get these darn runs done")
-    # elif len(time_steps) != expected_count:
-    # TODO: loosening this quite a bit for now.
-    elif len(time_steps) < expected_count - 10:
-        utils.eprint(f"number of time_steps {len(time_steps)} != expected count of {expected_count} (30 * {configured_duration} seconds)")
-        sys.exit(1)
+    yield from _complete_steps(pending, last_rtds, stats)
 
-    pmu_names = list(pmus.keys())
 
-    utils.print_msg(f"Writing {len(time_steps)} rows to CSV file: {csv_path.name}")
-    with csv_path.open("w", newline="") as csvfile:
-        writer = csv.writer(csvfile)
+def _complete_steps(pending: dict, last_rtds: dict, stats: dict) -> Iterator[Tuple[float, datetime, dict]]:
+    """
+    Yield pending time steps in order, counting docs whose rtds_time goes
+    backwards relative to the previous time step for the same PMU channel.
+    """
 
-        # write the CSV header
-        writer.writerow(csv_header)
+    for time_step in sorted(pending):
+        sceptre_time, nested = pending[time_step]
 
-        time_zero = time_steps[0]
+        for pmu_name, pmu_docs in nested.items():
+            for channel, doc in pmu_docs.items():
+                if not doc:
+                    continue
 
-        for sequence, time_step in enumerate(time_steps):
-            # pick first entry for timestamps.
-            # sceptre_time can vary due to each PMU being read in it's
-            # own thread, processing times, and network latencies.
-            # if we're using the same PMU all the time, it'll be at least
-            # somewhat consistent.
-            someone = ground_truth[time_step][0]
-
-            sceptre_ts = parse_time(someone["sceptre_time"])
-            sceptre_time_unix = sceptre_ts.timestamp()
-            assert time_step == sceptre_time_unix
-            approx_seconds_since_start = time_step - time_zero
-
-            # frequency and dfreq values are the same across all PMUs,
-            # so only set them once in the CSV to reduce size
-            pmu_zero = nested[time_step][pmu_names[0]][channels[0]]
-
-            if not pmu_zero:
-                utils.eprint(f"No PMU data for time step {time_step} (sequence={sequence})")
+                rtds_time = doc["rtds_time"]
+                if rtds_time < last_rtds.get((pmu_name, channel), ""):
+                    stats["out_of_order"] += 1
+
+                last_rtds[(pmu_name, channel)] = rtds_time
+
+        yield time_step, sceptre_time, nested
+
+    pending.clear()
+
+
+def _build_row(
+    sequence: int,
+    step: Tuple[float, datetime, dict],
+    time_zero: float,
+    pmu_names: list,
+    channels: list,
+    iperf_data: Optional[dict],
+) -> list:
+    """
+    Build the CSV row for a single time step.
+    """
+
+    time_step, sceptre_ts, nested = step
+
+    # sceptre_time can vary due to each PMU being read in it's
+    # own thread, processing times, and network latencies.
+    # if we're using the same PMU all the time, it'll be at least
+    # somewhat consistent.
+    sceptre_time_unix = sceptre_ts.timestamp()
+    assert time_step == sceptre_time_unix
+    approx_seconds_since_start = time_step - time_zero
+
+    # frequency and dfreq values are the same across all PMUs,
+    # so only set them once in the CSV to reduce size
+    pmu_zero = nested[pmu_names[0]][channels[0]]
+
+    if not pmu_zero:
+        utils.eprint(f"No PMU data for time step {time_step} (sequence={sequence})")
+        sys.exit(1)
+
+    row = [
+        # sequence
+        sequence,  # int
+        # approx_seconds_since_start
+        approx_seconds_since_start,  # float
+        # timestamp_unix
+        sceptre_time_unix,  # float
+        # timestamp_iso8601
+        sceptre_ts.isoformat(),  # str
+        # frequency
+        pmu_zero["measurement.frequency"],  # float
+        # dfreq
+        pmu_zero["measurement.dfreq"],  # float
+    ]
+
+    if iperf_data is not None:
+        # Iterate through the iperf sensors and add their values
+        # There is always going to be a .0 entry, e.g. 1.0, 2.0, etc.
+        # Use the same iperf values for all rows in the same second,
+        # which should be 30 rows. Using the rounded integer value
+        # should work. Technically should use sceptre time here, but
+        # approx_seconds_since_start keeps it more in-line with what's
+        # happening. Since time 0 is the iperf start time, we can use
+        # approx_seconds_since_start. (and this is inaccurate anyway
+        # due to only 1 read per second and not exactly on the second).
+        secs_int = int(approx_seconds_since_start)
+        for iperf_vals in iperf_data.values():
+            try:
+                val = iperf_vals[secs_int]
+            except KeyError:  # special case for second 1800
+                val = iperf_vals[secs_int - 1]
+            row.append(val["rtt"])
+            row.append(val["rttvar"])
+            row.append(val["retransmits"])
+
+    # Write angle and real for each channel in each PMU
+    for pmu_name in pmu_names:
+        for channel in channels:
+            doc = nested[pmu_name][channel]
+            try:
+                row.append(doc["measurement.phasor.angle"])
+            except Exception as ex:
+                utils.eprint(f"bad doc: {doc!r}\nexception: {ex!s}")
                 sys.exit(1)
+            row.append(doc["measurement.phasor.real"])
+
+    # Write freq and dfreq for each PMU
+    for pmu_name in pmu_names:
+        pmu_doc = nested[pmu_name][channels[0]]
+        row.append(pmu_doc["measurement.frequency"])
+        row.append(pmu_doc["measurement.dfreq"])
 
-            row = [
-                # sequence
-                sequence,  # int
-                # approx_seconds_since_start
-                approx_seconds_since_start,  # float
-                # timestamp_unix
-                sceptre_time_unix,  # float
-                # timestamp_iso8601
-                sceptre_ts.isoformat(),  # str
-                # frequency
-                pmu_zero["measurement.frequency"],  # float
-                # dfreq
-                pmu_zero["measurement.dfreq"],  # float
-            ]
-
-            if iperf_dir:
-                # Iterate through the iperf sensors and add their values
-                # There is always going to be a .0 entry, e.g. 1.0, 2.0, etc.
-                # Use the same iperf values for all rows in the same second,
-                # which should be 30 rows. Using the rounded integer value
-                # should work. Technically should use sceptre time here, but
-                # approx_seconds_since_start keeps it more in-line with what's
-                # happening. Since time 0 is the iperf start time, we can use
-                # approx_seconds_since_start. (and this is inaccurate anyway
-                # due to only 1 read per second and not exactly on the second).
-                secs_int = int(approx_seconds_since_start)
-                for iperf_vals in iperf_data.values():
-                    try:
-                        val = iperf_vals[secs_int]
-                    except KeyError:  # special case for second 1800
-                        val = iperf_vals[secs_int - 1]
-                    row.append(val["rtt"])
-                    row.append(val["rttvar"])
-                    row.append(val["retransmits"])
-
-            # Write angle and real for each channel in each PMU
-            for pmu_name in pmus.keys():
-                for channel in channels:
-                    doc = nested[time_step][pmu_name][channel]
-                    try:
-                        row.append(doc["measurement.phasor.angle"])
-                    except Exception as ex:
-                        utils.eprint(f"bad doc: {doc!r}\nexception: {ex!s}")
-                        sys.exit(1)
-                    row.append(doc["measurement.phasor.real"])
-
-            # Write freq and dfreq for each PMU
-            for pmu_name in pmus.keys():
-                pmu_doc = nested[time_step][pmu_name][channels[0]]
-                row.append(pmu_doc["measurement.frequency"])
-                row.append(pmu_doc["measurement.dfreq"])
-
-            writer.writerow(row)
-
-    utils.print_msg(f"Wrote {len(time_steps)} rows to CSV file: {csv_path}")
+    return row
 
 
 def main():
@@ -339,6 +509,7 @@ def main():
     parser.add_argument("-f", "--csv-path", type=str, required=True)
     parser.add_argument("-i", "--elastic-index", type=str, default="rtds-clean", required=False)
     parser.add_argument("--iperf-dir", type=str, default=None, required=False)
+    parser.add_argument("-s", "--slices", type=int, default=4, required=False)
     args = parser.parse_args()
 
     assert args.elastic_server
@@ -354,6 +525,7 @@ def main():
         es_server=args.elastic_server,
         es_index=args.elastic_index,
         iperf_dir=args.iperf_dir,
+        slices=args.slices,
     )
 
 
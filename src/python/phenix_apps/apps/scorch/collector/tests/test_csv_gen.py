@@ -0,0 +1,213 @@
+"""
+Unit tests for streaming CSV generation from RTDS data in Elasticsearch.
+"""
+
+import csv
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from dateutil.parser import parse as parse_time
+
+from phenix_apps.apps.scorch.collector import csv_gen
+
+GOLDEN_DIR = Path(__file__).parent
+START = datetime(2022, 7, 18, 23, 59, 50, tzinfo=timezone.utc)
+PMUS = {"PMU1": "bus1", "PMU2": "bus2"}
+CHANNELS = ["VA", "VB", "VC", "IA", "IB", "IC"]
+DURATION = 10  # seconds, 300 expected time steps
+
+
+def make_docs(steps: int = 30 * DURATION + 1) -> list:
+    """
+    Build PMU docs as returned by the Elasticsearch 'fields' option, with a
+    couple of time steps on either side of the experiment time range.
+    """
+
+    docs = []
+
+    for step in range(-2, steps + 2):
+        sceptre_time = START + timedelta(microseconds=step * 33333)
+        rtds_time = sceptre_time - timedelta(milliseconds=5)
+
+        for pmu_name, pmu_label in PMUS.items():
+            for i, channel in enumerate(CHANNELS):
+                docs.append({
+                    "rtds_time": [rtds_time.isoformat().replace("+00:00", "Z")],
+                    "sceptre_time": [sceptre_time.isoformat().replace("+00:00", "Z")],
+                    "measurement.dfreq": [0.001 * step],
+                    "measurement.channel": [channel],
+                    "measurement.frequency": [60.0 + step / 1000],
+                    "measurement.phasor.angle": [step * 0.1 + i],
+                    "measurement.phasor.real": [step * 0.2 - i],
+                    "measurement.time": [rtds_time.timestamp()],
+                    "pmu.label": [pmu_label],
+                    "pmu.name": [pmu_name],
+                })
+
+    # Elasticsearch returns docs in no particular order unless asked
+    random.Random(5).shuffle(docs)
+    return docs
+
+
+def fake_scan(docs: list, honor_sort: bool = True):
+    """
+    Return a stand-in for elasticsearch.helpers.scan over the given docs,
+    supporting sorting and sliced scrolls.
+    """
+
+    def scan(client, query, index, **kwargs):
+        hits = list(enumerate(docs))
+
+        if "slice" in query:
+            hits = [h for h in hits if h[0] % query["slice"]["max"] == query["slice"]["id"]]
+
+        if honor_sort and "sort" in query:
+            hits.sort(key=lambda h: parse_time(h[1]["sceptre_time"][0]))
+
+        for _, fields in hits:
+            yield {"fields": fields}
+
+    return scan
+
+
+def write_iperf(iperf_dir: Path, duration: int = DURATION) -> None:
+    """
+    Write iperf client results for two client/server pairs, with one interval
+    per second of the experiment.
+    """
+
+    for pair, base in [("client-load5_server-load8", 1000), ("client-load6_server-load9", 2500)]:
+        intervals = [
+            {
+                "sum": {"start": float(sec)},
+                "streams": [{"rtt": base + 37 * sec, "rttvar": 100 + sec, "retransmits": sec % 3}],
+            }
+            for sec in range(duration)
+        ]
+
+        (iperf_dir / f"iperf_client-data_{pair}.json").write_text(json.dumps({"intervals": intervals}))
+
+
+def make_record(duration: int = DURATION) -> dict:
+    return {
+        "experiment": {
+            "start": START.isoformat(),
+            "end": (START + timedelta(seconds=duration)).isoformat(),
+            "end_time_actual": (START + timedelta(seconds=duration + 1)).isoformat(),
+            "duration": duration,
+        },
+        "rtds": {"pmus": PMUS},
+    }
+
+
+@pytest.fixture
+def record():
+    return make_record()
+
+
+@pytest.fixture(autouse=True)
+def elastic(mocker):
+    return mocker.patch.object(csv_gen.utils, "connect_elastic", return_value=MagicMock())
+
+
+def read_rows(path) -> list:
+    with path.open(newline="") as f:
+        return list(csv.reader(f))
+
+
+@pytest.mark.parametrize("value", [
+    "2022-07-18T12:00:00.033333Z",
+    "2022-07-18T12:00:00.033333333Z",
+    "2022-07-18T12:00:00+00:00",
+    "2022-07-18T12:00:00.5+01:00",
+    "2022-07-18 12:00:00Z",
+])
+def test_fast_parse_time_matches_dateutil(value):
+    parsed = csv_gen.fast_parse_time(value)
+
+    assert parsed == parse_time(value)
+    assert parsed.isoformat() == parse_time(value).isoformat()
+
+
+def test_gen_csv_rows(mocker, record, tmp_path):
+    mocker.patch("elasticsearch.helpers.scan", fake_scan(make_docs()))
+    csv_path = tmp_path / "experiment_results.csv"
+
+    csv_gen.gen_csv(record, csv_path, "http://localhost:9200", slices=1)
+
+    rows = read_rows(csv_path)
+    header = rows[0]
+
+    # the extra time step at the end is dropped
+    assert len(rows) == 1 + 30 * DURATION
+    assert header[:6] == ["sequence", "approx_seconds_since_start", "timestamp_unix", "timestamp_iso8601", "frequency", "dfreq"]
+    assert header[6:8] == ["VA_angle_PMU1_bus1", "VA_real_PMU1_bus1"]
+    assert header[-2:] == ["freq_PMU2_bus2", "dfreq_PMU2_bus2"]
+    assert all(len(row) == len(header) for row in rows)
+
+    assert rows[1][:4] == ["0", "0.0", str(START.timestamp()), START.isoformat()]
+    assert [row[0] for row in rows[1:]] == [str(i) for i in range(30 * DURATION)]
+    assert float(rows[2][6]) == pytest.approx(0.1)
+    assert float(rows[2][9]) == pytest.approx(0.2 - 1)
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_gen_csv_sliced_matches_serial(mocker, record, tmp_path):
+    mocker.patch("elasticsearch.helpers.scan", fake_scan(make_docs()))
+
+    serial = tmp_path / "serial.csv"
+    sliced = tmp_path / "sliced.csv"
+
+    csv_gen.gen_csv(record, serial, "http://localhost:9200", slices=1)
+    csv_gen.gen_csv(record, sliced, "http://localhost:9200", slices=3)
+
+    assert sliced.read_bytes() == serial.read_bytes()
+
+
+def test_gen_csv_too_few_time_steps(mocker, record, tmp_path):
+    mocker.patch("elasticsearch.helpers.scan", fake_scan(make_docs(steps=200)))
+    csv_path = tmp_path / "experiment_results.csv"
+
+    with pytest.raises(SystemExit):
+        csv_gen.gen_csv(record, csv_path, "http://localhost:9200", slices=2)
+
+    assert not list(tmp_path.iterdir())
+
+
+def test_gen_csv_unsorted_docs(mocker, record, tmp_path):
+    mocker.patch("elasticsearch.helpers.scan", fake_scan(make_docs(), honor_sort=False))
+    csv_path = tmp_path / "experiment_results.csv"
+
+    with pytest.raises(SystemExit):
+        csv_gen.gen_csv(record, csv_path, "http://localhost:9200", slices=1)
+
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("golden, iperf", [
+    ("golden_results.csv", False),
+    ("golden_results_iperf.csv", True),
+])
+def test_gen_csv_matches_golden(mocker, tmp_path, golden, iperf):
+    """
+    The golden files were written by the previous, load-everything
+    implementation of gen_csv from these same docs and iperf results.
+    """
+
+    mocker.patch("elasticsearch.helpers.scan", fake_scan(make_docs(steps=30 * 2 + 1)))
+    csv_path = tmp_path / "experiment_results.csv"
+
+    iperf_dir = None
+
+    if iperf:
+        iperf_dir = tmp_path / "iperf"
+        iperf_dir.mkdir()
+        write_iperf(iperf_dir, duration=2)
+
+    csv_gen.gen_csv(make_record(duration=2), csv_path, "http://localhost:9200", iperf_dir=iperf_dir, slices=3)
+
+    assert csv_path.read_bytes() == (GOLDEN_DIR / golden).read_bytes()
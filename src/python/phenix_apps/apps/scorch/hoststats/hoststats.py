@@ -8,6 +8,127 @@ from phenix_apps.apps.scorch import ComponentBase
 from phenix_apps.common.logger import logger
 
 
+def host_vm_lists(vm_info: list) -> dict:
+    """
+    Map each minimega host to the names of the VMs on it, from `vm info`.
+    """
+
+    host_vms = {}
+
+    try:
+        for host in vm_info:
+            name_indx = host['Header'].index('name')
+            host_vms[host['Host']] = []
+
+            for vm in host['Tabular']:
+                host_vms[host['Host']].append(vm[name_indx])
+    except TypeError:
+        pass
+
+    return host_vms
+
+
+def host_samples(host_info: list, host_vms: dict, timestamp: int, fields: list = None) -> list:
+    """
+    Build one sample per minimega host from `host` output. If fields is given,
+    only those `host` fields are kept, and VM lists are only included if
+    host_vms isn't None.
+    """
+
+    samples = []
+
+    for host in host_info:
+        data = host['Data']
+        host_dict = {}
+
+        host_dict['compute_name'] = data.pop('Name')
+
+        if fields is None:
+            host_dict.update(data)
+        else:
+            host_dict.update({k: v for k, v in data.items() if k in fields})
+
+        if 'Load' in host_dict:
+            loads = host_dict.pop('Load').split()
+
+            host_dict['Load_1']  = float(loads[0])
+            host_dict['Load_5']  = float(loads[1])
+            host_dict['Load_15'] = float(loads[2])
+
+        host_dict['timestamp'] = timestamp
+
+        if host_vms is not None:
+            host_dict['vm_list'] = sorted(host_vms.get(host_dict['compute_name'], []))
+
+        samples.append(host_dict)
+
+    return samples
+
+
+class DeltaBatcher:
+    """
+    Batches samples into one record per host. The first sample in a record
+    has every value and later ones only have the values that changed since
+    the previous sample, so each record can be expanded on its own.
+
+    Record format:
+
+        {"compute_name": <host>, "timestamps": [<ms>, ...], "samples": [{...}, ...]}
+    """
+
+    def __init__(self) -> None:
+        self.batches = {}
+
+    def add(self, sample: dict) -> None:
+        sample = dict(sample)
+        host   = sample.pop('compute_name')
+        ts     = sample.pop('timestamp')
+
+        batch = self.batches.setdefault(host, {'timestamps': [], 'samples': [], 'last': {}})
+        last  = batch['last']
+
+        delta = {k: v for k, v in sample.items() if k not in last or last[k] != v}
+
+        batch['timestamps'].append(ts)
+        batch['samples'].append(delta)
+        batch['last'] = sample
+
+    def __len__(self) -> int:
+        return sum(len(b['samples']) for b in self.batches.values())
+
+    def records(self) -> list:
+        """
+        Returns a record for each host and starts new batches.
+        """
+
+        records = [
+            {'compute_name': host, 'timestamps': b['timestamps'], 'samples': b['samples']}
+            for host, b in self.batches.items()
+        ]
+
+        self.batches = {}
+
+        return records
+
+
+def expand_record(record: dict) -> list:
+    """
+    Expand a record written by DeltaBatcher back into full samples, in the
+    same form as the samples written when not in compact mode.
+    """
+
+    samples = []
+    current = {}
+
+    for ts, delta in zip(record['timestamps'], record['samples']):
+        current.update(delta)
+
+        sample = {'compute_name': record['compute_name'], **current, 'timestamp': ts}
+        samples.append(sample)
+
+    return samples
+
+
 class HostStats(ComponentBase):
     def __init__(self):
         ComponentBase.__init__(self, 'hoststats')
@@ -21,6 +142,15 @@ class HostStats(ComponentBase):
         self.resdata = []
         self.monitor = False
 
+        # compact mode
+        self.compact  = bool(self.metadata.get('compact', False))
+        self.fields   = self.metadata.get('fields', None)
+        self.vm_lists = bool(self.metadata.get('vmList', True))
+        self.batcher  = DeltaBatcher()
+        self.stopped  = threading.Event()
+        self.polls    = []  # poll durations since the last flush
+        self.missed   = 0   # poll periods skipped since the last flush
+
         self.execute_stage()
 
 
@@ -29,7 +159,11 @@ class HostStats(ComponentBase):
 
         self.monitor = True
 
-        thread = threading.Thread(target=self.__run_monitor)
+        if self.compact:
+            thread = threading.Thread(target=self.__run_sampler)
+        else:
+            thread = threading.Thread(target=self.__run_monitor)
+
         thread.start()
 
         logger.info(f'Started user component: {self.name}')
@@ -37,11 +171,16 @@ class HostStats(ComponentBase):
         # wait for calling process to send SIGTERM
         signal.pause()
         self.monitor = False
+        self.stopped.set()
 
         logger.info(f'Stopping user component: {self.name}')
 
         thread.join()
-        self.__flush_buffer()
+
+        if self.compact:
+            self.__flush_batches()
+        else:
+            self.__flush_buffer()
 
         logger.info(f'Stopped user component: {self.name}')
 
@@ -62,6 +201,86 @@ class HostStats(ComponentBase):
             count += 1
 
 
+    def __run_sampler(self):
+        period      = float(self.poll_period)
+        flush_every = max(int(self.flush_period/self.poll_period), 1)
+
+        start = time.monotonic()
+        tick  = 0
+
+        while not self.stopped.is_set():
+            polled = time.monotonic()
+
+            for sample in self.__sample():
+                self.batcher.add(sample)
+
+            self.polls.append(time.monotonic() - polled)
+
+            if len(self.polls) % flush_every == 0:
+                self.__flush_batches()
+
+            # Polls are scheduled on a fixed grid from the start time so slow
+            # polls don't push later ones back. If a poll overran one or more
+            # periods, those polls are skipped.
+            tick += 1
+            now  = time.monotonic()
+
+            if now > start + tick * period:
+                skip = int((now - start) / period) + 1
+                self.missed += skip - tick
+                tick = skip
+
+            self.stopped.wait(start + tick * period - now)
+
+
+    def __sample(self) -> list:
+        # only the VMs' names (and hosts) are needed, so skip the full VM info
+        host_vms = None
+        if self.vm_lists:
+            host_vms = host_vm_lists(self.mm.vm_info(summary='summary'))
+
+        # minimega's .columns only trims the tabular output, not the Data
+        # read here, so the selected fields are picked out of the full output
+        try:
+            return host_samples(self.mm.host(), host_vms, int(time.time()*1000), self.fields)
+        except TypeError:
+            return []
+
+
+    def __flush_batches(self):
+        count   = len(self.batcher)
+        records = self.batcher.records()
+
+        if records:
+            output_file = os.path.join(self.base_dir, 'host_stats.compact.jsonl')
+
+            with open(output_file, 'a+') as f:
+                for record in records:
+                    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+        if self.polls:
+            summary = (
+                f"recorded {count} samples from {len(records)} hosts in {len(self.polls)} polls "
+                f"(poll time avg {sum(self.polls)/len(self.polls):.3f}s max {max(self.polls):.3f}s, "
+                f"{self.missed} polls skipped)"
+            )
+
+            latest = []
+            for record in records:
+                current = expand_record(record)[-1]
+
+                details = [f"{k}={current[k]}" for k in ('Load_1', 'MemUsed') if k in current]
+                if 'vm_list' in current:
+                    details.append(f"VMs={len(current['vm_list'])}")
+
+                latest.append(f"{record['compute_name']}: {' '.join(details)}")
+
+            self.print(summary + ('; ' + ', '.join(latest) if latest else ''))
+
+        self.polls  = []
+        self.missed = 0
+
+
     def __flush_buffer(self):
         if not self.resdata:
             return
@@ -79,40 +298,14 @@ class HostStats(ComponentBase):
 
 
     def __get_resdata(self):
-        resdata  = []
-        host_vms = {}
         vm_info  = self.mm.vm_info()
-
-        try:
-            for host in vm_info:
-                name_indx = host['Header'].index('name')
-                host_vms[host['Host']] =  []
-
-                for vm in host['Tabular']:
-                    host_vms[host['Host']].append(vm[name_indx])
-        except TypeError:
-            pass
+        host_vms = host_vm_lists(vm_info)
 
         host_info = self.mm.host()
 
         self.print(f"getting host data for {len(vm_info)} hosts")
         try:
-            for host in host_info:
-                host_dict = {}
-
-                host_dict['compute_name'] = host['Data'].pop('Name')
-                host_dict.update(host['Data'])
-
-                loads = host_dict.pop('Load').split()
-
-                host_dict['Load_1']  = float(loads[0])
-                host_dict['Load_5']  = float(loads[1])
-                host_dict['Load_15'] = float(loads[2])
-
-                host_dict['timestamp'] = int(time.time()*1000)  # milliseconds
-                host_dict['vm_list']   = sorted(host_vms.get(host_dict['compute_name'], []))
-
-                resdata.append(host_dict)
+            resdata = host_samples(host_info, host_vms, int(time.time()*1000))  # milliseconds
         except TypeError:
             return []
 
@@ -0,0 +1,89 @@
+"""
+Unit tests for the hoststats component's compact sampling mode, run against a
+fake minimega connection.
+"""
+
+import json
+import time
+from pathlib import Path
+
+from phenix_apps.apps.scorch.hoststats import hoststats as hoststats_mod
+from phenix_apps.apps.scorch.hoststats.hoststats import DeltaBatcher, HostStats, expand_record, host_samples
+
+
+def test_delta_records_expand_to_full_samples(host_data):
+    hosts = ["compute1", "compute2"]
+    host_vms = {h: [f"{h}-vm{i}" for i in range(100)] for h in hosts}
+
+    full = []
+    batcher = DeltaBatcher()
+
+    for poll in range(20):
+        info = [{"Data": host_data(h, poll)} for h in hosts]
+
+        for sample in host_samples(info, host_vms, 1700000000000 + poll * 1000):
+            full.append(sample)
+            batcher.add(sample)
+
+    records = batcher.records()
+
+    assert len(records) == 2
+    assert len(batcher) == 0
+
+    expanded = [s for r in records for s in expand_record(r)]
+    assert sorted(expanded, key=lambda s: (s["timestamp"], s["compute_name"])) == full
+
+    # unchanged values (like VM lists) are only written once per record
+    assert "vm_list" in records[0]["samples"][0]
+    assert all("vm_list" not in s for s in records[0]["samples"][1:])
+    assert len(json.dumps(records)) * 10 < len(json.dumps(full))
+
+
+def test_host_samples_fields(host_data):
+    info = [{"Data": host_data("compute1", 0)}]
+
+    sample, = host_samples(info, None, 1, fields=["Load", "MemUsed"])
+
+    assert sample == {"compute_name": "compute1", "MemUsed": 100000, "Load_1": 0.0, "Load_5": 1.5, "Load_15": 1.25, "timestamp": 1}
+
+
+def test_sampler_keeps_cadence(mocker, scorch_component, fake_minimega):
+    print_ = mocker.patch.object(HostStats, "print")
+
+    # run the sampler for about a second before the stage is stopped
+    mocker.patch.object(hoststats_mod.signal, "pause", side_effect=lambda: time.sleep(1.05))
+
+    # the fourth poll overruns the next two periods
+    mm = fake_minimega([f"vm{i}" for i in range(10)], slow_polls={3: 0.25})
+    metadata = {"compact": True, "pollPeriod": 0.1, "flushPeriod": 0.5}
+    component = scorch_component(HostStats, "hoststats", "start", metadata, mm=mm)
+
+    start = mm.host_polls[0]
+    offsets = [(t - start) / 0.1 for t in mm.host_polls]
+
+    # polls stay on the original schedule, skipping the ones overrun
+    assert all(abs(o - round(o)) < 0.3 for o in offsets)
+    assert [round(o) for o in offsets[:5]] == [0, 1, 2, 3, 6]
+    assert round(offsets[-1]) in (9, 10)
+
+    output = Path(component.base_dir, "host_stats.compact.jsonl")
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sum(len(r["timestamps"]) for r in records) == len(mm.host_polls)
+
+    # only the summary is printed, once per flush
+    assert 1 <= print_.call_count <= 3
+    assert "2 polls skipped" in " ".join(str(c.args[0]) for c in print_.call_args_list)
+    assert mm.vm_info_args[0] == "summary"
+
+
+def test_sampler_skips_vm_info(mocker, scorch_component, fake_minimega):
+    mocker.patch.object(HostStats, "print")
+
+    mm = fake_minimega([f"vm{i}" for i in range(10)])
+    metadata = {"compact": True, "vmList": False, "fields": ["Load"]}
+    component = scorch_component(HostStats, "hoststats", "configure", metadata, mm=mm)
+
+    samples = component._HostStats__sample()
+
+    assert mm.vm_info_args == []
+    assert set(samples[0]) == {"compute_name", "Load_1", "Load_5", "Load_15", "timestamp"}
@@ -1,8 +1,10 @@
 import sys
 import os.path
 from collections import Counter
+from math import ceil
 from pathlib import Path
 from time import sleep
+from typing import List
 
 from box import Box
 
@@ -10,6 +12,10 @@ from phenix_apps.apps.scorch import ComponentBase
 from phenix_apps.common import utils
 from phenix_apps.common.logger import logger
 
+
+# Extra seconds to wait for results checks that gave up in the VM to report back.
+RESULTS_CHECK_GRACE = 10.0
+
 # TODO: configure which interface to use
 # OR be smart and determine which interface to use based on subnets
 # TODO: this doesn't allow servers that are on multiple VLANs
@@ -386,17 +392,106 @@ class Iperf(ComponentBase):
         Path(self.base_dir, "netstat_outputs.txt").write_text(ns_outputs)
         Path(self.base_dir, "ss_outputs.txt").write_text(ss_outputs)
 
+    @staticmethod
+    def _results_check(os_type: str, files: List[str], timeout: float) -> str:
+        """
+        Command that waits, for up to timeout seconds, for every file to end
+        with a closing brace, using bash on Linux and PowerShell on Windows.
+        It exits non-zero if they don't all get there in time.
+        """
+        seconds = ceil(timeout)
+
+        if os_type == "windows":
+            paths = ",".join(f"'{f}'" for f in files)
+            return (
+                f'powershell.exe -NoProfile -Command "$end = (Get-Date).AddSeconds({seconds}); foreach ($f in @({paths})) '
+                "{ while ((Get-Content -Tail 1 -ErrorAction SilentlyContinue $f) -notmatch '}') "
+                '{ if ((Get-Date) -gt $end) { exit 1 }; Start-Sleep -Seconds 1 } }"'
+            )
+
+        return f"timeout {seconds} bash -c 'for f in {' '.join(files)}; do until tail -c 2 $f 2>/dev/null | grep -q }}; do sleep 1; done; done'"
+
+    def _wait_for_client_results(self, mapping: Box, node_info: dict, timeout: float) -> None:
+        """
+        Wait for every iperf client to finish writing its JSON results file.
+
+        iperf3 only writes results to its log file once the test completes, so
+        a client is done when its file ends with the closing brace of the JSON
+        object. Each client VM is sent one command (suited to the VM's OS) that
+        waits in the VM for all of its files to be done, and the commands for
+        all VMs are waited on together.
+
+        Clients that haven't finished by the timeout are reported, and their
+        results are still collected.
+        """
+        paths = {}  # {client hostname: [client JSON result paths]}
+        for server in mapping.values():
+            for client in server.clients.values():
+                paths.setdefault(client.hostname, []).append(client.client_log_path)
+
+        tracker = utils.MMCommandTracker(self.mm)
+        handles = {}
+
+        for vm in sorted(paths):
+            check = self._results_check(node_info["os_types"].get(vm, "linux"), paths[vm], timeout)
+            handles[tracker.submit(check, vm=vm)] = vm
+
+        self.print(f"waiting up to {timeout} seconds for iperf results from {len(handles)} clients")
+
+        try:
+            results = tracker.wait(list(handles), timeout=timeout + RESULTS_CHECK_GRACE)
+        except RuntimeError:
+            # keep what the checks that did complete found
+            results = {handle: tracker.commands[handle]["results"] for handle in handles}
+
+        pending = sorted(
+            vm for handle, vm in handles.items()
+            if not results[handle] or results[handle][vm]["exitcode"] != 0
+        )
+
+        if pending:
+            self.eprint(f"WARNING: iperf results still incomplete after {timeout} seconds for {len(pending)} clients: {pending}")
+
+    def _collect_results(self, mapping: Box, node_info: dict) -> None:
+        """Copy the iperf results and logs for every client/server pair from their VMs."""
+        jobs = []
+        for server in mapping.values():
+            for client in server.clients.values():
+                # client results (this has the more interesting data)
+                jobs.append((client.hostname, client["client_log_path"], os.path.join(self.base_dir, os.path.basename(client["client_log_path"]))))
+
+                # server results for this client
+                jobs.append((server.hostname, client["server_log_path"], os.path.join(self.base_dir, os.path.basename(client["server_log_path"]))))
+
+                # debugging logs
+                client_log = f"iperf_client-log_client-{client.hostname}_server-{server.hostname}.log"
+                jobs.append((client.hostname, f"/{client_log}", os.path.join(self.base_dir, client_log)))
+
+                if node_info["os_types"][server.hostname] == "linux":
+                    server_log = f"iperf_server-log_client-{client.hostname}_server-{server.hostname}.log"
+                    jobs.append((server.hostname, f"/{server_log}", os.path.join(self.base_dir, server_log)))
+
+        workers = int(self.metadata.get("transfer_workers", 8))
+        self.print(f"collecting {len(jobs)} iperf files from {len(node_info['vms'])} nodes ({workers} at a time)")
+
+        results = utils.mm_recv_many(self.mm, jobs, max_workers=workers)
+        failed = [r for r in results if not r["success"]]
+
+        for result in failed:
+            self.eprint(f"failed to collect '{result['src']}' from '{result['vm']}': {result['error']}")
+
+        if failed:
+            sys.exit(1)
+
     def stop(self):
         logger.info(f'Stopping user component: {self.name}')
         node_info = self._get_node_info()
         mapping = self._build_iperf_mapping()
 
         if not self.metadata.get("use_rperf"):
-            sleep(5.0)
             # !!! WARNING: terminating iperf client early will cause JSON results to NOT be saved OR result in error flag being set !!!
-            if self.check_process_running(node_info["vms"][0], "iperf3", node_info["os_types"][node_info["vms"][0]]):
-                self.print(f"iperf is still running on {node_info['vms'][0]}, sleeping for 5 seconds to give it time to quit...")
-                sleep(5.0)
+            timeout = float(self.metadata.get("results_timeout", float(self.metadata.run_duration) + 10.0))
+            self._wait_for_client_results(mapping, node_info, timeout)
 
         if self.metadata.get("collect_netstat_info", False):
             try:
@@ -406,47 +501,9 @@ class Iperf(ComponentBase):
 
         self._kill_all_iperf(node_info)
 
-        if not self.metadata.get("use_rperf"):
-            sleep(5.0)
-
         # collect results
-        # TODO: parallelize file collection using miniccc filters?
         if not self.metadata.get("use_rperf"):
-            self.print(f"collecting iperf results for {len(node_info['vms'])} nodes")
-            for server in mapping.values():
-                for client in server.clients.values():
-                    # client results (this has the more interesting data)
-                    self.print(f"collecting iperf client data from '{client.hostname}'")
-                    utils.mm_recv(
-                        mm=self.mm,
-                        vm=client.hostname,
-                        src=client["client_log_path"],
-                        dst=os.path.join(self.base_dir, os.path.basename(client["client_log_path"])),
-                    )
-
-                    # server results for this client
-                    self.print(f"collecting iperf server data for client '{client.hostname}' from server '{server.hostname}'")
-                    utils.mm_recv(
-                        mm=self.mm,
-                        vm=server.hostname,
-                        src=client["server_log_path"],
-                        dst=os.path.join(self.base_dir, os.path.basename(client["server_log_path"])),
-                    )
-
-                    # debugging logs
-                    utils.mm_recv(
-                        mm=self.mm,
-                        vm=client.hostname,
-                        src=f"/iperf_client-log_client-{client.hostname}_server-{server.hostname}.log",
-                        dst=os.path.join(self.base_dir, f"iperf_client-log_client-{client.hostname}_server-{server.hostname}.log"),
-                    )
-                    if node_info["os_types"][server.hostname] == "linux":
-                        utils.mm_recv(
-                            mm=self.mm,
-                            vm=server.hostname,
-                            src=f"/iperf_server-log_client-{client.hostname}_server-{server.hostname}.log",
-                            dst=os.path.join(self.base_dir, f"iperf_server-log_client-{client.hostname}_server-{server.hostname}.log"),
-                        )
+            self._collect_results(mapping, node_info)
 
             # verify error field isn't set in iperf results
             for file in Path(self.base_dir).glob("*.json"):
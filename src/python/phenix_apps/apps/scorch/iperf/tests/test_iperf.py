@@ -0,0 +1,159 @@
+"""
+Unit tests for the iperf component's stop stage, run against a fake minimega
+connection.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from phenix_apps.apps.scorch.iperf import iperf as iperf_mod
+from phenix_apps.apps.scorch.iperf.iperf import Iperf
+from phenix_apps.common import utils
+
+
+@pytest.fixture(autouse=True)
+def clear_uuid_cache():
+    utils._VM_UUIDS.clear()
+
+
+@pytest.fixture
+def run_stop(mocker, scorch_component, fake_minimega):
+    """
+    Returns a function that runs the stop stage of an iperf component with
+    two servers, each with the given number of clients. Returns the component
+    and its fake minimega connection.
+    """
+
+    mocker.patch.object(iperf_mod.utils, "mm_kill_process")
+    mocker.patch.object(iperf_mod, "sleep")
+
+    def run(pairs: int, windows: tuple = (), slow_vms: dict | None = None, exitcodes: dict | None = None, **metadata) -> tuple:
+        servers = [
+            {"hostname": f"server{s}", "port_range_start": 5201 + s * 100, "clients": [{"hostname": f"client{s}-{c}"} for c in range(pairs)]}
+            for s in range(2)
+        ]
+
+        nodes = []
+        for server in servers:
+            for name in [server["hostname"]] + [c["hostname"] for c in server["clients"]]:
+                nodes.append({
+                    "general": {"hostname": name},
+                    "hardware": {"os_type": "windows" if name in windows else "linux"},
+                    "network": {"interfaces": [{"name": "eth0", "address": "10.0.0.1"}]},
+                })
+
+        metadata = {
+            "run_duration": 10,
+            "iperf_paths": {"linux": "/usr/bin/iperf3", "windows": "C:/iperf3.exe"},
+            "servers": servers,
+            **metadata,
+        }
+
+        mm = fake_minimega([node["general"]["hostname"] for node in nodes], polls_to_complete=1, slow_vms=slow_vms)
+        mm.exitcodes.update(exitcodes or {})
+
+        return scorch_component(Iperf, "iperf", "stop", metadata, nodes, mm=mm), mm
+
+    return run
+
+
+def checks(mm) -> dict:
+    """The results checks run in each VM."""
+
+    issued = {}
+
+    for cmd in mm.issued:
+        for vm in cmd["targets"]:
+            issued.setdefault(vm, []).append(cmd["cmd"])
+
+    return issued
+
+
+def linux_check(client: str, server: str, seconds: int) -> str:
+    path = f"/iperf_client-data_client-{client}_server-{server}.json"
+    return f"timeout {seconds} bash -c 'for f in {path}; do until tail -c 2 $f 2>/dev/null | grep -q }}; do sleep 1; done; done'"
+
+
+def fake_recv_many(mm, jobs, max_workers=8):
+    results = []
+
+    for vm, src, dst in jobs:
+        if "data_" in src:
+            Path(dst).write_text(json.dumps({"intervals": [{"streams": [{"rtt": 1500}]}, {"streams": [{"rtt": 2500}]}]}))
+        else:
+            Path(dst).write_text("log")
+
+        results.append({"vm": vm, "src": src, "dst": dst, "success": True, "error": None})
+
+    return results
+
+
+def test_stop_waits_for_results_and_collects_concurrently(mocker, run_stop):
+    recv = mocker.patch.object(iperf_mod.utils, "mm_recv_many", side_effect=fake_recv_many)
+
+    component, mm = run_stop(pairs=50, slow_vms={"client0-3": 4})
+
+    # every client is checked once, with a command that waits in the VM, and
+    # the checks are waited on together until the slowest is done
+    issued = checks(mm)
+    assert len(issued) == 100
+    assert all(len(cmds) == 1 for cmds in issued.values())
+    assert issued["client0-3"] == [linux_check("client0-3", "server0", 20)]
+    assert mm.calls.count("cc_commands") == 4
+
+    # no fixed sleeps beyond the kill settle time
+    assert all(call.args[0] <= 2.0 for call in iperf_mod.sleep.call_args_list)
+
+    # all four files per pair fetched with a single concurrent transfer call
+    recv.assert_called_once()
+    assert len(recv.call_args.args[1]) == 400
+
+    histogram = Path(component.base_dir, "rtt_histogram_client1-7-server1.txt").read_text()
+    assert histogram == "0.001500\n0.002500\n"
+
+
+def test_stop_checks_windows_clients_with_powershell(mocker, run_stop):
+    mocker.patch.object(iperf_mod.utils, "mm_recv_many", side_effect=fake_recv_many)
+
+    _, mm = run_stop(pairs=2, windows=("client0-1",), results_timeout=4.5)
+
+    issued = checks(mm)
+
+    [check] = issued["client0-1"]
+    assert check.startswith('powershell.exe -NoProfile -Command "$end = (Get-Date).AddSeconds(5); ')
+    assert "Get-Content -Tail 1" in check
+    assert "'/iperf_client-data_client-client0-1_server-server0.json'" in check
+
+    for vm in ("client0-0", "client1-0", "client1-1"):
+        assert issued[vm] == [linux_check(vm, f"server{vm[6]}", 5)]
+
+
+def test_stop_reports_incomplete_results(mocker, run_stop):
+    mocker.patch.object(iperf_mod, "RESULTS_CHECK_GRACE", 0.0)
+    recv = mocker.patch.object(iperf_mod.utils, "mm_recv_many", side_effect=fake_recv_many)
+    eprint = mocker.patch.object(Iperf, "eprint")
+
+    # client0-0's check gives up in the VM, and client1-1's never reports back
+    _, mm = run_stop(pairs=2, slow_vms={"client1-1": 1000}, exitcodes={"client0-0": 124}, results_timeout=0.2)
+
+    eprint.assert_called_once_with(
+        "WARNING: iperf results still incomplete after 0.2 seconds for 2 clients: ['client0-0', 'client1-1']"
+    )
+
+    # results are still collected for every client
+    assert len(recv.call_args.args[1]) == 16
+    assert mm.prefix == mm.filter == ""
+
+
+def test_stop_exits_on_failed_transfer(mocker, run_stop):
+    def failing_recv_many(mm, jobs, max_workers=8):
+        results = fake_recv_many(mm, jobs, max_workers)
+        results[1].update(success=False, error="not found")
+        return results
+
+    mocker.patch.object(iperf_mod.utils, "mm_recv_many", side_effect=failing_recv_many)
+
+    with pytest.raises(SystemExit):
+        run_stop(pairs=1)
@@ -48,6 +48,19 @@ class Kafka(ComponentBase):
             "csv", True
         )  # if false output a JSON
 
+        # options for the throughput-oriented listener
+        options = {
+            key: self.metadata[key]
+            for key in (
+                "high_throughput",
+                "poll_batch_size",
+                "flush_interval",
+                "flush_bytes",
+                "topic_refresh_seconds",
+            )
+            if key in self.metadata
+        }
+
         # get and output the output directory to the logger
         output_dir = self.base_dir
         logger.info(f"Output Directory: {output_dir}")
@@ -63,6 +76,7 @@ class Kafka(ComponentBase):
 
         kafka_ips_str = ",".join(kafka_ips)
         topics_str = json.dumps(topics)
+        options_str = json.dumps(options)
 
         # pass the inputs to the python file (which we execute as a
         # separate process)
@@ -72,7 +86,7 @@ class Kafka(ComponentBase):
         arguments = (
             f"python3 {executable} {csv_bool} '{self.path}' "
             f"{kafka_ips_str} '{topics_str}' "
-            f"'{self.exp_name}' '{wait_duration_seconds}'"
+            f"'{self.exp_name}' '{wait_duration_seconds}' '{options_str}'"
         )
         command = shlex.split(arguments)
 
@@ -6,16 +6,245 @@ the background without holding up other scorch components
 
 import csv
 import json
+import os
 import re
 import sys
 import time
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, List, Optional, Pattern
 
 from kafka import KafkaConsumer
 
 
-def run(csvBool, path, kafka_ips, topics, exp_name, wait_duration_seconds):
+def compile_filters(topics: List[dict]) -> Optional[Dict[str, Pattern]]:
+    """
+    Compile the topic filters into a single case-insensitive regex per key,
+    matching any of the values given for that key. A message is kept if any
+    key matches. Returns None if every message should be kept (no topics,
+    or a topic without filters).
+    """
+
+    if not topics:
+        return None
+
+    values = {}  # type: Dict[str, List[str]]
+    for topic in topics:
+        # if null filter
+        if not topic.get("filter", []):
+            return None
+
+        for filterVal in topic.get("filter", []):
+            pattern = str(filterVal.get("value")).lower()
+
+            # use regular expressions to account for wildcards
+            pattern = re.escape(pattern).replace(r"\*", ".*")
+            values.setdefault(filterVal.get("key"), []).append(pattern)
+
+    return {
+        key: re.compile(f"^(?:{'|'.join(patterns)})$", re.IGNORECASE)
+        for key, patterns in values.items()
+    }
+
+
+def message_matches(data: dict, filters: Optional[Dict[str, Pattern]]) -> bool:
+    """
+    Check if a message has any of the desired keys and values.
+    """
+
+    if filters is None:
+        return True
+
+    for key, regex in filters.items():
+        if key in data and regex.match(str(data[key]).lower()):
+            return True
+
+    return False
+
+
+def topic_pattern(topics: List[dict], exp_name: str) -> str:
+    """
+    Build a single regex matching every topic name to subscribe to, for use
+    with a pattern subscription that picks up new topics as they appear.
+    """
+
+    if not topics:
+        return exp_name + ".*"
+
+    names = []
+    for topic in topics:
+        name = topic.get("name")
+
+        # handle wildcards in the name, this only supports right
+        # wildcards, and we don't care about anything right of the wildcard
+        if name and "*" in name:
+            names.append(f".*{re.escape(name.split('*', 1)[0])}.*")
+        elif name:
+            names.append(re.escape(name))
+
+    return f"^(?:{'|'.join(names)})$"
+
+
+class CSVOutput:
+    """
+    Buffered CSV output that adds columns as new keys show up in messages.
+
+    Columns are never reordered or removed, and new keys are added to the
+    end. The output file's header has the columns known when the first rows
+    were written, and rows written after new keys show up are just longer.
+    Rewriting the file with a wider header would get slower as it grows (and
+    the listener is killed rather than stopped, so it can't be left until the
+    end), so the full header is kept in a sidecar file instead:
+    '<name>.header.csv' next to the output file.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1048576) -> None:
+        self.path = Path(path)
+        self.header_path = self.path.with_name(f"{self.path.stem}.header.csv")
+        self.file = self.path.open("a", newline="", encoding="utf-8", buffering=buffer_size)
+        self.writer = csv.writer(self.file)
+
+        self.columns = ["topic"]
+        self.known = {"topic"}
+        self.getter = None
+        self.wrote_header = False
+
+    def write(self, rows: List[dict]) -> None:
+        if not rows:
+            return
+
+        new = set()
+        for row in rows:
+            if not self.known.issuperset(row):
+                new.update(k for k in row if k not in self.known)
+
+        if new:
+            self._add_columns(sorted(new))
+
+        if not self.wrote_header:
+            self.writer.writerow(self.columns)
+            self.wrote_header = True
+
+        self.writer.writerows(map(self._values, rows))
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def _values(self, row: dict) -> tuple:
+        # most rows have every column, so try the fast path first
+        if self.getter:
+            try:
+                return self.getter(row)
+            except KeyError:
+                pass
+
+        return tuple(row.get(column, "") for column in self.columns)
+
+    def _add_columns(self, new: List[str]) -> None:
+        self.columns.extend(new)
+        self.known.update(new)
+        self.getter = itemgetter(*self.columns)  # always more than one column
+
+        # only the header is rewritten, and it's replaced in one go so it's
+        # never seen half written
+        tmp_path = self.header_path.with_name(f"{self.header_path.name}.tmp")
+
+        with tmp_path.open("w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow(self.columns)
+
+        os.replace(tmp_path, self.header_path)
+
+
+class JSONOutput:
+    """
+    Buffered newline-delimited JSON output.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1048576) -> None:
+        self.file = open(path, "a", encoding="utf-8", buffering=buffer_size)
+
+    def write(self, rows: List[dict]) -> None:
+        self.file.writelines(json.dumps(row) + "\n" for row in rows)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def run_high_throughput(csvBool, path, kafka_ips, topics, exp_name, options):
+    """
+    Throughput-oriented listener. Messages are consumed in batches with
+    poll(), output is buffered and flushed every flush_interval seconds (or
+    when flush_bytes are buffered), topics are matched with a pattern
+    subscription that's refreshed every topic_refresh_seconds, and CSV
+    columns grow as new keys show up.
+    """
+
+    max_records = int(options.get("poll_batch_size", 1000))
+    flush_interval = float(options.get("flush_interval", 1.0))
+    flush_bytes = int(options.get("flush_bytes", 1048576))
+    refresh_seconds = float(options.get("topic_refresh_seconds", 30))
+
     kafka_ips = kafka_ips.split(",")
     topics = json.loads(topics)
+    filters = compile_filters(topics)
+
+    # kafka consumer
+    consumer = KafkaConsumer(
+        bootstrap_servers=kafka_ips,
+        auto_offset_reset="latest",
+        enable_auto_commit=False,
+        value_deserializer=lambda m: json.loads(m.decode("utf-8")),
+        # topics matching the pattern are picked up on each metadata refresh
+        metadata_max_age_ms=int(refresh_seconds * 1000),
+    )
+    consumer.subscribe(pattern=topic_pattern(topics, exp_name))
+
+    if csvBool:
+        output = CSVOutput(path, flush_bytes)
+    else:
+        output = JSONOutput(path, flush_bytes)
+
+    last_flush = time.monotonic()
+
+    try:
+        while True:
+            batches = consumer.poll(timeout_ms=int(flush_interval * 1000), max_records=max_records)
+
+            for messages in batches.values():
+                rows = []
+
+                for message in messages:
+                    data = message.value
+
+                    if message_matches(data, filters):
+                        # output topic name
+                        row = {"topic": message.topic}
+                        row.update(data)
+                        rows.append(row)
+
+                output.write(rows)
+
+            now = time.monotonic()
+            if now - last_flush >= flush_interval:
+                output.flush()
+                last_flush = now
+    finally:
+        output.close()
+
+
+def run(csvBool, path, kafka_ips, topics, exp_name, wait_duration_seconds, options=None):
+    if options and options.get("high_throughput"):
+        return run_high_throughput(csvBool, path, kafka_ips, topics, exp_name, options)
+
+    kafka_ips = kafka_ips.split(",")
+    topics = json.loads(topics)
+    filters = compile_filters(topics)
 
     # kafka consumer
     consumer = KafkaConsumer(
@@ -43,10 +272,9 @@ def run(csvBool, path, kafka_ips, topics, exp_name, wait_duration_seconds):
             # wildcards
             if "*" in name:
                 foundTopics = False
-                filteredName = name.split("*", 1)[0]
 
                 # we don't care about anything right of the wildcard
-                pattern = f"^{re.escape(filteredName)}.*"
+                filteredName = name.split("*", 1)[0]
 
                 # if this is a new experiment, kafka may not have populated
                 # any tags... so wait until it has (up to 305 seconds,
@@ -62,6 +290,8 @@ def run(csvBool, path, kafka_ips, topics, exp_name, wait_duration_seconds):
                             subscribedTopics.append(topic)
                     if subscribedTopics:
                         foundTopics = True
+                    else:
+                        time.sleep(1.0)
             elif name and name not in subscribedTopics:
                 subscribedTopics.append(name)
 
@@ -75,103 +305,40 @@ def run(csvBool, path, kafka_ips, topics, exp_name, wait_duration_seconds):
 
         while True:
             for message in consumer:
-                storeMessage = False
-
                 # grab unfiltered/ unprocessed message data
                 data = message.value
 
-                if not topics:
-                    if csvBool:
-                        all_keys.update(data.keys())
-
-                        if writer is None:
-                            writer = csv.DictWriter(
-                                file,
-                                fieldnames=["topic"] + sorted(all_keys),
-                                extrasaction="ignore",
-                            )
-
-                            # check if the first line in the csv has
-                            # been written yet, write it if not
-                            if not wrote_header:
-                                writer.writeheader()
-                                wrote_header = True
-                    # store topic
-                    topicVal = message.topic
-
-                    storeMessage = True
-
-                # for each topic, check if this message has the
-                # desired key and value
-                for topic in topics:
-                    # if null filter
-                    if not topic.get("filter", []):
-                        if csvBool:
-                            all_keys.update(data.keys())
-
-                            if writer is None:
-                                writer = csv.DictWriter(
-                                    file,
-                                    fieldnames=["topic"] + sorted(all_keys),
-                                    extrasaction="ignore",
-                                )
-
-                                # check if the first line in the csv has
-                                # been written yet, write it if not
-                                if not wrote_header:
-                                    writer.writeheader()
-                                    wrote_header = True
-                        # store topic
-                        topicVal = message.topic
-
-                        storeMessage = True
-                        continue
-
-                    for filterVal in topic.get("filter", []):
-                        key = filterVal.get("key")
-                        value = filterVal.get("value")
-
-                        if key in data:
-                            actualValue = str(data.get(key)).lower()
-                            pattern = str(value).lower()
-
-                            # use regular expressions to account for wildcards
-                            pattern = re.escape(pattern).replace(r"\*", ".*")
-
-                            regex = re.compile(f"^{pattern}$", re.IGNORECASE)
-                            if regex.match(actualValue):
-                                if csvBool:
-                                    all_keys.update(data.keys())
-
-                                    if writer is None:
-                                        writer = csv.DictWriter(
-                                            file,
-                                            fieldnames=["topic"] + sorted(all_keys),
-                                            extrasaction="ignore",
-                                        )
-
-                                        # check if the first line in the csv has
-                                        # been written yet, write it if not
-                                        if not wrote_header:
-                                            writer.writeheader()
-                                            wrote_header = True
-                                # store topic
-                                topicVal = message.topic
-
-                                storeMessage = True
-
-                if storeMessage:
-                    # output topic name
-                    row = {"topic": topicVal}
-                    row.update(data)
-
-                    # write the data and flush the data to ensure that we
-                    # don't save to buffer
-                    if csvBool:
-                        writer.writerow(row)
-                    else:
-                        file.write(json.dumps(row) + "\n")
-                    file.flush()
+                # check if this message has any of the desired keys and values
+                if not message_matches(data, filters):
+                    continue
+
+                if csvBool:
+                    all_keys.update(data.keys())
+
+                    if writer is None:
+                        writer = csv.DictWriter(
+                            file,
+                            fieldnames=["topic"] + sorted(all_keys),
+                            extrasaction="ignore",
+                        )
+
+                        # check if the first line in the csv has
+                        # been written yet, write it if not
+                        if not wrote_header:
+                            writer.writeheader()
+                            wrote_header = True
+
+                # output topic name
+                row = {"topic": message.topic}
+                row.update(data)
+
+                # write the data and flush the data to ensure that we
+                # don't save to buffer
+                if csvBool:
+                    writer.writerow(row)
+                else:
+                    file.write(json.dumps(row) + "\n")
+                file.flush()
 
 
 def main():
@@ -186,5 +353,6 @@ if __name__ == "__main__":
     topics = sys.argv[4]
     exp_name = sys.argv[5]
     wait_duration_seconds = sys.argv[6]
+    options = json.loads(sys.argv[7]) if len(sys.argv) > 7 else {}
 
-    run(csvBool, path, kafka_ips, topics, exp_name, wait_duration_seconds)
+    run(csvBool, path, kafka_ips, topics, exp_name, wait_duration_seconds, options)
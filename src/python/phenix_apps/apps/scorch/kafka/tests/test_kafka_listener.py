@@ -0,0 +1,221 @@
+"""
+Unit tests for the kafka listener, run against a local fake consumer.
+"""
+
+import csv
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from phenix_apps.apps.scorch.kafka import kafka_listener
+
+TOPICS = [
+    {"name": "exp.foo.bar*", "filter": [{"key": "name", "value": "foo"}, {"key": "deviceOn", "value": False}]},
+    {"name": "exp.foo.bar2", "filter": [{"key": "name", "value": "bar*"}]},
+]
+
+
+class Done(Exception):
+    pass
+
+
+class FakeConsumer:
+    """
+    Stand-in for KafkaConsumer that hands out the same messages through
+    either iteration or poll(), then raises Done.
+    """
+
+    def __init__(self, messages: list):
+        self.messages = messages
+        self.subscribed = None
+
+    def subscribe(self, topics=(), pattern=None):
+        self.subscribed = pattern or topics
+
+    def topics(self):
+        return {m.topic for m in self.messages}
+
+    def __iter__(self):
+        yield from self.messages
+        raise Done
+
+    def poll(self, timeout_ms=0, max_records=None):
+        if not self.messages:
+            raise Done
+
+        batch, self.messages = self.messages[:max_records], self.messages[max_records:]
+        return {("topic", 0): batch}
+
+
+def make_messages(count: int) -> list:
+    names = ["foo", "Bar7", "baz", "qux"]
+    return [
+        SimpleNamespace(
+            topic=f"exp.foo.bar{i % 3}",
+            value={"name": names[i % 4], "deviceOn": i % 5 == 0, "value": i * 0.5, "ts": 1700000000 + i},
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_match(data: dict, topics: list) -> bool:
+    """
+    The per-message filter logic from before filters were compiled.
+    """
+
+    import re
+
+    if not topics:
+        return True
+
+    for topic in topics:
+        if not topic.get("filter", []):
+            return True
+
+        for filterVal in topic.get("filter", []):
+            key = filterVal.get("key")
+            if key in data:
+                pattern = re.escape(str(filterVal.get("value")).lower()).replace(r"\*", ".*")
+                if re.compile(f"^{pattern}$", re.IGNORECASE).match(str(data.get(key)).lower()):
+                    return True
+
+    return False
+
+
+def consume(mocker, messages, tmp_path, csv_bool=True, options=None):
+    consumer = FakeConsumer(messages)
+    mocker.patch.object(kafka_listener, "KafkaConsumer", return_value=consumer)
+    path = tmp_path / ("out.csv" if csv_bool else "out.ndjson")
+
+    with pytest.raises(Done):
+        kafka_listener.run(csv_bool, str(path), "127.0.0.1:9092", json.dumps(TOPICS), "exp", "1", options)
+
+    return consumer, path
+
+
+def test_compiled_filters_match_legacy():
+    filters = kafka_listener.compile_filters(TOPICS)
+
+    for message in make_messages(100):
+        assert kafka_listener.message_matches(message.value, filters) == legacy_match(message.value, TOPICS)
+
+    assert kafka_listener.compile_filters([]) is None
+    assert kafka_listener.compile_filters(TOPICS + [{"name": "exp.all"}]) is None
+
+
+def test_topic_pattern():
+    import re
+
+    pattern = re.compile(kafka_listener.topic_pattern(TOPICS, "exp"))
+
+    assert pattern.match("exp.foo.bar")
+    assert pattern.match("exp.foo.bar2")
+    assert pattern.match("other.exp.foo.bar99")
+    assert not pattern.match("exp.foo.baz")
+    assert kafka_listener.topic_pattern([], "exp") == "exp.*"
+
+
+def read_output(path, skip=0):
+    """
+    Rows of a CSV output file, with the full header from its sidecar file.
+    """
+
+    with path.with_name(f"{path.stem}.header.csv").open(newline="", encoding="utf-8") as f:
+        columns = next(csv.reader(f))
+
+    with path.open(newline="", encoding="utf-8") as f:
+        for _ in range(skip + 1):  # existing lines, then the output's own header
+            f.readline()
+
+        return list(csv.DictReader(f, fieldnames=columns, restval=""))
+
+
+def test_csv_output_keeps_multibyte_prefix(tmp_path):
+    path = tmp_path / "out.csv"
+    prefix = "gerät,straße\r\nµs,温度\r\n"
+    path.write_text(prefix, encoding="utf-8", newline="")
+
+    output = kafka_listener.CSVOutput(str(path))
+    output.write([{"topic": "t", "name": "größe"}])
+    output.write([{"topic": "t", "unit": "°C"}])
+    output.close()
+
+    with path.open(newline="", encoding="utf-8") as f:
+        assert f.readline() + f.readline() == prefix
+
+    assert read_output(path, skip=2) == [
+        {"topic": "t", "name": "größe", "unit": ""},
+        {"topic": "t", "name": "", "unit": "°C"},
+    ]
+
+
+def test_csv_output_adds_columns(tmp_path):
+    path = tmp_path / "out.csv"
+    path.write_text("left,alone\r\n")
+
+    output = kafka_listener.CSVOutput(str(path))
+    output.write([{"topic": "t", "b": 1, "a": 2}])
+    output.flush()
+    written = path.read_bytes()
+
+    output.write([{"topic": "t", "a": 3, "c": "x,y"}, {"topic": "t", "d": 4}])
+    output.write([{"topic": "only"}])
+    output.close()
+
+    # rows already written are never rewritten when columns are added, only
+    # the sidecar header is
+    assert path.read_bytes().startswith(written)
+    assert written == b"left,alone\r\ntopic,a,b\r\nt,2,1\r\n"
+    assert (tmp_path / "out.header.csv").read_bytes() == b"topic,a,b,c,d\r\n"
+
+    rows = read_output(path, skip=1)
+
+    assert rows == [
+        {"topic": "t", "a": "2", "b": "1", "c": "", "d": ""},
+        {"topic": "t", "a": "3", "b": "", "c": "x,y", "d": ""},
+        {"topic": "t", "a": "", "b": "", "c": "", "d": "4"},
+        {"topic": "only", "a": "", "b": "", "c": "", "d": ""},
+    ]
+
+
+@pytest.mark.parametrize("csv_bool", [True, False])
+def test_high_throughput_output(mocker, tmp_path, csv_bool):
+    messages = make_messages(1000)
+    expected = [m for m in messages if legacy_match(m.value, TOPICS)]
+
+    options = {"high_throughput": True, "poll_batch_size": 64}
+    consumer, path = consume(mocker, messages, tmp_path, csv_bool, options)
+
+    assert consumer.subscribed == kafka_listener.topic_pattern(TOPICS, "exp")
+
+    with path.open(newline="") as f:
+        if csv_bool:
+            rows = list(csv.DictReader(f))
+            assert [r["ts"] for r in rows] == [str(m.value["ts"]) for m in expected]
+        else:
+            rows = [json.loads(line) for line in f]
+            assert rows == [{"topic": m.topic, **m.value} for m in expected]
+
+
+@pytest.mark.benchmark
+def test_high_throughput_rate(mocker, tmp_path):
+    messages = make_messages(20000)
+
+    def timed(name, options):
+        # Best of three runs, so a busy test host doesn't decide the result.
+        best = None
+        for i in range(3):
+            out = tmp_path / f"{name}-{i}"
+            out.mkdir()
+            start = time.perf_counter()
+            consume(mocker, messages, out, True, options)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    legacy = timed("legacy", None)
+    fast = timed("fast", {"high_throughput": True})
+
+    assert fast < legacy
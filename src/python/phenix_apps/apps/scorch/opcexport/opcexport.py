@@ -98,6 +98,8 @@ class OPCExport(ComponentBase):
         host = self.metadata['opc_hostname']  # type: str
         elastic_ip = self.metadata.get('elastic_ip', '172.16.0.254')
         elastic_port = self.metadata.get('elastic_port', '9200')
+        queue_size = self.metadata.get('queue_size', 100000)
+        overflow = self.metadata.get('overflow', 'block')
 
         # start dirty elastic
         # open in new powershell window so that it will run in background and scorch can return
@@ -106,7 +108,7 @@ class OPCExport(ComponentBase):
         # after python is installed, the PATH variable is updated, but miniccc.exe doesn't pickup the change
         # because the process is still running. Therefore, absolute paths are needed.
         self.mm.cc_filter(f"name={host}")
-        self.mm.cc_background_once(f"C:/Progra~1/Python38/python.exe C:/opcexport/scada_to_elastic.py -u opc.tcp://{host}:4840 -f /opcexport/opc_variables.json -e {elastic_ip}:{elastic_port}")
+        self.mm.cc_background_once(f"C:/Progra~1/Python38/python.exe C:/opcexport/scada_to_elastic.py -u opc.tcp://{host}:4840 -f /opcexport/opc_variables.json -e {elastic_ip}:{elastic_port} --queue-size {queue_size} --overflow {overflow}")
         self.mm.clear_cc_filter()
 
         # Verify process is still running and didn't error out
@@ -8,6 +8,18 @@ Requires:
 
 asyncio is magic.
 
+Documents are written to Elasticsearch in batches by BulkWriter. When
+Elasticsearch can't keep up and the queue reaches its high-water mark
+(--queue-size), the overflow policy decides what happens:
+
+- "block" (default): the subscription handler waits for room in the queue,
+  which slows down processing of OPC data change notifications.
+- "drop": the oldest queued document is discarded to make room for the
+  newest one, keeping the data in Elasticsearch close to wall-clock time.
+
+Counters for queued, indexed, failed and dropped documents, and the lag
+between a document being queued and indexed, are logged periodically.
+
 Usage:
     python scada_to_elastic.py --help
 """
@@ -18,20 +30,21 @@ import json
 import logging
 import platform
 import sys
+import time
 from configparser import ConfigParser
 from datetime import datetime, timezone
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Tuple
 
 from asyncua import Client, Node
 from asyncua.common.subscription import DataChangeNotif
-from elasticsearch import AsyncElasticsearch
+from elasticsearch import ApiError, AsyncElasticsearch, TransportError
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
-__version__ = "0.4.0"
+__version__ = "0.5.0"
 
 INDEX_TYPE_MAPPING = {
     "properties": {
@@ -85,9 +98,244 @@ async def index_exists(es_obj: AsyncElasticsearch, index: str) -> bool:
     return False
 
 
+class BulkWriter:
+    """
+    Writes documents to Elasticsearch using bulk requests.
+
+    A batch is sent once it has batch_size documents or its oldest document
+    has waited flush_interval seconds, with up to max_in_flight bulk requests
+    running at once. Documents rejected with a retryable status (e.g. 429)
+    are retried with exponential backoff, up to max_retries times.
+    """
+
+    RETRY_STATUSES = {429, 502, 503, 504}
+
+    def __init__(
+        self,
+        es_obj: AsyncElasticsearch,
+        additions: dict,
+        batch_size: int = 1000,
+        flush_interval: float = 1.0,
+        max_in_flight: int = 4,
+        max_queued: int = 100000,
+        overflow: str = "block",
+        max_retries: int = 5,
+        retry_backoff: float = 0.5,
+    ) -> None:
+        if overflow not in ("block", "drop"):
+            raise ValueError(f"invalid overflow policy '{overflow}', must be 'block' or 'drop'")
+
+        self.es_obj = es_obj
+        self.additions = additions
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        # (time queued, document) tuples
+        self.queue = asyncio.Queue(maxsize=max_queued)  # type: asyncio.Queue[Tuple[float, dict]]
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.index_lock = asyncio.Lock()
+        self.tasks = set()  # type: Set[asyncio.Future]
+
+        # batch being filled by run(), sent by close() if run() is cancelled
+        self.batch = []  # type: List[Tuple[float, dict]]
+
+        self.stats = {
+            "queued": 0,  # documents put on the queue
+            "indexed": 0,  # documents successfully indexed
+            "failed": 0,  # documents that couldn't be indexed
+            "dropped": 0,  # documents dropped due to a full queue
+            "retried": 0,  # document retries
+            "lag": 0.0,  # seconds from queueing to indexing, for the latest batch
+        }
+
+    async def put(self, doc: dict) -> None:
+        """
+        Queue a document, applying the overflow policy if the queue is full.
+        """
+
+        item = (time.monotonic(), doc)
+
+        if self.overflow == "drop":
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except asyncio.QueueFull:
+                    self.queue.get_nowait()
+                    self.stats["dropped"] += 1
+        else:
+            await self.queue.put(item)
+
+        self.stats["queued"] += 1
+
+    async def run(self) -> None:
+        """
+        Pull batches off the queue and send them to Elasticsearch, forever.
+        """
+
+        while True:
+            self.batch.append(await self.queue.get())
+            deadline = self.batch[0][0] + self.flush_interval
+
+            while len(self.batch) < self.batch_size:
+                if not self.queue.empty():
+                    self.batch.append(self.queue.get_nowait())
+                    continue
+
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+                try:
+                    self.batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Blocks while max_in_flight requests are outstanding, which lets
+            # the queue fill up and the overflow policy kick in.
+            await self.in_flight.acquire()
+
+            batch, self.batch = self.batch, []
+            self._start(batch)
+
+    async def close(self) -> None:
+        """
+        Send everything queued so far and wait for all bulk requests to
+        finish. Call this once run() has been cancelled.
+        """
+
+        batch, self.batch = self.batch, []
+        remaining = self.queue.qsize()  # docs queued after this are left
+
+        while True:
+            while len(batch) < self.batch_size and remaining:
+                batch.append(self.queue.get_nowait())
+                remaining -= 1
+
+            if not batch:
+                break
+
+            await self.in_flight.acquire()
+            self._start(batch)
+            batch = []
+
+        if self.tasks:
+            await asyncio.wait(self.tasks)
+
+    def _start(self, batch: List[Tuple[float, dict]]) -> None:
+        """
+        Send a batch in the background. A slot in in_flight must be held.
+        """
+
+        task = asyncio.ensure_future(self.send(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def report(self, interval: float = 10.0) -> None:
+        """
+        Log the counters every interval seconds, forever.
+        """
+
+        while True:
+            await asyncio.sleep(interval)
+            log.info(
+                "bulk writer stats: " + ", ".join(f"{k}={v}" for k, v in self.stats.items())
+                + f", backlog={self.queue.qsize()}, in_flight={len(self.tasks)}"
+            )
+
+    async def send(self, batch: List[Tuple[float, dict]]) -> None:
+        """
+        Index a batch of documents, retrying the ones that fail with a
+        retryable error. Releases a slot in in_flight when done.
+        """
+
+        # documents that have been neither indexed nor counted as failed
+        pending = [doc for _, doc in batch]
+
+        try:
+            ts_now = datetime.now()
+            index = f"opc-dirty-{ts_now.strftime('%Y.%m.%d')}"
+
+            # Push pre-defined type mapping when creating index
+            async with self.index_lock:
+                if not await index_exists(self.es_obj, index):
+                    create_res = await self.es_obj.indices.create(index=index, mappings=INDEX_TYPE_MAPPING)
+                    log.info(f"Created index {index} (result: {create_res})")
+
+            # Set event.ingested to current time
+            additions = {**self.additions, "event": {"ingested": ts_now}}
+            pending = [{**additions, **doc} for doc in pending]
+
+            for attempt in range(self.max_retries + 1):
+                pending = await self._bulk(index, pending)
+
+                if not pending:
+                    break
+
+                if attempt == self.max_retries:
+                    log.error(f"Giving up on {len(pending)} docs after {attempt} retries")
+                    self.stats["failed"] += len(pending)
+                    pending = []
+                    break
+
+                self.stats["retried"] += len(pending)
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+            self.stats["lag"] = round(time.monotonic() - batch[0][0], 3)
+        except Exception as ex:
+            log.exception(f"Error indexing to Elastic: {ex}")
+            self.stats["failed"] += len(pending)
+        finally:
+            self.in_flight.release()
+
+    async def _bulk(self, index: str, docs: List[dict]) -> List[dict]:
+        """
+        Send one bulk request, returning the documents that should be retried.
+        """
+
+        operations = []
+        for doc in docs:
+            operations.append({"index": {}})
+            operations.append(doc)
+
+        try:
+            resp = await self.es_obj.bulk(index=index, operations=operations)
+        except ApiError as ex:
+            if ex.meta.status in self.RETRY_STATUSES:
+                log.warning(f"Bulk request rejected with status {ex.meta.status}, retrying")
+                return docs
+            raise
+        except TransportError as ex:  # connection errors and timeouts
+            log.warning(f"Bulk request failed, retrying: {ex}")
+            return docs
+
+        if not resp["errors"]:
+            self.stats["indexed"] += len(docs)
+            return []
+
+        retry = []
+        for doc, item in zip(docs, resp["items"]):
+            result = item["index"]
+            status = result.get("status", 500)
+
+            if status < 300:
+                self.stats["indexed"] += 1
+            elif status in self.RETRY_STATUSES:
+                retry.append(doc)
+            else:
+                log.error(f"Error indexing to Elastic: {result.get('error')}")
+                log.error(f"Bad data: {doc}")
+                self.stats["failed"] += 1
+
+        return retry
+
+
 class SubscriptionHandler:
-    def __init__(self, es_queue: asyncio.Queue) -> None:
-        self.es_queue = es_queue
+    def __init__(self, writer: BulkWriter) -> None:
+        self.writer = writer
         self.types_cache: dict[str, str] = {}
 
     async def datachange_notification(
@@ -192,7 +440,7 @@ class SubscriptionHandler:
         # else:
         #     es_data["measurement"]["analog"]["value"] = val
 
-        await self.es_queue.put(es_data)
+        await self.writer.put(es_data)
 
 
 async def setup_logging(verbose: bool = False):
@@ -264,6 +512,36 @@ async def main():
             "will default to 'http://172.16.0.254:9200'."
         )
     )
+    parser.add_argument(
+        "--batch-size", type=int,
+        default=1000,
+        help="Maximum number of documents in a single bulk request (default: 1000)"
+    )
+    parser.add_argument(
+        "--flush-interval", type=float,
+        default=1.0,
+        help="Maximum seconds a document waits before its batch is sent (default: 1.0)"
+    )
+    parser.add_argument(
+        "--max-in-flight", type=int,
+        default=4,
+        help="Maximum number of concurrent bulk requests (default: 4)"
+    )
+    parser.add_argument(
+        "--queue-size", type=int,
+        default=100000,
+        help="Maximum number of documents waiting to be indexed (default: 100000)"
+    )
+    parser.add_argument(
+        "--overflow", type=str,
+        choices=["block", "drop"],
+        default="block",
+        help=(
+            "What to do when the queue is full: 'block' waits for room, slowing "
+            "down OPC notifications, 'drop' discards the oldest queued document "
+            "(default: 'block')"
+        )
+    )
 
     args = parser.parse_args()
 
@@ -302,8 +580,37 @@ async def main():
     with vars_file.open("r", encoding="utf-8") as f:
         device_vars = json.load(f)  # type: Dict[str, List[str]]
 
-    # Queue of documents to push to Elasticsearch
-    es_queue = asyncio.Queue()
+    # Only need to create this dict once
+    es_additions = {
+        "ecs": {
+            "version": "8.1.0"
+        },
+        "agent": {
+            "type": "scada-to-elastic",
+            "version": __version__
+        },
+        "observer": {
+            "hostname": platform.node(),
+            "geo": {
+                "timezone": str(datetime.now(timezone.utc).astimezone().tzinfo)
+            }
+        },
+        "network": {
+            "protocol": "opc-ua",
+            "transport": "tcp",
+        },
+    }
+
+    # Queues documents and pushes them to Elasticsearch
+    writer = BulkWriter(
+        es_obj,
+        es_additions,
+        batch_size=args.batch_size,
+        flush_interval=args.flush_interval,
+        max_in_flight=args.max_in_flight,
+        max_queued=args.queue_size,
+        overflow=args.overflow,
+    )
 
     # --- Create client and execute commands ---
     # NOTE: by default, timeout is 4 seconds
@@ -314,7 +621,7 @@ async def main():
                 node = await client.nodes.objects.get_child([device, var])
                 nodes.append(node)
 
-        handler = SubscriptionHandler(es_queue)
+        handler = SubscriptionHandler(writer)
 
         # first arg is update period, in milliseconds
         subscription = await client.create_subscription(500, handler)
@@ -322,62 +629,22 @@ async def main():
         # We subscribe to data changes for two nodes (variables).
         await subscription.subscribe_data_change(nodes)
 
-        # Only need to create this dict once
-        es_additions = {
-            "event": {},  # event.ingested
-            "ecs": {
-                "version": "8.1.0"
-            },
-            "agent": {
-                "type": "scada-to-elastic",
-                "version": __version__
-            },
-            "observer": {
-                "hostname": platform.node(),
-                "geo": {
-                    "timezone": str(datetime.now(timezone.utc).astimezone().tzinfo)
-                }
-            },
-            "network": {
-                "protocol": "opc-ua",
-                "transport": "tcp",
-            },
-        }
-
         # TODO:
         #   Poll for changes every 10 milliseconds. if timestamp is the same, do nothing.
         #   if timestamp incremented, then send updates to elasticsearch.
 
-        while True:
-            # This blocks until there's something in queue,
-            # so no need to sleep like I do in rtds.py
-            # messages = es_queue.get()
-            es_data = await es_queue.get()
-
-            ts_now = datetime.now()
-            index = f"opc-dirty-{ts_now.strftime('%Y.%m.%d')}"
+        runner = asyncio.ensure_future(writer.run())
+        reporter = asyncio.ensure_future(writer.report())
 
-            # Set event.ingested to current time
-            es_additions["event"]["ingested"] = ts_now
-
-            body = {
-                **es_additions,
-                **es_data,
-            }
-
-            # Push pre-defined type mapping when creating index
-            if not await index_exists(es_obj, index):
-                create_res = await es_obj.indices.create(index=index, mappings=INDEX_TYPE_MAPPING)
-                log.info(f"Created index {index} (result: {create_res})")
-
-            # Push to Elasticsearch
-            try:
-                await es_obj.index(index=index, document=body)
-            except Exception as ex:
-                log.exception(f"Error indexing to Elastic: {ex}")
-                log.error(f"Bad data: {body}")
-                await es_obj.close()
-                return
+        try:
+            await asyncio.gather(runner, reporter)
+        finally:
+            # Flush what's left before disconnecting from Elasticsearch
+            runner.cancel()
+            reporter.cancel()
+            await asyncio.gather(runner, reporter, return_exceptions=True)
+            await writer.close()
+            await es_obj.close()
 
 
 if __name__ == "__main__":
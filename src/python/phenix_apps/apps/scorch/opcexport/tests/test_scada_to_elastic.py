@@ -0,0 +1,229 @@
+"""
+Unit tests for the OPC exporter's BulkWriter, run against a fake async
+Elasticsearch client.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("asyncua")
+
+from elasticsearch import ApiError, ConnectionError
+
+from phenix_apps.apps.scorch.opcexport import scada_to_elastic
+from phenix_apps.apps.scorch.opcexport.scada_to_elastic import BulkWriter
+
+
+def api_error(status: int) -> ApiError:
+    return ApiError("rejected", meta=SimpleNamespace(status=status), body={})
+
+
+def statuses(*codes):
+    """
+    Bulk response with one item per status code.
+    """
+
+    return {"errors": any(code >= 300 for code in codes), "items": [{"index": {"status": code}} for code in codes]}
+
+
+class FakeIndices:
+    def __init__(self):
+        self.created = []
+
+    async def exists(self, index):
+        return index in self.created
+
+    async def create(self, index, mappings=None):
+        self.created.append(index)
+        return {"acknowledged": True}
+
+
+class FakeElastic:
+    """
+    Stand-in for AsyncElasticsearch. Each bulk request takes delay seconds
+    and is answered with the next queued response (a bulk response or an
+    exception to raise), or with success once they run out.
+    """
+
+    def __init__(self, responses=None, delay: float = 0.0):
+        self.indices = FakeIndices()
+        self.responses = list(responses or [])
+        self.delay = delay
+        self.requests = []
+        self.active = 0
+        self.peak = 0
+
+    async def bulk(self, index, operations):
+        docs = operations[1::2]
+        self.requests.append([doc["n"] for doc in docs])
+
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+
+        if self.responses:
+            resp = self.responses.pop(0)
+
+            if isinstance(resp, Exception):
+                raise resp
+
+            return resp
+
+        return statuses(*[201] * len(docs))
+
+
+@pytest.fixture(autouse=True)
+def index_cache(mocker):
+    mocker.patch.object(scada_to_elastic, "INDEX_CACHE", set())
+
+
+def make_writer(es, **kwargs) -> BulkWriter:
+    kwargs.setdefault("flush_interval", 0.05)
+    kwargs.setdefault("retry_backoff", 0.0)
+
+    return BulkWriter(es, {"agent": {"type": "test"}}, **kwargs)
+
+
+async def run_until_closed(writer: BulkWriter, docs: int, wait: float = 0.0) -> None:
+    runner = asyncio.ensure_future(writer.run())
+
+    for n in range(docs):
+        await writer.put({"n": n})
+
+    await asyncio.sleep(wait)
+
+    runner.cancel()
+    await asyncio.gather(runner, return_exceptions=True)
+    await writer.close()
+
+
+def test_batching():
+    es = FakeElastic()
+    writer = make_writer(es, batch_size=3)
+
+    asyncio.run(run_until_closed(writer, 7, wait=0.2))
+
+    assert es.requests == [[0, 1, 2], [3, 4, 5], [6]]
+    assert es.indices.created and len(es.indices.created) == 1
+    assert writer.stats["queued"] == writer.stats["indexed"] == 7
+    assert writer.stats["failed"] == writer.stats["dropped"] == writer.stats["retried"] == 0
+
+
+def test_retry_rejected_docs():
+    es = FakeElastic([statuses(429, 201, 400), statuses(201)])
+    writer = make_writer(es, batch_size=3)
+
+    asyncio.run(run_until_closed(writer, 3, wait=0.2))
+
+    assert es.requests == [[0, 1, 2], [0]]
+    assert writer.stats["indexed"] == 2
+    assert writer.stats["failed"] == 1
+    assert writer.stats["retried"] == 1
+
+
+def test_retry_whole_batch_gives_up():
+    es = FakeElastic([ConnectionError("down"), api_error(503), api_error(429)])
+    writer = make_writer(es, batch_size=2, max_retries=2)
+
+    asyncio.run(run_until_closed(writer, 2, wait=0.2))
+
+    assert es.requests == [[0, 1]] * 3
+    assert writer.stats["indexed"] == 0
+    assert writer.stats["failed"] == 2
+    assert writer.stats["retried"] == 4
+
+
+def test_error_during_retry_counts_pending_docs():
+    # docs 1 and 2 are indexed, then retrying doc 0 fails outright
+    es = FakeElastic([statuses(429, 201, 201), api_error(400)])
+    writer = make_writer(es, batch_size=3)
+
+    asyncio.run(run_until_closed(writer, 3, wait=0.2))
+
+    assert es.requests == [[0, 1, 2], [0]]
+    assert writer.stats["indexed"] == 2
+    assert writer.stats["failed"] == 1
+
+
+def test_back_pressure():
+    es = FakeElastic(delay=0.1)
+    writer = make_writer(es, batch_size=1, max_in_flight=1, max_queued=2)
+
+    async def scenario():
+        runner = asyncio.ensure_future(writer.run())
+        putter = asyncio.ensure_future(run_puts())
+
+        await asyncio.sleep(0.05)
+
+        # one request in flight, one batch waiting on it and a full queue
+        assert not putter.done()
+        assert writer.queue.qsize() == 2
+
+        await putter
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        await writer.close()
+
+    async def run_puts():
+        for n in range(8):
+            await writer.put({"n": n})
+
+    asyncio.run(scenario())
+
+    assert es.peak == 1
+    assert es.requests == [[n] for n in range(8)]
+    assert writer.stats["indexed"] == 8
+    assert writer.stats["dropped"] == 0
+
+
+def test_overflow_drop():
+    es = FakeElastic()
+    writer = make_writer(es, batch_size=10, max_queued=3, overflow="drop")
+
+    async def scenario():
+        for n in range(8):
+            await writer.put({"n": n})
+
+        await writer.close()
+
+    asyncio.run(scenario())
+
+    assert es.requests == [[5, 6, 7]]
+    assert writer.stats["queued"] == 8
+    assert writer.stats["dropped"] == 5
+    assert writer.stats["indexed"] == 3
+
+
+def test_close_flushes_partial_batch_and_waits():
+    es = FakeElastic(delay=0.1)
+    writer = make_writer(es, batch_size=4, flush_interval=60.0)
+
+    async def scenario():
+        runner = asyncio.ensure_future(writer.run())
+
+        for n in range(10):
+            await writer.put({"n": n})
+
+        await asyncio.sleep(0.01)
+
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        await writer.close()
+
+        assert not writer.tasks
+
+    asyncio.run(scenario())
+
+    assert sorted(n for request in es.requests for n in request) == list(range(10))
+    assert writer.stats["indexed"] == 10
+
+
+def test_invalid_overflow():
+    with pytest.raises(ValueError):
+        BulkWriter(FakeElastic(), {}, overflow="wait")
@@ -1,5 +1,7 @@
+import os
 import shutil
 import sys
+from functools import partial
 from pathlib import Path
 
 from phenix_apps.apps.scorch import ComponentBase
@@ -97,130 +99,268 @@ class PCAP(ComponentBase):
         self.print("clearing capture on minimega")
         self.mm.clear_capture("pcap")
 
-        self.print(f"verifying {len(pcap_paths)} PCAP files")
+        merge = self.metadata.get("create_merged_pcap", False)
+        raw_dir = Path(self.base_dir, "raw")
+        merged_path = Path(self.base_dir, "merged.pcap")
+        m_path = Path(self.base_dir, "pcap_metadata.json")
+
+        # if stop is being run again, PCAPs that were merged will already
+        # have been moved into the "raw" sub-directory
+        if merge:
+            pcap_paths = [
+                Path(raw_dir, p.name) if not p.is_file() and Path(raw_dir, p.name).is_file() else p
+                for p in pcap_paths
+            ]
+
+        # capinfos results from a previous run, for PCAPs that haven't changed
+        cached_metadata = utils.read_json(m_path) if m_path.is_file() else {}
         pcap_metadata = {}
-        for pcap_path in pcap_paths:
-            if not pcap_path.is_file():
-                self.eprint(f"PCAP file doesn't exist: {pcap_path}")
-                sys.exit(1)
 
-            try:
-                pcap_info = utils.pcap_capinfos(pcap_path)
-            except Exception as ex:
-                self.eprint(f"failed to run capinfos to verify on PCAP file {pcap_path}: {ex}")
-                sys.exit(1)
+        # Processing is done as a graph of steps, each run as soon as the steps
+        # it depends on are done. Steps whose outputs are newer than their inputs
+        # are skipped.
+        steps = {}
 
-            # verify pcap files are valid by checking their metadata with capinfos
-            if not pcap_info or "pcap" not in pcap_info["File type"]:
-                self.eprint(f"failed validation of PCAP metadata for file {pcap_path}\nraw info: {pcap_info}")
-                sys.exit(1)
+        self.print(f"verifying {len(pcap_paths)} PCAP files")
+        for pcap_path in pcap_paths:
+            steps[f"capinfos {pcap_path.name}"] = {
+                "func": partial(self._verify_pcap, pcap_path, pcap_metadata),
+                "inputs": [pcap_path],
+                "outputs": [m_path] if pcap_path.name in cached_metadata else [],
+            }
 
-            pcap_metadata[pcap_path.name] = pcap_info
+        verified = list(steps)
+        final_paths = pcap_paths
+        metadata_deps = list(verified)
 
         # merge pcap files together into a single consolidated PCAP
         # the pcaps that were merged will be moved into "raw" sub-directory
-        if self.metadata.get("create_merged_pcap", False):
+        if merge:
             self.print(f"merging {len(pcap_paths)} PCAP files into a single file (create_merged_pcap=true)")
-
-            merged_path = self._merge_pcaps(pcap_paths)
-
-            # move all pcaps that were merged into "raw" sub-directory
-            new_paths = []
-            raw_dir = Path(self.base_dir, "raw")
-            raw_dir.mkdir(exist_ok=True)
-            for pcap_path in pcap_paths:
-                new_path = Path(pcap_path.parent, "raw", pcap_path.name)
-                pcap_path.rename(new_path)
-                new_paths.append(new_path)
-
-            pcap_paths = new_paths
-            pcap_paths.append(merged_path)
-
-            if self.metadata.get("dedupe", True):
-                self.print(f"'dedupe' is true, removing duplicates from '{merged_path.name}'")
-
-                # special processing for TCP flood packets
-                dos_targets = []
-                for comp in self.extract_app("scorch").metadata.components:
-                    if comp.type == "disruption" and comp.metadata.current_disruption in ["dos", "cyber_physical"]:
-                        dos_targets = [t.hostname for t in comp.metadata.dos.targets]
-                        break
-
-                if dos_targets:
-                    self.print("Performing special processing for TCP packet flood")
-                    non_target_paths = [
-                        p for p in pcap_paths
-                        if p != merged_path and not any(t in p.name for t in dos_targets)
-                    ]
-                    target_paths = [p for p in pcap_paths if p != merged_path and p not in non_target_paths]
-
-                    # merge all hosts EXCEPT hosts targetted by DOS into merged.pcap, dedupe
-                    self.print(f"Special processing: merging non-target PCAPs: {[p.name for p in non_target_paths]}")
-                    merged_path = self._merge_pcaps(non_target_paths)
-                    self._dedupe_pcap(merged_path)
-
-                    # split each target's PCAP into two, first part has the DOS packets, second one has everything else
-                    self.print(f"Special processing: splitting DOS packets from non-DOS packets for targets: {[p.name for p in target_paths]}")
-                    non_dos = []
-                    fragmented = []
-                    for t_path in target_paths:
-                        frag_path = t_path.with_stem(f"{t_path.stem}_fragmented")
-                        # give tshark 2 minutes to complete
-                        utils.run_command(
-                            f'tshark -r {t_path} -w {frag_path} -o ip.defragment:FALSE -o tcp.desegment_tcp_streams:FALSE -n -Y "ip.frag_offset > 0"',
-                            timeout=120.0
-                        )
-                        fragmented.append(frag_path)
-
-                        nd_path = t_path.with_stem(f"{t_path.stem}_no_dos_fragments")
-                        # give tshark 2 minutes to complete
-                        utils.run_command(
-                            f'tshark -r {t_path} -w {nd_path} -o ip.defragment:FALSE -o tcp.desegment_tcp_streams:FALSE -n -Y "not (ip.frag_offset > 0)"',
-                            timeout=120.0
-                        )
-                        non_dos.append(nd_path)
-
-                    # merge the "everything else" pcaps from targets into merged.pcap, dedupe again
-                    self.print("Special processing: merging non-attack packets into merged.pcap and deduping")
-                    # GAH, need to make sure pcap is merged into self
-                    merged_path = self._merge_pcaps([merged_path, *non_dos])
-                    self._dedupe_pcap(merged_path)
-
-                    # merge the "dos packets" pcaps from targets into merged.pcap, DON'T dedupe this time
-                    self.print("Special processing: final merge of fragmented attack packets into merged.pcap")
-                    merged_path = self._merge_pcaps([merged_path, *fragmented])
-
-                    # delete the fragmented PCAPs (those with DOS packets)
-                    self.print("Special processing: deleting fragmented PCAPs (those with DOS packets)")
-                    for wd_path in fragmented:
-                        wd_path.unlink()
-                    self.print("Finished special processing for TCP packet flood")
-                else:
-                    self._dedupe_pcap(merged_path)
-            else:
-                self.print(f"NOT removing duplicates from '{merged_path.name}' (dedupe=false)")
-
-            pcap_metadata[merged_path.name] = utils.pcap_capinfos(merged_path)
+            raw_paths = [Path(raw_dir, p.name) for p in pcap_paths]
+            final_paths = [*raw_paths, merged_path]
+            merged_steps = self._merged_steps(pcap_paths, raw_paths, merged_path, verified)
+            steps.update(merged_steps)
+
+            steps["capinfos merged.pcap"] = {
+                "func": partial(self._verify_pcap, merged_path, pcap_metadata, False),
+                "deps": [list(merged_steps)[-1]],
+                "inputs": [merged_path],
+                "outputs": [m_path] if merged_path.name in cached_metadata else [],
+            }
+            metadata_deps.append("capinfos merged.pcap")
 
         # Save metadata to JSON file
-        m_path = Path(self.base_dir, "pcap_metadata.json")
-        self.print(f"saving pcap metadata to {m_path}")
-        utils.write_json(m_path, pcap_metadata)
+        steps["save metadata"] = {
+            "func": partial(self._save_metadata, m_path, [p.name for p in final_paths], pcap_metadata, cached_metadata),
+            "deps": metadata_deps,
+        }
 
         # Process PCAPs to JSON, once all captures have been stopped
         if self.metadata.get("convertToJSON", False):
-            self.print(f"PCAP --> JSON conversion enabled, converting {len(pcap_paths)} files")
+            self.print(f"PCAP --> JSON conversion enabled, converting {len(final_paths)} files")
+
+            for pcap_path in final_paths:
+                if pcap_path == merged_path:
+                    deps = ["capinfos merged.pcap"]
+                elif merge:
+                    deps = ["move raw PCAPs"]
+                else:
+                    deps = [f"capinfos {pcap_path.name}"]
 
-            for pcap_path in pcap_paths:
                 # load6-0.pcap -> load6-0.jsonl
                 json_path = pcap_path.with_suffix(".jsonl")  # .pcap.jsonl could break filters for "*.pcap*"
-                self.print(f"running PCAP --> JSON conversion (source={pcap_path.name}, dest={json_path.name})")
-                utils.run_command(f"tshark -r {pcap_path} -T ek > {json_path}")
+                steps[f"convert {pcap_path.name}"] = {
+                    "func": partial(self._convert_to_json, pcap_path, json_path),
+                    "deps": deps,
+                    "inputs": [pcap_path],
+                    "outputs": [json_path],
+                }
         else:
             self.print("PCAP --> JSON conversion disabled")
 
+        workers = int(self.metadata.get("workers", os.cpu_count()))
+        self.print(f"processing PCAPs ({len(steps)} steps, {workers} workers)")
+
+        timings = utils.run_task_graph(steps, max_workers=workers)
+        self.stage_info["steps"] = timings
+
+        skipped = [name for name, timing in timings.items() if timing["skipped"]]
+        if skipped:
+            self.print(f"skipped {len(skipped)} steps with up to date outputs: {skipped}")
+
         logger.info(f"Stopped user component: {self.name}")
 
+    def _merged_steps(self, pcap_paths: list[Path], raw_paths: list[Path], merged_path: Path, verified: list[str]) -> dict:
+        """
+        Steps to create merged.pcap, which all list merged.pcap as an output
+        so they're skipped together if it's newer than the raw PCAPs.
+        """
+
+        steps = {}
+        move = {
+            "func": partial(self._move_to_raw, pcap_paths, raw_paths),
+            "outputs": raw_paths,
+        }
+
+        if not self.metadata.get("dedupe", True):
+            steps["merge"] = {
+                "func": partial(self._merge_and_dedupe, pcap_paths, False),
+                "deps": verified,
+                "inputs": pcap_paths,
+                "outputs": [merged_path],
+            }
+            steps["move raw PCAPs"] = {**move, "deps": ["merge"]}
+            return steps
+
+        # special processing for TCP flood packets
+        dos_targets = []
+        for comp in self.extract_app("scorch").metadata.components:
+            if comp.type == "disruption" and comp.metadata.current_disruption in ["dos", "cyber_physical"]:
+                dos_targets = [t.hostname for t in comp.metadata.dos.targets]
+                break
+
+        if not dos_targets:
+            steps["merge"] = {
+                "func": partial(self._merge_and_dedupe, pcap_paths, True),
+                "deps": verified,
+                "inputs": pcap_paths,
+                "outputs": [merged_path],
+            }
+            steps["move raw PCAPs"] = {**move, "deps": ["merge"]}
+            return steps
+
+        # merged.pcap is built from the PCAPs once they've been moved to "raw"
+        steps["move raw PCAPs"] = {**move, "deps": verified}
+
+        non_target_paths = [p for p in raw_paths if not any(t in p.name for t in dos_targets)]
+        target_paths = [p for p in raw_paths if p not in non_target_paths]
+
+        # merge all hosts EXCEPT hosts targetted by DOS into merged.pcap, dedupe
+        steps["merge non-targets"] = {
+            "func": partial(self._merge_non_targets, non_target_paths),
+            "deps": ["move raw PCAPs"],
+            "inputs": non_target_paths,
+            "outputs": [merged_path],
+        }
+
+        # split each target's PCAP into two, first part has the DOS packets, second one has everything else
+        fragmented = []
+        non_dos = []
+        for t_path in target_paths:
+            frag_path = t_path.with_stem(f"{t_path.stem}_fragmented")
+            nd_path = t_path.with_stem(f"{t_path.stem}_no_dos_fragments")
+            fragmented.append(frag_path)
+            non_dos.append(nd_path)
+
+            steps[f"split {t_path.name}"] = {
+                "func": partial(self._split_dos_packets, t_path, frag_path, nd_path),
+                "deps": ["move raw PCAPs"],
+                "inputs": [t_path],
+                "outputs": [merged_path, nd_path],
+            }
+
+        # merge the "everything else" pcaps from targets into merged.pcap, dedupe again,
+        # then merge the "dos packets" pcaps from targets into merged.pcap, DON'T dedupe this time
+        steps["merge targets"] = {
+            "func": partial(self._merge_targets, merged_path, non_dos, fragmented),
+            "deps": ["merge non-targets", *[f"split {p.name}" for p in target_paths]],
+            "inputs": raw_paths,
+            "outputs": [merged_path],
+        }
+
+        return steps
+
+    def _verify_pcap(self, pcap_path: Path, pcap_metadata: dict, validate: bool = True) -> None:
+        if not pcap_path.is_file():
+            self.eprint(f"PCAP file doesn't exist: {pcap_path}")
+            sys.exit(1)
+
+        try:
+            pcap_info = utils.pcap_capinfos(pcap_path)
+        except Exception as ex:
+            if not validate:
+                raise
+
+            self.eprint(f"failed to run capinfos to verify on PCAP file {pcap_path}: {ex}")
+            sys.exit(1)
+
+        # verify pcap files are valid by checking their metadata with capinfos
+        if validate and (not pcap_info or "pcap" not in pcap_info["File type"]):
+            self.eprint(f"failed validation of PCAP metadata for file {pcap_path}\nraw info: {pcap_info}")
+            sys.exit(1)
+
+        pcap_metadata[pcap_path.name] = pcap_info
+
+    def _save_metadata(self, m_path: Path, names: list[str], pcap_metadata: dict, cached_metadata: dict) -> None:
+        self.print(f"saving pcap metadata to {m_path}")
+
+        # keep the same order as the PCAPs, skipped steps use the previous results
+        utils.write_json(m_path, {name: pcap_metadata.get(name, cached_metadata.get(name)) for name in names})
+
+    def _move_to_raw(self, pcap_paths: list[Path], raw_paths: list[Path]) -> None:
+        # move all pcaps that were merged into "raw" sub-directory
+        raw_paths[0].parent.mkdir(exist_ok=True)
+
+        for pcap_path, new_path in zip(pcap_paths, raw_paths):
+            if pcap_path != new_path:
+                pcap_path.rename(new_path)
+
+    def _merge_and_dedupe(self, pcap_paths: list[Path], dedupe: bool) -> None:
+        merged_path = self._merge_pcaps(pcap_paths)
+
+        if dedupe:
+            self.print(f"'dedupe' is true, removing duplicates from '{merged_path.name}'")
+            self._dedupe_pcap(merged_path)
+        else:
+            self.print(f"NOT removing duplicates from '{merged_path.name}' (dedupe=false)")
+
+    def _merge_non_targets(self, non_target_paths: list[Path]) -> None:
+        self.print(f"Special processing: merging non-target PCAPs: {[p.name for p in non_target_paths]}")
+        merged_path = self._merge_pcaps(non_target_paths)
+        self._dedupe_pcap(merged_path)
+
+    def _split_dos_packets(self, t_path: Path, frag_path: Path, nd_path: Path) -> None:
+        self.print(f"Special processing: splitting DOS packets from non-DOS packets for target: {t_path.name}")
+
+        # give tshark 2 minutes to complete
+        utils.run_command(
+            f'tshark -r {t_path} -w {frag_path} -o ip.defragment:FALSE -o tcp.desegment_tcp_streams:FALSE -n -Y "ip.frag_offset > 0"',
+            timeout=120.0
+        )
+
+        # give tshark 2 minutes to complete
+        utils.run_command(
+            f'tshark -r {t_path} -w {nd_path} -o ip.defragment:FALSE -o tcp.desegment_tcp_streams:FALSE -n -Y "not (ip.frag_offset > 0)"',
+            timeout=120.0
+        )
+
+    def _merge_targets(self, merged_path: Path, non_dos: list[Path], fragmented: list[Path]) -> None:
+        # merge the "everything else" pcaps from targets into merged.pcap, dedupe again
+        self.print("Special processing: merging non-attack packets into merged.pcap and deduping")
+        # GAH, need to make sure pcap is merged into self
+        merged_path = self._merge_pcaps([merged_path, *non_dos])
+        self._dedupe_pcap(merged_path)
+
+        # merge the "dos packets" pcaps from targets into merged.pcap, DON'T dedupe this time
+        self.print("Special processing: final merge of fragmented attack packets into merged.pcap")
+        merged_path = self._merge_pcaps([merged_path, *fragmented])
+
+        # delete the fragmented PCAPs (those with DOS packets)
+        self.print("Special processing: deleting fragmented PCAPs (those with DOS packets)")
+        for wd_path in fragmented:
+            wd_path.unlink()
+        self.print("Finished special processing for TCP packet flood")
+
+    def _convert_to_json(self, pcap_path: Path, json_path: Path) -> None:
+        self.print(f"running PCAP --> JSON conversion (source={pcap_path.name}, dest={json_path.name})")
+
+        # write to a temporary file first so an interrupted conversion isn't
+        # mistaken for an up to date one
+        tmp_path = json_path.with_suffix(".jsonl.tmp")
+        utils.run_command(f"tshark -r {pcap_path} -T ek > {tmp_path}")
+        tmp_path.replace(json_path)
+
     def _merge_pcaps(self, pcap_paths: list[Path], merged_name: str = "merged.pcap") -> Path:
         merged_path = Path(self.base_dir, merged_name)
 
@@ -0,0 +1,241 @@
+"""
+Opt-in instrumentation for Scorch component stages.
+
+StageProfiler times every minimega command, Elasticsearch request, file
+transfer helper in phenix_apps.common.utils, subprocess and time.sleep made
+while it's active, and can optionally sample the stacks of all threads to
+build a profile of where the stage spent its time. Nothing is patched unless
+a profiler is started, so there is no overhead when profiling is disabled.
+"""
+
+import collections
+import functools
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import elasticsearch
+import minimega
+
+from phenix_apps.common import utils
+
+
+CATEGORIES = ['mm', 'es', 'transfer', 'subprocess', 'sleep']
+
+# utils helpers that move files to, from or between VMs and directories.
+TRANSFER_HELPERS = [
+    'mm_send', 'mm_recv', 'mm_send_many', 'mm_recv_many', 'mm_move_many',
+    'mm_delete_file', 'copy_file', 'rglob_copy',
+]
+
+
+class StageProfiler:
+    """
+    Records how much time a stage spends in each category of call, and
+    optionally a sampling profile of the stage.
+
+    For each category, `calls` counts the outermost calls, `total` is the time
+    spent in them and `self` excludes time spent in calls of other categories
+    made from within them (e.g. the sleeps inside a file transfer). Calls made
+    from other threads are included, so totals can exceed the stage's wall
+    time when work runs in parallel.
+    """
+
+    def __init__(self, sample_interval: Optional[float] = None) -> None:
+        self.sample_interval = sample_interval
+
+        self.stats: Dict[str, Dict[str, float]] = {
+            c: {'calls': 0, 'total': 0.0, 'self': 0.0} for c in CATEGORIES
+        }
+
+        self.samples: collections.Counter = collections.Counter()
+        self.sample_count: int = 0
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._patches: List[Tuple[Any, str, Any, bool]] = []
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self._main = None
+        self._main_self = 0.0
+        self._start = 0.0
+        self._wall = 0.0
+
+    def __enter__(self) -> 'StageProfiler':
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._main = threading.get_ident()
+        self._start = time.perf_counter()
+
+        self._patch(minimega.minimega, '_run', 'mm')
+        self._patch(minimega.minimega, '_get_response', 'mm')
+        self._patch(elasticsearch.Elasticsearch, 'perform_request', 'es')
+
+        for name in TRANSFER_HELPERS:
+            self._patch(utils, name, 'transfer')
+
+        # Popen is used by every subprocess helper (run, check_output, etc.),
+        # including ones imported with "from subprocess import ...".
+        self._patch(subprocess.Popen, '__init__', 'subprocess')
+        self._patch(subprocess.Popen, 'communicate', 'subprocess')
+        self._patch(subprocess.Popen, 'wait', 'subprocess')
+
+        self._patch(time, 'sleep', 'sleep')
+
+        if self.sample_interval:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample, name='scorch-profiler', daemon=True)
+            self._sampler.start()
+
+    def stop(self) -> None:
+        self._wall = time.perf_counter() - self._start
+
+        if self._sampler:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+
+        for owner, name, original, owned in reversed(self._patches):
+            if owned:
+                setattr(owner, name, original)
+            else:
+                delattr(owner, name)
+
+        self._patches = []
+
+    def _patch(self, owner: Any, name: str, category: str) -> None:
+        owned = name in vars(owner)
+        original = getattr(owner, name)
+
+        # Class attributes have to be looked up raw so staticmethods and
+        # classmethods keep working when restored.
+        if owned and isinstance(owner, type):
+            original = vars(owner)[name]
+            func = getattr(owner, name)
+        else:
+            func = original
+
+        setattr(owner, name, self._wrap(func, category))
+        self._patches.append((owner, name, original, owned))
+
+    def _wrap(self, func: Callable, category: str) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stack = getattr(self._local, 'stack', None)
+
+            if stack is None:
+                stack = self._local.stack = []
+
+            # Only the outermost call of a category is counted (e.g. _run
+            # calls _get_response).
+            for frame in stack:
+                if frame[0] == category:
+                    return func(*args, **kwargs)
+
+            frame = [category, 0.0]
+            stack.append(frame)
+
+            start = time.perf_counter()
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+
+                if stack:
+                    stack[-1][1] += elapsed
+
+                self._record(category, elapsed, elapsed - frame[1], not stack)
+
+        return wrapper
+
+    def _record(self, category: str, total: float, own: float, outermost: bool) -> None:
+        with self._lock:
+            stats = self.stats[category]
+
+            stats['calls'] += 1
+            stats['total'] += total
+            stats['self'] += own
+
+            if outermost and threading.get_ident() == self._main:
+                self._main_self += total
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+
+        while not self._stop.wait(self.sample_interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+
+                stack = []
+
+                while frame:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+                    frame = frame.f_back
+
+                stack.append(names.get(ident, str(ident)))
+                self.samples[';'.join(reversed(stack))] += 1
+
+            self.sample_count += 1
+
+    def timing(self) -> Dict[str, Any]:
+        """
+        The timing breakdown, in seconds. `untracked` is the time the stage's
+        own thread spent outside of any tracked call.
+        """
+
+        categories = {}
+
+        for category, stats in self.stats.items():
+            categories[category] = {
+                'calls': stats['calls'],
+                'total': round(stats['total'], 6),
+                'self': round(stats['self'], 6),
+            }
+
+        return {
+            'wall': round(self._wall, 6),
+            'untracked': round(max(self._wall - self._main_self, 0.0), 6),
+            'categories': categories,
+        }
+
+    def folded(self) -> str:
+        """
+        The sampling profile as folded stacks (one "frame;frame;... count" line
+        per unique stack), as used by flame graph tools.
+        """
+
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+    def write(self, prefix: str) -> Dict[str, str]:
+        """
+        Write the timing breakdown to `<prefix>-timing.json` and, if sampling
+        was enabled, the profile to `<prefix>-profile.folded`. Returns the
+        paths written.
+        """
+
+        files = {'timing': f'{prefix}-timing.json'}
+        utils.write_json(files['timing'], self.timing())
+
+        if self.sample_interval:
+            files['profile'] = f'{prefix}-profile.folded'
+
+            with open(files['profile'], 'w') as f:
+                f.write(self.folded())
+
+        return files
@@ -1,6 +1,10 @@
 import sys
+import time
 from collections import defaultdict
 from pathlib import Path
+from typing import List, Tuple
+
+from box import Box
 
 from phenix_apps.apps.scorch import ComponentBase
 from phenix_apps.common import utils
@@ -23,58 +27,47 @@ class QoS(ComponentBase):
         vms = self.metadata.vms
         self.print(f"applying qos to {len(vms)} VMs")
 
-        for i, vm in enumerate(vms):
-            hostname, interface = self.get_host_and_iface(vm)
+        # validate every VM's config before applying any qos, so a bad config
+        # doesn't leave only some of the VMs impaired
+        targets = []
+
+        for vm in vms:
+            hostname, interface, impairments = self.get_impairments(vm)
 
             values_applied[hostname]["interface"] = interface
 
-            loss = vm.get('loss')
-            delay = vm.get('delay')
-            rate = vm.get('rate')
+            for kind, args in impairments:
+                values_applied[hostname][kind] = args[0] if kind != 'rate' else ' '.join(args)
 
-            # at least one must be specified
-            if delay is None and loss is None and rate is None:
-                self.eprint(f'must specify one of loss, delay, or rate in config for node {hostname} (node config={vm})')
-                sys.exit(1)
+            targets.append((hostname, interface, impairments))
 
-            # rate cannot be combined with loss or delay
-            if rate is not None and (loss is not None or delay is not None):
-                self.eprint(f'cannot use rate limit at the same time as loss or delay for node {hostname} (node config={vm})')
-                sys.exit(1)
+        # hostname --> time.monotonic() time the VM's last qos was applied
+        applied = {}
 
-            # apply loss
-            if loss is not None:
-                loss = float(loss)
-                # TODO: manual specification of what variable loss is multiplied by
-                if vm.get('variable_loss') is not None:
-                    loss = float(vm.variable_loss) * self.count  # type: float
-                    self.print(f"variable_loss is set, {vm.variable_loss} * {self.count} => {loss} loss for run iteration {self.count} for interface {interface} on node {hostname}")
-
-                self.print(f'adding loss of {loss} to interface {interface} on node {hostname} ({i+1} of {len(vms)})')
-                if loss < 0.0 or loss > 99.9:
-                    self.eprint(f"loss of {loss} for {hostname} is not between 0.0 - 99.9 (note: 100% loss is not possible with minimega)")
-                    sys.exit(1)
-                self.mm.qos_add_loss(hostname, interface, loss)
-                values_applied[hostname]["loss"] = loss
-
-            # apply delay
-            if delay is not None:
-                delay = delay.strip().lower()  # duration of delay
-                self.print(f'adding delay of {delay} to interface {interface} on node {hostname} ({i+1} of {len(vms)})')
-                self.mm.qos_add_delay(hostname, interface, delay)
-                values_applied[hostname]["delay"] = delay
-
-            # apply rate limit
-            if rate is not None:
-                bw, unit = rate.strip().lower().split(' ')
-
-                if unit not in ['kbit', 'mbit', 'gbit']:
-                    self.eprint(f'rate limit unit must be one of kbit, mbit, or gbit, not {unit} for node {hostname} (node config={vm})')
-                    sys.exit(1)
-
-                self.print(f'adding rate limit of {bw} {unit} to interface {interface} on node {hostname} ({i+1} of {len(vms)})')
-                self.mm.qos_add_rate(hostname, interface, bw, unit)
-                values_applied[hostname]["rate"] = f"{bw} {unit}"
+        started_at = time.time()
+        started = time.monotonic()
+
+        if self.metadata.get('batch', False):
+            self.apply_batch(targets, applied)
+        else:
+            for i, (hostname, interface, impairments) in enumerate(targets):
+                for kind, args in impairments:
+                    desc = 'rate limit' if kind == 'rate' else kind
+                    self.print(f"adding {desc} of {' '.join(str(arg) for arg in args)} to interface {interface} on node {hostname} ({i+1} of {len(vms)})")
+
+                    getattr(self.mm, f'qos_add_{kind}')(hostname, interface, *args)
+
+                applied[hostname] = time.monotonic()
+
+        # record when each VM's qos was applied, relative to when the first qos
+        # command was issued, so the spread can be accounted for in results
+        for hostname, finished in applied.items():
+            values_applied[hostname]["applied_offset"] = round(finished - started, 6)
+            values_applied[hostname]["applied_at"] = round(started_at + finished - started, 6)
+
+        if applied:
+            spread = max(applied.values()) - min(applied.values())
+            self.print(f"qos applied to {len(applied)} VMs within {spread:.3f} seconds ({max(applied.values()) - started:.3f} seconds total)")
 
         qos_path = Path(self.base_dir, "qos_values_applied.json")
         self.print(f"saving qos values applied to {qos_path}")
@@ -82,11 +75,135 @@ class QoS(ComponentBase):
 
         logger.info(f'Started user component: {self.name}')
 
+    def get_impairments(self, vm: Box) -> Tuple[str, int, List[Tuple[str, Tuple[str, ...]]]]:
+        """
+        Validate a VM's qos config.
+
+        Returns:
+            tuple with the hostname, the interface index and the impairments to
+            apply, each a (loss, delay or rate, qos command arguments) tuple
+        """
+
+        hostname, interface = self.get_host_and_iface(vm)
+
+        loss = vm.get('loss')
+        delay = vm.get('delay')
+        rate = vm.get('rate')
+
+        # at least one must be specified
+        if delay is None and loss is None and rate is None:
+            self.eprint(f'must specify one of loss, delay, or rate in config for node {hostname} (node config={vm})')
+            sys.exit(1)
+
+        # rate cannot be combined with loss or delay
+        if rate is not None and (loss is not None or delay is not None):
+            self.eprint(f'cannot use rate limit at the same time as loss or delay for node {hostname} (node config={vm})')
+            sys.exit(1)
+
+        impairments = []
+
+        if loss is not None:
+            loss = float(loss)
+            # TODO: manual specification of what variable loss is multiplied by
+            if vm.get('variable_loss') is not None:
+                loss = float(vm.variable_loss) * self.count  # type: float
+                self.print(f"variable_loss is set, {vm.variable_loss} * {self.count} => {loss} loss for run iteration {self.count} for interface {interface} on node {hostname}")
+
+            if loss < 0.0 or loss > 99.9:
+                self.eprint(f"loss of {loss} for {hostname} is not between 0.0 - 99.9 (note: 100% loss is not possible with minimega)")
+                sys.exit(1)
+
+            impairments.append(('loss', (loss,)))
+
+        if delay is not None:
+            delay = delay.strip().lower()  # duration of delay
+            impairments.append(('delay', (delay,)))
+
+        if rate is not None:
+            bw, unit = rate.strip().lower().split(' ')
+
+            if unit not in ['kbit', 'mbit', 'gbit']:
+                self.eprint(f'rate limit unit must be one of kbit, mbit, or gbit, not {unit} for node {hostname} (node config={vm})')
+                sys.exit(1)
+
+            impairments.append(('rate', (bw, unit)))
+
+        return hostname, interface, impairments
+
+    def apply_batch(self, targets: list, applied: dict) -> None:
+        """
+        Apply every VM's qos with a single minimega call, by having minimega
+        read a command file with all of the qos commands.
+
+        If it fails partway, qos is cleared from the VMs it was already
+        applied to before exiting.
+        """
+
+        commands = []
+        owners = []  # index in targets of each command's VM
+
+        for i, (hostname, interface, impairments) in enumerate(targets):
+            for kind, args in impairments:
+                commands.append(f"qos add {hostname} {interface} {kind} {' '.join(str(arg) for arg in args)}")
+                owners.append(i)
+
+        self.print(f"applying {len(commands)} qos commands to {len(targets)} interfaces in a single batch")
+
+        received = []
+
+        try:
+            utils.mm_read_commands(self.mm, Path(self.base_dir, 'qos.mm'), commands, received)
+        except Exception as ex:
+            self.eprint(f"error applying qos: {ex}")
+
+            # minimega stops reading at the first command that fails, so only
+            # the commands it responded to before that were applied
+            self.clear_targets([targets[i] for i in sorted(set(owners[:len(received)]))])
+            sys.exit(1)
+
+        if len(received) != len(commands):
+            self.eprint(f"error applying qos: minimega sent {len(received)} responses for {len(commands)} qos commands")
+
+            # responses can't be matched up with commands, so any of the VMs
+            # could have qos applied
+            self.clear_targets(targets)
+            sys.exit(1)
+
+        for i, finished in zip(owners, received):
+            applied[targets[i][0]] = finished
+
+    def clear_targets(self, targets: list) -> None:
+        """
+        Clear qos from each (hostname, interface, impairments) target, warning
+        about (rather than stopping at) any that can't be cleared.
+        """
+
+        for hostname, interface, _ in targets:
+            self.print(f'clearing qos for interface {interface} on node {hostname}')
+
+            try:
+                self.mm.clear_qos(hostname, interface)
+            except Exception as ex:
+                self.eprint(f"WARNING: failed to clear qos for interface {interface} on node {hostname}: {ex}")
+
     def stop(self):
         logger.info(f'Stopping user component: {self.name}')
 
         vms = self.metadata.vms  # type: list
         self.print(f"clearing qos from {len(vms)} VMs")
+
+        if self.metadata.get('batch', False):
+            commands = ['clear qos {} {}'.format(*self.get_host_and_iface(vm)) for vm in vms]
+
+            try:
+                utils.mm_read_commands(self.mm, Path(self.base_dir, 'qos.mm'), commands)
+            except Exception as ex:
+                self.eprint(f"error clearing qos: {ex}")
+                sys.exit(1)
+
+            logger.info(f'Stopped user component: {self.name}')
+            return
+
         for i, vm in enumerate(vms):
             hostname, interface = self.get_host_and_iface(vm)
             self.print(f'clearing qos for interface {interface} on node {hostname} ({i+1} of {len(vms)})')
@@ -0,0 +1,133 @@
+"""
+Unit tests for the qos component's batched mode, run against a fake minimega
+connection.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from phenix_apps.apps.scorch.qos.qos import QoS
+
+
+def make_nodes(vms: list) -> list:
+    return [
+        {"general": {"hostname": name}, "network": {"interfaces": [{"name": "eth0"}, {"name": "eth1"}]}}
+        for name in sorted({vm["hostname"] for vm in vms})
+    ]
+
+
+@pytest.fixture
+def run_stage(mocker, scorch_component, fake_minimega):
+    """
+    Returns a function that runs a stage of a qos component (on its third
+    iteration) for the given VMs, returning the component's minimega
+    connection (a new fake one, unless it's given) and its output directory.
+    """
+
+    mocker.patch.object(QoS, "print")
+
+    def run(stage: str, vms: list, name: str = "qos", mm=None, **metadata) -> tuple:
+        mm = mm or fake_minimega()
+        component = scorch_component(QoS, "qos", stage, {"vms": vms, **metadata}, make_nodes(vms), mm=mm, name=name, count=2)
+
+        return mm, Path(component.base_dir)
+
+    return run
+
+
+VMS = [
+    {"hostname": "rtu-2", "loss": 25.0},
+    {"hostname": "scada", "interface": "eth1", "delay": "100MS", "loss": 1},
+    {"hostname": "relay-6", "rate": "500 kbit"},
+    {"hostname": "relay-10", "loss": 0.0, "variable_loss": 10.0},
+]
+
+
+def test_batch_matches_serial(run_stage):
+    serial_mm, serial_dir = run_stage("start", VMS, name="serial")
+    batch_mm, batch_dir = run_stage("start", VMS, name="batch", batch=True)
+
+    assert len(batch_mm.reads) == 1
+    assert batch_mm.commands == serial_mm.commands
+    assert "qos add scada 1 delay 100ms" in batch_mm.commands
+    assert "qos add relay-10 0 loss 20.0" in batch_mm.commands
+
+    def values(base_dir):
+        return json.loads(Path(base_dir, "qos_values_applied.json").read_text())
+
+    serial_values, batch_values = values(serial_dir), values(batch_dir)
+
+    for hostname in batch_values:
+        for applied in [serial_values[hostname], batch_values[hostname]]:
+            assert applied.pop("applied_at") > 0
+            assert applied.pop("applied_offset") >= 0
+
+    assert batch_values == serial_values
+    assert batch_values["relay-6"] == {"interface": 0, "rate": "500 kbit"}
+
+
+def test_batch_records_application_times(run_stage):
+    vms = [{"hostname": f"vm{i}", "delay": "10ms"} for i in range(50)]
+    _, base_dir = run_stage("start", vms, batch=True)
+
+    values = json.loads(Path(base_dir, "qos_values_applied.json").read_text())
+    offsets = [values[f"vm{i}"]["applied_offset"] for i in range(50)]
+
+    assert offsets == sorted(offsets)
+    assert values["vm49"]["applied_at"] - values["vm0"]["applied_at"] == pytest.approx(offsets[-1] - offsets[0], abs=1e-5)
+
+
+def test_failed_batch_clears_applied_vms(mocker, run_stage, fake_minimega):
+    eprint = mocker.patch.object(QoS, "eprint")
+
+    mm = fake_minimega()
+    mm.read_errors["qos add scada 1 delay 100ms"] = "invalid delay"
+
+    with pytest.raises(SystemExit):
+        run_stage("start", VMS, mm=mm, batch=True)
+
+    # scada's loss was applied before its delay failed, and reading stopped
+    # before relay-6 and relay-10
+    assert mm.commands == [
+        "qos add rtu-2 0 loss 25.0",
+        "qos add scada 1 loss 1.0",
+        "clear qos rtu-2 0",
+        "clear qos scada 1",
+    ]
+    eprint.assert_called_once_with("error applying qos: invalid delay")
+
+
+def test_missing_responses_clear_every_vm(mocker, run_stage, fake_minimega):
+    eprint = mocker.patch.object(QoS, "eprint")
+
+    mm = fake_minimega()
+    mm.missing_responses = 1
+
+    with pytest.raises(SystemExit):
+        run_stage("start", VMS, mm=mm, batch=True)
+
+    eprint.assert_called_once_with("error applying qos: minimega sent 4 responses for 5 qos commands")
+    assert mm.commands[5:] == ["clear qos rtu-2 0", "clear qos scada 1", "clear qos relay-6 0", "clear qos relay-10 0"]
+
+
+def test_invalid_config_applies_nothing(mocker, scorch_component, fake_minimega):
+    mocker.patch.object(QoS, "print")
+    eprint = mocker.patch.object(QoS, "eprint")
+
+    vms = VMS + [{"hostname": "rtu-2", "rate": "5 tbit"}]
+    mm = fake_minimega()
+
+    with pytest.raises(SystemExit):
+        scorch_component(QoS, "qos", "start", {"vms": vms, "batch": True}, make_nodes(vms), mm=mm)
+
+    assert mm.commands == []
+    eprint.assert_called_once()
+
+
+def test_batch_stop(run_stage):
+    mm, _ = run_stage("stop", VMS, batch=True)
+
+    assert len(mm.reads) == 1
+    assert mm.commands == ["clear qos rtu-2 0", "clear qos scada 1", "clear qos relay-6 0", "clear qos relay-10 0"]
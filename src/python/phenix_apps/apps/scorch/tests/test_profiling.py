@@ -0,0 +1,126 @@
+"""
+Unit tests for opt-in profiling of Scorch component stages.
+"""
+
+import json
+import subprocess
+import time
+
+import minimega
+import pytest
+from elasticsearch import Elasticsearch
+
+from phenix_apps.apps.scorch import ComponentBase
+from phenix_apps.apps.scorch.profiling import StageProfiler
+from phenix_apps.common import utils
+
+
+def test_timing_by_category(tmp_path, monkeypatch):
+    def transfer(*args):
+        time.sleep(0.05)
+
+    monkeypatch.setattr(utils, "rglob_copy", transfer)
+
+    originals = (
+        time.sleep, subprocess.Popen.__init__, minimega.minimega._run, Elasticsearch.perform_request, utils.copy_file,
+    )
+
+    with StageProfiler() as profiler:
+        time.sleep(0.05)
+        utils.rglob_copy("*", tmp_path, tmp_path)
+        subprocess.run(["true"], check=True)
+
+    timing = profiler.timing()
+    cats = timing["categories"]
+
+    assert cats["sleep"]["calls"] == 2
+    assert cats["sleep"]["total"] >= 0.1
+
+    # The sleep inside the transfer counts towards both, but not its self time.
+    assert cats["transfer"]["calls"] == 1
+    assert cats["transfer"]["total"] >= 0.05
+    assert cats["transfer"]["self"] < 0.05
+
+    assert cats["subprocess"]["calls"] >= 1
+    assert cats["mm"]["calls"] == cats["es"]["calls"] == 0
+
+    assert timing["wall"] >= timing["untracked"] >= 0
+
+    # Everything is put back the way it was.
+    assert (
+        time.sleep, subprocess.Popen.__init__, minimega.minimega._run, Elasticsearch.perform_request, utils.copy_file,
+    ) == originals
+
+
+def test_sampling_profile(tmp_path):
+    def busy():
+        end = time.perf_counter() + 0.2
+
+        while time.perf_counter() < end:
+            pass
+
+    with StageProfiler(sample_interval=0.005) as profiler:
+        busy()
+
+    assert profiler.sample_count > 0
+    assert "busy (test_profiling.py)" in profiler.folded()
+
+    files = profiler.write(str(tmp_path / "stage"))
+
+    assert files == {"timing": str(tmp_path / "stage-timing.json"), "profile": str(tmp_path / "stage-profile.folded")}
+    assert json.loads((tmp_path / "stage-timing.json").read_text())["categories"]["sleep"]["calls"] == 0
+    assert (tmp_path / "stage-profile.folded").read_text().splitlines()[0].rsplit(" ", 1)[1].isdigit()
+
+
+class Sleeper(ComponentBase):
+    def __init__(self):
+        ComponentBase.__init__(self, "sleeper")
+        self.execute_stage()
+
+    def start(self):
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def run_component(tmp_path, scorch_component):
+    """
+    Returns a function that runs the start stage of a component with the
+    given metadata, returning the component and its stage info.
+    """
+
+    def run(metadata):
+        component = scorch_component(Sleeper, "sleeper", "start", metadata, name="s")
+        info = [p for p in tmp_path.rglob("*.json") if not p.name.endswith("-timing.json")]
+
+        return component, json.loads(info[0].read_text())
+
+    return run
+
+
+def test_execute_stage_profile(tmp_path, run_component):
+    _, content = run_component({"profile": "sample", "profile_interval": 0.001})
+
+    info = next(p for p in tmp_path.rglob("*-start-*.json") if not p.name.endswith("-timing.json"))
+    stem = str(info)[:-len(".json")]
+
+    assert content["profile"] == {"timing": f"{stem}-timing.json", "profile": f"{stem}-profile.folded"}
+
+    timing = json.loads(open(content["profile"]["timing"]).read())
+
+    assert timing["categories"]["sleep"]["calls"] == 1
+
+
+def test_execute_stage_profile_disabled(run_component):
+    component, content = run_component({})
+
+    assert component.stage_profiler() is None
+    assert "profile" not in content
+
+
+@pytest.mark.parametrize("mode", ["off", "false", "Timing", 1])
+def test_execute_stage_profile_unknown_mode(tmp_path, run_component, capsys, mode):
+    component, content = run_component({"profile": mode})
+
+    assert "profile" not in content
+    assert f"ignoring unknown profile mode {mode!r}" in capsys.readouterr().err
+    assert not list(tmp_path.rglob("*-timing.json"))
@@ -0,0 +1,176 @@
+"""
+Streams vmstat samples off of VMs while a run is in progress.
+
+The vmstats component's start stage runs this file as a separate process
+(scorch doesn't allow components to run detached) and its stop stage stops it
+with SIGTERM. In each VM, vmstat output is split into chunk files of a fixed
+number of lines. Every period, finished chunks are moved off of all the VMs at
+once, parsed, and appended to a JSON lines file per VM, so the stop stage only
+has to wait for the last period's worth of samples.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import signal
+import sys
+import threading
+from typing import List, Optional, Tuple
+
+import minimega
+
+from phenix_apps.common import utils
+
+
+CHUNK_DIR    = '/vmstat'
+CHUNK_PREFIX = 'chunk.'
+
+
+def parse_lines(lines: List[str], vm: str, header: Optional[List[str]] = None) -> Tuple[Optional[List[str]], List[dict]]:
+    """
+    Parse lines of `vmstat -n -t` output into one dict per sample.
+
+    The column names are taken from the header vmstat prints before its first
+    sample. Output that's been split up after the header can be parsed by
+    passing in the header returned from parsing the output before it.
+
+    Returns (header, stats).
+    """
+
+    stats = []
+
+    for line in lines:
+        if not line.strip() or line.startswith('procs'):
+            continue
+
+        if header is None:
+            header = line.split()
+            continue
+
+        items = []
+
+        for item in line.split():
+            try:
+                items.append(int(item))
+            except ValueError:
+                items.append(item)
+
+        # date and time are separate fields, but a single column
+        items[-2] = f'{items[-2]} {items[-1]}'
+        del items[-1]
+
+        stat = dict(zip(header, items))
+        stat['vm_name'] = vm
+
+        stats.append(stat)
+
+    return header, stats
+
+
+class VMStatStreamer:
+    """
+    Moves finished vmstat chunks off of VMs and appends their samples to a
+    JSON lines file per VM, optionally gzip compressed.
+    """
+
+    def __init__(self, mm: minimega.minimega, vms: List[str], out_dir: str, compress: bool = False, max_workers: int = 8) -> None:
+        self.mm          = mm
+        self.vms         = vms
+        self.compress    = compress
+        self.max_workers = max_workers
+
+        self.chunks_dir = os.path.join(out_dir, 'chunks')
+        self.stats_dir  = os.path.join(out_dir, 'vm_stats')
+
+        # vm --> vmstat column names, from the VM's first chunk
+        self.headers = {}
+
+        os.makedirs(self.stats_dir, exist_ok=True)
+
+    def shard_path(self, vm: str) -> str:
+        return os.path.join(self.stats_dir, f"{vm}.jsonl{'.gz' if self.compress else ''}")
+
+    def drain(self, final: bool = False) -> int:
+        """
+        Move finished chunks off of every VM and parse them. The newest chunk
+        in each VM is still being written to unless vmstat has been stopped,
+        so it's left alone unless this is the final drain.
+
+        Returns the number of samples parsed.
+        """
+
+        jobs = [(vm, CHUNK_DIR, os.path.join(self.chunks_dir, vm)) for vm in self.vms]
+
+        results = utils.mm_move_many(
+            self.mm, jobs, pattern=f'{CHUNK_PREFIX}*', keep_last=0 if final else 1, max_workers=self.max_workers,
+        )
+
+        count = 0
+
+        for result in results:
+            if not result['success']:
+                utils.eprint(f"failed to move vmstat chunks from {result['vm']}: {result['error']}", ui=False)
+
+            # chunks moved before a failure are still on the host
+            for name in result['files']:
+                count += self.parse_chunk(result['vm'], os.path.join(result['dst'], name))
+
+        return count
+
+    def parse_chunk(self, vm: str, path: str) -> int:
+        with open(path, 'r') as f:
+            header, stats = parse_lines(f.readlines(), vm, self.headers.get(vm))
+
+        if header:
+            self.headers[vm] = header
+
+        if stats:
+            opener = gzip.open if self.compress else open
+
+            with opener(self.shard_path(vm), 'at') as f:
+                for datum in stats:
+                    f.write(json.dumps(datum) + '\n')
+
+        os.remove(path)
+
+        return len(stats)
+
+    def run(self, period: float, stop: threading.Event) -> None:
+        """
+        Drain chunks every period until stop is set, then do a final drain.
+        """
+
+        while not stop.wait(period):
+            self.drain()
+
+        self.drain(final=True)
+
+        shutil.rmtree(self.chunks_dir, ignore_errors=True)
+
+
+def main():
+    config = json.loads(sys.argv[1])
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, stack: stop.set())
+
+    try:
+        mm = minimega.connect(namespace=config['namespace'])
+
+        streamer = VMStatStreamer(
+            mm, config['vms'], config['out_dir'], config.get('compress', False), config.get('workers', 8),
+        )
+
+        streamer.run(float(config.get('period', 30)), stop)
+    finally:
+        # lets the stop stage know the final drain is done
+        if config.get('pid_file'):
+            try:
+                os.remove(config['pid_file'])
+            except FileNotFoundError:
+                pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Unit tests for streaming vmstat samples off of VMs, run against a fake
+transfer helper where each VM's filesystem is a local directory.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import threading
+
+import pytest
+
+from phenix_apps.apps.scorch.vmstats import stream
+
+HEADER = [
+    "procs -----------memory---------- ---swap-- -----io---- -system-- ------cpu----- -----timestamp-----\n",
+    " r  b   swpd   free   buff  cache   si   so    bi    bo   in   cs us sy id wa st                 UTC\n",
+]
+
+
+def vmstat_output(samples: int) -> list:
+    return HEADER + [
+        f" 1  0      0 {123456 + i} 7890 456789    0    0     1     2   30   40  1  0 99  0  0 2024-02-29 17:{i // 60 % 60:02d}:{i % 60:02d}\n"
+        for i in range(samples)
+    ]
+
+
+def legacy_parse(lines: list, vm: str) -> list:
+    # parsing done by the vmstats stop stage before streaming was added
+    stats = []
+
+    for i, line in enumerate(lines):
+        if i in (0, 1):
+            continue
+
+        items = []
+
+        for item in line.split():
+            try:
+                items.append(int(item))
+            except ValueError:
+                items.append(item)
+
+        items[-2] = f"{items[-2]} {items[-1]}"
+        del items[-1]
+
+        stat = dict(zip(lines[1].split(), items))
+        stat["vm_name"] = vm
+
+        stats.append(stat)
+
+    return stats
+
+
+class FakeVMs:
+    """
+    Each VM's chunk directory is a local directory, written to like
+    `vmstat | split -l <lines>` would.
+    """
+
+    def __init__(self, root, vms: list, lines: int):
+        self.root = root
+        self.lines = lines
+        self.output = {vm: [] for vm in vms}
+        self.moved = []
+
+    def write(self, vm: str, lines: list) -> None:
+        self.output[vm].extend(lines)
+
+        chunk_dir = self.root / vm
+        chunk_dir.mkdir(exist_ok=True)
+
+        for n in range(0, len(self.output[vm]), self.lines):
+            path = chunk_dir / f"{stream.CHUNK_PREFIX}{n // self.lines:08d}"
+            moved = (vm, path.name) in self.moved
+
+            if not moved:
+                path.write_text("".join(self.output[vm][n : n + self.lines]))
+
+    def move_many(self, mm, jobs, pattern="*", keep_last=0, max_workers=8, mount_timeout=10.0):
+        results = []
+
+        for vm, src, dst in jobs:
+            assert src == stream.CHUNK_DIR
+
+            names = sorted(os.listdir(self.root / vm)) if (self.root / vm).exists() else []
+            if keep_last:
+                names = names[:-keep_last]
+
+            os.makedirs(dst, exist_ok=True)
+
+            for name in names:
+                shutil.move(str(self.root / vm / name), os.path.join(dst, name))
+                self.moved.append((vm, name))
+
+            results.append({"vm": vm, "src": src, "dst": dst, "success": True, "error": None, "files": names})
+
+        return results
+
+
+def read_shard(path: str) -> list:
+    opener = gzip.open if path.endswith(".gz") else open
+
+    with opener(path, "rt") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_parse_lines_matches_legacy():
+    lines = vmstat_output(100)
+
+    header, stats = stream.parse_lines(lines, "vm-1")
+
+    assert header == HEADER[1].split()
+    assert stats == legacy_parse(lines, "vm-1")
+    assert stats[0]["UTC"] == "2024-02-29 17:00:00"
+
+    # output split after the header parses the same with the header passed in
+    _, first = stream.parse_lines(lines[:30], "vm-1")
+    _, rest = stream.parse_lines(lines[30:], "vm-1", header)
+
+    assert first + rest == stats
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_streamer_drains_incrementally(mocker, tmp_path, compress):
+    vms = ["vm-1", "vm-2", "vm-3"]
+    fake = FakeVMs(tmp_path / "vms", vms, lines=10)
+    (tmp_path / "vms").mkdir()
+    mocker.patch.object(stream.utils, "mm_move_many", side_effect=fake.move_many)
+
+    streamer = stream.VMStatStreamer(None, vms, str(tmp_path / "out"), compress=compress)
+    output = {vm: vmstat_output(95) for vm in vms}
+
+    # samples arrive over several periods, each drain only takes finished chunks
+    for start, stop in [(0, 25), (25, 60), (60, 97)]:
+        for vm in vms:
+            fake.write(vm, output[vm][start:stop])
+
+        count = streamer.drain()
+        assert count <= 3 * (stop - start + 10)
+
+    # the final drain is bounded by what's been written since the last drain
+    assert streamer.drain(final=True) == 3 * 7
+
+    for vm in vms:
+        path = streamer.shard_path(vm)
+
+        assert path.endswith(".jsonl.gz" if compress else ".jsonl")
+        assert read_shard(path) == legacy_parse(output[vm], vm)
+        assert os.listdir(os.path.join(streamer.chunks_dir, vm)) == []
+
+
+def test_streamer_run_drains_until_stopped(mocker, tmp_path):
+    fake = FakeVMs(tmp_path / "vms", ["vm-1"], lines=10)
+    (tmp_path / "vms").mkdir()
+    fake.write("vm-1", vmstat_output(15))
+    mocker.patch.object(stream.utils, "mm_move_many", side_effect=fake.move_many)
+
+    streamer = stream.VMStatStreamer(None, ["vm-1"], str(tmp_path / "out"))
+    drain = mocker.spy(streamer, "drain")
+
+    stop = threading.Event()
+    stop.set()
+
+    streamer.run(0.01, stop)
+
+    drain.assert_called_once_with(final=True)
+    assert len(read_shard(streamer.shard_path("vm-1"))) == 15
+    assert not os.path.exists(streamer.chunks_dir)
@@ -1,8 +1,12 @@
 import json
+import os
+import signal
+import subprocess
 import sys
 import time
 
 from phenix_apps.apps.scorch import ComponentBase
+from phenix_apps.apps.scorch.vmstats import stream
 from phenix_apps.common import utils
 from phenix_apps.common.logger import logger
 
@@ -14,6 +18,8 @@ class VMStats(ComponentBase):
 
     def __init__(self):
         ComponentBase.__init__(self, 'vmstats')
+
+        self.pid_file = f'{self.base_dir}/vmstats-stream.pid'
         self.execute_stage()
 
     def start(self):
@@ -27,16 +33,90 @@ class VMStats(ComponentBase):
 
         self.mm.clear_cc_prefix()
         self.mm.cc_filter("vmstat=1 os=linux")
-        self.mm.cc_background(f"bash -c 'vmstat -n -t {freq} >> /vmstat.out'")
+
+        if self.metadata.get('stream', False):
+            # split vmstat output into chunks that can be moved off the VM as
+            # soon as they're finished
+            lines = int(self.metadata.get('chunkLines', 60))
+            self.mm.cc_background(f"bash -c 'mkdir -p {stream.CHUNK_DIR} && stdbuf -oL vmstat -n -t {freq} | split -l {lines} -d -a 8 - {stream.CHUNK_DIR}/{stream.CHUNK_PREFIX}'")
+        else:
+            self.mm.cc_background(f"bash -c 'vmstat -n -t {freq} >> /vmstat.out'")
+
         self.mm.clear_cc_filter()
 
+        if self.metadata.get('stream', False):
+            self.__start_streamer(vms)
+
         logger.info(f'Started user component: {self.name}')
 
+    def __start_streamer(self, vms: list) -> None:
+        config = {
+            'namespace': self.exp_name,
+            'vms':       vms,
+            'out_dir':   self.base_dir,
+            'period':    float(self.metadata.get('streamPeriod', 30)),
+            'compress':  bool(self.metadata.get('compress', False)),
+            'workers':   int(self.metadata.get('transferWorkers', 8)),
+            'pid_file':  self.pid_file,
+        }
+
+        self.print(f"streaming vmstat samples from {len(vms)} VMs every {config['period']} seconds")
+
+        with open(f'{self.base_dir}/vmstats-stream.log', 'a') as log:
+            proc = subprocess.Popen(
+                [sys.executable, '-m', 'phenix_apps.apps.scorch.vmstats.stream', json.dumps(config)],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+
+        with open(self.pid_file, 'w') as f:
+            f.write(str(proc.pid))
+
+    def __stop_streamer(self) -> None:
+        try:
+            with open(self.pid_file, 'r') as f:
+                pid = int(f.read().strip())
+        except FileNotFoundError:
+            self.eprint("WARNING: vmstat streamer PID file not found, streamer already stopped")
+            return
+
+        timeout = float(self.metadata.get('streamStopTimeout', 60))
+        self.print(f"waiting up to {timeout} seconds for vmstat streamer (PID {pid}) to finish")
+
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.eprint(f"WARNING: vmstat streamer (PID {pid}) is not running")
+            os.remove(self.pid_file)
+            return
+
+        # the streamer removes its PID file once its final drain is done
+        deadline = time.monotonic() + timeout
+        while os.path.exists(self.pid_file) and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        if os.path.exists(self.pid_file):
+            self.eprint(f"WARNING: vmstat streamer (PID {pid}) didn't finish in {timeout} seconds, killing it")
+
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+            os.remove(self.pid_file)
+
     def stop(self):
         logger.info(f'Stopping user component: {self.name}')
 
         vms = self.__vm_list()
 
+        if self.metadata.get('stream', False):
+            self.__stop_streaming(vms)
+            logger.info(f'Stopped user component: {self.name}')
+            return
+
         self.print("killing vmstat processes")
         self.mm.cc_filter("vmstat=1 os=linux")
         self.mm.cc_exec_once("pkill vmstat")
@@ -62,27 +142,8 @@ class VMStats(ComponentBase):
         self.print("reading vmstat.out files")
         for vm in vms:
             with open(f'{self.base_dir}/{vm}.out', 'r') as f:
-                lines = f.readlines()
-
-                for i, line in enumerate(lines):
-                    if i in (0,1):
-                        continue
-
-                    items = []
-
-                    for item in line.split():
-                        try:
-                            items.append(int(item))
-                        except ValueError:
-                            items.append(item)
-
-                    items[-2] = f'{items[-2]} {items[-1]}'
-                    del items[-1]
-
-                    stat = dict(zip(lines[1].split(), items))
-                    stat['vm_name'] = vm
-
-                    stats.append(stat)
+                _, vm_stats = stream.parse_lines(f.readlines(), vm)
+                stats.extend(vm_stats)
 
         stats_path = f'{self.base_dir}/vm_stats.jsonl'
         self.print(f"writing consolidated vmstats to {stats_path}")
@@ -93,6 +154,27 @@ class VMStats(ComponentBase):
 
         logger.info(f'Stopped user component: {self.name}')
 
+    def __stop_streaming(self, vms: list) -> None:
+        # Wait for vmstat to actually be stopped in every VM so the streamer's
+        # final drain gets each VM's last chunk.
+        self.print("killing vmstat processes")
+        tracker = utils.MMCommandTracker(self.mm)
+        handle  = tracker.submit("pkill vmstat", cc_filter="vmstat=1 os=linux", expected=len(vms))
+
+        try:
+            tracker.wait([handle], timeout=30.0)
+        except RuntimeError as ex:
+            self.eprint(f"WARNING: vmstat may still be running in some VMs: {ex}")
+
+        self.__stop_streamer()
+
+        self.print(f"deleting {stream.CHUNK_DIR} from VMs")
+        self.mm.cc_filter("vmstat=1 os=linux")
+        self.mm.cc_exec_once(f"rm -rf {stream.CHUNK_DIR}")
+        self.mm.clear_cc_filter()
+
+        self.print(f"vmstats for each VM written to {self.base_dir}/vm_stats")
+
     def __vm_list(self) -> list:
         vms = self.metadata.get('vms', None)
         compatible_os = ["linux", "centos", "rhel"]
@@ -0,0 +1,169 @@
+"""
+Unit tests for the AppBase topology lookup helpers.
+"""
+
+import copy
+import io
+import json
+
+import pytest
+from box import BoxError
+
+from phenix_apps.apps import AppBase
+from phenix_apps.common import settings
+
+
+def make_node(hostname, address, labels=None, annotations=None):
+    return {
+        "general": {"hostname": hostname},
+        "network": {"interfaces": [{"name": "eth0", "address": address, "mask": 24}]},
+        "labels": labels,
+        "annotations": annotations,
+    }
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PHENIX_LOG_FILE", None)
+
+    nodes = [
+        make_node(f"node-{i}", f"10.0.{i // 250}.{i % 250 + 1}", labels={"group": "a"} if i % 2 else None)
+        for i in range(1000)
+    ]
+
+    hosts = [
+        {"hostname": f"node-{i}", "metadata": {"type": "rtu" if i % 3 else "provider", "labels": ["elk"]}}
+        for i in range(0, 1000, 10)
+    ]
+    hosts.append({"hostname": "missing", "metadata": {"type": "rtu"}})
+
+    experiment = {
+        "spec": {
+            "experimentName": "test",
+            "baseDir": str(tmp_path),
+            "topology": {"nodes": nodes},
+            "scenario": {"apps": [{"name": "test", "hosts": hosts}]},
+        },
+    }
+
+    monkeypatch.setattr("sys.stdin", io.StringIO(json.dumps(experiment)))
+
+    return AppBase("test", "pre-start")
+
+
+def test_extract_node(app):
+    assert app.extract_node("node-42").general.hostname == "node-42"
+    assert app.extract_node("nope") is None
+    assert len(app.extract_node(r"node-9\d$", wildcard=True)) == 10
+
+    assert app.extract_node_hostname_for_ip("10.0.0.43") == "node-42"
+    assert app.extract_node_hostname_for_ip("10.0.0.43:8080") == "node-42"
+    assert app.extract_node_interface_ip("node-42", "eth0", include_mask=True) == ("10.0.0.43", 24)
+
+
+def test_extract_nodes_type(app):
+    rtus = app.extract_nodes_type("rtu")
+    assert len(rtus) == 67
+    assert rtus[0].hostname == "node-10"
+    assert rtus[0].topology == app.extract_node("node-10")
+    assert rtus[-1].topology is None
+
+    assert len(app.extract_nodes_type("rtu", include_missing=False)) == 66
+    assert len(app.extract_nodes_type(["rtu", "provider"])) == 101
+    assert len(app.extract_nodes_label("elk")) == 100
+    assert len(app.extract_all_nodes(include_missing=False)) == 100
+
+
+def test_views_and_copies(app):
+    view = app.extract_app_node("node-10")
+
+    # views share data with the experiment and can't be modified at any depth
+    assert view.metadata == app.app.hosts[1].metadata
+
+    with pytest.raises(BoxError):
+        view.metadata = {}
+
+    with pytest.raises(BoxError):
+        view.metadata.type = "changed"
+
+    with pytest.raises(BoxError):
+        view.metadata.labels.append("other")
+
+    with pytest.raises(BoxError):
+        view.topology.network.interfaces[0].address = "10.1.1.1"
+
+    assert app.app.hosts[1].metadata.type == "rtu"
+    assert app.app.hosts[1].metadata.labels == ["elk"]
+    assert app.extract_node("node-10").network.interfaces[0].address == "10.0.0.11"
+
+    # copies of views can be modified
+    copy.deepcopy(view).metadata.type = "changed"
+    assert app.app.hosts[1].metadata.type == "rtu"
+
+    copied = app.extract_app_node("node-10", copy=True)
+    copied.metadata.type = "changed"
+
+    assert app.extract_app_node("node-10").metadata.type == "rtu"
+
+
+def test_indexes_follow_mutations(app):
+    assert len(app.extract_labelled_topology_nodes("group")) == 500
+
+    app.add_label("node-0", "group", "b")
+    app.add_label("node-0", "helics", "broker")
+    app.add_annotation("node-4", "helics/federate", [{"broker": "10.0.0.1"}])
+
+    grouped = app.extract_labelled_topology_nodes(["group", "helics"])
+    assert len(grouped) == 501
+    assert grouped[0].general.hostname == "node-0"
+    assert [n.general.hostname for n in app.extract_annotated_topology_nodes("helics/federate")] == ["node-4"]
+
+    app.add_node(make_node("new", "192.168.0.1", labels={"group": "c"}))
+    assert app.extract_node("new").general.hostname == "new"
+    assert app.extract_node_hostname_for_ip("192.168.0.1") == "new"
+    assert len(app.extract_labelled_topology_nodes("group")) == 502
+
+    # existing nodes are only replaced when overwrite is set
+    app.add_node(make_node("node-1", "192.168.0.2"))
+    assert app.extract_node_hostname_for_ip("192.168.0.2") is None
+
+    app.add_node(make_node("node-1", "192.168.0.2"), overwrite=True)
+    assert app.extract_node_hostname_for_ip("192.168.0.2") == "node-1"
+    assert len(app.extract_labelled_topology_nodes("group")) == 501
+
+    # nodes appended directly to the topology are picked up as well
+    app.experiment.spec.topology.nodes.append(make_node("direct", "192.168.0.3"))
+    assert app.extract_node("direct") is not None
+
+
+def test_indexes_follow_direct_edits(app):
+    assert app.extract_node_hostname_for_ip("10.0.0.43") == "node-42"
+
+    # hostnames and addresses changed without the helpers
+    node = app.extract_node("node-42")
+    node.general.hostname = "renamed"
+    node.network.interfaces[0].address = "172.16.0.1"
+
+    assert app.extract_node("node-42") is None
+    assert app.extract_node("renamed") is node
+    assert app.extract_node_hostname_for_ip("10.0.0.43") is None
+    assert app.extract_node_hostname_for_ip("172.16.0.1") == "renamed"
+
+    # a hostname reused by another node after a rename
+    app.extract_node("node-43").general.hostname = "node-42"
+    assert app.extract_node("node-42") is app.experiment.spec.topology.nodes[43]
+
+
+def test_app_host_lookups_follow_direct_edits(app):
+    assert len(app.extract_nodes_type("provider")) == 34
+
+    # types and hostnames changed, and hosts added, without the helpers
+    app.app.hosts[0].metadata.type = "rtu"
+    app.app.hosts[1].hostname = "renamed"
+    app.app.hosts.append({"hostname": "node-5", "metadata": {"type": "provider"}})
+
+    assert len(app.extract_nodes_type("provider")) == 34
+    assert app.extract_nodes_type("rtu")[0].hostname == "node-0"
+    assert app.extract_app_node("node-10") is None
+    assert app.extract_app_node("renamed").topology is None
+    assert app.extract_app_node("node-5").topology == app.extract_node("node-5")
@@ -1,7 +1,7 @@
 from .app import WindTurbine
 
 def main():
-    WindTurbine.main("wind-turbine")
+    WindTurbine.main("wind-turbine", freeze_gc=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
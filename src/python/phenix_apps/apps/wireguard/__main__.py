@@ -1,7 +1,7 @@
 from .app import Wireguard
 
 def main():
-    Wireguard.main("wireguard")
+    Wireguard.main("wireguard", freeze_gc=True)
 
 if __name__ == "__main__":
     main()
@@ -16,6 +16,7 @@ class Wireguard(AppBase):
         templates = utils.abs_path(__file__, 'templates/')
 
         guards = self.extract_all_nodes()
+        jobs   = []
 
         for vm in guards:
             path = f"{self.startup_dir}/{vm.hostname}-wireguard.conf"
@@ -27,10 +28,7 @@ class Wireguard(AppBase):
 
             self.add_inject(hostname=vm.hostname, inject=kwargs)
 
-            with open(path, 'w') as f:
-                utils.mako_serve_template(
-                    'wireguard_config.mako', templates, f, wireguard=vm.metadata
-                )
+            jobs.append(('wireguard_config.mako', {'wireguard': vm.metadata}, path))
 
             if vm.metadata.get('boot', False):
                 path = f"{self.startup_dir}/{vm.hostname}-wireguard-enable.sh"
@@ -42,9 +40,8 @@ class Wireguard(AppBase):
 
                 self.add_inject(hostname=vm.hostname, inject=kwargs)
 
-                with open(path, 'w') as f:
-                    utils.mako_serve_template(
-                        'wireguard_enable.mako', templates, f, name='wg0'
-                    )
+                jobs.append(('wireguard_enable.mako', {'name': 'wg0'}, path))
+
+        utils.mako_serve_many(templates, jobs)
 
         logger.info(f'Started user application: {self.name}')
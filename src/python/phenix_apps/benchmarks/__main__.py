@@ -0,0 +1,84 @@
+import argparse
+import json
+import sys
+import tempfile
+
+from phenix_apps.benchmarks import runner
+from phenix_apps.benchmarks.experiment import APPS
+from phenix_apps.common.logger import logger
+
+
+def _list(value: str) -> list:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark phenix apps against synthetic experiments (no minimega or Elasticsearch needed)",
+    )
+    parser.add_argument(
+        "--sizes", type=_list, default=["100", "1000"],
+        help="comma-separated experiment sizes in topology nodes (default: 100,1000)",
+    )
+    parser.add_argument(
+        "--apps", type=_list, default=APPS,
+        help=f"comma-separated apps to run (default: {','.join(APPS)})",
+    )
+    parser.add_argument(
+        "--stages", type=_list, default=runner.STAGES,
+        help=f"comma-separated stages to run (default: {','.join(runner.STAGES)})",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage; the best wall time is reported")
+    parser.add_argument("--no-memory", action="store_true", help="skip measuring peak memory")
+    parser.add_argument("--baseline", help="baseline results to compare against")
+    parser.add_argument("--save", help="write results to this file for use as a baseline")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2,
+        help="fractional increase in wall time or peak memory over the baseline that counts as a regression",
+    )
+    parser.add_argument("--work-dir", help="directory for experiment files (default: a new temporary directory)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON instead of a table")
+    parser.add_argument("--log-level", default="ERROR", help="log level for app output (default: ERROR)")
+
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level.upper())
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="phenix-benchmark-")
+
+    try:
+        results = runner.run_benchmarks(
+            [int(size) for size in args.sizes],
+            work_dir,
+            apps=args.apps,
+            stages=args.stages,
+            repeat=args.repeat,
+            memory=not args.no_memory,
+        )
+    except (runner.BenchmarkError, ValueError) as ex:
+        print(f"benchmark failed: {ex}", file=sys.stderr)
+        sys.exit(1)
+
+    regressions = []
+
+    if args.baseline:
+        regressions = runner.compare(results, runner.load_baseline(args.baseline), args.tolerance)
+
+    if args.save:
+        runner.save_baseline(args.save, results)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(runner.format_report(results))
+
+        if args.baseline:
+            print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%} compared to {args.baseline}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
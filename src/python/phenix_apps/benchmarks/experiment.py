@@ -0,0 +1,227 @@
+"""
+Synthetic experiments for benchmarking phenix apps.
+
+`generate_experiment` builds a deterministic experiment with the given number of
+topology nodes, split between the `sceptre`, `ot-sim`, `helics` and `scale`
+apps so each app has realistic work to do in its configure, pre-start and
+post-start stages.
+"""
+
+from typing import Any, Dict, List
+
+
+# Apps in the order phenix runs them.
+APPS = ["sceptre", "ot-sim", "helics", "scale"]
+
+# Share of the topology given to the scale app, which adds its nodes in the
+# configure stage.
+SCALE_SHARE = 0.1
+
+BROKER = "helics-broker"
+
+
+def _node(index: int, hostname: str, os_type: str = "linux") -> Dict[str, Any]:
+    subnet = index // 200
+
+    return {
+        "type": "VirtualMachine",
+        "general": {"hostname": hostname, "vm_type": "kvm"},
+        "hardware": {
+            "os_type": os_type,
+            "vcpus": 1,
+            "memory": 1024 if os_type == "linux" else 4096,
+            "drives": [{"image": "bennu.qc2" if os_type == "linux" else "win10.qc2"}],
+        },
+        "network": {
+            "interfaces": [
+                {
+                    "name": "eth0",
+                    "type": "ethernet",
+                    "proto": "static",
+                    "vlan": f"EXP-{subnet}",
+                    "address": f"10.{subnet // 256}.{subnet % 256}.{index % 200 + 1}",
+                    "mask": 24,
+                    "gateway": f"10.{subnet // 256}.{subnet % 256}.254",
+                },
+                {
+                    "name": "mgmt",
+                    "type": "ethernet",
+                    "proto": "static",
+                    "vlan": "mgmt",
+                    "address": f"172.16.{index // 250}.{index % 250 + 1}",
+                    "mask": 16,
+                },
+            ],
+        },
+    }
+
+
+def _split(total: int, *shares: float) -> List[int]:
+    counts = [int(total * share) for share in shares]
+    return [total - sum(counts)] + counts
+
+
+def _sceptre(nodes: list, hosts: list, count: int) -> None:
+    def add(hostname, metadata, os_type="linux"):
+        nodes.append(_node(len(nodes), hostname, os_type))
+        hosts.append({"hostname": hostname, "metadata": metadata})
+
+    add(
+        "provider",
+        {
+            "type": "provider",
+            "simulator": "PowerWorld",
+            "case": "/phenix/injects/case.PWB",
+            "oneline": "/phenix/injects/oneline.pwd",
+        },
+    )
+
+    for hostname, typ in (
+        ("opc", "opc"),
+        ("scada", "scada-server"),
+        ("historian", "historian"),
+        ("hmi", "hmi"),
+        ("engineer", "engineer-workstation"),
+    ):
+        add(hostname, {"type": typ}, "windows")
+
+    add("elk", {"type": "elk"})
+
+    clients = max(int(count * 0.02), 1)
+    feps = max(int(count * 0.02), 1)
+    servers = max(count - 7 - clients - feps, 1)
+
+    rtus = [f"rtu-{i}" for i in range(servers)]
+
+    for i, rtu in enumerate(rtus):
+        add(
+            rtu,
+            {
+                "type": "fd-server",
+                "provider": "provider",
+                "infrastructure": "power-transmission",
+                "labels": ["elk"],
+                "dnp3": [
+                    {"type": "bus", "name": f"bus-{i}"},
+                    {"type": "generator", "name": f"gen-{i}"},
+                ],
+                "modbus": [
+                    {"type": "load", "name": f"load-{i}"},
+                    {"type": "branch", "name": f"branch-{i}-{i + 1}"},
+                ],
+            },
+        )
+
+    for i in range(clients):
+        add(f"client-{i}", {"type": "fd-client", "connected_rtus": rtus[5 * i:5 * (i + 1)]})
+
+    # FEPs front the last RTUs, which take them out of the OPC config
+    for i in range(feps):
+        add(
+            f"fep-{i}",
+            {
+                "type": "fep",
+                "provider": "provider",
+                "infrastructure": "power-transmission",
+                "connected_rtus": rtus[::-1][4 * i:4 * (i + 1)],
+            },
+        )
+
+
+def _otsim(nodes: list, hosts: list, count: int) -> None:
+    def add(hostname, metadata):
+        nodes.append(_node(len(nodes), hostname))
+        hosts.append({"hostname": hostname, "metadata": metadata})
+
+    servers, feps, clients = _split(count, 0.05, 0.05)
+    outstations = [f"outstation-{i}" for i in range(servers)]
+
+    for i, outstation in enumerate(outstations):
+        metadata = {
+            "type": "fd-server",
+            "modbus": [
+                {"name": f"bus-{i}", "type": "bus"},
+                {"name": f"load-{i}", "type": "load"},
+            ],
+        }
+
+        # Clients only connect to Modbus outstations, since ot-sim clients
+        # don't configure a DNP3 master.
+        if i % 10:
+            metadata["dnp3"] = [
+                {"name": f"line-{i}", "type": "line"},
+                {"name": f"breaker-{i}", "type": "breaker"},
+            ]
+
+        add(outstation, metadata)
+
+    for i in range(feps):
+        add(f"ot-fep-{i}", {"type": "fep", "upstream": outstations[5 * i:5 * (i + 1)]})
+
+    for i in range(clients):
+        add(f"ot-client-{i}", {"type": "fd-client", "connected_rtus": outstations[::10][i::max(clients, 1)]})
+
+
+def generate_experiment(nodes: int, name: str = "benchmark") -> Dict[str, Any]:
+    """
+    Returns an experiment with (after the scale app's configure stage) the
+    given number of topology nodes.
+    """
+
+    if nodes < 20:
+        raise ValueError("synthetic experiments need at least 20 nodes")
+
+    scale = max(int(nodes * SCALE_SHARE), 1)
+    sceptre = (nodes - scale - 1) // 2
+    otsim = nodes - scale - 1 - sceptre
+
+    topology = [_node(0, BROKER)]
+
+    sceptre_hosts = []
+    _sceptre(topology, sceptre_hosts, sceptre)
+
+    otsim_hosts = []
+    _otsim(topology, otsim_hosts, otsim)
+
+    apps = [
+        {"name": "sceptre", "hosts": sceptre_hosts},
+        {
+            "name": "ot-sim",
+            "metadata": {"helics": {"broker": {"hostname": f"{BROKER}|eth0"}, "federate": "OpenDSS"}},
+            "hosts": otsim_hosts,
+        },
+        {"name": "helics", "metadata": {"broker": {"root": f"{BROKER}|eth0"}}},
+        {
+            "name": "scale",
+            "metadata": {
+                "profiles": [
+                    {
+                        "name": "containers",
+                        "plugin": "builtin",
+                        "count": scale,
+                        "container_template": {
+                            "networks": [
+                                {"name": "MGMT", "network": "172.30.0.1/16"},
+                                {"name": "EXP", "network": "10.200.0.1/16"},
+                            ],
+                            "gateway": "MGMT",
+                            "rootfs": "otsimfs.tgz",
+                        },
+                    }
+                ]
+            },
+        },
+    ]
+
+    return {
+        "apiVersion": "phenix.sandia.gov/v1",
+        "kind": "Experiment",
+        "metadata": {"name": name, "annotations": {"topology": name, "scenario": name}},
+        "spec": {
+            "experimentName": name,
+            "baseDir": f"/tmp/phenix/benchmark/{name}",
+            "topology": {"nodes": topology},
+            "scenario": {"apps": apps},
+        },
+        "status": {"vlans": {"MGMT": 100, "EXP": 101}},
+    }
@@ -0,0 +1,253 @@
+"""
+Runs phenix apps in-process, in dry-run mode, against synthetic experiments
+and reports how long each stage took, how much memory it used and how much it
+wrote, optionally compared against a stored baseline.
+
+Nothing here talks to minimega or Elasticsearch, so benchmarks can run
+anywhere the package is installed.
+"""
+
+import contextlib
+import gc
+import importlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from phenix_apps.benchmarks.experiment import APPS, generate_experiment
+from phenix_apps.common import lazy_box
+
+
+STAGES = ["configure", "pre-start", "post-start"]
+
+# App name --> (module, class) for each app that can be benchmarked.
+APP_CLASSES = {
+    "sceptre": ("phenix_apps.apps.sceptre.app", "Sceptre"),
+    "ot-sim": ("phenix_apps.apps.otsim.app", "OTSim"),
+    "helics": ("phenix_apps.apps.helics.app", "Helics"),
+    "scale": ("phenix_apps.apps.scale.app", "Scale"),
+}
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+
+    return total
+
+
+def _run_once(app: str, stage: str, raw: str, memory: bool = False) -> Tuple[str, float, int]:
+    module, name = APP_CLASSES[app]
+    cls = getattr(importlib.import_module(module), name)
+
+    out = io.StringIO()
+    sink = io.StringIO()
+
+    orig_stdin = sys.stdin
+    sys.stdin = io.StringIO(raw)
+
+    gc.collect()
+
+    if memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+
+    try:
+        # Apps print progress and summaries, which would otherwise mix with the
+        # benchmark report.
+        with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+            instance = cls(app, stage, dryrun=True)
+            instance.execute_stage()
+            instance.finalize()
+
+            lazy_box.dump(instance.experiment, out)
+    except SystemExit as ex:
+        raise BenchmarkError(f"{app} {stage} exited with status {ex.code}: {sink.getvalue()[-2000:]}") from None
+    finally:
+        elapsed = time.perf_counter() - start
+
+        peak = 0
+
+        if memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        sys.stdin = orig_stdin
+
+    return out.getvalue(), elapsed, peak
+
+
+def run_stage(app: str, stage: str, raw: str, repeat: int = 1, memory: bool = True) -> Tuple[str, Dict[str, Any]]:
+    """
+    Runs a single app stage against the given experiment JSON and returns the
+    updated experiment JSON along with the best wall time of `repeat` runs,
+    the peak Python memory allocated (measured in a separate run, since
+    tracing allocations slows the stage down), the size of the experiment
+    JSON written and the size of the files the stage wrote to the experiment
+    directory.
+    """
+
+    base_dir = json.loads(raw)["spec"]["baseDir"]
+    before = _dir_size(base_dir)
+
+    output, wall, _ = _run_once(app, stage, raw)
+    files = _dir_size(base_dir) - before
+
+    for _ in range(repeat - 1):
+        wall = min(wall, _run_once(app, stage, raw)[1])
+
+    peak = _run_once(app, stage, raw, memory=True)[2] if memory else None
+
+    return output, {
+        "app": app,
+        "stage": stage,
+        "wall": round(wall, 4),
+        "peak": peak,
+        "output": len(output.encode("utf-8")),
+        "files": files,
+    }
+
+
+def run_benchmarks(
+    sizes: List[int],
+    work_dir: str,
+    apps: Optional[List[str]] = None,
+    stages: Optional[List[str]] = None,
+    repeat: int = 1,
+    memory: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Generates an experiment of each size and runs each stage of each app in
+    turn, passing the experiment each app outputs on to the next like phenix
+    does. Returns a result for every app stage and size.
+    """
+
+    apps = apps or APPS
+    stages = stages or STAGES
+
+    for app in apps:
+        if app not in APP_CLASSES:
+            raise BenchmarkError(f"unknown app: {app}")
+
+    results = []
+
+    for size in sizes:
+        name = f"benchmark-{size}"
+
+        experiment = generate_experiment(size, name)
+        experiment["spec"]["baseDir"] = os.path.join(work_dir, name)
+        os.makedirs(experiment["spec"]["baseDir"], exist_ok=True)
+
+        # Only benchmark the requested apps, but keep the others in the
+        # scenario so the experiment is the same either way.
+        raw = json.dumps(experiment)
+
+        for stage in stages:
+            for app in apps:
+                raw, result = run_stage(app, stage, raw, repeat, memory)
+
+                result["nodes"] = size
+                results.append(result)
+
+    return results
+
+
+def result_key(result: Dict[str, Any]) -> str:
+    return f"{result['app']}/{result['stage']}/{result['nodes']}"
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path) as f:
+        data = json.load(f)
+
+    return {result_key(r): r for r in data.get("results", [])}
+
+
+def save_baseline(path: str, results: List[Dict[str, Any]]) -> None:
+    keys = ("app", "stage", "nodes", "wall", "peak", "output", "files")
+    results = [{k: r.get(k) for k in keys} for r in results]
+
+    with open(path, "w") as f:
+        json.dump({"version": 1, "results": results}, f, indent=2)
+        f.write("\n")
+
+
+def compare(
+    results: List[Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    tolerance: float = 0.2,
+    min_wall: float = 0.05,
+) -> List[Dict[str, Any]]:
+    """
+    Adds the baseline values to each result and returns the results whose wall
+    time or peak memory grew by more than `tolerance` (as a fraction of the
+    baseline). Wall time increases under `min_wall` seconds are ignored as
+    noise.
+    """
+
+    regressions = []
+
+    for result in results:
+        base = baseline.get(result_key(result))
+
+        if not base:
+            continue
+
+        result["baseline"] = {k: base.get(k) for k in ("wall", "peak", "output", "files")}
+
+        reasons = []
+
+        if result["wall"] > base["wall"] * (1 + tolerance) and result["wall"] - base["wall"] >= min_wall:
+            reasons.append("wall")
+
+        if result.get("peak") and base.get("peak") and result["peak"] > base["peak"] * (1 + tolerance):
+            reasons.append("peak")
+
+        if reasons:
+            result["regressed"] = reasons
+            regressions.append(result)
+
+    return regressions
+
+
+def _change(value, base) -> str:
+    if value is None or not base:
+        return ""
+
+    return f" ({(value - base) / base:+.0%})"
+
+
+def format_report(results: List[Dict[str, Any]]) -> str:
+    header = f"{'nodes':>6}  {'app':<8} {'stage':<11} {'wall (s)':>16} {'peak (MB)':>16} {'output (KB)':>12} {'files (KB)':>11}"
+    lines = [header, "-" * len(header)]
+
+    for r in results:
+        base = r.get("baseline", {})
+        peak = r["peak"] / 2**20 if r.get("peak") is not None else None
+
+        wall = f"{r['wall']:.3f}{_change(r['wall'], base.get('wall'))}"
+        mem = f"{peak:.1f}{_change(r['peak'], base.get('peak'))}" if peak is not None else "-"
+        flag = f"  REGRESSED: {', '.join(r['regressed'])}" if r.get("regressed") else ""
+
+        lines.append(
+            f"{r['nodes']:>6}  {r['app']:<8} {r['stage']:<11} {wall:>16} {mem:>16} "
+            f"{r['output'] / 1024:>12.1f} {r['files'] / 1024:>11.1f}{flag}"
+        )
+
+    return "\n".join(lines)
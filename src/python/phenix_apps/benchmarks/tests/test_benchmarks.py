@@ -0,0 +1,98 @@
+"""
+Unit tests for the synthetic experiment benchmarks.
+"""
+
+import json
+
+import minimega
+import pytest
+
+from phenix_apps.benchmarks import runner
+from phenix_apps.benchmarks.experiment import APPS, generate_experiment
+
+
+def test_generate_experiment():
+    experiment = generate_experiment(1000)
+
+    nodes = experiment["spec"]["topology"]["nodes"]
+    apps = {app["name"]: app for app in experiment["spec"]["scenario"]["apps"]}
+    scale = apps["scale"]["metadata"]["profiles"][0]["count"]
+
+    assert list(apps) == APPS
+    assert len(nodes) + scale == 1000
+    assert len({n["general"]["hostname"] for n in nodes}) == len(nodes)
+    assert len({n["network"]["interfaces"][0]["address"] for n in nodes}) == len(nodes)
+
+    hosts = apps["sceptre"]["hosts"] + apps["ot-sim"]["hosts"]
+    assert {h["hostname"] for h in hosts} <= {n["general"]["hostname"] for n in nodes}
+
+    assert generate_experiment(1000) == experiment
+
+    with pytest.raises(ValueError):
+        generate_experiment(10)
+
+
+def test_run_stages_offline(tmp_path, mocker):
+    mocker.patch.object(minimega, "connect", side_effect=AssertionError("benchmarks must not connect to minimega"))
+
+    experiment = generate_experiment(100)
+    experiment["spec"]["baseDir"] = str(tmp_path)
+
+    raw = json.dumps(experiment)
+    results = []
+
+    for stage in runner.STAGES:
+        for app in APPS:
+            raw, result = runner.run_stage(app, stage, raw)
+            results.append(result)
+
+    assert len(results) == len(runner.STAGES) * len(APPS)
+    assert all(r["wall"] >= 0 and r["peak"] > 0 for r in results)
+
+    out = json.loads(raw)
+    nodes = {n["general"]["hostname"]: n for n in out["spec"]["topology"]["nodes"]}
+
+    assert len(nodes) == 100
+    assert (tmp_path / "sceptre" / "rtu-0" / "config.xml").exists()
+    assert (tmp_path / "ot-sim" / "outstation-0.xml").exists()
+    assert nodes["helics-broker"]["labels"]["helics"] == "broker"
+
+    sceptre = next(r for r in results if r["app"] == "sceptre" and r["stage"] == "pre-start")
+    assert sceptre["files"] > 0
+    assert sceptre["output"] > len(json.dumps(experiment))
+
+
+def test_run_benchmarks(tmp_path):
+    results = runner.run_benchmarks([100, 200], str(tmp_path), apps=["ot-sim", "helics"], stages=["pre-start"], memory=False)
+
+    assert [runner.result_key(r) for r in results] == [
+        "ot-sim/pre-start/100", "helics/pre-start/100", "ot-sim/pre-start/200", "helics/pre-start/200",
+    ]
+    assert all(r["peak"] is None for r in results)
+
+    with pytest.raises(runner.BenchmarkError):
+        runner.run_benchmarks([100], str(tmp_path), apps=["nope"])
+
+
+def test_compare_with_baseline(tmp_path):
+    def result(app, wall, peak):
+        return {"app": app, "stage": "pre-start", "nodes": 100, "wall": wall, "peak": peak, "output": 1, "files": 2}
+
+    path = str(tmp_path / "baseline.json")
+    runner.save_baseline(path, [result("sceptre", 1.0, 1000), result("ot-sim", 1.0, 1000), result("helics", 0.01, 1000)])
+
+    results = [
+        result("sceptre", 1.1, 1100),  # within tolerance
+        result("ot-sim", 1.5, 1000),  # slower
+        result("helics", 0.03, 2000),  # more memory; slower, but only by noise
+        result("scale", 9.0, 9000),  # not in the baseline
+    ]
+
+    regressions = runner.compare(results, runner.load_baseline(path), tolerance=0.2)
+
+    assert [(r["app"], r["regressed"]) for r in regressions] == [("ot-sim", ["wall"]), ("helics", ["peak"])]
+    assert results[0]["baseline"]["wall"] == 1.0
+    assert "baseline" not in results[3]
+
+    report = runner.format_report(results)
+    assert "+50%" in report and "REGRESSED: wall" in report
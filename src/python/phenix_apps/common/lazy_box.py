@@ -0,0 +1,312 @@
+"""
+Box and BoxList subclasses that wrap nested dicts and lists on first access
+instead of when they're created.
+
+Wrapping a large experiment in Box up front converts every dict and list in
+it, which costs far more than decoding the JSON. Most apps only touch a small
+part of the experiment, so `loads` keeps the decoded data as-is and each
+subtree is wrapped the first time it's read. `dump` writes the experiment back
+out without converting the parts that were never touched.
+"""
+
+import copy
+import json
+
+from keyword import iskeyword
+from typing import IO, Any, Optional
+
+from box import Box, BoxError, BoxList
+
+
+def _child_config(config: dict, key: Any = None) -> dict:
+    out = config.copy()
+
+    # Per-instance state, not options passed down to children.
+    out.pop("__created", None)
+    out.pop("__safe_keys", None)
+
+    if key is not None and out["box_namespace"] is not False:
+        out["box_namespace"] = (*out["box_namespace"], key)
+
+    return out
+
+
+def _new_box(config: dict, raw: dict) -> "LazyBox":
+    # dict.__new__ skips Box.__new__, which builds a config that would just be
+    # replaced.
+    box = dict.__new__(LazyBox)
+
+    config["__created"] = True
+    config["__safe_keys"] = {}
+    object.__setattr__(box, "_box_config", config)
+
+    dict.update(box, raw)
+
+    # Box maps attribute-safe names to keys so keys like "ground-truth-module"
+    # can be read as attributes. Identifier keys map to themselves and are
+    # found without the mapping.
+    for key in raw:
+        if not (isinstance(key, str) and key.isidentifier() and not iskeyword(key)):
+            config["__safe_keys"][box._safe_attr(key)] = key
+
+    return box
+
+
+def _new_list(options: dict, raw: list) -> "LazyBoxList":
+    items = list.__new__(LazyBoxList)
+
+    items.box_options = options
+    items.box_org_ref = None
+
+    list.extend(items, raw)
+
+    return items
+
+
+class LazyBox(Box):
+    """
+    A Box whose nested dicts and lists (as decoded from JSON) are converted to
+    LazyBox and LazyBoxList objects the first time they're accessed.
+    """
+
+    def __getitem__(self, item, _ignore_default=False):
+        try:
+            value = dict.__getitem__(self, item)
+        except (KeyError, TypeError):
+            return super().__getitem__(item, _ignore_default)
+
+        typ = type(value)
+
+        if typ is dict:
+            value = _new_box(_child_config(self._box_config, item), value)
+            dict.__setitem__(self, item, value)
+        elif typ is list:
+            value = _new_list(_child_config(self._box_config, item), value)
+            dict.__setitem__(self, item, value)
+
+        return value
+
+    def items(self, dotted=False):
+        if not dotted:
+            for key in self.keys():
+                self[key]
+
+        return super().items(dotted)
+
+    def values(self):
+        for key in self.keys():
+            self[key]
+
+        return super().values()
+
+
+class LazyBoxList(BoxList):
+    """
+    A BoxList whose dict and list items (as decoded from JSON) are converted to
+    LazyBox and LazyBoxList objects the first time they're accessed.
+    """
+
+    def __getitem__(self, item):
+        if not isinstance(item, int):
+            if isinstance(item, slice):
+                return [self[i] for i in range(*item.indices(len(self)))]
+
+            return super().__getitem__(item)
+
+        value = list.__getitem__(self, item)
+        typ = type(value)
+
+        if typ is dict:
+            value = _new_box(_child_config(self.box_options), value)
+            list.__setitem__(self, item, value)
+        elif typ is list:
+            value = _new_list(_child_config(self.box_options), value)
+            list.__setitem__(self, item, value)
+
+        return value
+
+    def __iter__(self):
+        i = 0
+
+        while i < len(self):
+            yield self[i]
+            i += 1
+
+    def __reversed__(self):
+        for i in range(len(self) - 1, -1, -1):
+            yield self[i]
+
+    def pop(self, index=-1):
+        value = self[index]
+        list.pop(self, index)
+
+        return value
+
+
+class FrozenBox(Box):
+    """
+    A read-only view of a dict that shares its values instead of copying them.
+    Nested dicts and lists are wrapped in read-only views the first time
+    they're accessed, so the data can't be changed through the view at any
+    depth. Create one with `frozen_view`.
+    """
+
+    def __getitem__(self, item, _ignore_default=False):
+        try:
+            value = dict.__getitem__(self, item)
+        except (KeyError, TypeError):
+            return super().__getitem__(item, _ignore_default)
+
+        if isinstance(value, (dict, list)) and not isinstance(value, (FrozenBox, FrozenBoxList)):
+            value = frozen_view(value)
+            dict.__setitem__(self, item, value)
+
+        return value
+
+    def items(self, dotted=False):
+        if not dotted:
+            for key in self.keys():
+                self[key]
+
+        return super().items(dotted)
+
+    def values(self):
+        for key in self.keys():
+            self[key]
+
+        return super().values()
+
+    def __copy__(self):
+        return Box(to_plain(self))
+
+    def __deepcopy__(self, memo):
+        # copies are regular, modifiable Box objects
+        return Box(copy.deepcopy(to_plain(self), memo))
+
+
+def _frozen(*args, **kwargs):
+    raise BoxError("BoxList is frozen")
+
+
+class FrozenBoxList(BoxList):
+    """
+    A read-only view of a list, the list counterpart of FrozenBox.
+    """
+
+    def __getitem__(self, item):
+        if not isinstance(item, int):
+            if isinstance(item, slice):
+                return [self[i] for i in range(*item.indices(len(self)))]
+
+            return super().__getitem__(item)
+
+        value = list.__getitem__(self, item)
+
+        if isinstance(value, (dict, list)) and not isinstance(value, (FrozenBox, FrozenBoxList)):
+            value = frozen_view(value)
+            list.__setitem__(self, item, value)
+
+        return value
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __reversed__(self):
+        for i in range(len(self) - 1, -1, -1):
+            yield self[i]
+
+    def __copy__(self):
+        return BoxList(to_plain(self))
+
+    def __deepcopy__(self, memo):
+        return BoxList(copy.deepcopy(to_plain(self), memo))
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _frozen
+    append = extend = insert = pop = remove = reverse = sort = clear = _frozen
+
+
+def frozen_view(obj: Any) -> Any:
+    """
+    Return a read-only view of a dict or list (including Box and LazyBox
+    objects) without copying it. Only the view's own references to the
+    nested values are created up front; changes made to the original data
+    afterwards may or may not show through, so views should be short-lived.
+    Other values are returned as they are.
+    """
+
+    if isinstance(obj, dict):
+        config = obj._box_config if isinstance(obj, Box) else LazyBox()._box_config
+        config = _child_config(config)
+        config["frozen_box"] = True
+
+        box = dict.__new__(FrozenBox)
+
+        config["__created"] = True
+        config["__safe_keys"] = {}
+        object.__setattr__(box, "_box_config", config)
+
+        dict.update(box, obj)
+
+        for key in obj:
+            if not (isinstance(key, str) and key.isidentifier() and not iskeyword(key)):
+                config["__safe_keys"][box._safe_attr(key)] = key
+
+        return box
+
+    if isinstance(obj, list):
+        items = list.__new__(FrozenBoxList)
+
+        options = _child_config(obj.box_options if isinstance(obj, BoxList) else LazyBox()._box_config)
+        options["frozen_box"] = True
+
+        items.box_options = options
+        items.box_org_ref = None
+
+        list.extend(items, obj)
+
+        return items
+
+    return obj
+
+
+def loads(raw: str) -> LazyBox:
+    """
+    Decode a JSON object into a LazyBox. Raises BoxError if the JSON isn't an
+    object, like Box.from_json.
+    """
+
+    data = json.loads(raw)
+
+    if not isinstance(data, dict):
+        raise BoxError(f"json data not returned as a dictionary, but rather a {type(data).__name__}")
+
+    return _new_box(_child_config(LazyBox()._box_config), data)
+
+
+def to_plain(obj: Any) -> Any:
+    """
+    Convert Box and BoxList objects back into plain dicts and lists.
+
+    Values that were never wrapped are returned as they are, so only the parts
+    of a LazyBox that were accessed get copied.
+    """
+
+    if isinstance(obj, Box):
+        return {k: to_plain(v) for k, v in dict.items(obj)}
+
+    if isinstance(obj, BoxList):
+        return [to_plain(v) for v in list.__iter__(obj)]
+
+    return obj
+
+
+def dump(obj: Any, fp: IO, indent: Optional[int] = None) -> None:
+    """
+    Write a Box (or LazyBox) to the given file as JSON followed by a newline.
+    The output is the same as `print(obj.to_json(indent=indent), file=fp)`.
+    """
+
+    fp.write(json.dumps(to_plain(obj), ensure_ascii=False, indent=indent))
+    fp.write("\n")
+    fp.flush()
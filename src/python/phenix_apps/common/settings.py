@@ -15,3 +15,23 @@ PHENIX_TEMP_DIR = os.getenv('PHENIX_TEMP_DIR', '/tmp/phenix')
 
 # Base minimega filepath
 MM_FILEPATH = os.getenv('MM_FILEPATH', '/phenix/images')
+
+# Optional directory for caching compiled mako templates on disk. Disabled
+# when empty.
+PHENIX_MAKO_MODULE_DIR = os.getenv('PHENIX_MAKO_MODULE_DIR', '')
+
+# Optional directory for caching precompiled SunSpec SMDX models on disk, keyed
+# by model file hash. Disabled when empty.
+PHENIX_SUNSPEC_CACHE_DIR = os.getenv('PHENIX_SUNSPEC_CACHE_DIR', '')
+
+# Ratio of schedulable vCPUs (and memory) to physical CPUs (and memory) per
+# cluster host, used by the bin-pack scheduler.
+PHENIX_SCHEDULER_CPU_RATIO = float(os.getenv('PHENIX_SCHEDULER_CPU_RATIO', '1.0'))
+PHENIX_SCHEDULER_MEM_RATIO = float(os.getenv('PHENIX_SCHEDULER_MEM_RATIO', '1.0'))
+
+# Opt-in instrumentation of Scorch component stages, used when a component's
+# metadata doesn't set `profile`. Either "timing" for a per-category timing
+# breakdown, or "sample" to also capture a sampling profile. Disabled when
+# empty.
+PHENIX_SCORCH_PROFILE = os.getenv('PHENIX_SCORCH_PROFILE', '')
+PHENIX_SCORCH_PROFILE_INTERVAL = float(os.getenv('PHENIX_SCORCH_PROFILE_INTERVAL', '0.01'))
@@ -0,0 +1,176 @@
+"""
+Unit tests for miniccc command completion tracking.
+"""
+
+import minimega
+import pytest
+
+from phenix_apps.common import utils
+
+
+@pytest.fixture(autouse=True)
+def clear_uuid_cache():
+    utils._VM_UUIDS.clear()
+
+
+def test_mm_exec_wait(fake_minimega):
+    mm = fake_minimega(["vm-1", "vm-2"])
+
+    result = utils.mm_exec_wait(mm, "vm-2", "which tcpdump", poll_rate=0.01)
+
+    assert result == {
+        "id": "1",
+        "cmd": "which tcpdump",
+        "exitcode": 0,
+        "stderr": None,
+        "stdout": "which tcpdump on vm-2",
+    }
+
+    # the prefix used to track the command doesn't leak into later commands
+    assert mm.prefix == ""
+
+
+def test_wait_many(fake_minimega):
+    vms = [f"vm-{i}" for i in range(50)]
+    mm = fake_minimega(vms, polls_to_complete=3)
+
+    tracker = utils.MMCommandTracker(mm)
+    handles = [tracker.submit(f"hostname {vm}", vm=vm) for vm in vms]
+    handles.append(tracker.submit("uptime", cc_filter="all", expected=len(vms)))
+
+    results = tracker.wait(timeout=5.0, poll_rate=0.01)
+
+    assert results[handles[7]]["vm-7"]["stdout"] == "hostname vm-7 on vm-7"
+    assert sorted(results[handles[-1]]) == sorted(vms)
+
+    # a single 'cc commands' poll per loop iteration covers every command, and
+    # the UUID map is only looked up once
+    assert mm.calls.count("cc_commands") == 3
+    assert mm.calls.count("vm_info") == 1
+
+    # UUID map is shared across calls
+    utils.mm_exec_wait(mm, "vm-3", "true", poll_rate=0.01)
+    assert mm.calls.count("vm_info") == 1
+
+
+def test_send_and_background(fake_minimega):
+    mm = fake_minimega(["vm-1", "vm-2"])
+
+    tracker = utils.MMCommandTracker(mm)
+    sent = tracker.send("/phenix/images/exp/script.sh", vm="vm-1")
+    started = tracker.submit("bash /tmp/miniccc/files/exp/script.sh", vm="vm-1", background=True)
+
+    results = tracker.wait(timeout=5.0, poll_rate=0.01)
+
+    assert results[sent] == {}
+    assert results[started]["vm-1"]["exitcode"] == 0
+    assert [c for c in mm.calls if c in ("cc_send", "cc_background_once")] == ["cc_send", "cc_background_once"]
+    assert [c["prefix"] for c in mm.issued] == [sent, started]
+    assert mm.prefix == ""
+
+
+def test_cc_state_cleared_once(fake_minimega):
+    mm = fake_minimega(["vm-1", "vm-2"])
+    mm.filter = "os=linux iperf=1"
+
+    tracker = utils.MMCommandTracker(mm)
+    handles = [tracker.submit("hostname", vm=vm) for vm in ["vm-1", "vm-2"]]
+
+    # the command was issued with the tracker's own prefix and filter, without
+    # querying or restoring the caller's
+    assert mm.issued[0]["prefix"] == handles[0]
+    assert mm.issued[0]["targets"] == ["vm-1"]
+    assert mm.calls == ["cc_prefix", "cc_filter", "cc_exec_once"] * 2
+    assert mm.prefix == handles[1]
+
+    tracker.wait(handles, timeout=5.0, poll_rate=0.01)
+
+    assert mm.calls.count("clear_cc_prefix") == mm.calls.count("clear_cc_filter") == 1
+    assert mm.prefix == ""
+    assert mm.filter == ""
+
+
+def test_exitcode_retries_per_handle(fake_minimega):
+    vms = [f"vm-{i}" for i in range(4)]
+    mm = fake_minimega(vms, polls_to_complete=1)
+
+    tracker = utils.MMCommandTracker(mm)
+    handles = [tracker.submit("true", vm=vm) for vm in vms]
+
+    # 24 failures in total, but no more than 10 for any one command
+    mm.exitcode_failures = {str(i + 1): 6 for i in range(len(vms))}
+
+    results = tracker.wait(handles, poll_rate=0.001)
+
+    assert all(results[h][vm]["exitcode"] == 0 for h, vm in zip(handles, vms))
+
+    handle = tracker.submit("true", vm="vm-0")
+    mm.exitcode_failures = {"5": 11}
+
+    with pytest.raises(minimega.Error):
+        tracker.wait([handle], poll_rate=0.001)
+
+
+def test_recreated_vm(fake_minimega):
+    mm = fake_minimega(["vm-1", "vm-2"])
+
+    utils.mm_exec_wait(mm, "vm-2", "true", poll_rate=0.01)
+
+    # vm-2 is re-created with the same name, so it has a new UUID
+    mm.vms["vm-2"] = "ffffffff-0000-4000-8000-000000000000"
+
+    result = utils.mm_exec_wait(mm, "vm-2", "hostname", poll_rate=0.01)
+
+    assert result["stdout"] == "hostname on vm-2"
+    assert mm.calls.count("vm_info") == 2
+
+
+def test_vm_uuid_cache_expires(fake_minimega):
+    mm = fake_minimega(["vm-1", "vm-2"])
+
+    assert utils.mm_vm_uuid(mm, "vm-2") == "00000001-0000-4000-8000-000000000000"
+
+    # name lookups can't tell the UUID is stale, so only the cache's age
+    # picks up a VM re-created under the same name
+    mm.vms["vm-2"] = "ffffffff-0000-4000-8000-000000000000"
+    assert utils.mm_vm_uuid(mm, "vm-2") == "00000001-0000-4000-8000-000000000000"
+
+    fetched, uuids = utils._VM_UUIDS[mm]
+    utils._VM_UUIDS[mm] = (fetched - utils._VM_UUIDS_MAX_AGE - 1, uuids)
+
+    assert utils.mm_vm_uuid(mm, "vm-2") == "ffffffff-0000-4000-8000-000000000000"
+    assert mm.calls.count("vm_info") == 2
+
+
+def test_wait_first(fake_minimega):
+    mm = fake_minimega(["vm-1", "vm-2", "vm-3"], polls_to_complete=1, slow_vms={"vm-2": 3})
+
+    tracker = utils.MMCommandTracker(mm)
+    handles = [tracker.submit("hostname", vm=vm) for vm in ["vm-1", "vm-2", "vm-3"]]
+
+    results = tracker.wait(handles, poll_rate=0.01, first=True)
+
+    assert sorted(results) == sorted([handles[0], handles[2]])
+    assert mm.calls.count("cc_commands") == 1
+
+    results = tracker.wait([handles[1]], poll_rate=0.01, first=True)
+
+    assert results[handles[1]]["vm-2"]["stdout"] == "hostname on vm-2"
+    assert mm.calls.count("cc_commands") == 3
+
+def test_wait_timeout(fake_minimega):
+    mm = fake_minimega(["vm-1"], polls_to_complete=1000)
+
+    with pytest.raises(RuntimeError, match="Timeout exceeded"):
+        utils.mm_exec_wait(mm, "vm-1", "sleep 100", timeout=0.2, poll_rate=0.05)
+
+
+def test_parse_cc_response():
+    resp = (
+        "1/0ab5dbc3-8ca6-4b75-a503-b5a191995dae/stdout:\nline 1\nline 2\n\n"
+        "1/0ab5dbc3-8ca6-4b75-a503-b5a191995dae/stderr:\nerr\n"
+    )
+
+    assert utils._parse_cc_response(resp) == {
+        "0ab5dbc3-8ca6-4b75-a503-b5a191995dae": {"stdout": "line 1\nline 2", "stderr": "err"},
+    }
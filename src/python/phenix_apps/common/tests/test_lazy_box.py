@@ -0,0 +1,187 @@
+"""
+Unit tests for lazily wrapped experiment Boxes.
+"""
+
+import copy
+import io
+import json
+import sys
+import time
+
+import pytest
+from box import Box, BoxError
+
+from phenix_apps.apps import AppBase
+from phenix_apps.common import lazy_box, settings
+from phenix_apps.common.lazy_box import LazyBox, LazyBoxList
+
+DATA = {
+    "a": {"b": [{"c": 1}, {"d": [1, 2, {"e": "é"}]}], "ground-truth-module": {"x": 1}},
+    "l": [[{"z": 1}]],
+    "n": None,
+}
+
+
+def test_wraps_on_access():
+    box = lazy_box.loads(json.dumps(DATA))
+
+    assert type(dict.__getitem__(box, "a")) is dict
+
+    assert isinstance(box.a, LazyBox)
+    assert isinstance(box.a.b, LazyBoxList)
+    assert box.a.b[1].d[2].e == "é"
+    assert box.a.ground_truth_module.x == 1
+    assert box["l"][0][0].z == 1
+    assert box.get("a").get("b")[0].c == 1
+    assert box.get("missing") is None
+
+    # Values are wrapped once and stored back in place.
+    assert box.a.b is box.a.b
+    assert type(dict.__getitem__(box.a, "b")) is LazyBoxList
+    assert type(list.__getitem__(box.a.b[1].d, 2)) is LazyBox
+
+
+def test_iteration_wraps_values():
+    box = lazy_box.loads(json.dumps(DATA))
+
+    assert [type(v) for v in box.values()] == [LazyBox, LazyBoxList, type(None)]
+    assert all(isinstance(v, LazyBox) for v in box.a.b)
+    assert [type(v) for _, v in box.a.items()] == [LazyBoxList, LazyBox]
+    assert isinstance(next(reversed(box.a.b)), LazyBox)
+    assert isinstance(box.a.b[0:1][0], LazyBox)
+    assert box.a.b.pop(0).c == 1
+
+
+def test_same_as_box():
+    raw = json.dumps(DATA)
+    box = lazy_box.loads(raw)
+    expected = Box.from_json(raw)
+
+    assert box == expected
+    assert box.to_dict() == expected.to_dict()
+    assert copy.deepcopy(box) == expected
+
+    box.a.b.append({"new": {"x": [1]}})
+    box.q = {"r": [{"s": 1}]}
+
+    assert isinstance(box.a.b[-1].new, Box)
+    assert isinstance(box.q.r[0], Box)
+
+    for indent in (None, 2):
+        out = io.StringIO()
+        lazy_box.dump(box, out, indent=indent)
+
+        assert out.getvalue() == box.to_json(indent=indent) + "\n"
+
+
+def test_loads_requires_object():
+    with pytest.raises(BoxError):
+        lazy_box.loads("[1, 2]")
+
+    with pytest.raises(json.JSONDecodeError):
+        lazy_box.loads("nope")
+
+
+def make_experiment(nodes):
+    def node(i):
+        return {
+            "type": "VirtualMachine",
+            "general": {"hostname": f"vm-{i}", "description": "synthetic node " * 3, "vm_type": "kvm"},
+            "hardware": {
+                "os_type": "linux",
+                "vcpus": 2,
+                "memory": 2048,
+                "drives": [{"image": "ubuntu.qc2", "interface": "virtio", "cache_mode": "writeback"}],
+            },
+            "network": {
+                "interfaces": [
+                    {
+                        "name": f"eth{j}",
+                        "vlan": f"vlan-{(i + j) % 300}",
+                        "address": f"10.{j}.{i // 250 % 250}.{i % 250}",
+                        "mask": 24,
+                        "gateway": "10.0.0.254",
+                        "proto": "static",
+                        "type": "ethernet",
+                    }
+                    for j in range(3)
+                ],
+                "routes": [{"destination": "0.0.0.0/0", "next": "10.0.0.254", "cost": 1}],
+            },
+            "injections": [{"src": f"/phenix/{i}/a.sh", "dst": "/etc/a.sh", "description": "startup"}],
+            "labels": {"role": "scada", "site": f"s{i % 10}"},
+        }
+
+    return {
+        "metadata": {"name": "exp", "annotations": {}},
+        "spec": {
+            "experimentName": "exp",
+            "topology": {"nodes": [node(i) for i in range(nodes)]},
+            "scenario": {"apps": [{"name": "test", "metadata": {"x": 1}}]},
+        },
+        "status": {},
+    }
+
+
+class LabelApp(AppBase):
+    def configure(self):
+        self.add_label("vm-5", "touched", "true")
+
+
+def run_app(monkeypatch, raw: str) -> str:
+    """
+    Runs LabelApp's configure stage on the raw experiment, like phenix does,
+    and returns what it writes out.
+    """
+
+    monkeypatch.setattr(settings, "PHENIX_LOG_FILE", None)
+    monkeypatch.setattr(sys, "argv", ["phenix-app-test", "configure"])
+    monkeypatch.setattr(sys, "stdin", io.StringIO(raw))
+
+    out = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", out)
+
+    LabelApp.main("test")
+
+    return out.getvalue()
+
+
+def test_app_round_trip(tmp_path, monkeypatch):
+    experiment = make_experiment(50)
+    experiment["spec"]["baseDir"] = str(tmp_path)
+
+    out = run_app(monkeypatch, json.dumps(experiment))
+
+    experiment["spec"]["topology"]["nodes"][5]["labels"]["touched"] = "true"
+    assert json.loads(out) == experiment
+
+
+@pytest.mark.benchmark
+def test_startup_time_20mb_experiment(tmp_path, monkeypatch):
+    """Start up and emit a 20 MB experiment in well under a few seconds."""
+
+    monkeypatch.setattr(settings, "PHENIX_LOG_FILE", None)
+
+    experiment = make_experiment(22000)
+    experiment["spec"]["baseDir"] = str(tmp_path)
+
+    raw = json.dumps(experiment)
+    assert len(raw) > 20_000_000
+
+    monkeypatch.setattr(sys, "argv", ["phenix-app-test", "configure"])
+    monkeypatch.setattr(sys, "stdin", io.StringIO(raw))
+
+    start = time.perf_counter()
+    LabelApp("test", "configure")
+    startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    out = run_app(monkeypatch, raw)
+    total = time.perf_counter() - start
+
+    # Wrapping the whole experiment in Box up front took ~10s here.
+    assert startup < 2
+    assert total < 6
+
+    experiment["spec"]["topology"]["nodes"][5]["labels"]["touched"] = "true"
+    assert json.loads(out) == experiment
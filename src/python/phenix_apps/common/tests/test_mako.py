@@ -0,0 +1,81 @@
+"""
+Unit tests for cached Mako template rendering.
+"""
+
+import os
+
+import mako.lookup
+
+from phenix_apps.common import utils
+
+
+TEMPLATE = """\
+% for name in names:
+${prefix}-${name}
+% endfor
+"""
+
+
+def _write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def test_mako_lookup_is_cached(tmp_path):
+    _write(tmp_path / "list.mako", TEMPLATE)
+
+    lookup = utils.mako_lookup(tmp_path)
+
+    assert utils.mako_lookup(str(tmp_path)) is lookup
+    assert utils.mako_lookup(tmp_path, str(tmp_path / "mods")) is not lookup
+    assert lookup.get_template("list.mako") is lookup.get_template("list.mako")
+
+
+def test_mako_serve_template_output_unchanged(tmp_path):
+    _write(tmp_path / "list.mako", TEMPLATE)
+    kwargs = {"prefix": "vm", "names": ["a", "b"]}
+
+    out = tmp_path / "out.txt"
+    with open(out, "w") as f:
+        utils.mako_serve_template("list.mako", tmp_path, f, **kwargs)
+
+    fresh = mako.lookup.TemplateLookup(directories=[str(tmp_path)])
+    expected = fresh.get_template("list.mako").render(**kwargs) + "\n"
+
+    assert out.read_text() == expected
+
+
+def test_mako_render_recompiles_changed_template(tmp_path):
+    path = tmp_path / "hello.mako"
+    _write(path, "hello ${name}")
+
+    assert utils.mako_render(str(path), name="one") == "hello one"
+
+    _write(path, "goodbye ${name}")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert utils.mako_render(str(path), name="two") == "goodbye two"
+
+
+def test_mako_serve_many(tmp_path):
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    _write(templates / "list.mako", TEMPLATE)
+    _write(templates / "hello.mako", "hello ${name}")
+
+    mods = tmp_path / "mods"
+    jobs = [
+        ("list.mako", {"prefix": "vm", "names": [str(i), "x"]}, tmp_path / f"{i}.txt")
+        for i in range(5)
+    ]
+    jobs.append(("hello.mako", {"name": "world"}, tmp_path / "hello.txt"))
+
+    written = utils.mako_serve_many(templates, jobs, module_directory=str(mods))
+
+    assert written == [job[2] for job in jobs]
+    assert (tmp_path / "3.txt").read_text() == "vm-3\nvm-x\n\n"
+    assert (tmp_path / "hello.txt").read_text() == "hello world\n"
+
+    # Compiled template modules are cached on disk.
+    assert any(name.endswith(".py") for _, _, files in os.walk(mods) for name in files)
@@ -0,0 +1,109 @@
+"""
+Unit tests for running dependency graphs of tasks.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from phenix_apps.common import utils
+
+
+def test_run_task_graph_order_and_parallelism():
+    lock = threading.Lock()
+    order = []
+    active = [0, 0]  # current, max
+
+    def step(name):
+        def func():
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+                order.append(name)
+        return func
+
+    tasks = {
+        "a": {"func": step("a")},
+        "b": {"func": step("b")},
+        "c": {"func": step("c")},
+        "merge": {"func": step("merge"), "deps": ["a", "b", "c"]},
+        "d": {"func": step("d"), "deps": ["a"]},
+        "last": {"func": step("last"), "deps": ["merge", "d"]},
+    }
+
+    results = utils.run_task_graph(tasks, max_workers=2)
+
+    assert set(results) == set(tasks)
+    assert active[1] == 2
+    assert order.index("merge") > max(order.index(n) for n in "abc")
+    assert order.index("d") > order.index("a")
+    assert order[-1] == "last"
+    assert all(not r["skipped"] and r["duration"] >= 0.05 for r in results.values())
+
+
+def test_run_task_graph_skips_up_to_date(tmp_path):
+    src = tmp_path / "src.txt"
+    out = tmp_path / "out.txt"
+    final = tmp_path / "final.txt"
+    calls = []
+
+    def build():
+        calls.append("build")
+        out.write_text(src.read_text().upper())
+
+    def finish():
+        calls.append("finish")
+        final.write_text(out.read_text() + "!")
+
+    tasks = {
+        "build": {"func": build, "inputs": [src], "outputs": [out]},
+        "finish": {"func": finish, "deps": ["build"], "inputs": [out], "outputs": [final]},
+    }
+
+    src.write_text("hi")
+    utils.run_task_graph(tasks)
+    assert calls == ["build", "finish"]
+
+    results = utils.run_task_graph(tasks)
+    assert calls == ["build", "finish"]
+    assert results["build"]["skipped"] and results["finish"]["skipped"]
+
+    # touching the source re-runs everything downstream of it
+    stat = out.stat()
+    os.utime(src, (stat.st_atime + 10, stat.st_mtime + 10))
+    results = utils.run_task_graph(tasks)
+    assert calls == ["build", "finish", "build", "finish"]
+    assert final.read_text() == "HI!"
+
+
+def test_run_task_graph_error_stops_dependents():
+    calls = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    tasks = {
+        "fail": {"func": fail},
+        "after": {"func": lambda: calls.append("after"), "deps": ["fail"]},
+    }
+
+    with pytest.raises(RuntimeError, match="boom"):
+        utils.run_task_graph(tasks)
+
+    assert not calls
+
+
+def test_run_task_graph_bad_graphs():
+    with pytest.raises(ValueError, match="unknown task"):
+        utils.run_task_graph({"a": {"func": lambda: None, "deps": ["nope"]}})
+
+    with pytest.raises(ValueError, match="cycle"):
+        utils.run_task_graph({
+            "a": {"func": lambda: None, "deps": ["b"]},
+            "b": {"func": lambda: None, "deps": ["a"]},
+        })
@@ -0,0 +1,115 @@
+"""
+Unit tests for the concurrent miniccc file transfer helpers.
+"""
+
+import os
+
+import pytest
+
+from phenix_apps.common import settings, utils
+
+
+@pytest.fixture
+def vms(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PHENIX_DIR", str(tmp_path / "phenix"))
+    os.makedirs(settings.PHENIX_DIR)
+
+    roots = {}
+    for i in range(20):
+        root = tmp_path / "vms" / f"vm-{i}"
+        (root / "results").mkdir(parents=True)
+        (root / "out.txt").write_text(f"output from vm-{i}\n")
+        (root / "results" / "a.json").write_text("{}")
+        roots[f"vm-{i}"] = str(root)
+
+    return roots
+
+
+def test_recv_many(vms, tmp_path, fake_minimega):
+    mm = fake_minimega(roots=vms, mount_delay=0.05)
+    dst = tmp_path / "dst"
+
+    jobs = [(vm, "/out.txt", str(dst / f"{vm}.txt")) for vm in vms]
+    jobs.append(("vm-0", "/results", str(dst / "results")))
+
+    results = utils.mm_recv_many(mm, jobs, max_workers=4)
+
+    assert len(results) == 21
+    assert all(r["success"] for r in results)
+    assert [r["vm"] for r in results] == [job[0] for job in jobs]
+    assert results[3]["bytes"] == len("output from vm-3\n")
+    assert results[-1]["bytes"] == 2
+    assert (dst / "vm-7.txt").read_text() == "output from vm-7\n"
+    assert (dst / "results" / "a.json").exists()
+
+    # bounded worker pool, and every mount point was cleaned up afterwards
+    assert 1 < mm.max_active_mounts <= 4
+    assert os.listdir(settings.PHENIX_DIR) == []
+
+
+def test_recv_many_failures(vms, tmp_path, fake_minimega):
+    mm = fake_minimega(roots=vms)
+    jobs = [
+        ("vm-0", "/missing.txt", str(tmp_path / "missing.txt")),
+        ("vm-1", ["/out.txt", "/results/a.json"], str(tmp_path)),
+        ("nope", "/out.txt", str(tmp_path / "nope.txt")),
+    ]
+
+    results = utils.mm_recv_many(mm, jobs)
+
+    assert len(results) == 4
+    assert not results[0]["success"]
+    assert "not found in VM vm-0" in results[0]["error"]
+    assert results[1]["success"] and results[2]["success"]
+    assert not results[3]["success"]
+    assert "vm not found" in results[3]["error"]
+
+    with pytest.raises(ValueError, match="not found in VM vm-0"):
+        utils.mm_recv(mm, "vm-0", "/missing.txt", str(tmp_path / "missing.txt"))
+
+
+def test_send_many(vms, tmp_path, fake_minimega):
+    mm = fake_minimega(roots=vms)
+
+    script = tmp_path / "script.sh"
+    script.write_text("echo hello\n")
+
+    jobs = [(vm, str(script), "/tmp/script.sh") for vm in vms]
+    results = utils.mm_send_many(mm, jobs)
+
+    assert all(r["success"] and r["bytes"] == 11 for r in results)
+
+    for root in vms.values():
+        assert open(os.path.join(root, "tmp", "script.sh")).read() == "echo hello\n"
+
+    with pytest.raises(ValueError, match="not found locally"):
+        utils.mm_send(mm, "vm-0", str(tmp_path / "missing"), "/missing")
+
+
+def test_move_many(vms, tmp_path, fake_minimega):
+    mm = fake_minimega(roots=vms)
+
+    for i, root in enumerate(vms.values()):
+        os.makedirs(os.path.join(root, "chunks"))
+        for n in range(i % 4):
+            with open(os.path.join(root, "chunks", f"chunk.{n:04d}"), "w") as f:
+                f.write(f"{n}\n")
+
+    jobs = [(vm, "/chunks", str(tmp_path / "dst" / vm)) for vm in vms]
+    jobs.append(("vm-0", "/nothing-here", str(tmp_path / "dst" / "none")))
+
+    results = utils.mm_move_many(mm, jobs, pattern="chunk.*", keep_last=1)
+
+    assert all(r["success"] for r in results)
+    assert results[3]["files"] == ["chunk.0000", "chunk.0001"]
+    assert results[3]["bytes"] == 4
+    assert results[1]["files"] == [] and results[-1]["files"] == []
+    assert sorted(os.listdir(tmp_path / "dst" / "vm-3")) == ["chunk.0000", "chunk.0001"]
+
+    # moved files are removed from the VM, the newest one is left in place
+    assert os.listdir(os.path.join(vms["vm-3"], "chunks")) == ["chunk.0002"]
+
+    results = utils.mm_move_many(mm, jobs[:4], pattern="chunk.*")
+
+    assert [r["files"] for r in results] == [[], ["chunk.0000"], ["chunk.0001"], ["chunk.0002"]]
+    assert os.listdir(os.path.join(vms["vm-3"], "chunks")) == []
@@ -1,7 +1,9 @@
 import csv
 import datetime
+import fnmatch
 import json
 import math
+import multiprocessing
 import os
 import os.path
 import random
@@ -9,14 +11,18 @@ import re
 import shutil
 import stat
 import tempfile
+import threading
 import time
 import sys
 import subprocess
+import weakref
 from io import StringIO
 from pathlib import Path
-from typing import Union, Optional, List, IO
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from typing import Union, Optional, List, IO, Tuple
 from socket import inet_ntoa
 from struct import pack
+from uuid import uuid4
 
 import phenix_apps.common.settings as phenix_settings
 from phenix_apps.common.logger import logger
@@ -40,9 +46,60 @@ def kibana_format_time(ts: datetime.datetime) -> str:
     return ts.strftime("%b %d, %Y @ %H:%M:%S.%f").replace(".000000", ".000")
 
 
+_MAKO_LOCK = threading.Lock()
+
+# Process-wide caches of template lookups, keyed by (templates_dir,
+# module_directory), and of standalone templates, keyed by file path.
+_MAKO_LOOKUPS = {}
+_MAKO_TEMPLATES = {}
+
+
+def _mako_module_dir(module_directory: Optional[str]) -> Optional[str]:
+    module_directory = module_directory or phenix_settings.PHENIX_MAKO_MODULE_DIR
+
+    if module_directory:
+        return os.path.abspath(module_directory)
+
+    return None
+
+
+def mako_lookup(
+    templates_dir: Union[str, Path], module_directory: Optional[str] = None
+) -> mako.lookup.TemplateLookup:
+    """Get the cached Mako template lookup for a template directory.
+
+    Templates are compiled the first time they are requested and reused for
+    the life of the process. The lookup still checks template modification
+    times, so edited templates are recompiled.
+
+    Args:
+        templates_dir: directory to search for templates in
+        module_directory: optional directory to cache compiled templates in
+            on disk. Defaults to PHENIX_MAKO_MODULE_DIR, if set.
+
+    Returns:
+        mako.lookup.TemplateLookup: lookup for the template directory.
+    """
+
+    key = (os.path.abspath(templates_dir), _mako_module_dir(module_directory))
+
+    with _MAKO_LOCK:
+        lookup = _MAKO_LOOKUPS.get(key)
+
+        if lookup is None:
+            lookup = mako.lookup.TemplateLookup(
+                directories=[str(templates_dir)], module_directory=key[1]
+            )
+            _MAKO_LOOKUPS[key] = lookup
+
+    return lookup
+
+
 def mako_render(script_path: str, **kwargs) -> str:
     """Generate a mako template from a file and render it using provided args.
 
+    Compiled templates are cached per file and recompiled if the file changes.
+
     Args:
         script_path (str): Full path to mako template script.
         kwargs: Arbitrary keyword arguments.
@@ -51,7 +108,19 @@ def mako_render(script_path: str, **kwargs) -> str:
         str: Rendered string from mako template.
     """
 
-    template = mako.template.Template(filename=script_path)
+    key    = os.path.abspath(script_path)
+    mtime  = os.stat(key).st_mtime_ns
+    cached = _MAKO_TEMPLATES.get(key)
+
+    if cached and cached[0] == mtime:
+        template = cached[1]
+    else:
+        template = mako.template.Template(
+            filename=script_path, module_directory=_mako_module_dir(None)
+        )
+
+        with _MAKO_LOCK:
+            _MAKO_TEMPLATES[key] = (mtime, template)
 
     return template.render(**kwargs)
 
@@ -70,13 +139,97 @@ def mako_serve_template(
         kwargs: Arbitrary keyword arguments to pass to the template
     """
 
-    mylookup   = mako.lookup.TemplateLookup(directories=[templates_dir])
-    mytemplate = mylookup.get_template(template_name)
+    mytemplate = mako_lookup(templates_dir).get_template(template_name)
 
     # print is a workaround for different encodings, I think
     print(mytemplate.render(**kwargs), file=filename)
 
 
+# Jobs being rendered by forked worker processes in mako_serve_many. Workers
+# inherit them when they're forked, so job kwargs never need to be pickled.
+_MAKO_JOBS = []
+
+
+def _mako_render_jobs(lookup: mako.lookup.TemplateLookup, jobs) -> None:
+    templates = {}
+
+    for template_name, kwargs, path in jobs:
+        template = templates.get(template_name)
+
+        if template is None:
+            template = templates[template_name] = lookup.get_template(template_name)
+
+        with open(path, 'w') as f:
+            print(template.render(**kwargs), file=f)
+
+
+def _mako_render_slice(templates_dir: Union[str, Path], module_directory: Optional[str], start: int, stop: int) -> None:
+    # The lookup and its compiled templates are inherited from the parent.
+    _mako_render_jobs(mako_lookup(templates_dir, module_directory), _MAKO_JOBS[start:stop])
+
+
+def mako_serve_many(
+    templates_dir: Union[str, Path],
+    jobs: List[Tuple[str, dict, Union[str, Path]]],
+    module_directory: Optional[str] = None,
+    workers: int = 1,
+) -> List[Union[str, Path]]:
+    """Render many Mako templates from one template directory to files.
+
+    Each template is looked up and compiled once no matter how many jobs use
+    it. Output is written the same way as `mako_serve_template`.
+
+    With more than one worker, jobs are rendered in parallel by worker
+    processes forked from this one, so kwargs can be any objects (they're
+    never pickled) but must not be changed until this returns. Output is the
+    same either way. Jobs are rendered serially where fork isn't available.
+
+    Args:
+        templates_dir: directory to search for templates in
+        jobs: list of (template_name, kwargs, output_path) tuples
+        module_directory: optional directory to cache compiled templates in
+        workers: number of worker processes to render with
+
+    Returns:
+        list: the output paths written to, in job order.
+    """
+
+    global _MAKO_JOBS
+
+    lookup = mako_lookup(templates_dir, module_directory)
+    jobs   = list(jobs)
+
+    workers = min(workers, len(jobs))
+
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        _mako_render_jobs(lookup, jobs)
+        return [job[2] for job in jobs]
+
+    # Compile templates before forking so workers don't each compile them.
+    for template_name in {job[0] for job in jobs}:
+        lookup.get_template(template_name)
+
+    # Several small slices per worker keeps workers busy when some jobs are
+    # much bigger than others.
+    size = math.ceil(len(jobs) / (workers * 4))
+
+    _MAKO_JOBS = jobs
+
+    try:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            futures = [
+                pool.submit(_mako_render_slice, templates_dir, module_directory, start, start + size)
+                for start in range(0, len(jobs), size)
+            ]
+
+            for future in futures:
+                future.result()
+    finally:
+        _MAKO_JOBS = []
+
+    return [job[2] for job in jobs]
+
+
 def mark_executable(file_path: str) -> None:
     """
     Add executable by owner bit to file mode.
@@ -227,9 +380,10 @@ def expand_shorthand(short: str) -> list:
     return [short]
 
 
-def mm_send(mm: minimega.minimega, vm: str, src: str, dst: str) -> None:
-    if not os.path.exists(src):
-        raise ValueError(f'{src} not found locally')
+def _mm_mount_base() -> str:
+    """
+    Base directory that miniccc mount points are created in.
+    """
 
     # Use PHENIX_DIR as base directory to ensure minimega has access to it. This
     # assumes PHENIX_DIR is mounted into the containers if containers are being
@@ -243,79 +397,365 @@ def mm_send(mm: minimega.minimega, vm: str, src: str, dst: str) -> None:
     if Path('/tmp/miniccc-mounts').is_dir():
         base = '/tmp/miniccc-mounts'
 
-    with tempfile.TemporaryDirectory(dir=base) as tmp:
-        vm_dst  = os.path.join(tmp, dst.strip('/'))
-        dst_dir = os.path.dirname(vm_dst)
+    return base
 
-        try:
-            mm.cc_mount(vm, tmp)
-            time.sleep(1.0)
 
-            if not os.path.exists(dst_dir):
-                os.makedirs(dst_dir, exist_ok=True)
+def _wait_for(test, timeout: float, poll_rate: float = 0.05, max_poll: float = 0.5) -> bool:
+    """
+    Poll test() with exponential backoff until it returns True or the timeout
+    expires. Returns the final result of test().
+    """
 
-            if os.path.isdir(src):
-                shutil.copytree(src, vm_dst, dirs_exist_ok=True)
-            else:
-                shutil.copyfile(src, vm_dst)
-        finally:
-            mm.clear_cc_mount(vm)
-            # race condition between miniccc clearing mount and temp directory being
-            # cleaned up when exiting the context of the 'with' statement.
-            time.sleep(1.0)
+    deadline = time.monotonic() + timeout
 
+    while not test():
+        if time.monotonic() >= deadline:
+            return test()
 
-def mm_recv(mm: minimega.minimega, vm: str, src: Union[List[str], str], dst: str) -> None:
+        time.sleep(poll_rate)
+        poll_rate = min(poll_rate * 2, max_poll)
+
+    return True
+
+
+def _mount_ready(path: str) -> bool:
+    # A miniccc mount is ready once the guest filesystem is visible, either as a
+    # real mount point or (with propagated mounts) as a populated directory.
+    return os.path.ismount(path) or bool(os.listdir(path))
+
+
+def _mount_cleared(path: str) -> bool:
+    return not os.path.ismount(path) and not os.listdir(path)
+
+
+def _copy_path(src: str, dst: str) -> int:
     """
-    Transfer one or more files from a VM to a destination on the host using miniccc mounts.
+    Copy a file or directory tree from src to dst, returning the number of
+    bytes copied.
     """
 
-    # Use PHENIX_DIR as base directory to ensure minimega has access to it. This
-    # assumes PHENIX_DIR is mounted into the containers if containers are being
-    # used.
-    base = phenix_settings.PHENIX_DIR
+    copied = 0
 
-    # If the well-known '/tmp/miniccc-mounts' directory is present, then use it
-    # as the base directory instead. This is common when deploying minimega and
-    # phenix as a Kubernetes deployment, wherein bidirectional mount propagation
-    # has to be enabled (and is done so via a Kubernetes `emptyDir` volume).
-    if Path('/tmp/miniccc-mounts').is_dir():
-        base = '/tmp/miniccc-mounts'
+    def counting_copy(s, d, **kwargs):
+        nonlocal copied
+        result = shutil.copy2(s, d, **kwargs)
+        copied += os.path.getsize(result)
+        return result
 
-    with tempfile.TemporaryDirectory(dir=base) as tmp:
-        if isinstance(src, str):
-            src = [src]
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, dirs_exist_ok=True, copy_function=counting_copy)
+    else:
+        counting_copy(src, dst)
+
+    return copied
+
+
+def _mm_transfer_vm(
+    mm: minimega.minimega,
+    vm: str,
+    jobs: List[Tuple[int, str, str]],
+    direction: str,
+    mount_timeout: float,
+    pattern: str = '*',
+    keep_last: int = 0,
+) -> List[Tuple[int, dict]]:
+    """
+    Run all transfers for a single VM over one miniccc mount.
+    """
+
+    results = []
+    pending = list(jobs)
+
+    tmp = tempfile.mkdtemp(dir=_mm_mount_base())
+    mounted = False
+
+    try:
+        mm.cc_mount(vm, tmp)
+        mounted = True
 
-        vm_sources = [os.path.join(tmp, s.strip('/')) for s in src]
-        dst_dir = os.path.dirname(dst)
+        if not _wait_for(lambda: _mount_ready(tmp), mount_timeout):
+            raise TimeoutError(f'mount for VM {vm} not ready after {mount_timeout} seconds')
 
-        if not os.path.exists(dst_dir):
-            os.makedirs(dst_dir, exist_ok=True)
+        while pending:
+            idx, src, dst = pending.pop(0)
+
+            result = {
+                'vm':       vm,
+                'src':      src,
+                'dst':      dst,
+                'success':  False,
+                'bytes':    0,
+                'duration': 0.0,
+                'error':    None,
+            }
 
-        try:
-            mm.cc_mount(vm, tmp)
+            if direction == 'move':
+                result['files'] = []
 
-            for vm_src in vm_sources:
-                tries = 0
-                while not os.path.exists(vm_src):
-                    tries += 1
+            start = time.monotonic()
 
-                    if tries >= 5:
-                        # finally block will still get called
+            try:
+                if direction == 'recv':
+                    vm_src = os.path.join(tmp, src.strip('/'))
+
+                    # the guest may still be flushing the file to its filesystem
+                    if not _wait_for(lambda: os.path.exists(vm_src), 2.5):
                         raise ValueError(f'{src} not found in VM {vm}')
-                    else:
-                        time.sleep(0.5)
 
-                if os.path.isdir(vm_src):
-                    shutil.copytree(vm_src, dst, dirs_exist_ok=True)
+                    dst_dir = os.path.dirname(dst)
+                    if dst_dir:
+                        os.makedirs(dst_dir, exist_ok=True)
+
+                    result['bytes'] = _copy_path(vm_src, dst)
+                elif direction == 'move':
+                    vm_src = os.path.join(tmp, src.strip('/'))
+
+                    names = []
+                    if os.path.isdir(vm_src):
+                        names = sorted(fnmatch.filter(os.listdir(vm_src), pattern))
+
+                    if keep_last:
+                        names = names[:-keep_last]
+
+                    os.makedirs(dst, exist_ok=True)
+
+                    for name in names:
+                        path = os.path.join(vm_src, name)
+
+                        result['bytes'] += _copy_path(path, os.path.join(dst, name))
+                        os.remove(path)
+                        result['files'].append(name)
                 else:
-                    # shutil.copyfile(vm_src, dst)
-                    shutil.copy2(vm_src, dst)  # file or dir destination
-        finally:
+                    vm_dst = os.path.join(tmp, dst.strip('/'))
+                    os.makedirs(os.path.dirname(vm_dst), exist_ok=True)
+
+                    result['bytes'] = _copy_path(src, vm_dst)
+
+                result['success'] = True
+            except Exception as ex:
+                result['error'] = str(ex)
+
+            result['duration'] = time.monotonic() - start
+            results.append((idx, result))
+    except Exception as ex:
+        # mount failed, so every remaining transfer for this VM failed with it
+        for idx, src, dst in pending:
+            result = {
+                'vm':       vm,
+                'src':      src,
+                'dst':      dst,
+                'success':  False,
+                'bytes':    0,
+                'duration': 0.0,
+                'error':    str(ex),
+            }
+
+            if direction == 'move':
+                result['files'] = []
+
+            results.append((idx, result))
+    finally:
+        cleared = True
+
+        if mounted:
             mm.clear_cc_mount(vm)
             # race condition between miniccc clearing mount and temp directory being
-            # cleaned up when exiting the context of the 'with' statement.
-            time.sleep(1.0)
+            # cleaned up, so wait for the mount to actually go away before removing it.
+            cleared = _wait_for(lambda: _mount_cleared(tmp), mount_timeout)
+
+        if cleared:
+            shutil.rmtree(tmp, ignore_errors=True)
+        else:
+            eprint(f'mount for VM {vm} still present at {tmp}, not removing it')
+
+    return results
+
+
+def _mm_transfer_many(
+    mm: minimega.minimega,
+    jobs: List[Tuple[str, Union[List[str], str], str]],
+    direction: str,
+    max_workers: int,
+    mount_timeout: float,
+    **kwargs,
+) -> List[dict]:
+    by_vm = {}
+    count = 0
+
+    for vm, src, dst in jobs:
+        if isinstance(src, str):
+            src = [src]
+
+        for s in src:
+            by_vm.setdefault(vm, []).append((count, s, dst))
+            count += 1
+
+    results = [None] * count
+
+    if not by_vm:
+        return []
+
+    workers = max(1, min(max_workers, len(by_vm)))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_mm_transfer_vm, mm, vm, vm_jobs, direction, mount_timeout, **kwargs)
+            for vm, vm_jobs in by_vm.items()
+        ]
+
+        for future in as_completed(futures):
+            for idx, result in future.result():
+                results[idx] = result
+
+    return results
+
+
+def mm_send_many(
+    mm: minimega.minimega,
+    jobs: List[Tuple[str, str, str]],
+    max_workers: int = 8,
+    mount_timeout: float = 10.0,
+) -> List[dict]:
+    """
+    Transfer files from the host to many VMs concurrently using miniccc mounts.
+
+    Args:
+        mm: minimega instance.
+        jobs: list of (vm, src, dst) tuples, where src is a local file or
+            directory and dst is the destination path in the VM.
+        max_workers: maximum number of VMs mounted at the same time.
+        mount_timeout: seconds to wait for a mount to become ready (or to clear).
+
+    Returns:
+        list: one result dict per job, in job order, with the keys 'vm', 'src',
+        'dst', 'success', 'bytes', 'duration' and 'error'.
+    """
+
+    for _, src, _ in jobs:
+        if not os.path.exists(src):
+            raise ValueError(f'{src} not found locally')
+
+    return _mm_transfer_many(mm, jobs, 'send', max_workers, mount_timeout)
+
+
+def mm_recv_many(
+    mm: minimega.minimega,
+    jobs: List[Tuple[str, Union[List[str], str], str]],
+    max_workers: int = 8,
+    mount_timeout: float = 10.0,
+) -> List[dict]:
+    """
+    Transfer files from many VMs to the host concurrently using miniccc mounts.
+
+    All jobs for the same VM share a single mount. A job's src may be a list
+    of paths, in which case each path is copied to dst (which should then be a
+    directory) and reported as a separate result.
+
+    Args:
+        mm: minimega instance.
+        jobs: list of (vm, src, dst) tuples, where src is the path in the VM
+            and dst is the local destination.
+        max_workers: maximum number of VMs mounted at the same time.
+        mount_timeout: seconds to wait for a mount to become ready (or to clear).
+
+    Returns:
+        list: one result dict per transferred path, in job order, with the keys
+        'vm', 'src', 'dst', 'success', 'bytes', 'duration' and 'error'.
+    """
+
+    return _mm_transfer_many(mm, jobs, 'recv', max_workers, mount_timeout)
+
+
+def mm_move_many(
+    mm: minimega.minimega,
+    jobs: List[Tuple[str, str, str]],
+    pattern: str = '*',
+    keep_last: int = 0,
+    max_workers: int = 8,
+    mount_timeout: float = 10.0,
+) -> List[dict]:
+    """
+    Move files out of a directory in many VMs to the host concurrently using
+    miniccc mounts. Files are removed from the VM once they've been copied.
+
+    Args:
+        mm: minimega instance.
+        jobs: list of (vm, src, dst) tuples, where src is a directory in the VM
+            and dst is the local directory to move its files to.
+        pattern: glob pattern the names of files to move must match.
+        keep_last: number of matching files, in name order, to leave in the VM
+            (e.g. ones that may still be being written to).
+        max_workers: maximum number of VMs mounted at the same time.
+        mount_timeout: seconds to wait for a mount to become ready (or to clear).
+
+    Returns:
+        list: one result dict per job, in job order, with the same keys as
+        mm_recv_many plus 'files', the names of the files moved in name order.
+        A src directory that doesn't exist (yet) moves no files.
+    """
+
+    return _mm_transfer_many(
+        mm, jobs, 'move', max_workers, mount_timeout, pattern=pattern, keep_last=keep_last,
+    )
+
+
+def mm_send(mm: minimega.minimega, vm: str, src: str, dst: str) -> None:
+    results = mm_send_many(mm, [(vm, src, dst)], max_workers=1)
+
+    for result in results:
+        if not result['success']:
+            raise ValueError(result['error'])
+
+
+def mm_recv(mm: minimega.minimega, vm: str, src: Union[List[str], str], dst: str) -> None:
+    """
+    Transfer one or more files from a VM to a destination on the host using miniccc mounts.
+    """
+
+    results = mm_recv_many(mm, [(vm, src, dst)], max_workers=1)
+
+    for result in results:
+        if not result['success']:
+            raise ValueError(result['error'])
+
+
+def mm_read_commands(
+    mm: minimega.minimega,
+    path: Union[str, Path],
+    commands: List[str],
+    received: Optional[List[float]] = None,
+) -> List[float]:
+    """
+    Run minimega commands with one round-trip, by writing them to a command
+    file and having minimega read it. The file has to be at a path minimega
+    can read (e.g. in the phenix images directory).
+
+    minimega sends the response to each command as soon as it's run, so the
+    time each response is received is also when its command finished.
+
+    Args:
+        received: list to append the times to as responses come in, so the
+            responses received before a failed command are known.
+
+    Returns:
+        list: time.monotonic() time each response was received, in order.
+    """
+
+    if received is None:
+        received = []
+
+    with open(path, 'w') as f:
+        for cmd in commands:
+            f.write(f'{cmd}\n')
+
+    mm.read(str(path))
+    received.append(time.monotonic())
+
+    if mm.moreResponses:
+        for _ in mm.streamResponses():
+            received.append(time.monotonic())
+
+    return received
 
 
 def mm_get_cc_path(mm: minimega.minimega) -> Optional[Path]:
@@ -335,88 +775,306 @@ def mm_get_cc_path(mm: minimega.minimega) -> Optional[Path]:
     return cc_path
 
 
-def mm_exec_wait(
-    mm: minimega.minimega,
-    vm: str,
-    cmd: str,
-    once: bool = True,
-    timeout: float = 0.0,
-    poll_rate: float = 1.0,
-    debug: bool = False,
-) -> dict:
-    mm.cc_filter(f'name={vm}')
+# Serializes multi-call cc state changes (prefix, filter, exec) so concurrent
+# submissions over a shared minimega connection don't clobber each other.
+_CC_LOCK = threading.RLock()
 
-    if once:
-        mm.cc_exec_once(cmd)
-    else:
-        mm.cc_exec(cmd)
+# Cached VM name -> UUID maps, keyed by minimega connection (each connection
+# is bound to a single namespace), along with when they were fetched.
+_VM_UUIDS = weakref.WeakKeyDictionary()
 
-    last_cmd = mm_last_command(mm)
-    mm_wait_for_cmd(
-        mm=mm, cmd_id=last_cmd['id'], timeout=timeout, poll_rate=poll_rate, debug=debug
-    )
+# Seconds before a cached VM UUID map is fetched again, so VMs re-created under
+# the same name are picked up.
+_VM_UUIDS_MAX_AGE = 10.0
 
-    waiting = True
-    counter = 0
+_CC_RESPONSE_RE = re.compile(r'^(\d+)/([0-9a-fA-F]{8}-[0-9a-fA-F-]{27})/(stdout|stderr):\n', re.MULTILINE)
 
-    while waiting:
-        # we only expect a single response since scoped by VM
-        try:
-            exit_resp = mm.cc_exitcode(last_cmd['id'], vm)[0]
-            waiting = False
-            break
-        except minimega.Error as ex:
-            if not timeout:
-                raise ex from None
 
-        if timeout and counter > int(timeout / poll_rate):
-            raise RuntimeError(f"Timeout exceeded waiting for exit code in mm.mm_exec_wait (timeout={timeout}, counter={counter}, poll_rate={poll_rate})") from None
+def _parse_cc_response(resp: str) -> dict:
+    """
+    Split a raw 'cc responses' string into stdout/stderr per client UUID.
 
-        if debug:
-            print_msg(f"Waiting {poll_rate} seconds before checking exit code for ID '{last_cmd['id']}' (timeout={timeout}, counter={counter})")
+    '1/0ab5dbc3-8ca6-4b75-a503-b5a191995dae/stdout:\nlo UNKNOWN 127.0.0.1/8\n'
+    -> {'0ab5dbc3-8ca6-4b75-a503-b5a191995dae': {'stdout': 'lo UNKNOWN 127.0.0.1/8'}}
+    """
 
-        time.sleep(poll_rate)
-        counter += 1
+    outputs = {}
+    parts = _CC_RESPONSE_RE.split(resp)
 
-    result = {
-        'id':       last_cmd['id'],
-        'cmd':      last_cmd['cmd'],
-        'exitcode': int(exit_resp['Response']),
-        'stderr':   None,
-        'stdout':   None,
-    }
+    # parts: [leading, id, uuid, stream, output, id, uuid, stream, output, ...]
+    for i in range(1, len(parts) - 3, 4):
+        _, uuid, stream, output = parts[i:i + 4]
+        outputs.setdefault(uuid, {})[stream] = output.strip()
 
-    resps = mm.cc_responses(last_cmd['id'])
-    uuid  = mm_vm_uuid(mm, vm)
-
-    # example response from mm.cc_responses:
-    # [{
-    #   'Host': 'kn-0',
-    #   'Response': '1/0ab5dbc3-8ca6-4b75-a503-b5a191995dae/stdout:\nlo               UNKNOWN        127.0.0.1/8 ::1/128 \n\n',
-    #   'Header': None,
-    #   'Tabular': None,
-    #   'Error': '',
-    #   'Data': None
-    # }]
-
-    for row in resps:
-        if not row['Response']:
-            continue
+    return outputs
 
-        resp = row['Response']
 
-        if uuid not in resp:
-            eprint(f"UUID '{uuid}' not in response: {repr(resp)}")
-            continue
+class MMCommandTracker:
+    """
+    Tracks completion of miniccc commands without per-command polling.
+
+    Each submitted command is tagged with a unique cc prefix, which is known as
+    soon as the command is issued and is used as its handle. Outstanding
+    commands are then resolved together: every iteration of the wait loop makes
+    a single 'cc commands' call for all of them, backing off exponentially while
+    nothing changes. VM UUIDs are resolved through a cache shared by all
+    trackers using the same minimega connection.
+
+    The tracker owns the cc prefix and filter while it's in use: submitting a
+    command sets both, and they're cleared once when waiting starts rather
+    than being restored after every command. Callers that rely on a cc filter
+    of their own need to set it again after using a tracker.
+
+    Example:
+        tracker = MMCommandTracker(mm)
+        handles = [tracker.submit('hostname', vm=vm) for vm in vms]
+        results = tracker.wait(handles, timeout=30.0)
+        results[handles[0]][vms[0]]['stdout']
+    """
 
-        if "/stderr:\n" in resp:
-            result["stderr"] = resp.partition("/stderr:\n")[2].strip()
-        if "/stdout:\n" in resp:
-            result["stdout"] = resp.partition("/stdout:\n")[2].strip()
-        if "/stderr:\n" not in resp and "/stdout:\n" not in resp:
-            eprint(f"no stderr or stdout in response: {repr(resp)}")
+    def __init__(self, mm: minimega.minimega) -> None:
+        self.mm = mm
+        self.commands = {}
+        self.cc_state_set = False
+
+    def submit(
+        self,
+        cmd: str,
+        vm: Optional[str] = None,
+        cc_filter: Optional[str] = None,
+        expected: int = 1,
+        once: bool = True,
+        background: bool = False,
+    ) -> str:
+        """
+        Issue a command and return its handle.
+
+        Args:
+            cmd: command to execute.
+            vm: name of the VM to run the command on. Mutually exclusive with cc_filter.
+            cc_filter: arbitrary cc filter to target multiple clients.
+            expected: number of clients targeted by cc_filter.
+            once: use 'cc exec-once' instead of 'cc exec'.
+            background: use 'cc background' instead of 'cc exec'. The command
+                completes as soon as it has been started.
+        """
+
+        if background:
+            issue = self.mm.cc_background_once if once else self.mm.cc_background
+        else:
+            issue = self.mm.cc_exec_once if once else self.mm.cc_exec
+
+        return self._submit(issue, cmd, vm, cc_filter, expected)
+
+    def send(
+        self,
+        src: str,
+        vm: Optional[str] = None,
+        cc_filter: Optional[str] = None,
+        expected: int = 1,
+    ) -> str:
+        """
+        Send a file with 'cc send' and return its handle. The file is placed in
+        the miniccc files directory in the VM. Waiting on the handle waits for
+        the file to be received, and its result is an empty dict.
+
+        Args:
+            src: path of the file to send, in the minimega files directory.
+            vm: name of the VM to send to. Mutually exclusive with cc_filter.
+            cc_filter: arbitrary cc filter to target multiple clients.
+            expected: number of clients targeted by cc_filter.
+        """
+
+        handle = self._submit(self.mm.cc_send, src, vm, cc_filter, expected)
+        self.commands[handle]['send'] = True
+
+        return handle
+
+    def _submit(self, issue, cmd: str, vm: Optional[str], cc_filter: Optional[str], expected: int) -> str:
+        if vm:
+            cc_filter = f'name={vm}'
+            expected  = 1
+        elif not cc_filter:
+            raise ValueError('either vm or cc_filter must be provided')
+
+        handle = f'phenix-{uuid4().hex[:12]}'
+
+        with _CC_LOCK:
+            self.mm.cc_prefix(handle)
+            self.mm.cc_filter(cc_filter)
+            self.cc_state_set = True
+
+            issue(cmd)
+
+        self.commands[handle] = {
+            'id':       None,
+            'cmd':      cmd,
+            'vm':       vm,
+            'expected': expected,
+            'send':     False,
+            'results':  None,
+        }
+
+        return handle
+
+    def clear_cc_state(self) -> None:
+        """
+        Clear the cc prefix and filter left set by submitted commands, so they
+        don't apply to commands issued without the tracker.
+        """
+
+        with _CC_LOCK:
+            if self.cc_state_set:
+                self.mm.clear_cc_prefix()
+                self.mm.clear_cc_filter()
+                self.cc_state_set = False
+
+    def wait(
+        self,
+        handles: Optional[List[str]] = None,
+        timeout: float = 0.0,
+        poll_rate: float = 1.0,
+        debug: bool = False,
+        first: bool = False,
+    ) -> dict:
+        """
+        Wait for commands to complete on all of their targeted clients.
+
+        Args:
+            handles: handles returned by submit or send. Defaults to all outstanding commands.
+            timeout: seconds to wait before raising RuntimeError (0 waits forever).
+            poll_rate: maximum number of seconds between checks.
+            first: return as soon as any of the commands has completed, with
+                results for only the completed ones.
+
+        Returns:
+            dict: keyed by handle, each value a dict keyed by VM name holding
+            'id', 'cmd', 'exitcode', 'stderr' and 'stdout'.
+        """
+
+        if handles is None:
+            handles = list(self.commands)
+
+        self.clear_cc_state()
+
+        pending  = [h for h in handles if self.commands[h]['results'] is None]
+        deadline = time.monotonic() + timeout if timeout else None
+        delay    = min(0.05, poll_rate)
+        retries  = dict.fromkeys(pending, 0)
+
+        while pending:
+            progress = False
+            rows = self._command_rows()
+
+            for handle in list(pending):
+                info = self.commands[handle]
+                row  = rows.get(handle)
+
+                if row is None:
+                    continue
+
+                info['id'] = row[0]
+                info['cmd'] = row[2][1:-1]
+
+                if int(row[3]) < info['expected']:
+                    continue
+
+                if info['send']:
+                    # files don't have exit codes or output to collect
+                    info['results'] = {}
+                    pending.remove(handle)
+                    progress = True
+                    continue
+
+                try:
+                    info['results'] = self._collect(info)
+                except minimega.Error as ex:
+                    # responses are in, but exit codes haven't been processed yet
+                    retries[handle] += 1
+
+                    if not timeout and retries[handle] > 10:
+                        raise ex from None
+
+                    continue
+
+                pending.remove(handle)
+                progress = True
+
+            if not pending or (first and len(pending) < len(handles)):
+                break
 
-    return result
+            if deadline and time.monotonic() >= deadline:
+                raise RuntimeError(f"Timeout exceeded in MMCommandTracker.wait (timeout={timeout}, pending={pending})") from None
+
+            if progress:
+                delay = min(0.05, poll_rate)
+            else:
+                delay = min(delay * 2, poll_rate)
+
+            if debug:
+                print_msg(f"Waiting {delay:.2f} seconds before checking {len(pending)} outstanding commands (timeout={timeout})")
+
+            time.sleep(delay)
+
+        if first:
+            return {h: self.commands[h]['results'] for h in handles if self.commands[h]['results'] is not None}
+
+        return {h: self.commands[h]['results'] for h in handles}
+
+    def _command_rows(self) -> dict:
+        # 'Header': ['id', 'prefix', 'command', 'responses', 'background', 'once', 'sent', 'received', 'connectivity', 'level', 'filter']
+        rows = {}
+
+        for host in self.mm.cc_commands():
+            for row in host['Tabular'] or []:
+                if row[1] in self.commands:
+                    rows[row[1]] = row
+
+        return rows
+
+    def _collect(self, info: dict) -> dict:
+        outputs = {}
+
+        for row in self.mm.cc_responses(info['id']):
+            if row['Response']:
+                outputs.update(_parse_cc_response(row['Response']))
+
+        names = mm_vm_names(self.mm, list(outputs))
+        targets = [info['vm']] if info['vm'] else [names.get(u, u) for u in outputs]
+
+        # uuid keyed outputs -> name keyed outputs
+        outputs = {names.get(u, u): out for u, out in outputs.items()}
+
+        results = {}
+
+        for vm in targets:
+            exit_resp = self.mm.cc_exitcode(info['id'], vm)[0]
+            output = outputs.get(vm, {})
+
+            results[vm] = {
+                'id':       info['id'],
+                'cmd':      info['cmd'],
+                'exitcode': int(exit_resp['Response']),
+                'stderr':   output.get('stderr'),
+                'stdout':   output.get('stdout'),
+            }
+
+        return results
+
+
+def mm_exec_wait(
+    mm: minimega.minimega,
+    vm: str,
+    cmd: str,
+    once: bool = True,
+    timeout: float = 0.0,
+    poll_rate: float = 1.0,
+    debug: bool = False,
+) -> dict:
+    tracker = MMCommandTracker(mm)
+    handle  = tracker.submit(cmd, vm=vm, once=once)
+
+    return tracker.wait([handle], timeout=timeout, poll_rate=poll_rate, debug=debug)[handle][vm]
 
 
 def mm_wait_for_cmd(
@@ -445,6 +1103,9 @@ def mm_wait_for_cmd(
                 waiting = False
                 break
 
+        if not waiting:
+            break
+
         if timeout and counter > int(timeout / poll_rate):
             raise RuntimeError(f"Timeout exceeded in mm_wait_for_command (timeout={timeout}, counter={counter}, poll_rate={poll_rate})") from None
 
@@ -482,6 +1143,9 @@ def mm_wait_for_prefix(
                 waiting = False
                 break
 
+        if not waiting:
+            break
+
         if timeout and counter > int(timeout / poll_rate):
             raise RuntimeError(f"Timeout exceeded in mm_wait_for_prefix (timeout={timeout}, counter={counter}, poll_rate={poll_rate})") from None
 
@@ -535,23 +1199,61 @@ def mm_get_cc_responses(
 
 
 def mm_last_command(mm: minimega.minimega) -> dict:
-    commands = mm.cc_commands()
+    last = mm.cc_commands()[0]['Tabular'][-1]
 
     return {
-        'id':  commands[0]['Tabular'][-1][0],
-        'cmd': mm.cc_commands()[0]['Tabular'][-1][2][1:-1],
+        'id':  last[0],
+        'cmd': last[2][1:-1],
     }
 
 
+def mm_vm_uuids(mm: minimega.minimega, refresh: bool = False) -> dict:
+    """
+    Returns a map of VM name to UUID for the connection's minimega namespace.
+    The map is cached and shared across calls using the same connection until
+    refresh is set or it's older than _VM_UUIDS_MAX_AGE seconds. Lookups
+    through mm_vm_names also refresh it when they miss, so VMs that have been
+    (re)created since are picked up.
+    """
+
+    fetched, uuids = _VM_UUIDS.get(mm, (None, None))
+
+    if refresh or fetched is None or time.monotonic() - fetched > _VM_UUIDS_MAX_AGE:
+        uuids = {}
+
+        for host in mm.vm_info(summary='summary'):
+            header = host.get('Header') or []
+            idx = header.index('uuid') if 'uuid' in header else 4
+
+            for vm in host['Tabular']:
+                uuids[vm[1]] = vm[idx]
+
+        _VM_UUIDS[mm] = (time.monotonic(), uuids)
+
+    return uuids
+
+
+def mm_vm_names(mm: minimega.minimega, uuids: List[str]) -> dict:
+    """
+    Returns a map of UUID to VM name for the given UUIDs, refreshing the cached
+    UUID map once if any of them are unknown.
+    """
+
+    names = {u: n for n, u in mm_vm_uuids(mm).items()}
+
+    if any(u not in names for u in uuids):
+        names = {u: n for n, u in mm_vm_uuids(mm, refresh=True).items()}
+
+    return {u: names[u] for u in uuids if u in names}
+
+
 def mm_vm_uuid(mm: minimega.minimega, name: str) -> Optional[str]:
-    info = mm.vm_info(summary='summary')
+    uuids = mm_vm_uuids(mm)
 
-    for host in info:
-        for vm in host['Tabular']:
-            if vm[1] == name:
-                return vm[4]
+    if name not in uuids:
+        uuids = mm_vm_uuids(mm, refresh=True)
 
-    return None
+    return uuids.get(name)
 
 
 def mm_info_for_vm(mm: minimega.minimega, name: str) -> dict:
@@ -643,6 +1345,117 @@ def run_command(cmd: str, timeout: Optional[float] = None) -> str:
     return result
 
 
+def _outputs_current(inputs: List[Union[str, Path]], outputs: List[Union[str, Path]]) -> bool:
+    """
+    Check if every output exists and is at least as new as every input.
+    """
+
+    if not outputs:
+        return False
+
+    try:
+        oldest = min(os.stat(path).st_mtime for path in outputs)
+        newest = max((os.stat(path).st_mtime for path in inputs), default=0.0)
+    except FileNotFoundError:
+        return False
+
+    return newest <= oldest
+
+
+def run_task_graph(tasks: dict, max_workers: Optional[int] = None) -> dict:
+    """
+    Run a dependency graph of tasks on a bounded worker pool, starting each
+    task as soon as the tasks it depends on are done.
+
+    tasks maps a task name to a dict with the keys:
+
+    - func: callable to run, with no arguments
+    - deps: (optional) names of tasks that have to finish first
+    - inputs: (optional) paths of files the task reads
+    - outputs: (optional) paths of files the task writes
+
+    A task is skipped if it has outputs, they're all at least as new as its
+    inputs, and none of the tasks it depends on ran. If a task raises an
+    exception, no more tasks are started and the exception is raised once
+    the running tasks finish.
+
+    Returns a dict of task name -> {'start', 'duration', 'skipped'} in the
+    order the tasks finished, with durations in seconds.
+    """
+
+    for name, task in tasks.items():
+        for dep in task.get("deps", []):
+            if dep not in tasks:
+                raise ValueError(f"task '{name}' depends on unknown task '{dep}'")
+
+    deps_of = {name: set(task.get("deps", [])) for name, task in tasks.items()}
+    waiting = {name: set(deps) for name, deps in deps_of.items()}
+    dependents = {name: [] for name in tasks}
+    for name, deps in deps_of.items():
+        for dep in deps:
+            dependents[dep].append(name)
+
+    results = {}
+    ran = set()
+    error = None
+
+    def _run(name: str) -> dict:
+        task = tasks[name]
+        start = time.time()
+
+        skipped = not (deps_of[name] & ran) and _outputs_current(
+            task.get("inputs", []), task.get("outputs", [])
+        )
+
+        if not skipped:
+            task["func"]()
+
+        return {
+            "start": datetime.datetime.fromtimestamp(start, tz=datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "duration": round(time.time() - start, 3),
+            "skipped": skipped,
+        }
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        running = {}
+
+        for name, deps in waiting.items():
+            if not deps:
+                running[pool.submit(_run, name)] = name
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name = running.pop(future)
+
+                try:
+                    results[name] = future.result()
+                except BaseException as ex:
+                    error = error or ex
+                    continue
+
+                if not results[name]["skipped"]:
+                    ran.add(name)
+
+                if error:
+                    continue
+
+                for dependent in dependents[name]:
+                    waiting[dependent].discard(name)
+
+                    if not waiting[dependent]:
+                        running[pool.submit(_run, dependent)] = dependent
+
+    if error:
+        raise error
+
+    if len(results) != len(tasks):
+        raise ValueError(f"task graph has a cycle: {sorted(set(tasks) - set(results))}")
+
+    return results
+
+
 def read_json(path: Union[str, Path]):
     if isinstance(path, str):
         path = Path(path).resolve()
@@ -0,0 +1,7 @@
+from .scheduler import BinPack
+
+def main():
+    BinPack()
+
+if __name__ == "__main__":
+    main()
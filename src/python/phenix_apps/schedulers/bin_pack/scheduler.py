@@ -0,0 +1,299 @@
+import sys, time
+
+from collections import defaultdict
+
+import phenix_apps.common.settings as phenix_settings
+
+from phenix_apps.schedulers import SchedulerBase
+
+
+class HostCapacity(object):
+    """
+    Tracks the resources committed to a single cluster host while scheduling.
+    """
+
+    def __init__(self, name, cpus, memory):
+        self.name   = name
+        self.cpus   = cpus
+        self.memory = memory
+
+        self.cpu_used = 0
+        self.mem_used = 0
+        self.vms      = 0
+
+        # VLAN alias --> number of VMs on this host with an interface in it.
+        self.vlans = defaultdict(int)
+
+
+    def fits(self, cpus, memory):
+        return self.cpu_used + cpus <= self.cpus and self.mem_used + memory <= self.memory
+
+
+    def free(self):
+        """
+        Fraction of the host's scarcest resource that is still available.
+        """
+
+        cpu = 1 - self.cpu_used / self.cpus if self.cpus else 0
+        mem = 1 - self.mem_used / self.memory if self.memory else 0
+
+        return min(cpu, mem)
+
+
+    def add(self, cpus, memory, vlans):
+        self.cpu_used += cpus
+        self.mem_used += memory
+        self.vms      += 1
+
+        for vlan in vlans:
+            self.vlans[vlan] += 1
+
+
+    def utilization(self):
+        return {
+            'vms':     self.vms,
+            'cpu':     self.cpu_used,
+            'cpus':    self.cpus,
+            'cpu_pct': round(100 * self.cpu_used / self.cpus, 1) if self.cpus else 0.0,
+            'mem':     self.mem_used,
+            'memory':  self.memory,
+            'mem_pct': round(100 * self.mem_used / self.memory, 1) if self.memory else 0.0,
+        }
+
+
+class SchedulingError(Exception):
+    pass
+
+
+def host_capacities(hosts, cpu_ratio=1.0, mem_ratio=1.0):
+    """
+    Builds the schedulable capacity of each cluster host from the `hosts` list
+    phenix passes to schedulers, less whatever is already committed to other
+    experiments. Hosts explicitly marked as not schedulable are skipped.
+    """
+
+    capacities = {}
+
+    for host in hosts:
+        if host.get('schedulable') is False:
+            continue
+
+        cpus   = int(host.get('cpus', 0) * cpu_ratio) - host.get('cpucommit', 0)
+        memory = int(host.get('memtotal', 0) * mem_ratio) - host.get('memcommit', 0)
+
+        capacities[host['name']] = HostCapacity(host['name'], max(cpus, 0), max(memory, 0))
+
+    return capacities
+
+
+def vm_requirements(node):
+    """
+    Returns the (vcpus, memory, vlans) a topology node needs from a host.
+    """
+
+    hardware = node.get('hardware') or {}
+    network  = node.get('network') or {}
+
+    vlans = set()
+
+    for iface in network.get('interfaces') or []:
+        vlan = iface.get('vlan')
+
+        if vlan:
+            vlans.add(vlan)
+
+    return (
+        int(hardware.get('vcpus', 1)),
+        int(hardware.get('memory', 512)),
+        tuple(sorted(vlans)),
+    )
+
+
+def _best_host(hosts, cpus, memory, vlans, vlan_sizes):
+    """
+    Returns the host with room for the given resources that has the most VLAN
+    affinity, weighted so small VLANs count for more than ones most VMs share.
+    Ties go to the host with the least free capacity, so hosts are packed
+    before empty ones are started on.
+    """
+
+    best, best_key = None, None
+
+    for host in hosts:
+        if not host.fits(cpus, memory):
+            continue
+
+        score = sum(host.vlans[v] / vlan_sizes[v] for v in vlans)
+        key   = (score, -host.free())
+
+        if best_key is None or key > best_key:
+            best, best_key = host, key
+
+    return best
+
+
+def _place(groups, reqs, hosts, vlan_sizes):
+    """
+    Greedily places groups of VMs in the given order. A group goes to a single
+    host when one has room for all of it, otherwise its VMs are placed one at
+    a time.
+    """
+
+    assignments = {}
+    ordered     = sorted(hosts.values(), key=lambda h: h.name)
+
+    for group in groups:
+        vlans  = reqs[group[0]][2]
+        cpus   = sum(reqs[name][0] for name in group)
+        memory = sum(reqs[name][1] for name in group)
+
+        host = _best_host(ordered, cpus, memory, vlans, vlan_sizes)
+
+        for name in group:
+            cpus, memory, vlans = reqs[name]
+
+            if host is None or not host.fits(cpus, memory):
+                best = _best_host(ordered, cpus, memory, vlans, vlan_sizes)
+            else:
+                best = host
+
+            if best is None:
+                raise SchedulingError(
+                    f'no cluster host has room for VM {name} ({cpus} vCPUs, {memory} MB memory)'
+                )
+
+            best.add(cpus, memory, vlans)
+            assignments[name] = best.name
+
+    return assignments
+
+
+def bin_pack(nodes, hosts, schedules=None, cpu_ratio=1.0, mem_ratio=1.0):
+    """
+    Places topology nodes on cluster hosts without exceeding any host's CPU or
+    memory capacity.
+
+    Nodes already present in `schedules` keep their host, and their resources
+    are charged to it first. The rest are grouped by the set of VLANs they
+    connect to, and each group is kept on one host where it fits. If that
+    can't fit every VM, placement is retried one VM at a time, largest first.
+
+    Returns the complete schedule (VM hostname --> cluster host name) and the
+    per-host utilization. Raises SchedulingError if the VMs don't fit.
+    """
+
+    schedules  = dict(schedules or {})
+    capacities = host_capacities(hosts, cpu_ratio, mem_ratio)
+
+    if not capacities:
+        raise SchedulingError('no schedulable cluster hosts')
+
+    reqs       = {}
+    vlan_sizes = defaultdict(int)
+    by_vlans   = defaultdict(list)
+
+    for node in nodes:
+        name = node['general']['hostname']
+        req  = vm_requirements(node)
+
+        for vlan in req[2]:
+            vlan_sizes[vlan] += 1
+
+        if name in schedules:
+            host = capacities.get(schedules[name])
+
+            if host:
+                host.add(*req)
+        else:
+            reqs[name] = req
+            by_vlans[req[2]].append(name)
+
+    # Groups sharing a leading VLAN are adjacent, and bigger VMs go first
+    # within a group.
+    grouped = [
+        sorted(by_vlans[vlans], key=lambda n: (-reqs[n][1], -reqs[n][0], n))
+        for vlans in sorted(by_vlans)
+    ]
+    by_size = [[n] for n in sorted(reqs, key=lambda n: (-reqs[n][1], -reqs[n][0], n))]
+
+    base = {
+        name: (host.cpu_used, host.mem_used, host.vms, dict(host.vlans))
+        for name, host in capacities.items()
+    }
+
+    for groups in (grouped, by_size):
+        try:
+            placed = _place(groups, reqs, capacities, vlan_sizes)
+            break
+        except SchedulingError:
+            if groups is by_size:
+                raise
+
+            # Reset hosts to their pre-existing commitments before retrying.
+            for name, host in capacities.items():
+                host.cpu_used, host.mem_used, host.vms, vlans = base[name]
+                host.vlans = defaultdict(int, vlans)
+
+    schedules.update(placed)
+
+    utilization = {name: host.utilization() for name, host in sorted(capacities.items())}
+
+    return schedules, utilization
+
+
+def spanning_vlans(nodes, schedules):
+    """
+    Returns the VLANs with VMs on more than one cluster host.
+    """
+
+    spans = defaultdict(set)
+
+    for node in nodes:
+        host = schedules.get(node['general']['hostname'])
+
+        for vlan in vm_requirements(node)[2]:
+            spans[vlan].add(host)
+
+    return sorted(vlan for vlan, hosts in spans.items() if len(hosts) > 1)
+
+
+class BinPack(SchedulerBase):
+    def __init__(self):
+        SchedulerBase.__init__(self, 'bin-pack')
+
+        spec  = self.experiment.spec
+        nodes = spec.topology.nodes
+        start = time.perf_counter()
+
+        try:
+            schedules, utilization = bin_pack(
+                nodes,
+                self.experiment.get('hosts') or [],
+                spec.get('schedules') or {},
+                phenix_settings.PHENIX_SCHEDULER_CPU_RATIO,
+                phenix_settings.PHENIX_SCHEDULER_MEM_RATIO,
+            )
+        except SchedulingError as ex:
+            self.eprint(f'bin-pack scheduler: {ex}')
+            sys.exit(1)
+
+        elapsed = time.perf_counter() - start
+
+        spec.schedules = schedules
+
+        # STDOUT is reserved for the experiment JSON, so report to STDERR.
+        self.eprint(f'bin-pack scheduler: placed {len(nodes)} VMs in {elapsed:.2f}s')
+
+        for name, util in utilization.items():
+            self.eprint(
+                f"  {name}: {util['vms']} VMs, "
+                f"{util['cpu']}/{util['cpus']} vCPUs ({util['cpu_pct']}%), "
+                f"{util['mem']}/{util['memory']} MB ({util['mem_pct']}%)"
+            )
+
+        spans = spanning_vlans(nodes, schedules)
+
+        if spans:
+            self.eprint(f"  VLANs spanning hosts: {', '.join(spans)}")
+
+        print(self.experiment.to_json())
@@ -0,0 +1,147 @@
+"""
+Unit tests for the bin-pack scheduler.
+"""
+
+import io
+import json
+import sys
+import time
+
+import pytest
+from box import Box
+
+from phenix_apps.schedulers.bin_pack import scheduler
+from phenix_apps.schedulers.bin_pack.scheduler import SchedulingError, bin_pack
+
+
+def node(name, vcpus=1, memory=1024, vlans=()):
+    return {
+        "general": {"hostname": name},
+        "hardware": {"vcpus": vcpus, "memory": memory},
+        "network": {"interfaces": [{"name": f"eth{i}", "vlan": v} for i, v in enumerate(vlans)]},
+    }
+
+
+def host(name, cpus=8, memtotal=8192, **kwargs):
+    return {"name": name, "cpus": cpus, "memtotal": memtotal, **kwargs}
+
+
+def test_respects_capacity():
+    nodes = [node(f"vm-{i}", vcpus=2, memory=2048) for i in range(8)]
+    hosts = [host("h1"), host("h2")]
+
+    schedules, util = bin_pack(nodes, hosts)
+
+    assert len(schedules) == 8
+    for name in ("h1", "h2"):
+        assert util[name]["cpu"] <= 8
+        assert util[name]["mem"] <= 8192
+    assert util["h1"]["vms"] + util["h2"]["vms"] == 8
+
+
+def test_over_capacity_raises():
+    nodes = [node(f"vm-{i}", vcpus=4) for i in range(5)]
+
+    with pytest.raises(SchedulingError, match="no cluster host has room"):
+        bin_pack(nodes, [host("h1"), host("h2")])
+
+    with pytest.raises(SchedulingError, match="no schedulable"):
+        bin_pack(nodes, [host("h1", schedulable=False)])
+
+
+def test_existing_assignments_and_commitments():
+    nodes = [node("pinned", vcpus=6), node("a", vcpus=2), node("b", vcpus=4)]
+    hosts = [host("h1"), host("h2", cpucommit=2)]
+
+    schedules, util = bin_pack(nodes, hosts, {"pinned": "h1"})
+
+    assert schedules["pinned"] == "h1"
+    # h1 only has 2 vCPUs left, and h2 has 6 after its existing commitment.
+    assert schedules["b"] == "h2"
+    assert util["h1"]["cpu"] + util["h2"]["cpu"] == 12
+    assert util["h2"]["cpus"] == 6
+
+
+def test_vlan_affinity():
+    nodes = []
+    for vlan in ("red", "blue", "green"):
+        nodes += [node(f"{vlan}-{i}", vlans=[vlan, "mgmt"]) for i in range(4)]
+
+    schedules, _ = bin_pack(nodes, [host(f"h{i}") for i in range(3)])
+
+    for vlan in ("red", "blue", "green"):
+        assert len({schedules[f"{vlan}-{i}"] for i in range(4)}) == 1
+
+    assert scheduler.spanning_vlans(nodes, schedules) == ["mgmt"]
+
+
+def test_falls_back_to_largest_first(mocker):
+    # Grouped by VLAN, "a" fills most of h1 and "b" most of h2, leaving no room
+    # for "c". Placing the largest VMs first fits them all.
+    nodes = [
+        node("a-0", vcpus=5, vlans=["a"]),
+        node("a-1", vcpus=1, vlans=["a"]),
+        node("b-0", vcpus=6, vlans=["b"]),
+        node("c-0", vcpus=5, vlans=["c"]),
+    ]
+    place = mocker.spy(scheduler, "_place")
+
+    schedules, util = bin_pack(nodes, [host("h1"), host("h2", cpus=10)])
+
+    assert place.call_count == 2
+    assert schedules == {"b-0": "h1", "a-0": "h2", "c-0": "h2", "a-1": "h1"}
+    assert util["h1"]["cpu"] == 7
+    assert util["h2"]["cpu"] == 10
+
+
+def ten_thousand_vms() -> tuple:
+    nodes = [
+        node(f"vm-{i}", vcpus=1 + i % 4, memory=512 * (1 + i % 3), vlans=[f"vlan-{i // 50}", "mgmt"])
+        for i in range(10000)
+    ]
+    hosts = [host(f"h{i}", cpus=512, memtotal=1024 * 1024) for i in range(64)]
+
+    return nodes, hosts
+
+
+def test_ten_thousand_vms():
+    nodes, hosts = ten_thousand_vms()
+
+    schedules, util = bin_pack(nodes, hosts)
+
+    assert len(schedules) == 10000
+    assert all(u["cpu"] <= u["cpus"] and u["mem"] <= u["memory"] for u in util.values())
+
+    # Every 50 VM VLAN fits on a single host, only "mgmt" spans hosts.
+    assert scheduler.spanning_vlans(nodes, schedules) == ["mgmt"]
+
+
+@pytest.mark.benchmark
+def test_ten_thousand_vms_time():
+    nodes, hosts = ten_thousand_vms()
+
+    start = time.perf_counter()
+    bin_pack(nodes, hosts)
+
+    assert time.perf_counter() - start < 5
+
+
+def test_scheduler_main(monkeypatch, capsys):
+    experiment = {
+        "spec": {
+            "topology": {"nodes": [node("vm-1", vlans=["a"]), node("vm-2", vlans=["a"])]},
+            "schedules": {},
+        },
+        "hosts": [host("h1"), host("h2")],
+    }
+
+    monkeypatch.setattr(sys, "argv", ["phenix-scheduler-bin-pack"])
+    monkeypatch.setattr(sys, "stdin", io.StringIO(json.dumps(experiment)))
+
+    scheduler.BinPack()
+
+    out, err = capsys.readouterr()
+    result = Box.from_json(out)
+
+    assert result.spec.schedules == {"vm-1": "h1", "vm-2": "h1"}
+    assert "h1: 2 VMs" in err
@@ -16,6 +16,6 @@ class SingleNode(SchedulerBase):
             if hostname in spec.schedules:
                 continue
 
-            spec.schedules.hostname = hosts[0].name
+            spec.schedules[hostname] = hosts[0].name
 
         print(self.experiment.to_json())